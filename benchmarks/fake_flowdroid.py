@@ -0,0 +1,84 @@
+"""
+Stand-in for `java -jar soot-infoflow-cmd...` used by the benchmarks.
+
+It accepts the same arguments pyflowdroid passes to FlowDroid and prints a
+log with the same shape as the FlowDroid one. Its behaviour is tuned with
+environment variables:
+
+- FAKE_FLOWDROID_LATENCY: seconds each analysis takes, by default 0.5.
+- FAKE_FLOWDROID_LINES: filler lines printed by each analysis, by default 1000.
+- FAKE_FLOWDROID_LEAKS: leaks reported by each analysis, by default 2.
+
+When the server source of pyflowdroid is passed instead of `-jar`, it behaves
+like the FlowDroid server used by `AnalysisServer`.
+"""
+
+import os
+import sys
+import time
+
+INFOFLOW = "[main] INFO soot.jimple.infoflow.Infoflow - "
+SETUP = "[main] INFO soot.jimple.infoflow.android.SetupApplication - "
+SINK = (
+    "virtualinvoke $r5.<android.telephony.SmsManager: void sendTextMessage("
+    "java.lang.String,java.lang.String,java.lang.String,android.app.PendingIntent,"
+    "android.app.PendingIntent)>($r4)"
+)
+SOURCE = (
+    "$r3 = virtualinvoke $r2.<android.telephony.TelephonyManager: "
+    "java.lang.String getDeviceId()>()"
+)
+METHOD = "<com.example.MainActivity: void onCreate(android.os.Bundle)>"
+
+
+def analyze(apk: str, out=sys.stdout) -> None:
+    """
+    Prints a FlowDroid-like log for the given apk.
+    """
+    latency = float(os.environ.get("FAKE_FLOWDROID_LATENCY", "0.5"))
+    lines = int(os.environ.get("FAKE_FLOWDROID_LINES", "1000"))
+    leaks = int(os.environ.get("FAKE_FLOWDROID_LEAKS", "2"))
+
+    write = out.write
+    write(f"{SETUP}Initializing Soot for {apk}...\n")
+    write(f"{SETUP}Found 42 callback methods for 7 components\n")
+    write(f"{SETUP}Collecting callbacks and building a callgraph took 3 seconds\n")
+    write(f"{INFOFLOW}Callgraph has 18234 edges\n")
+
+    # Spread the latency along the output, like the real analysis does
+    for i in range(lines):
+        write(f"[main] DEBUG soot.jimple.toolkits.callgraph - Processing edge {i}\n")
+        if latency and i % max(lines // 10, 1) == 0:
+            out.flush()
+            time.sleep(latency / 10)
+    if latency and not lines:
+        time.sleep(latency)
+
+    write(f"{INFOFLOW}IFDS problem with 9000 forward and 100 backward edges ")
+    write(f"solved in 2 seconds, processing {leaks} results...\n")
+    for _ in range(leaks):
+        write(f"{INFOFLOW}The sink {SINK} in method {METHOD} was called with ")
+        write("values from the following sources:\n")
+        write(f"{INFOFLOW}- {SOURCE} in method {METHOD}\n")
+        write(f"{INFOFLOW}\ton Path: \n")
+        write(f"{INFOFLOW}\t -> {METHOD}\n")
+    write(
+        f"{INFOFLOW}Data flow solver took 4 seconds. Maximum memory consumption: 512 MB\n"
+    )
+    write(f"{SETUP}Found {leaks} leaks\n")
+    out.flush()
+
+
+def main(argv: list) -> None:
+    if any(arg.endswith("FlowDroidServer.java") for arg in argv):
+        for line in sys.stdin:
+            args = line.rstrip("\n").split("\t")
+            analyze(args[args.index("-a") + 1])
+            sys.stdout.write("@@PYFLOWDROID_DONE 0\n")
+            sys.stdout.flush()
+    else:
+        analyze(argv[argv.index("-a") + 1])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,261 @@
+"""
+Offline benchmarks of the pyflowdroid pipeline.
+
+FlowDroid is replaced by `fake_flowdroid.py`, put in the PATH as `java`, and
+the apk store by a local `StoreServer`, so the benchmarks need neither Java
+nor network access. Results are printed as JSON, or written to `--output`,
+so runs of different versions can be compared.
+
+Usage:
+
+    poetry run python benchmarks/run.py --apks 20 --workers 1,4 --output bench.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+import statistics
+import tempfile
+import contextlib
+from pathlib import Path
+from typing import Callable
+
+import pyflowdroid
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.download import CubapkProvider
+from pyflowdroid.results import parse_logs
+from pyflowdroid.analyze import generate_report
+import fake_flowdroid
+from store_server import StoreServer
+
+BENCHMARKS_PATH = Path(__file__).parent.resolve()
+
+
+def _install_fake_java(folder: Path) -> None:
+    """
+    Puts the FlowDroid stand-in in the PATH as `java`.
+    """
+    bin_path = folder / "bin"
+    bin_path.mkdir()
+    java_path = bin_path / "java"
+    script_path = BENCHMARKS_PATH / "fake_flowdroid.py"
+    java_path.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script_path}" "$@"\n')
+    java_path.chmod(0o755)
+    os.environ["PATH"] = f"{bin_path}{os.pathsep}{os.environ['PATH']}"
+
+
+def _create_apks(folder: Path, amount: int, size: int) -> Path:
+    """
+    Creates `amount` apks of `size` bytes with different contents.
+    """
+    folder.mkdir()
+    for i in range(amount):
+        seed = f"apk-{i}".encode()
+        (folder / f"app{i}.apk").write_bytes((seed * (size // len(seed) + 1))[:size])
+    return folder
+
+
+def _timed(function: Callable, *args, **kwargs) -> float:
+    """
+    Runs a function returning its duration in seconds.
+    """
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _latency(durations: list) -> dict:
+    """
+    Summarizes a list of durations in seconds.
+    """
+    durations = sorted(durations)
+    percentiles = (
+        statistics.quantiles(durations, n=20, method="inclusive")
+        if len(durations) > 1
+        else []
+    )
+    return {
+        "count": len(durations),
+        "mean": statistics.fmean(durations) if durations else 0.0,
+        "p50": statistics.median(durations) if durations else 0.0,
+        "p95": percentiles[-1] if percentiles else durations[-1] if durations else 0.0,
+        "max": durations[-1] if durations else 0.0,
+    }
+
+
+def bench_parse(log_lines: int, leaks: int, repeat: int) -> dict:
+    """
+    Measures the speed of the FlowDroid log parser.
+    """
+    os.environ.update(FAKE_FLOWDROID_LATENCY="0", FAKE_FLOWDROID_LINES=str(log_lines))
+    os.environ["FAKE_FLOWDROID_LEAKS"] = str(leaks)
+    out = io.StringIO()
+    fake_flowdroid.analyze("app.apk", out)
+    log = out.getvalue()
+    lines = log.splitlines(keepends=True)
+
+    duration = min(_timed(parse_logs, lines) for _ in range(repeat))
+    return {
+        "lines": len(lines),
+        "bytes": len(log),
+        "seconds": duration,
+        "lines_per_second": len(lines) / duration,
+        "mb_per_second": len(log) / duration / (1 << 20),
+    }
+
+
+def bench_analysis(apks_path: Path, workers: int, use_server: bool) -> dict:
+    """
+    Measures the throughput of the analysis of a folder of apks.
+    """
+    start = time.perf_counter()
+    completions = []
+    server = pyflowdroid.AnalysisServer(workers) if use_server else None
+    with server or contextlib.nullcontext():
+        for _ in pyflowdroid.iter_analyze(
+            str(apks_path), workers=workers, server=server
+        ):
+            completions.append(time.perf_counter() - start)
+    duration = time.perf_counter() - start
+    return {
+        "workers": workers,
+        "server": use_server,
+        "apks": len(completions),
+        "seconds": duration,
+        "apks_per_minute": len(completions) / duration * 60,
+        "first_result_seconds": completions[0] if completions else None,
+    }
+
+
+def bench_stages(apks_path: Path, cache_path: Path, reports: int) -> dict:
+    """
+    Measures the latency of each stage of the analysis of a single apk.
+    """
+    apk_paths = sorted(str(p) for p in apks_path.glob("*.apk"))
+    cache = ResultCache(str(cache_path))
+
+    # Analysis with the cache empty, then answered from the cache
+    analysis = [_timed(pyflowdroid.analyze_apk, p, cache=cache) for p in apk_paths]
+    cached = [_timed(pyflowdroid.analyze_apk, p, cache=cache) for p in apk_paths]
+    no_logs = [_timed(pyflowdroid.analyze_apk, p, save_logs=False) for p in apk_paths]
+
+    # Aggregation of many results into the final report
+    results = dict(pyflowdroid.iter_analyze(str(apks_path), cache=cache))
+    many_results = {
+        f"{apk}-{i}": r for i in range(reports) for apk, r in results.items()
+    }
+    start = time.perf_counter()
+    generate_report(*pyflowdroid.quantify_leaks(many_results))
+    report = time.perf_counter() - start
+
+    return {
+        "analyze_apk": _latency(analysis),
+        "analyze_apk_without_logs": _latency(no_logs),
+        "analyze_apk_cached": _latency(cached),
+        "report": {"apks": len(many_results), "seconds": report},
+    }
+
+
+def bench_download(folder: Path, pages: int, apk_size: int, workers: int) -> dict:
+    """
+    Measures the crawl of the index of a store and the download of its apks.
+    """
+    with StoreServer(pages=pages, apk_size=apk_size) as store:
+        index_path = str(folder / "index.json")
+
+        # Crawl with no stored index, then revalidating the stored one
+        cold = _timed(
+            dict, CubapkProvider(base_url=store.url, index_path=index_path).iter_apks()
+        )
+        provider = CubapkProvider(
+            base_url=store.url, index_path=index_path, index_ttl=0
+        )
+        revalidated = _timed(dict, provider.iter_apks())
+
+        amount = pages * store.apks_per_page
+        provider = CubapkProvider(base_url=store.url, index_path=index_path)
+        download = _timed(
+            provider.download_apks, amount, str(folder / "apks"), workers=workers
+        )
+
+    return {
+        "pages": pages,
+        "index_cold_seconds": cold,
+        "index_revalidated_seconds": revalidated,
+        "apks": amount,
+        "workers": workers,
+        "download_seconds": download,
+        "download_mb_per_second": amount * apk_size / download / (1 << 20),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--apks", type=int, default=20, help="apks analyzed")
+    parser.add_argument("--apk-size", type=int, default=1 << 20, help="bytes per apk")
+    parser.add_argument("--workers", default="1,4", help="comma separated workers")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per apk")
+    parser.add_argument("--log-lines", type=int, default=2000, help="lines per log")
+    parser.add_argument("--leaks", type=int, default=2, help="leaks per apk")
+    parser.add_argument("--pages", type=int, default=5, help="pages of the store")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of the parser")
+    parser.add_argument("--output", default="", help="JSON file of the results")
+    args = parser.parse_args()
+    workers = [int(w) for w in args.workers.split(",")]
+    logging.disable(logging.CRITICAL)
+
+    results: dict = {
+        "meta": {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": vars(args),
+        }
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        _install_fake_java(folder)
+        results["parse"] = bench_parse(
+            args.log_lines * 10, args.leaks * 10, args.repeat
+        )
+
+        # Analysis benchmarks use the requested FlowDroid behaviour
+        os.environ.update(
+            FAKE_FLOWDROID_LATENCY=str(args.latency),
+            FAKE_FLOWDROID_LINES=str(args.log_lines),
+            FAKE_FLOWDROID_LEAKS=str(args.leaks),
+        )
+        apks_path = _create_apks(folder / "apks", args.apks, args.apk_size)
+        results["analysis"] = [
+            bench_analysis(apks_path, w, use_server)
+            for use_server in (False, True)
+            for w in workers
+        ]
+        results["stages"] = bench_stages(apks_path, folder / "cache", reports=1000)
+        results["download"] = bench_download(
+            folder / "store", args.pages, args.apk_size, max(workers)
+        )
+
+    # Peak memory of the benchmark and of its largest FlowDroid process (KB)
+    results["peak_rss_kb"] = {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
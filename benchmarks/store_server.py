@@ -0,0 +1,156 @@
+"""
+Local HTTP server mimicking the apk store crawled by `CubapkProvider`.
+
+It serves `pages` pages of the index with `apks_per_page` apks each. Every apk
+is `apk_size` bytes long and is downloaded through a redirection, like in the
+real store. Pages are served with an ETag so revalidations are answered with
+'304 Not Modified', and apks honour 'bytes=N-' ranges so interrupted
+downloads can be resumed.
+"""
+
+import re
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_PAGE_PATTERN = re.compile(r"^/store/\?page=(\d+)$")
+_REDIRECT_PATTERN = re.compile(r"^/go/(\d+)_(\d+)$")
+_APK_PATTERN = re.compile(r"^/dl/(\d+)_(\d+)$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d+)-$")
+
+
+class StoreServer:
+    """
+    Apk store served from a background thread.
+
+    Parameters
+    ----------
+    pages : int, optional
+        Number of pages of the index, by default 5.
+    apks_per_page : int, optional
+        Number of apks listed in each page, by default 10.
+    apk_size : int, optional
+        Size (in bytes) of each apk, by default 1 MB.
+    cut_at : int, optional
+        Bytes of each apk sent before the connection is closed, to test
+        interrupted downloads. It can be changed while the server runs. If 0,
+        apks are sent whole. By default 0.
+
+    Attributes
+    ----------
+    requests : list
+        Path and 'Range' header of every request received.
+    """
+
+    def __init__(
+        self,
+        pages: int = 5,
+        apks_per_page: int = 10,
+        apk_size: int = 1 << 20,
+        cut_at: int = 0,
+    ):
+        self.pages = pages
+        self.apks_per_page = apks_per_page
+        self.apk_size = apk_size
+        self.cut_at = cut_at
+        self.requests: list = []
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StoreServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _page(self, page: int) -> bytes:
+        apps = "".join(
+            f'<div class="app-data"><div class="app-title">App {page} {i}</div>'
+            f'<div class="app-meta"><a href="/go/{page}_{i}">Download</a></div></div>'
+            for i in range(self.apks_per_page)
+        )
+        return f"<html><body>{apps}</body></html>".encode()
+
+    def _handler(self) -> type:
+        return type("Handler", (_StoreHandler,), {"store": self})
+
+    def _apk(self, name: str) -> bytes:
+        # Use a different content per apk so they are not deduplicated
+        seed = name.encode()
+        return (seed * (self.apk_size // len(seed) + 1))[: self.apk_size]
+
+
+class _StoreHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the requests to a `StoreServer`, set as its `store`.
+    """
+
+    protocol_version = "HTTP/1.1"
+    store: StoreServer
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _reply(self, status: int, body: bytes = b"", **headers) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        # Announce the whole body but send only a part of it if requested
+        if self.store.cut_at and len(body) > self.store.cut_at:
+            body = body[: self.store.cut_at]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def _reply_page(self, page: int) -> None:
+        etag = f'"page-{page}"'
+        if page > self.store.pages:
+            self._reply(404)
+        elif self.headers.get("If-None-Match") == etag:
+            self._reply(304)
+        else:
+            self._reply(200, self.store._page(page), ETag=etag)
+
+    def _reply_apk(self, name: str) -> None:
+        content = self.store._apk(name)
+        match = _RANGE_PATTERN.match(self.headers.get("Range", ""))
+        if not match:
+            self._reply(200, content)
+            return
+
+        # Answer with the requested range, or with 416 if it is past the end
+        offset = int(match.group(1))
+        size = len(content)
+        if offset >= size:
+            self._reply(416, Content_Range=f"bytes */{size}")
+        else:
+            content_range = f"bytes {offset}-{size - 1}/{size}"
+            self._reply(206, content[offset:], Content_Range=content_range)
+
+    def do_GET(self) -> None:
+        self.store.requests.append((self.path, self.headers.get("Range")))
+        match = _PAGE_PATTERN.match(self.path)
+        if match:
+            self._reply_page(int(match.group(1)))
+            return
+
+        match = _REDIRECT_PATTERN.match(self.path)
+        if match:
+            self._reply(302, Location=f"/dl/{match.group(1)}_{match.group(2)}")
+            return
+
+        match = _APK_PATTERN.match(self.path)
+        if match:
+            self._reply_apk(f"{match.group(1)}_{match.group(2)}")
+            return
+
+        self._reply(404)
@@ -1,20 +1,74 @@
 import logging
-from pyflowdroid.download import fetch
+from pyflowdroid.download import fetch, fetch_async
 from pyflowdroid.install import install_deps
-from pyflowdroid.analyze import analyze, analyze_apk, generate_report
+from pyflowdroid.analyze import (
+    analyze,
+    analyze_apk,
+    iter_analyze,
+    quantify_leaks,
+    generate_report,
+    AnalysisServer,
+)
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.manifest import RunManifest
+from pyflowdroid.logstore import LogStore
+from pyflowdroid.database import ResultsDatabase
+from pyflowdroid.definitions import SourceSinkSet, load_sources_and_sinks
+from pyflowdroid.triage import Triage
+from pyflowdroid.workqueue import JobQueue, run_worker
+from pyflowdroid.scheduler import CostModel
+from pyflowdroid.platforms import PlatformProvider
+from pyflowdroid.discovery import ApkScanner
+from pyflowdroid.aio import analyze_apk_async, iter_analyze_async, analyze_async
+from pyflowdroid.pipeline import fetch_and_analyze, iter_fetch_and_analyze
+from pyflowdroid.report import ReportWriter, write_report
+from pyflowdroid.diff import analyze_apk_diff, diff_apks
+from pyflowdroid.results import ApkResult, Leak, parse_logs
+from pyflowdroid.metrics import Metrics, get_metrics, set_metrics
 
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    datefmt='%H:%M:%S'
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S",
 )
 
 __all__ = [
-    'fetch',
-    'install_deps',
-    'analyze',
-    'analyze_apk',
-    'generate_report',
+    "fetch",
+    "fetch_async",
+    "install_deps",
+    "analyze",
+    "analyze_apk",
+    "iter_analyze",
+    "quantify_leaks",
+    "generate_report",
+    "AnalysisServer",
+    "ResultCache",
+    "RunManifest",
+    "LogStore",
+    "ResultsDatabase",
+    "SourceSinkSet",
+    "load_sources_and_sinks",
+    "Triage",
+    "JobQueue",
+    "run_worker",
+    "CostModel",
+    "PlatformProvider",
+    "ApkScanner",
+    "analyze_async",
+    "analyze_apk_async",
+    "iter_analyze_async",
+    "fetch_and_analyze",
+    "iter_fetch_and_analyze",
+    "ReportWriter",
+    "write_report",
+    "analyze_apk_diff",
+    "diff_apks",
+    "ApkResult",
+    "Leak",
+    "parse_logs",
+    "Metrics",
+    "get_metrics",
+    "set_metrics",
 ]
 
-__version__ = '0.2.0'
\ No newline at end of file
+__version__ = "0.2.0"
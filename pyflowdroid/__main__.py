@@ -1,22 +1,414 @@
+import sys
 import typer
+import contextlib
 import pyflowdroid
-
+from pyflowdroid.analyze import _heap_per_worker
+from pyflowdroid.consts import (
+    DEFAULT_CACHE_FOLDER,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_REPORT_TOP,
+)
 
 app = typer.Typer()
 
 
 @app.command()
-def install():
-    pyflowdroid.install_deps()
+def install(
+    api_levels: str = typer.Option(
+        "", help="Only these comma separated Android API levels"
+    ),
+    force: bool = typer.Option(False, "--force", help="Reinstall an intact install"),
+    verify: bool = typer.Option(
+        False, "--verify", help="Check the hashes of the installed files"
+    ),
+    flowdroid_sha256: str = typer.Option("", help="Expected FlowDroid jar SHA-256"),
+    android_sha256: str = typer.Option("", help="Expected Android zip SHA-256"),
+):
+    levels = [int(level) for level in _split(api_levels)] if api_levels else None
+    pyflowdroid.install_deps(
+        levels,
+        force,
+        verify,
+        flowdroid_sha256=flowdroid_sha256,
+        android_sha256=android_sha256,
+    )
+
+
+def _split(values: str):
+    return [value.strip() for value in values.split(",")] if values else None
+
+
+def _report(results, report_format: str, output: str, top: int):
+    if not (report_format or output):
+        total, leaks, leaky_apps = pyflowdroid.quantify_leaks(results)
+        typer.echo(pyflowdroid.generate_report(total, leaks, leaky_apps))
+        return
+    with contextlib.ExitStack() as stack:
+        out = sys.stdout
+        if output:
+            out = stack.enter_context(open(output, "w", newline=""))
+        pyflowdroid.write_report(results, out, report_format or "text", top)
+
+
+def _platforms(lazy: bool, mirror: str):
+    if lazy or mirror:
+        return pyflowdroid.PlatformProvider(mirror=mirror)
+    return None
+
 
 @app.command()
-def analyze(path: str):
-    total, leaks, leaky_apps = pyflowdroid.analyze(path)
-    typer.echo(pyflowdroid.generate_report(total, leaks, leaky_apps))
+def categories(sources_and_sinks: str = typer.Argument("small.txt")):
+    definitions = pyflowdroid.load_sources_and_sinks(sources_and_sinks)
+    typer.echo(f"{'CATEGORY':<24}{'SOURCES':>10}{'SINKS':>10}")
+    for category, (sources, sinks) in definitions.categories().items():
+        typer.echo(f"{category:<24}{sources:>10}{sinks:>10}")
+
+
+@app.command()
+def analyze(
+    path: str,
+    sources_and_sinks: str = typer.Option(
+        "", help="Sources and sinks file, or small.txt / large.txt"
+    ),
+    source_categories: str = typer.Option(
+        "", help="Only sources of these comma separated categories"
+    ),
+    sink_categories: str = typer.Option(
+        "", help="Only sinks of these comma separated categories"
+    ),
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", min=1, help="FlowDroid processes run at once"
+    ),
+    max_heap: int = typer.Option(0, help="Total JVM heap (MB) shared by all jobs"),
+    cache_dir: str = typer.Option(
+        str(DEFAULT_CACHE_FOLDER), help="Result cache folder"
+    ),
+    cache_size: int = typer.Option(DEFAULT_CACHE_SIZE, help="Max cache size (MB)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Do not use the cache"),
+    refresh: bool = typer.Option(False, "--refresh", help="Ignore cached results"),
+    timeout: int = typer.Option(0, help="Max seconds per apk (0 = no limit)"),
+    max_rss: int = typer.Option(0, help="Max memory (MB) per apk (0 = no limit)"),
+    server: bool = typer.Option(False, "--server", help="Reuse warm FlowDroid JVMs"),
+    manifest: str = typer.Option("", help="Record each apk result in this file"),
+    resume: bool = typer.Option(False, "--resume", help="Skip apks in the manifest"),
+    retry_failed: bool = typer.Option(
+        False, "--retry-failed", help="Like --resume, but retrying failed apks"
+    ),
+    metrics: str = typer.Option(
+        "", help="Write metrics to this file (JSON if .json, else Prometheus)"
+    ),
+    log_store: str = typer.Option("", help="Save compressed logs in this folder"),
+    log_compression: str = typer.Option("gzip", help="Log compression (gzip or zstd)"),
+    log_store_size: int = typer.Option(0, help="Max log store size (MB, 0 = no limit)"),
+    database: str = typer.Option("", help="Record the results in this SQLite file"),
+    triage: str = typer.Option(
+        "", help="Skip or defer (skip / defer) apks that cannot leak anything"
+    ),
+    queue: str = typer.Option("", help="Send the apks to the workers of this queue"),
+    schedule: bool = typer.Option(
+        False, "--schedule", help="Analyze the biggest apks first, learning costs"
+    ),
+    lazy_platforms: bool = typer.Option(
+        False, "--lazy-platforms", help="Fetch each apk's Android platform on demand"
+    ),
+    platform_mirror: str = typer.Option(
+        "", help="Zip, folder or url the platforms are fetched from"
+    ),
+    include: str = typer.Option("*.apk", help="Comma separated patterns to analyze"),
+    exclude: str = typer.Option("", help="Comma separated patterns to ignore"),
+    follow_symlinks: bool = typer.Option(
+        False, "--follow-symlinks", help="Follow links to files and folders"
+    ),
+    max_depth: int = typer.Option(-1, help="Max subfolder depth (-1 = no limit)"),
+    snapshot: str = typer.Option(
+        "", help="Only analyze apks new or modified since this snapshot file"
+    ),
+    report_format: str = typer.Option(
+        "", help="Stream the report as text, json, csv or sarif"
+    ),
+    output: str = typer.Option("", help="Write the report to this file"),
+    top: int = typer.Option(
+        DEFAULT_REPORT_TOP, help="Entries of each ranking of the report"
+    ),
+):
+    definitions = sources_and_sinks
+    if source_categories or sink_categories:
+        definitions = pyflowdroid.load_sources_and_sinks(sources_and_sinks).select(
+            _split(source_categories), _split(sink_categories)
+        )
+    cache = None if no_cache else pyflowdroid.ResultCache(cache_dir, cache_size)
+    run_manifest = pyflowdroid.RunManifest(manifest) if manifest else None
+    store = None
+    if log_store:
+        store = pyflowdroid.LogStore(
+            log_store, log_compression, max_size=log_store_size
+        )
+    with contextlib.ExitStack() as stack:
+        if metrics:
+            registry = pyflowdroid.set_metrics(pyflowdroid.Metrics())
+            stack.callback(registry.write, metrics)
+        job_queue = None
+        if queue:
+            job_queue = stack.enter_context(pyflowdroid.JobQueue(queue))
+        results_database = None
+        if database:
+            results_database = stack.enter_context(
+                pyflowdroid.ResultsDatabase(database)
+            )
+        analysis_server = None
+        if server:
+            analysis_server = stack.enter_context(
+                pyflowdroid.AnalysisServer(jobs, _heap_per_worker(max_heap, jobs))
+            )
+        results = pyflowdroid.iter_analyze(
+            path,
+            definitions,
+            workers=jobs,
+            max_heap=max_heap,
+            cache=cache,
+            refresh=refresh,
+            timeout=timeout,
+            max_rss=max_rss,
+            server=analysis_server,
+            manifest=run_manifest,
+            resume=resume,
+            retry_failed=retry_failed,
+            log_store=store,
+            database=results_database,
+            triage=triage,
+            queue=job_queue,
+            cost_model=pyflowdroid.CostModel() if schedule else None,
+            platforms=_platforms(lazy_platforms, platform_mirror),
+            scanner=pyflowdroid.ApkScanner(
+                _split(include),
+                _split(exclude) or (),
+                follow_symlinks,
+                max_depth,
+                snapshot,
+            ),
+        )
+        _report(results, report_format, output, top)
+
+
+@app.command()
+def run(
+    path: str = typer.Argument("apks", help="Folder the apks are downloaded to"),
+    provider: str = typer.Option("cubapk.com", help="Provider of the apks"),
+    amount: int = typer.Option(10, help="Apks downloaded and analyzed"),
+    sources_and_sinks: str = typer.Option(
+        "", help="Sources and sinks file, or small.txt / large.txt"
+    ),
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", min=1, help="FlowDroid processes run at once"
+    ),
+    download_jobs: int = typer.Option(1, help="Apks downloaded at once"),
+    buffer: int = typer.Option(0, help="Downloaded apks waiting at most (0 = jobs)"),
+    delete_apks: bool = typer.Option(
+        False, "--delete-apks", help="Delete each downloaded apk once analyzed"
+    ),
+    max_heap: int = typer.Option(0, help="Total JVM heap (MB) shared by all jobs"),
+    cache_dir: str = typer.Option(
+        str(DEFAULT_CACHE_FOLDER), help="Result cache folder"
+    ),
+    cache_size: int = typer.Option(DEFAULT_CACHE_SIZE, help="Max cache size (MB)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Do not use the cache"),
+    timeout: int = typer.Option(0, help="Max seconds per apk (0 = no limit)"),
+    max_rss: int = typer.Option(0, help="Max memory (MB) per apk (0 = no limit)"),
+    server: bool = typer.Option(False, "--server", help="Reuse warm FlowDroid JVMs"),
+    manifest: str = typer.Option("", help="Record each apk result in this file"),
+    metrics: str = typer.Option(
+        "", help="Write metrics to this file (JSON if .json, else Prometheus)"
+    ),
+    database: str = typer.Option("", help="Record the results in this SQLite file"),
+    lazy_platforms: bool = typer.Option(
+        False, "--lazy-platforms", help="Fetch each apk's Android platform on demand"
+    ),
+    platform_mirror: str = typer.Option(
+        "", help="Zip, folder or url the platforms are fetched from"
+    ),
+    report_format: str = typer.Option(
+        "", help="Stream the report as text, json, csv or sarif"
+    ),
+    output: str = typer.Option("", help="Write the report to this file"),
+    top: int = typer.Option(
+        DEFAULT_REPORT_TOP, help="Entries of each ranking of the report"
+    ),
+):
+    cache = None if no_cache else pyflowdroid.ResultCache(cache_dir, cache_size)
+    run_manifest = pyflowdroid.RunManifest(manifest) if manifest else None
+    with contextlib.ExitStack() as stack:
+        if metrics:
+            registry = pyflowdroid.set_metrics(pyflowdroid.Metrics())
+            stack.callback(registry.write, metrics)
+        results_database = None
+        if database:
+            results_database = stack.enter_context(
+                pyflowdroid.ResultsDatabase(database)
+            )
+        analysis_server = None
+        if server:
+            analysis_server = stack.enter_context(
+                pyflowdroid.AnalysisServer(jobs, _heap_per_worker(max_heap, jobs))
+            )
+        results = pyflowdroid.iter_fetch_and_analyze(
+            amount,
+            provider,
+            path,
+            sources_and_sinks,
+            workers=jobs,
+            max_heap=max_heap,
+            cache=cache,
+            timeout=timeout,
+            max_rss=max_rss,
+            server=analysis_server,
+            manifest=run_manifest,
+            database=results_database,
+            platforms=_platforms(lazy_platforms, platform_mirror),
+            download_workers=download_jobs,
+            buffer_size=buffer,
+            delete_apks=delete_apks,
+        )
+        _report(results, report_format, output, top)
+
 
 @app.command()
-def download(amount:int, path: str, provider: str):
-    pyflowdroid.fetch(amount, provider, path)
-    typer.echo(f"Downloaded {amount} apks from {provider}")
-    
-app()
\ No newline at end of file
+def worker(
+    queue: str,
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", min=1, help="FlowDroid processes run at once"
+    ),
+    max_heap: int = typer.Option(0, help="Total JVM heap (MB) shared by all jobs"),
+    cache_dir: str = typer.Option(
+        str(DEFAULT_CACHE_FOLDER), help="Result cache folder"
+    ),
+    cache_size: int = typer.Option(DEFAULT_CACHE_SIZE, help="Max cache size (MB)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Do not use the cache"),
+    server: bool = typer.Option(False, "--server", help="Reuse warm FlowDroid JVMs"),
+    keep_waiting: bool = typer.Option(
+        False, "--wait", help="Wait for new jobs instead of exiting when idle"
+    ),
+    lazy_platforms: bool = typer.Option(
+        False, "--lazy-platforms", help="Fetch each apk's Android platform on demand"
+    ),
+    platform_mirror: str = typer.Option(
+        "", help="Zip, folder or url the platforms are fetched from"
+    ),
+):
+    cache = None if no_cache else pyflowdroid.ResultCache(cache_dir, cache_size)
+    with contextlib.ExitStack() as stack:
+        job_queue = stack.enter_context(pyflowdroid.JobQueue(queue))
+        analysis_server = None
+        if server:
+            analysis_server = stack.enter_context(
+                pyflowdroid.AnalysisServer(jobs, _heap_per_worker(max_heap, jobs))
+            )
+        analyzed = pyflowdroid.run_worker(
+            job_queue,
+            jobs,
+            keep_waiting=keep_waiting,
+            max_heap=_heap_per_worker(max_heap, jobs),
+            cache=cache,
+            server=analysis_server,
+            platforms=_platforms(lazy_platforms, platform_mirror),
+        )
+    typer.echo(f"Analyzed {analyzed} apks from {queue}")
+
+
+@app.command()
+def diff(
+    old_apk: str,
+    new_apk: str,
+    sources_and_sinks: str = typer.Option(
+        "", help="Sources and sinks file, or small.txt / large.txt"
+    ),
+    full: bool = typer.Option(
+        False, "--full", help="Fully analyze the new apk if its code changed"
+    ),
+    max_heap: int = typer.Option(0, help="JVM heap (MB) of FlowDroid"),
+    cache_dir: str = typer.Option(
+        str(DEFAULT_CACHE_FOLDER), help="Result cache folder"
+    ),
+    cache_size: int = typer.Option(DEFAULT_CACHE_SIZE, help="Max cache size (MB)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Do not use the cache"),
+    timeout: int = typer.Option(0, help="Max seconds per apk (0 = no limit)"),
+    max_rss: int = typer.Option(0, help="Max memory (MB) per apk (0 = no limit)"),
+    lazy_platforms: bool = typer.Option(
+        False, "--lazy-platforms", help="Fetch each apk's Android platform on demand"
+    ),
+    platform_mirror: str = typer.Option(
+        "", help="Zip, folder or url the platforms are fetched from"
+    ),
+):
+    cache = None if no_cache else pyflowdroid.ResultCache(cache_dir, cache_size)
+    result = pyflowdroid.analyze_apk_diff(
+        old_apk,
+        new_apk,
+        sources_and_sinks,
+        max_heap=max_heap,
+        cache=cache,
+        timeout=timeout,
+        max_rss=max_rss,
+        platforms=_platforms(lazy_platforms, platform_mirror),
+        restrict_scope=not full,
+    )
+    if result.diff is not None:
+        changes = result.diff
+        typer.echo(
+            f"Classes: {len(changes.added)} added, {len(changes.removed)} removed, "
+            f"{len(changes.modified)} modified"
+        )
+    typer.echo(f"Analysis: {result.mode} ({result.result.status})")
+    typer.echo(f"Leaks: {result.old_result.leak_count} -> {result.result.leak_count}")
+    for sign, leaks in (("+", result.new_leaks), ("-", result.resolved_leaks)):
+        for leak in leaks:
+            typer.echo(f" {sign} {leak.method}: {leak.source} -> {leak.sink}")
+
+
+@app.command()
+def logs(log_store: str, apk: str):
+    store = pyflowdroid.LogStore(log_store)
+    key = store.key(apk)
+    if key not in store:
+        typer.echo(f"No logs of {apk} in {log_store}", err=True)
+        raise typer.Exit(1)
+    for line in store.read(key):
+        typer.echo(line, nl=False)
+
+
+@app.command()
+def query(
+    database: str,
+    sink: str = typer.Option(None, help="Prefix of the sink method signature"),
+    source: str = typer.Option(None, help="Prefix of the source method signature"),
+    run: int = typer.Option(None, help="Only results of this run"),
+    leaks: bool = typer.Option(False, "--leaks", help="List leaks, not only apks"),
+):
+    with pyflowdroid.ResultsDatabase(database) as results_database:
+        filters = dict(sink=sink, source=source, run_id=run)
+        if leaks:
+            for leak in results_database.leaks(**filters):
+                typer.echo(f"{leak['apk']}\t{leak['source']}\t{leak['sink']}")
+        else:
+            for apk in results_database.leaky_apks(**filters):
+                typer.echo(apk)
+
+
+@app.command()
+def download(
+    amount: int,
+    path: str,
+    provider: str,
+    jobs: int = typer.Option(1, "--jobs", "-j", min=1, help="Apks downloaded at once"),
+    metrics: str = typer.Option(
+        "", help="Write metrics to this file (JSON if .json, else Prometheus)"
+    ),
+):
+    with contextlib.ExitStack() as stack:
+        if metrics:
+            registry = pyflowdroid.set_metrics(pyflowdroid.Metrics())
+            stack.callback(registry.write, metrics)
+        downloaded = pyflowdroid.fetch(amount, provider, path, workers=jobs)
+    typer.echo(f"Downloaded {downloaded} apks from {provider}")
+
+
+app()
@@ -1,91 +1,546 @@
-import random
-import progressbar
+import os
+import time
+import asyncio
+import signal
+import hashlib
+import functools
+import threading
 import subprocess
+from collections import deque
+from typing import IO, Callable, Optional
+from pyflowdroid.metrics import Metrics, get_metrics, _timed_calls
 
 
-class ProgressBar:
+def cli_header(msg: str, char: str = "#", lenght: int = 80) -> str:
+    """
+    Returns a header with the given message.
+
+    Parameters
+    ----------
+    msg : str
+        Message that is going to be printed.
+    char : str
+        Character that is going to be used to fill the header.
+    lenght : int
+        Lenght of the header.
+
+
+    Returns
+    -------
+    str
+        Header.
+    """
+
+    lp = int(0.5 * (lenght - 2 - len(msg)))  # left padding
+    rp = lenght - len(msg) - lp - 2  # right padding
+    return f'{"#" * 80}\n{"#"+" " * rp}{msg}{" " * lp + "#"}\n{"#" * lenght}\n'
+
+
+# Reasons why `_run_command` kills a command
+KILLED_BY_TIMEOUT = "timeout"
+KILLED_BY_MEMORY = "memory"
+
+# Seconds between two checks of the watchdog of `_run_command`
+WATCHDOG_INTERVAL = 1.0
+
+# Longest line read from the output of `_run_command_async`
+ASYNC_LINE_LIMIT = 1 << 24
+
+
+class CommandResult:
+    """
+    Compact result of a command executed with `_run_command`.
+
+    Parameters
+    ----------
+    returncode : int
+        Exit code of the command.
+    tail : list, optional
+        Last lines of the output of the command.
+    log_path : str, optional
+        Path to the file with the full output of the command, if it was saved.
+    killed_by : str, optional
+        Limit that made `_run_command` kill the command ('timeout' or
+        'memory'), or None if the command was not killed.
+    """
+
+    __slots__ = ("returncode", "tail", "log_path", "killed_by")
+
+    def __init__(
+        self,
+        returncode: int,
+        tail: Optional[list] = None,
+        log_path: Optional[str] = None,
+        killed_by: Optional[str] = None,
+    ):
+        self.returncode = returncode
+        self.tail = tail or []
+        self.log_path = log_path
+        self.killed_by = killed_by
+
+    def __repr__(self) -> str:
+        return (
+            f"CommandResult(returncode={self.returncode}, "
+            f"log_path={self.log_path!r}, killed_by={self.killed_by!r})"
+        )
+
+
+def _process_group_rss(pgid: int) -> int:
     """
-    Progress bar call back that can be used with urlib.requests.urlretreive.
+    Computes the resident memory of all the processes in a process group.
 
-    Base code taken from:
-    https://stackoverflow.com/questions/37748105/how-to-use-progressbar-module-with-urlretrieve
+    Only Linux is supported, since the memory is read from '/proc'.
+
+    Parameters
+    ----------
+    pgid : int
+        Id of the process group.
+
+    Returns
+    -------
+    int
+        Resident memory (in bytes) of the process group.
     """
+    total = 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
 
-    def __init__(self):
-        self.pbar = None
-        self.progress = 0
+        # Fields after the command name, which may contain spaces
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
 
-    def _update_progress_bar(self, downloaded, total_size):
+        # fields[2] is the process group and fields[21] the rss in pages
+        if int(fields[2]) == pgid:
+            total += int(fields[21]) * page_size
+    return total
 
-        # Checks if the download is not finished and updates the progress bar
-        # with the current progress
-        if downloaded < total_size:
-            self.pbar.update(downloaded)
 
-        # In case is finished, finishes the progress bar
+def _kill_process_tree(process: subprocess.Popen) -> None:
+    """
+    Kills a process started by `_run_command` together with its children.
+
+    Parameters
+    ----------
+    process : subprocess.Popen
+        Process to be killed.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _watch_process(
+    process: subprocess.Popen,
+    stop: threading.Event,
+    killed_by: list,
+    timeout: float,
+    max_rss: int,
+) -> None:
+    """
+    Kills a process when it runs out of time or memory.
+
+    Parameters
+    ----------
+    process : subprocess.Popen
+        Process to be watched. It must be the leader of its process group.
+    stop : threading.Event
+        Event set when the process is no longer to be watched.
+    killed_by : list
+        List where the reason to kill the process is appended.
+    timeout : float
+        Maximum time (in seconds) the process can run. 0 means no limit.
+    max_rss : int
+        Maximum resident memory (in MB) of the process group. 0 means no limit.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if timeout and time.monotonic() >= deadline:
+            killed_by.append(KILLED_BY_TIMEOUT)
+        elif max_rss and _process_group_rss(process.pid) > max_rss * 1024 * 1024:
+            killed_by.append(KILLED_BY_MEMORY)
         else:
-            self.pbar.finish()
+            wait_time = WATCHDOG_INTERVAL
+            if timeout:
+                wait_time = min(wait_time, max(deadline - time.monotonic(), 0))
+            if stop.wait(wait_time):
+                return
+            continue
 
-    def __call__(self, block_num, block_size, total_size):
+        _kill_process_tree(process)
+        return
 
-        # Define max_val according to the total size of the file if it's known
-        max_val = total_size if total_size > 0 else 100
 
-        # Create a progress bar in the first call
-        if not self.pbar:
-            self.pbar = progressbar.ProgressBar(maxval=max_val)
-            self.pbar.start()
+class _CommandOutput:
+    """
+    Handles the output of a command executed with `_run_command` or
+    `_run_command_async`, line by line.
+
+    Each line is written to the log file and passed to `on_line`, and the last
+    ones are kept for the result. The handling is timed when metrics are
+    enabled.
 
-        # Update the progress if we know the total download size
-        if total_size > 0:
-            self.progress = block_num * block_size
+    Parameters
+    ----------
+    log_path : str, optional
+        Path to the file where the output is saved.
+    on_line : Callable[[str], None], optional
+        Function called with each line of the output.
+    tail_size : int
+        Number of lines kept from the end of the output.
+    log_file : file object, optional
+        Already open file where the output is written instead of `log_path`.
+    """
 
-        # Fake the progress if we don't know the total download size
+    def __init__(
+        self,
+        log_path: Optional[str],
+        on_line: Optional[Callable[[str], None]],
+        tail_size: int,
+        log_file: Optional[IO[str]],
+    ):
+        self.log_path = log_path
+        self.tail: deque = deque(maxlen=tail_size)
+        self.killed_by: list = []
+        self._own_file = open(log_path, "w") if log_path is not None else None
+        log_file = self._own_file or log_file
+        self._write = log_file.write if log_file is not None else None
+        self._on_line = on_line
+
+        # Time the handling of the output only when metrics are enabled
+        self._metrics = get_metrics()
+        self._stage_times: dict = {}
+        if self._metrics.enabled:
+            if self._write is not None:
+                self._write = _timed_calls(self._write, self._stage_times, "log_write")
+            if self._on_line is not None:
+                self._on_line = _timed_calls(
+                    self._on_line, self._stage_times, "log_parse"
+                )
+        self._start = time.perf_counter()
+        self._first_output: Optional[float] = None
+
+    def add(self, line: str) -> None:
+        """
+        Handles a line of the output, including its line break.
+        """
+        if self._first_output is None:
+            self._first_output = time.perf_counter()
+        if self._write is not None:
+            self._write(line)
+        line = line.rstrip("\n")
+        self.tail.append(line)
+        if self._on_line is not None:
+            self._on_line(line)
+
+    def close(self) -> None:
+        """
+        Closes the log file, if it was opened by this object.
+        """
+        if self._own_file is not None:
+            self._own_file.close()
+
+    def result(self, returncode: int) -> CommandResult:
+        """
+        Builds the result of the command, recording its metrics.
+        """
+        killed = self.killed_by[0] if self.killed_by else None
+        if self._metrics.enabled:
+            _record_command_metrics(
+                self._metrics,
+                self._start,
+                self._first_output,
+                self._stage_times,
+                killed,
+            )
+        return CommandResult(returncode, list(self.tail), self.log_path, killed)
+
+
+def _run_command(
+    args: list,
+    log_path: Optional[str] = None,
+    on_line: Optional[Callable[[str], None]] = None,
+    timeout: float = 0,
+    max_rss: int = 0,
+    tail_size: int = 20,
+    log_file: Optional[IO[str]] = None,
+) -> CommandResult:
+    """
+    Runs a command in a subprocess, without a shell, streaming its output
+    line by line.
+
+    The output is never fully loaded in memory: each line is written to
+    `log_path` (if given) and passed to `on_line` (if given) as soon as the
+    command prints it.
+
+    If `timeout` or `max_rss` are given, a watchdog kills the command and all
+    its children when one of the limits is reached.
+
+    Parameters
+    ----------
+    args : list
+        Program and arguments of the command.
+    log_path : str, optional
+        Path to the file where the output is saved, by default None.
+    on_line : Callable[[str], None], optional
+        Function called with each line of the output, by default None.
+    timeout : float, optional
+        Maximum time (in seconds) the command can run. If 0, there is no
+        limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of the command and its children. Only
+        supported in Linux. If 0, there is no limit. By default 0.
+    tail_size : int, optional
+        Number of lines kept from the end of the output, by default 20.
+    log_file : file object, optional
+        Already open file where the output is written instead of `log_path`.
+        It is not closed when the command finishes. By default None.
+
+    Returns
+    -------
+    CommandResult
+        Compact result of the command.
+    """
+    output = _CommandOutput(log_path, on_line, tail_size, log_file)
+    stop = threading.Event()
+    watched = bool(timeout or max_rss)
+
+    try:
+        # Watched commands run in their own process group to kill them as a
+        # whole, including their children
+        with subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            start_new_session=watched,
+        ) as process:
+            if watched:
+                watchdog = threading.Thread(
+                    target=_watch_process,
+                    args=(process, stop, output.killed_by, timeout, max_rss),
+                    daemon=True,
+                )
+                watchdog.start()
+
+            try:
+                for line in process.stdout:
+                    output.add(line)
+            except BaseException:
+                if watched:
+                    _kill_process_tree(process)
+                raise
+    finally:
+        stop.set()
+        output.close()
+
+    return output.result(process.returncode)
+
+
+async def _watch_process_async(
+    process: asyncio.subprocess.Process,
+    killed_by: list,
+    timeout: float,
+    max_rss: int,
+) -> None:
+    """
+    Asyncio counterpart of `_watch_process`, cancelled when the process is no
+    longer to be watched.
+
+    Parameters
+    ----------
+    process : asyncio.subprocess.Process
+        Process to be watched. It must be the leader of its process group.
+    killed_by : list
+        List where the reason to kill the process is appended.
+    timeout : float
+        Maximum time (in seconds) the process can run. 0 means no limit.
+    max_rss : int
+        Maximum resident memory (in MB) of the process group. 0 means no limit.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if timeout and time.monotonic() >= deadline:
+            killed_by.append(KILLED_BY_TIMEOUT)
+        elif max_rss and (
+            await asyncio.to_thread(_process_group_rss, process.pid)
+            > max_rss * 1024 * 1024
+        ):
+            killed_by.append(KILLED_BY_MEMORY)
         else:
-            fake_remaining = max_val - self.progress
-            self.progress = random.random() * fake_remaining / 3
+            wait_time = WATCHDOG_INTERVAL
+            if timeout:
+                wait_time = min(wait_time, max(deadline - time.monotonic(), 0))
+            await asyncio.sleep(wait_time)
+            continue
 
-        # Updates the status of the progress bar
-        self._update_progress_bar(self.progress, max_val)
+        _kill_process_tree(process)
+        return
 
 
-def cli_header(msg: str, char: str = "#", lenght: int = 80) -> str:
+async def _run_command_async(
+    args: list,
+    log_path: Optional[str] = None,
+    on_line: Optional[Callable[[str], None]] = None,
+    timeout: float = 0,
+    max_rss: int = 0,
+    tail_size: int = 20,
+    log_file: Optional[IO[str]] = None,
+) -> CommandResult:
     """
-    Returns a header with the given message.
+    Asyncio counterpart of `_run_command`, running the command without
+    blocking the event loop.
+
+    The command always runs in its own process group. It is killed together
+    with all its children when a limit is reached or when the task running
+    this coroutine is cancelled, and it is waited for before returning, so no
+    process outlives the task.
 
     Parameters
     ----------
-    msg : str
-        Message that is going to be printed.
-    char : str
-        Character that is going to be used to fill the header.
-    lenght : int
-        Lenght of the header.
+    args : list
+        Program and arguments of the command.
+    log_path : str, optional
+        Path to the file where the output is saved, by default None.
+    on_line : Callable[[str], None], optional
+        Function called with each line of the output, by default None.
+    timeout : float, optional
+        Maximum time (in seconds) the command can run. If 0, there is no
+        limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of the command and its children. Only
+        supported in Linux. If 0, there is no limit. By default 0.
+    tail_size : int, optional
+        Number of lines kept from the end of the output, by default 20.
+    log_file : file object, optional
+        Already open file where the output is written instead of `log_path`.
+        It is not closed when the command finishes. By default None.
+
+    Returns
+    -------
+    CommandResult
+        Compact result of the command.
+    """
+    output = _CommandOutput(log_path, on_line, tail_size, log_file)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *map(str, args),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+            limit=ASYNC_LINE_LIMIT,
+        )
+        watchdog = None
+        if timeout or max_rss:
+            watchdog = asyncio.ensure_future(
+                _watch_process_async(process, output.killed_by, timeout, max_rss)
+            )
+
+        try:
+            async for raw_line in process.stdout:
+                output.add(raw_line.decode(errors="replace"))
+            await process.wait()
+
+        # Never leave the command running, even if the task is cancelled
+        except BaseException:
+            _kill_process_tree(process)
+            await asyncio.shield(process.wait())
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+    finally:
+        output.close()
+
+    return output.result(process.returncode)
+
+
+def _record_command_metrics(
+    metrics: Metrics,
+    start: float,
+    first_output: Optional[float],
+    stage_times: dict,
+    killed: Optional[str],
+) -> None:
+    """
+    Records the metrics of a command executed with `_run_command`.
+
+    Parameters
+    ----------
+    metrics : Metrics
+        Registry where the metrics are recorded.
+    start : float
+        Value of `time.perf_counter` when the command started.
+    first_output : float, optional
+        Value of `time.perf_counter` when the command printed its first line,
+        if it printed any.
+    stage_times : dict
+        Seconds spent in each stage of the handling of the output.
+    killed : str, optional
+        Limit that made `_run_command` kill the command, if any.
+    """
+    metrics.observe("pyflowdroid_command_seconds", time.perf_counter() - start)
+    if first_output is not None:
+        metrics.observe(
+            "pyflowdroid_stage_seconds", first_output - start, stage="startup"
+        )
+    for stage, seconds in stage_times.items():
+        metrics.observe("pyflowdroid_stage_seconds", seconds, stage=stage)
+    if killed is not None:
+        metrics.increment("pyflowdroid_commands_killed_total", reason=killed)
+
 
+def _hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 hash of a file without loading it fully in memory.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    chunk_size : int, optional
+        Size (in bytes) of the chunks read from the file, by default 1MB.
 
     Returns
     -------
     str
-        Header.
+        Hexadecimal digest of the file content.
     """
-    
-    lp = int(0.5 * (lenght - 2 - len(msg)))  # left padding
-    rp = lenght - len(msg) - lp - 2  # right padding
-    return f'{"#" * 80}\n{"#"+" " * rp}{msg}{" " * lp + "#"}\n{"#" * lenght}\n'
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def _run_command(cmd: str) -> str:
+@functools.lru_cache(maxsize=256)
+def _hash_file_cached(path: str, size: int, mtime_ns: int) -> str:
+    return _hash_file(path)
+
+
+def _hash_file_once(path: str) -> str:
     """
-    Runs a command in a subprocess and returns the output.
+    Computes the SHA-256 hash of a file only once while it is not modified.
+
+    Hashes are memoized on the path, size and modification time of the file,
+    so the cache, the log store, the manifest and the other components that
+    key their entries on the content of an apk share a single read of it.
 
     Parameters
     ----------
-    cmd : str
-        Command that is going to be executed.
+    path : str
+        Path to the file.
 
     Returns
     -------
     str
-        Output returned by the command.
+        Hexadecimal digest of the file content.
     """
-    return subprocess.getoutput(cmd)
+    stat = os.stat(path)
+    return _hash_file_cached(str(path), stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,365 @@
+import time
+import asyncio
+import logging
+import contextlib
+import itertools
+from pathlib import Path
+from typing import AsyncIterator, Optional, Union
+from pyflowdroid._cli_tools import _run_command_async
+from pyflowdroid.analyze import (
+    _analysis_target,
+    _cached_result,
+    _find_apks,
+    _flowdroid_command,
+    _flowdroid_result,
+    _heap_per_worker,
+    _log_destination,
+    _record_apk_metrics,
+    quantify_leaks,
+)
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.logstore import LogStore
+from pyflowdroid.manifest import RunManifest
+from pyflowdroid.metrics import get_metrics
+from pyflowdroid.platforms import PlatformProvider
+from pyflowdroid.definitions import SourceSinkSet, resolve_sources_and_sinks
+from pyflowdroid.results import ApkResult, LogParser, STATUS_OK
+from pyflowdroid.consts import (
+    PYFLOWDROID_PATH,
+    DEFAULT_APK_FOLDER_NAME,
+    ANDROID_FOLDER_NAME,
+    DEFAULT_QUEUE_FACTOR,
+)
+
+
+async def analyze_apk_async(
+    path: str,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    log_store: Optional[LogStore] = None,
+    platforms: Optional[PlatformProvider] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> ApkResult:
+    """
+    Execute FlowDroid analysis in an APK file without blocking the event
+    loop.
+
+    FlowDroid runs in an asyncio subprocess, and the disk accesses of the
+    cache and the platforms run in threads. If the task is cancelled,
+    FlowDroid is killed together with its children before the cancellation
+    propagates.
+
+    Parameters
+    ----------
+    path : str
+        Path-like object pointing to the apk file.
+    sources_and_sinks : path, optional
+        Sources and sinks file, 'small.txt' (the default) or 'large.txt', or
+        a `SourceSinkSet`, as in `analyze_apk`.
+    save_logs : bool, optional
+        Defines whether or not save raw logs from FlowDroid, by default True
+    max_heap : int, optional
+        Maximum heap size (in MB) of the FlowDroid JVM. If 0, the JVM default
+        is used. By default 0.
+    cache : ResultCache, optional
+        Cache used to skip the analysis of already analyzed apks. If None, the
+        analysis always runs. By default None.
+    refresh : bool, optional
+        Defines whether or not ignore the cached results and analyze the apk
+        again, updating the cache, by default False.
+    timeout : int, optional
+        Maximum time (in seconds) FlowDroid can run on an apk. If 0, there is
+        no limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of the FlowDroid process tree. If 0,
+        there is no limit. By default 0.
+    log_store : LogStore, optional
+        Compressed store where the raw logs are saved instead of the '.log'
+        file next to the apk, by default None.
+    platforms : PlatformProvider, optional
+        Provider of the Android platform of the API level of the apk, fetched
+        on demand. If None, all the installed platforms are used. By default
+        None.
+    semaphore : asyncio.Semaphore, optional
+        Semaphore held while FlowDroid runs, to limit the number of JVMs
+        running at the same time across calls. Cached results do not wait for
+        it. By default None.
+
+    Returns
+    -------
+    ApkResult
+        Structured result of the FlowDroid analyzer.
+
+    Raises
+    ------
+    ValueError
+        If `path` does not exist or does not point to an apk file.
+    ValueError
+        If `sources_and_sinks` is passed and does not point to a existing file
+        or is not one of default values ('small.txt' or 'large.txt').
+    """
+    start = time.perf_counter()
+    apk_path = Path(path)
+
+    # Check if path exists, is a file and its extension is .apk
+    if not (apk_path.is_file() and str(path).endswith(".apk")):
+        raise ValueError(f"Address {path} does not point to a valid apk file")
+
+    # Find the platforms and the sources and sinks
+    android_path = Path(PYFLOWDROID_PATH, ANDROID_FOLDER_NAME)
+    if platforms is not None:
+        android_path = await asyncio.to_thread(platforms.for_apk, apk_path)
+    sns_path = resolve_sources_and_sinks(sources_and_sinks)
+
+    # Define where the logs are saved if save_logs is True
+    log_path, log_key = await asyncio.to_thread(
+        _log_destination, apk_path, save_logs, log_store
+    )
+
+    # Look for the apk in the cache
+    if cache is not None:
+        cache_key, result = await asyncio.to_thread(
+            _cached_result, cache, apk_path, sns_path, refresh, log_path
+        )
+        if result is not None:
+            _record_apk_metrics(result, start, cached=True)
+            return result
+
+    # Run FlowDroid streaming its output to the log file or store
+    command = _flowdroid_command(apk_path, android_path, sns_path, max_heap)
+    async with semaphore or contextlib.nullcontext():
+        result = await _run_logged_async(
+            command, apk_path, log_path, timeout, max_rss, log_store, log_key
+        )
+
+    # Cache only the analyses that finished successfully
+    if cache is not None and result.status == STATUS_OK:
+        await asyncio.to_thread(cache.put, cache_key, result)
+
+    _record_apk_metrics(result, start, cached=False)
+    return result
+
+
+async def _run_logged_async(
+    command: list,
+    apk_path: Path,
+    log_path: Optional[str] = None,
+    timeout: int = 0,
+    max_rss: int = 0,
+    log_store: Optional[LogStore] = None,
+    log_key: Optional[str] = None,
+) -> ApkResult:
+    """
+    Asyncio counterpart of `_run_logged`, running a FlowDroid command in an
+    asyncio subprocess.
+    """
+    log_writer = None
+    if log_key is not None:
+        log_writer = log_store.writer(log_key, str(apk_path))
+    with get_metrics().timer("pyflowdroid_stage_seconds", stage="flowdroid"), (
+        log_writer or contextlib.nullcontext()
+    ):
+        logging.info(f"Analyzing '{apk_path}'")
+        parser = LogParser(str(apk_path))
+        command_result = await _run_command_async(
+            command, log_path, parser.feed, timeout, max_rss, log_file=log_writer
+        )
+    return _flowdroid_result(parser, command_result, apk_path, log_path)
+
+
+async def iter_analyze_async(
+    path: str = DEFAULT_APK_FOLDER_NAME,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    workers: int = 1,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    manifest: Optional[RunManifest] = None,
+    log_store: Optional[LogStore] = None,
+    platforms: Optional[PlatformProvider] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[tuple[str, ApkResult]]:
+    """
+    Execute FlowDroid analysis in an APK file or in all APK files contained
+    in a folder, yielding each result as soon as it is available.
+
+    At most `workers` FlowDroid processes run at the same time, and at most
+    `workers * 2` apks are being analyzed or waiting for a process. Closing
+    the iterator or cancelling the task consuming it kills the running
+    FlowDroid processes.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path-like object pointing to an apk file or to a folder with apk
+        files, by default 'apks'.
+    sources_and_sinks : path, optional
+        Sources and sinks file, 'small.txt' (the default) or 'large.txt', or
+        a `SourceSinkSet`, as in `analyze_apk`.
+    save_logs : bool, optional
+        Defines whether or not save raw logs from FlowDroid, by default True
+    workers : int, optional
+        Number of FlowDroid processes running at the same time, by default 1.
+    max_heap : int, optional
+        Total heap (in MB) shared by all the FlowDroid JVMs. If 0, the JVM
+        default is used. By default 0.
+    cache : ResultCache, optional
+        Cache used to skip the analysis of already analyzed apks, by default
+        None.
+    refresh : bool, optional
+        Defines whether or not ignore the cached results, by default False.
+    timeout : int, optional
+        Maximum time (in seconds) FlowDroid can run on each apk. If 0, there
+        is no limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of each FlowDroid process tree. If 0,
+        there is no limit. By default 0.
+    manifest : RunManifest, optional
+        Manifest where each result is recorded as soon as it is available,
+        by default None.
+    log_store : LogStore, optional
+        Compressed store where the raw logs are saved, by default None.
+    platforms : PlatformProvider, optional
+        Provider of the Android platform of the API level of each apk,
+        fetched on demand, by default None.
+    semaphore : asyncio.Semaphore, optional
+        Semaphore shared with other calls to limit the FlowDroid processes of
+        the whole service. If None, a semaphore of `workers` slots is used.
+        By default None.
+
+    Yields
+    ------
+    tuple[str, ApkResult]
+        Pairs of APK file name and its result of FlowDroid analyzer, in
+        completion order.
+
+    Raises
+    ------
+    ValueError
+        If `path` does not exist.
+    ValueError
+        If `sources_and_sinks` is passed and does not point to a existing file
+        or is not one of default values ('small.txt' or 'large.txt').
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is too small to be shared
+        among all the workers.
+    """
+
+    # Options shared by the analysis of every apk
+    options = dict(
+        sources_and_sinks=str(resolve_sources_and_sinks(sources_and_sinks)),
+        save_logs=save_logs,
+        max_heap=_heap_per_worker(max_heap, workers),
+        cache=cache,
+        refresh=refresh,
+        timeout=timeout,
+        max_rss=max_rss,
+        log_store=log_store,
+        platforms=platforms,
+        semaphore=semaphore or asyncio.Semaphore(workers),
+    )
+
+    # Find the apks in a thread, since big folders take a while
+    target = _analysis_target(path)
+    apk_paths = [str(target)]
+    if target.is_dir():
+        logging.info(f"Analyzing '{target}'")
+        apk_paths = await asyncio.to_thread(list, _find_apks(target))
+
+    # Keep a bounded window of apks in flight, refilled as each one finishes
+    pending_paths = iter(apk_paths)
+    pending: set = set()
+    queue_size = workers * DEFAULT_QUEUE_FACTOR
+    try:
+        while True:
+            for apk_path in itertools.islice(pending_paths, queue_size - len(pending)):
+                pending.add(
+                    asyncio.ensure_future(_analyze_one(apk_path, manifest, options))
+                )
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                yield task.result()
+
+    # Kill the FlowDroid processes left if the iteration is stopped
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _analyze_one(
+    apk_path: str, manifest: Optional[RunManifest], options: dict
+) -> tuple[str, ApkResult]:
+    """
+    Analyzes an apk, recording its result in `manifest` if given.
+    """
+    result = await analyze_apk_async(apk_path, **options)
+    if manifest is not None:
+        await asyncio.to_thread(manifest.record, result)
+    return apk_path, result
+
+
+async def analyze_async(
+    path: str = DEFAULT_APK_FOLDER_NAME,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    workers: int = 1,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    manifest: Optional[RunManifest] = None,
+    log_store: Optional[LogStore] = None,
+    platforms: Optional[PlatformProvider] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> tuple[int, int, list]:
+    """
+    Asyncio counterpart of `analyze`: execute FlowDroid analysis in an APK
+    file or in all APK files contained in a folder and quantify the leaks.
+
+    Parameters are the ones of `iter_analyze_async`.
+
+    Returns
+    -------
+    tuple[int, int, list]
+        Total of apks analyzed, total of leaks found and list of leaky apks.
+
+    Raises
+    ------
+    ValueError
+        If `path` does not exist.
+    ValueError
+        If `sources_and_sinks` is passed and does not point to a existing file
+        or is not one of default values ('small.txt' or 'large.txt').
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is too small to be shared
+        among all the workers.
+    """
+    results = iter_analyze_async(
+        path,
+        sources_and_sinks,
+        save_logs,
+        workers,
+        max_heap,
+        cache,
+        refresh,
+        timeout,
+        max_rss,
+        manifest,
+        log_store,
+        platforms,
+        semaphore,
+    )
+    return quantify_leaks([pair async for pair in results])
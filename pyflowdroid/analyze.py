@@ -1,30 +1,86 @@
+import time
+import queue
+import contextlib
 import logging
+import itertools
+import threading
+import subprocess
 from pathlib import Path
-from pyflowdroid._cli_tools import _run_command, cli_header
+from typing import IO, Callable, Iterable, Iterator, Optional, Union
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pyflowdroid._cli_tools import (
+    _run_command,
+    _watch_process,
+    _kill_process_tree,
+    cli_header,
+    CommandResult,
+    KILLED_BY_TIMEOUT,
+    KILLED_BY_MEMORY,
+)
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.logstore import LogStore
+from pyflowdroid.database import ResultsDatabase
+from pyflowdroid.definitions import (
+    SourceSinkSet,
+    load_sources_and_sinks,
+    resolve_sources_and_sinks,
+)
+from pyflowdroid.manifest import RunManifest
+from pyflowdroid.metrics import get_metrics, _timed_calls
+from pyflowdroid.workqueue import JobQueue, iter_queue_results
+from pyflowdroid.scheduler import CostModel, plan_heap
+from pyflowdroid.platforms import PlatformProvider
+from pyflowdroid.discovery import ApkScanner, _config_key
+from pyflowdroid.triage import (
+    Triage,
+    TRIAGE_SKIP,
+    TRIAGE_DEFER,
+    VERDICT_ANALYZE,
+    VERDICT_DUPLICATE,
+    VERDICT_INVALID,
+)
+from pyflowdroid.results import (
+    ApkResult,
+    LogParser,
+    parse_logs,
+    STATUS_OK,
+    STATUS_TIMEOUT,
+    STATUS_OUT_OF_MEMORY,
+    STATUS_SKIPPED,
+    STATUS_INVALID,
+)
 from pyflowdroid.consts import (
     PYFLOWDROID_PATH,
     DEFAULT_APK_FOLDER_NAME,
     ANDROID_FOLDER_NAME,
     FLOWDROID_EXEC_NAME,
+    FLOWDROID_SERVER_SOURCE,
+    DEFAULT_QUEUE_FACTOR,
 )
 
+# Status of the results of FlowDroid runs killed by `_run_command`
+_KILLED_BY_STATUS = {
+    KILLED_BY_TIMEOUT: STATUS_TIMEOUT,
+    KILLED_BY_MEMORY: STATUS_OUT_OF_MEMORY,
+}
 
-def _save_logs(logs: str, log_path: str):
-    """
-    Save a log file.
+# Line printed by the FlowDroid server after each analysis
+_SERVER_DONE_MARKER = "@@PYFLOWDROID_DONE"
 
-    Parameters
-    ----------
-    logs : str
-        Content of the file.
-    log_path : str
-        Path to log file.
-    """
-    with open(log_path, "w") as f:
-        f.write(logs)
 
-
-def analyze_apk(path: str, sources_and_sinks: str = "", save_logs: bool = True) -> str:
+def analyze_apk(
+    path: str,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    server: Optional["AnalysisServer"] = None,
+    log_store: Optional[LogStore] = None,
+    platforms: Optional[PlatformProvider] = None,
+) -> ApkResult:
     """
     Execute FlowDroid analysis in an APK file.
 
@@ -37,14 +93,45 @@ def analyze_apk(path: str, sources_and_sinks: str = "", save_logs: bool = True)
         library there are two sources_and_sinks files: 'large.txt' and
         'small.txt'. Both can be passed as valid values of this param.
         If not specified, the default sources and sinks file is 'small.txt'.
-        A path to a custom sources and sinks file can be passed as a string too.
+        A path to a custom sources and sinks file can be passed as a string too,
+        as well as a `SourceSinkSet`, e.g. with only some categories.
     save_logs : bool, optional
         Defines whether or not save raw logs from FlowDroid, by default True
+    max_heap : int, optional
+        Maximum heap size (in MB) of the FlowDroid JVM. If 0, the JVM default
+        is used. By default 0.
+    cache : ResultCache, optional
+        Cache used to skip the analysis of already analyzed apks. If None, the
+        analysis always runs. By default None.
+    refresh : bool, optional
+        Defines whether or not ignore the cached results and analyze the apk
+        again, updating the cache, by default False.
+    timeout : int, optional
+        Maximum time (in seconds) FlowDroid can run on an apk. If reached,
+        FlowDroid is killed and the result status is 'timeout'. If 0, there is
+        no limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of the FlowDroid process tree. If
+        reached, FlowDroid is killed and the result status is 'out_of_memory'.
+        If 0, there is no limit. By default 0.
+    server : AnalysisServer, optional
+        Running FlowDroid server used to analyze the apk instead of starting a
+        new FlowDroid process. When given, `max_heap` is ignored in favour of
+        the heap of the server. By default None.
+    log_store : LogStore, optional
+        Compressed store where the raw logs are saved, keyed on the hash of
+        the apk, instead of the '.log' file next to the apk, by default None.
+    platforms : PlatformProvider, optional
+        Provider of the Android platform of the API level of the apk, fetched
+        on demand. If None, all the installed platforms are used. By default
+        None.
 
     Returns
     -------
-    str
-        Logs with the raw output of FlowDroid analyzer.
+    ApkResult
+        Structured result of the FlowDroid analyzer. The raw output is
+        streamed to the '.log' file next to the apk, or to `log_store`, when
+        `save_logs` is True.
 
     Raises
     ------
@@ -56,136 +143,1436 @@ def analyze_apk(path: str, sources_and_sinks: str = "", save_logs: bool = True)
     """
 
     # Convert path to pathlib object
+    start = time.perf_counter()
+    metrics = get_metrics()
     apk_path = Path(path)
 
-    # Check if path exists, is a file and its extension is .apk
-    if apk_path.exists() and apk_path.is_file() and str(path).endswith(".apk"):
+    # Raise execption for invalid paths
+    if not (apk_path.is_file() and str(path).endswith(".apk")):
+        raise ValueError(f"Address {path} does not point to a valid apk file")
+
+    # Create the path for required resources
+    android_path = Path(PYFLOWDROID_PATH, ANDROID_FOLDER_NAME)
+    if platforms is not None:
+        android_path = platforms.for_apk(apk_path)
+
+    # If no valid path specified, use default sources and sinks file
+    sns_path = resolve_sources_and_sinks(sources_and_sinks)
+
+    # Log the sources and sinks file being used
+    logging.info(f"Using sources and sinks from '{sns_path}'")
+
+    # Define where the logs are saved if save_logs is True
+    log_path, log_key = _log_destination(apk_path, save_logs, log_store)
+    metrics.observe(
+        "pyflowdroid_stage_seconds",
+        time.perf_counter() - start,
+        stage="validation",
+    )
+
+    # Look for the apk in the cache
+    if cache is not None:
+        cache_key, result = _cached_result(cache, apk_path, sns_path, refresh, log_path)
+        if result is not None:
+            _record_apk_metrics(result, start, cached=True)
+            return result
+
+    # Run FlowDroid streaming its output to the log file or store
+    result = _run_logged(
+        apk_path,
+        android_path,
+        sns_path,
+        max_heap,
+        log_path,
+        timeout,
+        max_rss,
+        server,
+        log_store,
+        log_key,
+    )
+
+    # Cache only the analyses that finished successfully
+    if cache is not None and result.status == STATUS_OK:
+        with metrics.timer("pyflowdroid_stage_seconds", stage="cache_store"):
+            cache.put(cache_key, result)
+
+    _record_apk_metrics(result, start, cached=False)
+    return result
+
+
+def _log_destination(
+    apk_path: Path, save_logs: bool, log_store: Optional[LogStore] = None
+) -> tuple[Optional[str], Optional[str]]:
+    """
+    Finds where the raw logs of an apk are saved.
+
+    Returns
+    -------
+    tuple[Optional[str], Optional[str]]
+        Path to the '.log' file next to the apk and key of the logs in
+        `log_store`. Only one of them is set, or none if `save_logs` is False.
+    """
+    if save_logs and log_store is not None:
+        return None, log_store.key(apk_path)
+    if save_logs:
+        return str(apk_path.with_suffix(".log")), None
+    return None, None
+
+
+def _cached_result(
+    cache: ResultCache,
+    apk_path: Path,
+    sns_path: Path,
+    refresh: bool,
+    log_path: Optional[str] = None,
+) -> tuple[str, Optional[ApkResult]]:
+    """
+    Looks for the result of an apk in the cache.
+
+    Returns
+    -------
+    tuple[str, Optional[ApkResult]]
+        Key of the analysis in the cache and its cached result, or None if it
+        is not cached or `refresh` is True.
+    """
+    with get_metrics().timer("pyflowdroid_stage_seconds", stage="cache_lookup"):
+        cache_key = cache.key(apk_path, sns_path)
+        result = None if refresh else cache.get(cache_key)
+    if result is not None:
+        logging.info(f"Using cached results for '{apk_path}'")
+        has_logs = log_path is not None and Path(log_path).exists()
+        result.apk = str(apk_path)
+        result.log_path = log_path if has_logs else None
+    return cache_key, result
+
+
+def _run_logged(
+    apk_path: Path,
+    android_path: Path,
+    sns_path: Path,
+    max_heap: int = 0,
+    log_path: Optional[str] = None,
+    timeout: int = 0,
+    max_rss: int = 0,
+    server: Optional["AnalysisServer"] = None,
+    log_store: Optional[LogStore] = None,
+    log_key: Optional[str] = None,
+) -> ApkResult:
+    """
+    Runs FlowDroid, in a new process or in `server`, saving its output in
+    the '.log' file at `log_path` or in `log_store` under `log_key`.
+    """
+    log_writer = None
+    if log_key is not None:
+        log_writer = log_store.writer(log_key, str(apk_path))
+    with get_metrics().timer("pyflowdroid_stage_seconds", stage="flowdroid"), (
+        log_writer or contextlib.nullcontext()
+    ):
+        if server is not None:
+            result = server.analyze(
+                apk_path,
+                android_path,
+                sns_path,
+                log_path,
+                timeout,
+                max_rss,
+                log_writer,
+            )
+        else:
+            result = _run_flowdroid(
+                apk_path,
+                android_path,
+                sns_path,
+                max_heap,
+                log_path,
+                timeout,
+                max_rss,
+                log_writer,
+            )
+    if log_path is not None:
+        logging.info(f"Flowdroid logs saved in {log_path}")
+    elif log_key is not None:
+        logging.info(f"Flowdroid logs saved in '{log_store.folder}' as {log_key}")
+    return result
+
+
+def _record_apk_metrics(result: ApkResult, start: float, cached: bool) -> None:
+    """
+    Records the metrics of the analysis of an apk.
+
+    Parameters
+    ----------
+    result : ApkResult
+        Result of the analysis.
+    start : float
+        Value of `time.perf_counter` when the analysis started.
+    cached : bool
+        Whether or not the result was taken from the cache.
+    """
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return
+
+    elapsed = time.perf_counter() - start
+    metrics.observe("pyflowdroid_apk_seconds", elapsed, status=result.status)
+    metrics.increment("pyflowdroid_apks_total", status=result.status)
+    metrics.increment("pyflowdroid_leaks_total", result.leak_count)
+    if cached:
+        metrics.increment("pyflowdroid_cache_hits_total")
+        return
+
+    # Phases of FlowDroid, as reported in its own output
+    for phase, seconds in result.timings.items():
+        metrics.observe("pyflowdroid_flowdroid_phase_seconds", seconds, phase=phase)
+
+
+def _run_flowdroid(
+    apk_path: Path,
+    android_path: Path,
+    sns_path: Path,
+    max_heap: int = 0,
+    log_path: Optional[str] = None,
+    timeout: int = 0,
+    max_rss: int = 0,
+    log_file: Optional[IO[str]] = None,
+) -> ApkResult:
+    """
+    Run FlowDroid in a subprocess.
+
+    Parameters
+    ----------
+    apk_path : Path
+        Path to the apk file.
+    android_path : Path
+        Path to the android platforms folder.
+    sns_path : Path
+        Path to the sources and sinks file.
+    max_heap : int, optional
+        Maximum heap size (in MB) of the FlowDroid JVM. If 0, the JVM default
+        is used. By default 0.
+    log_path : str, optional
+        Path to the file where the raw output of FlowDroid is saved. If None,
+        the output is not saved. By default None.
+    timeout : int, optional
+        Maximum time (in seconds) FlowDroid can run. If 0, there is no limit.
+        By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of the FlowDroid process tree. If 0,
+        there is no limit. By default 0.
+    log_file : file object, optional
+        Already open file where the raw output of FlowDroid is saved instead
+        of `log_path`, by default None.
+
+    Returns
+    -------
+    ApkResult
+        Structured result of the FlowDroid analyzer.
+    """
+
+    # Create the flowdroid call for the given apk file
+    command = _flowdroid_command(apk_path, android_path, sns_path, max_heap)
+
+    # Execute command parsing the output while FlowDroid prints it
+    logging.info(f"Analyzing '{apk_path}'")
+    parser = LogParser(str(apk_path))
+    command_result = _run_command(
+        command, log_path, parser.feed, timeout, max_rss, log_file=log_file
+    )
+    return _flowdroid_result(parser, command_result, apk_path, log_path)
+
+
+def _flowdroid_command(
+    apk_path: Path, android_path: Path, sns_path: Path, max_heap: int = 0
+) -> list:
+    """
+    Builds the arguments of the FlowDroid call for an apk.
+
+    Parameters
+    ----------
+    apk_path : Path
+        Path to the apk file.
+    android_path : Path
+        Path to the android platforms folder.
+    sns_path : Path
+        Path to the sources and sinks file.
+    max_heap : int, optional
+        Maximum heap size (in MB) of the FlowDroid JVM. If 0, the JVM default
+        is used. By default 0.
+
+    Returns
+    -------
+    list
+        Program and arguments of the FlowDroid call.
+    """
+
+    # Create the path to the FlowDroid executable
+    fd_path = Path(PYFLOWDROID_PATH, FLOWDROID_EXEC_NAME)
+
+    # Limit the heap of the JVM if requested, exiting instead of hanging on OOM
+    java_opts = []
+    if max_heap > 0:
+        java_opts = [f"-Xmx{max_heap}m", "-XX:+ExitOnOutOfMemoryError"]
+
+    return [
+        "java",
+        *java_opts,
+        "-jar",
+        str(fd_path),
+        "-a",
+        str(apk_path),
+        "-p",
+        str(android_path),
+        "-s",
+        str(sns_path),
+    ]
+
+
+def _flowdroid_result(
+    parser: LogParser,
+    command_result: CommandResult,
+    apk_path: Path,
+    log_path: Optional[str] = None,
+) -> ApkResult:
+    """
+    Builds the result of a FlowDroid run from its parsed output.
+
+    Parameters
+    ----------
+    parser : LogParser
+        Parser fed with the output of FlowDroid.
+    command_result : CommandResult
+        Result of the FlowDroid command.
+    apk_path : Path
+        Path to the apk file.
+    log_path : str, optional
+        Path to the file with the raw output of FlowDroid, by default None.
+
+    Returns
+    -------
+    ApkResult
+        Structured result of the FlowDroid analyzer.
+    """
+    result = parser.finish(command_result.returncode, log_path)
+
+    # Record why FlowDroid was killed, if it was
+    if command_result.killed_by is not None:
+        reason = command_result.killed_by
+        logging.warning(f"FlowDroid killed by {reason} limit on '{apk_path}'")
+        result.status = _KILLED_BY_STATUS[command_result.killed_by]
+    return result
+
+
+def _output_handlers(
+    parser: LogParser, log_file: Optional[IO[str]], stage_times: dict
+) -> tuple[Optional[Callable[[str], None]], Callable[[str], None]]:
+    """
+    Builds the functions handling each line of the output of a FlowDroid
+    server, timing them in `stage_times` when metrics are enabled.
+
+    Returns
+    -------
+    tuple
+        Function writing each raw line to `log_file`, or None if there is no
+        log file, and function feeding each line to `parser`.
+    """
+    write = log_file.write if log_file is not None else None
+    on_line = parser.feed
+    if get_metrics().enabled:
+        if write is not None:
+            write = _timed_calls(write, stage_times, "log_write")
+        on_line = _timed_calls(on_line, stage_times, "log_parse")
+    return write, on_line
+
+
+def _server_result(
+    parser: LogParser,
+    returncode: Optional[int],
+    log_path: Optional[str],
+    killed_by: list,
+    stage_times: dict,
+) -> ApkResult:
+    """
+    Builds the result of an analysis run in a FlowDroid server, recording its
+    metrics.
+    """
+    metrics = get_metrics()
+    for stage, seconds in stage_times.items():
+        metrics.observe("pyflowdroid_stage_seconds", seconds, stage=stage)
+    result = parser.finish(returncode, log_path)
+    if killed_by:
+        metrics.increment("pyflowdroid_commands_killed_total", reason=killed_by[0])
+        result.status = _KILLED_BY_STATUS[killed_by[0]]
+    return result
+
+
+class AnalysisServer:
+    """
+    Pool of long-lived FlowDroid processes reused across many apks.
+
+    Starting FlowDroid is expensive: the JVM has to start and load all the
+    FlowDroid classes before any analysis begins. The server starts `workers`
+    FlowDroid processes once and sends them one apk at a time, so small apks
+    do not pay for the startup. Processes that crash or are killed by a limit
+    are replaced by new ones.
+
+    Only the JVM startup and the JIT warm-up are saved. FlowDroid resets Soot
+    for every apk, so each analysis still parses the sources and sinks and
+    loads the Android platform jars.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of FlowDroid processes, i.e. maximum number of apks analyzed at
+        the same time, by default 1.
+    max_heap : int, optional
+        Maximum heap size (in MB) of each FlowDroid JVM. If 0, the JVM default
+        is used. By default 0.
+    """
+
+    def __init__(self, workers: int = 1, max_heap: int = 0):
+        if workers < 1:
+            raise ValueError("workers must be greater than 0")
+        self.max_heap = max_heap
+        self._idle: queue.Queue = queue.Queue()
+        self._processes: list = []
+        self._lock = threading.Lock()
+        for _ in range(workers):
+            self._idle.put(None)
 
-        # Create the path for required resources
+    def __enter__(self) -> "AnalysisServer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _start_process(self) -> subprocess.Popen:
+        """
+        Starts a FlowDroid server process.
+        """
         fd_path = Path(PYFLOWDROID_PATH, FLOWDROID_EXEC_NAME)
-        android_path = Path(PYFLOWDROID_PATH, ANDROID_FOLDER_NAME)
-        sns_path = Path(sources_and_sinks)
+        server_path = Path(PYFLOWDROID_PATH, FLOWDROID_SERVER_SOURCE)
+        java_opts = []
+        if self.max_heap > 0:
+            java_opts = [f"-Xmx{self.max_heap}m", "-XX:+ExitOnOutOfMemoryError"]
 
-        # If no valid path specified, use default sources and sinks file
-        if not (sns_path.exists() and sns_path.is_file()):
-            if sources_and_sinks == "large.txt":
-                sns_path = Path(PYFLOWDROID_PATH, "sources_sinks", "large.txt")
-            elif sources_and_sinks in ["small.txt", ""]:
-                sns_path = Path(PYFLOWDROID_PATH, "sources_sinks", "small.txt")
-            else:
-                raise ValueError("Invalid sources and sinks file path.")
+        logging.info("Starting FlowDroid server")
+        process = subprocess.Popen(
+            ["java", *java_opts, "-cp", str(fd_path), str(server_path)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            start_new_session=True,
+        )
+        with self._lock:
+            self._processes.append(process)
+        return process
 
-        # Log the sources and sinks file being used
-        logging.info(f"Using sources and sinks from '{sns_path}'")
+    def _stop_process(self, process: subprocess.Popen) -> None:
+        """
+        Kills a FlowDroid server process.
+        """
+        _kill_process_tree(process)
+        process.wait()
+        with self._lock:
+            self._processes.remove(process)
 
-        # Create the flowdroid call for the given apk file
-        command = f"java -jar {fd_path} -a {apk_path} -p {android_path} -s {sns_path}"
+    def analyze(
+        self,
+        apk_path: Path,
+        android_path: Path,
+        sns_path: Path,
+        log_path: Optional[str] = None,
+        timeout: int = 0,
+        max_rss: int = 0,
+        log_file: Optional[IO[str]] = None,
+    ) -> ApkResult:
+        """
+        Analyzes an apk in one of the FlowDroid processes of the server.
 
-        # Execute command and get the output
-        logging.info(f"Analyzing '{apk_path}'")
-        logs = _run_command(command)
+        Parameters
+        ----------
+        apk_path : Path
+            Path to the apk file.
+        android_path : Path
+            Path to the android platforms folder.
+        sns_path : Path
+            Path to the sources and sinks file.
+        log_path : str, optional
+            Path to the file where the raw output of FlowDroid is saved. If
+            None, the output is not saved. By default None.
+        timeout : int, optional
+            Maximum time (in seconds) FlowDroid can run. If 0, there is no
+            limit. By default 0.
+        max_rss : int, optional
+            Maximum resident memory (in MB) of the FlowDroid process. If 0,
+            there is no limit. By default 0.
+        log_file : file object, optional
+            Already open file where the raw output of FlowDroid is saved
+            instead of `log_path`, by default None.
 
-        # Save logs if save_logs is True
-        if save_logs:
-            log_path = apk_path.with_suffix(".log")
-            logging.info(f"Flowdroid logs saved in {log_path}")
-            _save_logs(logs, log_path)
+        Returns
+        -------
+        ApkResult
+            Structured result of the FlowDroid analyzer.
+        """
 
-        # Return the logs
-        return logs
+        # Wait for an idle FlowDroid process
+        metrics = get_metrics()
+        parser = LogParser(str(apk_path))
+        process = self._idle.get()
+        returncode: Optional[int] = None
+        busy = False
+        killed_by: list = []
+        stage_times: dict = {}
+        stop = threading.Event()
+        own_file = None
+        try:
+            # Start a new process if the idle one died or there was none
+            if process is None or process.poll() is not None:
+                with metrics.timer("pyflowdroid_stage_seconds", stage="server_start"):
+                    process = self._start_process()
+            own_file = open(log_path, "w") if log_path is not None else None
+            write, on_line = _output_handlers(parser, own_file or log_file, stage_times)
 
-    # Raise execption for invalid paths
-    else:
-        raise ValueError(f"Address {path} does not point to a valid apk file")
+            # Watch the process if there are limits for this analysis
+            if timeout or max_rss:
+                threading.Thread(
+                    target=_watch_process,
+                    args=(process, stop, killed_by, timeout, max_rss),
+                    daemon=True,
+                ).start()
+
+            # Send the apk to the server and read its output until it is done
+            busy = True
+            returncode = self._send(process, [apk_path, android_path, sns_path])
+            if returncode is None:
+                returncode = self._read_output(process, on_line, write)
+        finally:
+            stop.set()
+            if own_file is not None:
+                own_file.close()
+            self._release(process, busy and returncode is None)
+
+        # A process that died or was killed has no code for this analysis
+        if returncode is None:
+            returncode = process.returncode
+        return _server_result(parser, returncode, log_path, killed_by, stage_times)
+
+    @staticmethod
+    def _send(process: subprocess.Popen, paths: list) -> Optional[int]:
+        """
+        Sends the apk, android platforms and sources and sinks paths of an
+        analysis to a FlowDroid server process.
+
+        Returns
+        -------
+        Optional[int]
+            None if the analysis was sent, or the exit code of the process if
+            it stopped before receiving it.
+        """
+        logging.info(f"Analyzing '{paths[0]}' in FlowDroid server")
+        args = ["-a", paths[0], "-p", paths[1], "-s", paths[2]]
+        try:
+            process.stdin.write("\t".join(map(str, args)) + "\n")
+            process.stdin.flush()
+        except BrokenPipeError:
+            logging.error("FlowDroid server stopped unexpectedly")
+            return process.wait()
+        return None
+
+    def _release(self, process: Optional[subprocess.Popen], busy: bool) -> None:
+        """
+        Returns the slot of a finished analysis to the idle ones.
+
+        The process is kept only if it is alive and not `busy` with an
+        analysis that did not finish. Otherwise it is stopped and the slot is
+        returned empty, so the next analysis starts a new process.
+        """
+        keep = process is not None and process.poll() is None and not busy
+        try:
+            if process is not None and not keep:
+                self._stop_process(process)
+        finally:
+            self._idle.put(process if keep else None)
+
+    @staticmethod
+    def _read_output(
+        process: subprocess.Popen,
+        on_line: Callable[[str], None],
+        write: Optional[Callable[[str], None]] = None,
+    ) -> Optional[int]:
+        """
+        Reads the output of an analysis from a FlowDroid server process.
+
+        Parameters
+        ----------
+        process : subprocess.Popen
+            FlowDroid server process.
+        on_line : Callable[[str], None]
+            Function called with each line of the output.
+        write : Callable[[str], None], optional
+            Function writing each raw line of the output to the log, if any.
+
+        Returns
+        -------
+        Optional[int]
+            Exit code of the analysis, or None if the process died.
+        """
+        for line in process.stdout:
+            if line.startswith(_SERVER_DONE_MARKER):
+                return int(line.split()[1])
+            if write is not None:
+                write(line)
+            on_line(line.rstrip("\n"))
+        return None
+
+    def close(self) -> None:
+        """
+        Stops all the FlowDroid processes of the server.
+        """
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            process.stdin.close()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                _kill_process_tree(process)
+                process.wait()
+        with self._lock:
+            self._processes.clear()
 
 
 def analyze_apk_folder(
     path: str = DEFAULT_APK_FOLDER_NAME,
-    sources_and_sinks: str = "",
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
     save_logs: bool = True,
+    workers: int = 1,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    server: Optional[AnalysisServer] = None,
+    manifest: Optional[RunManifest] = None,
+    resume: bool = False,
+    retry_failed: bool = False,
+    log_store: Optional[LogStore] = None,
+    database: Optional[ResultsDatabase] = None,
+    triage: str = "",
+    queue: Optional[JobQueue] = None,
+    cost_model: Optional[CostModel] = None,
+    platforms: Optional[PlatformProvider] = None,
+    scanner: Optional[ApkScanner] = None,
 ) -> dict:
     """
     Execute FlowDroid analysis in all APK files contained in a folder.
 
+    Parameters are the ones of `iter_analyze`, with `path` pointing to a
+    folder.
+
+    Returns
+    -------
+    dict
+        Pairs of APK file name and its result of FlowDroid analyzer, sorted by
+        APK file name.
+
+    Raises
+    ------
+    ValueError
+        If `path` does not exist or does not point to a folder.
+    ValueError
+        If `sources_and_sinks` is passed and does not point to a existing file
+        or is not one of default values ('small.txt' or 'large.txt').
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is too small to be shared
+        among all the workers.
+    ValueError
+        If `triage` is not '', 'skip' or 'defer'.
+    """
+
+    # Create the path object with the folder
+    folder_path = Path(path)
+
+    # Check if path points to a folder (the default one is created if needed)
+    if path != DEFAULT_APK_FOLDER_NAME and not folder_path.is_dir():
+        raise ValueError(f"Address {path} does not point to a valid folder")
+
+    # Analyze all apks and sort their results
+    results = iter_analyze(
+        path,
+        sources_and_sinks,
+        save_logs,
+        workers,
+        max_heap,
+        cache,
+        refresh,
+        timeout,
+        max_rss,
+        server,
+        manifest,
+        resume,
+        retry_failed,
+        log_store,
+        database,
+        triage,
+        queue,
+        cost_model,
+        platforms,
+        scanner,
+    )
+    return dict(sorted(results))
+
+
+def iter_analyze(
+    path: str = DEFAULT_APK_FOLDER_NAME,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    workers: int = 1,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    server: Optional[AnalysisServer] = None,
+    manifest: Optional[RunManifest] = None,
+    resume: bool = False,
+    retry_failed: bool = False,
+    log_store: Optional[LogStore] = None,
+    database: Optional[ResultsDatabase] = None,
+    triage: str = "",
+    queue: Optional[JobQueue] = None,
+    cost_model: Optional[CostModel] = None,
+    platforms: Optional[PlatformProvider] = None,
+    scanner: Optional[ApkScanner] = None,
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Lazily execute FlowDroid analysis in the given path.
+
+    Results are yielded as soon as each analysis finishes, so in parallel runs
+    they come in completion order. Apks are discovered while the analysis runs
+    and no result is kept in memory after being yielded, unless `triage` is
+    used, which keeps them to give the copies of an apk the same result.
+
     Parameters
     ----------
     path : str, optional
-        Path to the folder. By default, the default folder is 'apks'.
+        Path pointing the target of the analysis. If path points to an apk file,
+        only that apk is analyzed. If path points to a folder, all apk files in
+        that folder are analyzed. By default, 'apks'.
     sources_and_sinks : path, optional
         Defines the path to the sources and sinks file. As part of this
         library there are two sources_and_sinks files: 'large.txt' and
         'small.txt'. Both can be passed as valid values of this param.
         If not specified, the default sources and sinks file is 'small.txt'.
-        A path to a custom sources and sinks file can be passed as a string too.
+        A path to a custom sources and sinks file can be passed as a string too,
+        as well as a `SourceSinkSet`, e.g. with only some categories.
     save_logs : bool, optional
         Defines whether or not save raw logs from FlowDroid, by default True
+    workers : int, optional
+        Number of FlowDroid processes running at the same time, by default 1.
+    max_heap : int, optional
+        Total heap (in MB) shared by all the FlowDroid JVMs. Each JVM gets
+        `max_heap // workers` MB. If 0, the JVM default is used. By default 0.
+    cache : ResultCache, optional
+        Cache used to skip the analysis of already analyzed apks. If None, the
+        analysis always runs. By default None.
+    refresh : bool, optional
+        Defines whether or not ignore the cached results and analyze the apks
+        again, updating the cache, by default False.
+    timeout : int, optional
+        Maximum time (in seconds) FlowDroid can run on each apk. If reached,
+        FlowDroid is killed and the result status is 'timeout'. If 0, there is
+        no limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of FlowDroid on each apk. If reached,
+        FlowDroid is killed and the result status is 'out_of_memory'. If 0,
+        there is no limit. By default 0.
+    server : AnalysisServer, optional
+        Running FlowDroid server used to analyze the apks instead of starting
+        a new FlowDroid process for each one, by default None.
+    manifest : RunManifest, optional
+        Manifest where the result of each apk is recorded as soon as its
+        analysis finishes, by default None.
+    resume : bool, optional
+        Defines whether or not skip the apks already recorded in `manifest`,
+        reusing their recorded results, by default False.
+    retry_failed : bool, optional
+        Like `resume`, but analyzing again the apks whose recorded analysis
+        failed, timed out or ran out of memory, by default False.
+    log_store : LogStore, optional
+        Compressed store where the raw logs are saved instead of the '.log'
+        files next to the apks, by default None.
+    database : ResultsDatabase, optional
+        Database where the results are recorded as a new run, by default
+        None.
+    triage : str, optional
+        Defines whether or not triage the apks before analyzing them, by
+        default ''. Corrupt apks get an 'invalid' result and copies of an apk
+        get its result without being analyzed again. Apks whose dex files
+        reference no method named like a sink are not analyzed and get a
+        'skipped' result if `triage` is 'skip', or are analyzed after all the
+        others if it is 'defer'.
+    queue : JobQueue, optional
+        Queue where the apks are submitted to be analyzed by workers, possibly
+        on other hosts, instead of analyzing them here. The analysis options
+        are sent with the apks, while `workers`, `max_heap`, `cache`,
+        `server`, `log_store` and `platforms` are chosen by each worker. By
+        default None.
+    cost_model : CostModel, optional
+        Model used to analyze the apks from the longest to the shortest
+        predicted analysis, splitting `max_heap` among the FlowDroid JVMs in
+        proportion to the predicted cost of their apks. The observed
+        durations are added to its history. By default None.
+    platforms : PlatformProvider, optional
+        Provider of the Android platform of the API level of each apk,
+        fetched on demand. If None, all the installed platforms are used. By
+        default None.
+    scanner : ApkScanner, optional
+        Scanner used to find the apks of a folder, with its patterns, depth
+        and symlink options. If it has a snapshot, only the new and modified
+        apks are analyzed, the results of the others are taken from it, and
+        the analyzed ones are recorded in it. The snapshot is kept apart for
+        each sources and sinks file and options. If None, all the '.apk'
+        files are analyzed. By default None.
 
-    Returns
-    -------
-    dict
-        Pairs of APK file name and its raw output of FlowDroid analyzer.
+    Yields
+    ------
+    tuple[str, ApkResult]
+        Pairs of APK file name and its result of FlowDroid analyzer.
 
     Raises
     ------
     ValueError
-        If `path` does not exist or does not point to a folder.
+        If `path` does not exist.
     ValueError
         If `sources_and_sinks` is passed and does not point to a existing file
         or is not one of default values ('small.txt' or 'large.txt').
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is too small to be shared
+        among all the workers.
+    ValueError
+        If `triage` is not '', 'skip' or 'defer'.
     """
 
-    # Create apk folder if it does not exist
+    if triage not in ("", TRIAGE_SKIP, TRIAGE_DEFER):
+        raise ValueError(f"Unknown triage mode '{triage}'")
+
+    # Find the sources and sinks once for all the apks
+    sources_and_sinks = str(resolve_sources_and_sinks(sources_and_sinks))
+
+    # Options shared by the analysis of every apk
+    options = dict(
+        sources_and_sinks=sources_and_sinks,
+        save_logs=save_logs,
+        max_heap=_heap_per_worker(max_heap, workers),
+        cache=cache,
+        refresh=refresh,
+        timeout=timeout,
+        max_rss=max_rss,
+        server=server,
+        manifest=manifest,
+        log_store=log_store,
+        platforms=platforms,
+    )
+
+    # Analyze a single apk, or all the apks of a folder
+    target = _analysis_target(path)
+    if not target.is_dir() and not triage and queue is None:
+        results: Iterable = [(str(target), _analyze_and_record(target, **options))]
+    else:
+        results = _iter_apks(
+            target,
+            options,
+            workers,
+            max_heap,
+            resume,
+            retry_failed,
+            triage,
+            queue,
+            cost_model,
+            scanner,
+        )
+
+    # Record the results in the database while they are yielded
+    if database is not None:
+        results = database.record(results, path, sources_and_sinks)
+    yield from results
+
+
+def _analysis_target(path: str) -> Path:
+    """
+    Checks the target of an analysis, creating the default apk folder if it
+    does not exist.
+    """
     if path == DEFAULT_APK_FOLDER_NAME:
         Path(path).mkdir(parents=True, exist_ok=True)
+    target = Path(path)
+    if not target.exists():
+        raise ValueError(f"Address {target} does not point to an existing location")
+    return target
 
-    # Create the path object with the folder
-    folder_path = Path(path)
-    logging.info(f"Analyzing '{folder_path}'")
 
-    # Check if path exists and is a folder
-    if folder_path.exists() and folder_path.is_dir():
+def _iter_apks(
+    target: Path,
+    options: dict,
+    workers: int = 1,
+    max_heap: int = 0,
+    resume: bool = False,
+    retry_failed: bool = False,
+    triage: str = "",
+    queue: Optional[JobQueue] = None,
+    cost_model: Optional[CostModel] = None,
+    scanner: Optional[ApkScanner] = None,
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Lazily execute FlowDroid analysis in the apks of a folder, or in a single
+    apk that has to be triaged or queued.
 
-        # Retreive all apk files in the folder
-        apk_paths = [
-            str(apk_path)
-            for apk_path in folder_path.glob("**/*.apk")
-            if apk_path.is_file()
-        ]
-        logging.info(f"Found {len(apk_paths)} apks in '{folder_path}'")
+    Parameters are the ones of `iter_analyze`, with the options of each
+    analysis in `options`.
+    """
 
-        # Analize all apks and store their logs
-        return {
-            str(apk_path): analyze_apk(apk_path, sources_and_sinks, save_logs)
-            for apk_path in apk_paths
-        }
+    # Find the apks lazily, skipping the ones analyzed in a previous run
+    reused: list = []
+    duplicates: dict = {}
+    manifest = options["manifest"]
+    config = _scan_config(options) if scanner is not None else ""
+    apk_paths = _pending_apks(
+        target, scanner, config, manifest, resume, retry_failed, reused
+    )
+
+    # Schedule the apks from the longest to the shortest predicted analysis
+    costs: dict = {}
+    if cost_model is not None:
+        costs = {cost.apk: cost for cost in cost_model.order(apk_paths)}
+        apk_paths = list(costs)
+
+    # Filter out the apks that do not need FlowDroid before launching it
+    if triage:
+        checker = Triage(load_sources_and_sinks(options["sources_and_sinks"]))
+        apk_paths = _triage_apks(
+            apk_paths, checker, triage, reused, duplicates, manifest
+        )
+
+    # Yield the results of the previous run and the triage as they are found
+    results = _iter_results(
+        apk_paths, options, workers, max_heap, queue, cost_model, costs
+    )
+    pairs = _merge_reused(results, reused)
+    if triage:
+        pairs = _copy_duplicates(pairs, duplicates, manifest)
+    if scanner is not None:
+        pairs = scanner.record(pairs, config)
+    return pairs
+
+
+def _scan_config(options: dict) -> str:
+    """
+    Computes the key of the analysis configuration in the snapshot of the
+    scanner, from the options that change the results.
+    """
+    platforms = options["platforms"]
+    return _config_key(
+        options["sources_and_sinks"],
+        timeout=options["timeout"],
+        max_rss=options["max_rss"],
+        platforms=str(platforms.folder) if platforms is not None else "",
+    )
+
+
+def _pending_apks(
+    target: Path,
+    scanner: Optional[ApkScanner],
+    config: str,
+    manifest: Optional[RunManifest],
+    resume: bool,
+    retry_failed: bool,
+    reused: list,
+) -> Iterable[str]:
+    """
+    Lazily finds the apks to be analyzed, adding the ones whose result is
+    reused from the snapshot of `scanner` or from `manifest` to `reused`.
+    """
+    apk_paths: Iterable[str] = [str(target)]
+    if target.is_dir():
+        logging.info(f"Analyzing '{target}'")
+        apk_paths = _find_apks(target, scanner, config, reused)
+    if manifest is not None and (resume or retry_failed):
+        apk_paths = _skip_recorded(apk_paths, manifest, retry_failed, reused)
+    return apk_paths
+
+
+def _iter_results(
+    apk_paths: Iterable[str],
+    options: dict,
+    workers: int = 1,
+    max_heap: int = 0,
+    queue: Optional[JobQueue] = None,
+    cost_model: Optional[CostModel] = None,
+    costs: Optional[dict] = None,
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Analize the apks sequentially, in a pool of workers, scheduled by their
+    cost or in remote workers.
+    """
+    if queue is not None:
+        results = iter_queue_results(
+            queue,
+            apk_paths,
+            options["sources_and_sinks"],
+            save_logs=options["save_logs"],
+            timeout=options["timeout"],
+            max_rss=options["max_rss"],
+        )
+        if options["manifest"] is not None:
+            results = _record_all(results, options["manifest"])
+        return results
+    if cost_model is not None:
+        return _iter_scheduled(
+            apk_paths, costs or {}, cost_model, workers, max_heap, **options
+        )
+    if workers == 1:
+        return ((p, _analyze_and_record(p, **options)) for p in apk_paths)
+    return _iter_pool(apk_paths, workers, **options)
 
-    # Raise execption for invalid paths
-    raise ValueError(f"Address {path} does not point to a valid folder")
+
+def _find_apks(
+    folder_path: Path,
+    scanner: Optional[ApkScanner] = None,
+    config: str = "",
+    reused: Optional[list] = None,
+) -> Iterator[str]:
+    """
+    Lazily find all the apk files in a folder and its subfolders.
+
+    Parameters
+    ----------
+    folder_path : Path
+        Path to the folder.
+    scanner : ApkScanner, optional
+        Scanner used to find the apks. If None, all the '.apk' files are
+        found. By default None.
+    config : str, optional
+        Key of the analysis configuration in the snapshot of `scanner`, by
+        default ''.
+    reused : list, optional
+        List where the pairs of unchanged apk and its result recorded in the
+        snapshot are added, by default None.
+
+    Yields
+    ------
+    str
+        Path to an apk file.
+    """
+    return (scanner or ApkScanner()).scan(str(folder_path), config, reused)
+
+
+def _skip_recorded(
+    apk_paths: Iterable[str], manifest: RunManifest, retry_failed: bool, reused: list
+) -> Iterator[str]:
+    """
+    Filter out the apks whose result can be reused from a run manifest.
+
+    Parameters
+    ----------
+    apk_paths : Iterable[str]
+        Paths to the apk files.
+    manifest : RunManifest
+        Manifest of a previous run.
+    retry_failed : bool
+        Defines whether or not the apks whose recorded analysis did not finish
+        successfully are analyzed again.
+    reused : list
+        List where the pairs of skipped apk and its recorded result are added.
+
+    Yields
+    ------
+    str
+        Path to an apk file that has to be analyzed.
+    """
+    entries = manifest.entries()
+    for apk_path in apk_paths:
+        result = manifest.previous_result(apk_path, entries, retry_failed)
+        if result is None:
+            yield apk_path
+        else:
+            reused.append((apk_path, result))
+
+
+def _triage_apks(
+    apk_paths: Iterable[str],
+    checker: Triage,
+    mode: str,
+    reused: list,
+    duplicates: dict,
+    manifest: Optional[RunManifest] = None,
+) -> Iterator[str]:
+    """
+    Filter out the apks that do not need to be analyzed by FlowDroid.
+
+    Parameters
+    ----------
+    apk_paths : Iterable[str]
+        Paths to the apk files.
+    checker : Triage
+        Triage of the apks.
+    mode : str
+        'skip' to give a 'skipped' result to the apks that cannot leak
+        anything, or 'defer' to analyze them after all the others.
+    reused : list
+        List where the pairs of invalid or skipped apk and its result are
+        added.
+    duplicates : dict
+        Dictionary where the copies of each apk are added, by its path.
+    manifest : RunManifest, optional
+        Manifest where the results of the invalid or skipped apks are
+        recorded, by default None.
+
+    Yields
+    ------
+    str
+        Path to an apk file that has to be analyzed.
+    """
+    deferred = []
+    for apk_path in apk_paths:
+        verdict = checker.check(apk_path)
+        if verdict.verdict == VERDICT_ANALYZE:
+            yield apk_path
+        elif verdict.verdict == VERDICT_DUPLICATE:
+            duplicates.setdefault(verdict.original, []).append(apk_path)
+        elif verdict.verdict != VERDICT_INVALID and mode == TRIAGE_DEFER:
+            deferred.append(apk_path)
+        else:
+            invalid = verdict.verdict == VERDICT_INVALID
+            result = ApkResult(apk_path, STATUS_INVALID if invalid else STATUS_SKIPPED)
+            if manifest is not None:
+                manifest.record(result)
+            reused.append((apk_path, result))
+
+    # Low priority apks, analyzed once all the others are queued
+    yield from deferred
+
+
+def _record_all(
+    results: Iterable[tuple[str, ApkResult]], manifest: RunManifest
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Record in a manifest the results of the apks as they are yielded.
+    """
+    for apk_path, result in results:
+        manifest.record(result)
+        yield apk_path, result
+
+
+def _merge_reused(
+    results: Iterable[tuple[str, ApkResult]], reused: list
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Yield the results of the analysis and the reused results as they are
+    found.
+    """
+    for result in results:
+        yield from _drain(reused)
+        yield result
+    yield from _drain(reused)
+
+
+def _copy_duplicates(
+    pairs: Iterable[tuple[str, ApkResult]],
+    duplicates: dict,
+    manifest: Optional[RunManifest] = None,
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Yield the results of the apks and, once the result of an apk is known, a
+    copy of it for each of the copies of the apk.
+
+    Parameters
+    ----------
+    pairs : Iterable[tuple[str, ApkResult]]
+        Pairs of APK file name and its result.
+    duplicates : dict
+        Copies of each apk, by its path. It is filled while `pairs` is
+        consumed.
+    manifest : RunManifest, optional
+        Manifest where the results of the copies are recorded, by default
+        None.
+
+    Yields
+    ------
+    tuple[str, ApkResult]
+        Pairs of APK file name and its result.
+    """
+    finished: dict = {}
+
+    def copies() -> Iterator[tuple[str, ApkResult]]:
+        for original in [o for o in duplicates if o in finished]:
+            for duplicate in duplicates.pop(original):
+                copy = ApkResult.from_dict(finished[original].to_dict())
+                copy.apk = duplicate
+                if manifest is not None:
+                    manifest.record(copy)
+                yield duplicate, copy
+
+    for apk_path, result in pairs:
+        finished[str(apk_path)] = result
+        yield apk_path, result
+        yield from copies()
+
+    # Copies found after the last result
+    yield from copies()
+
+
+def _drain(items: list) -> Iterator:
+    """
+    Yield and remove all the items of a list.
+    """
+    while items:
+        yield items.pop(0)
+
+
+def _analyze_and_record(
+    path: str, manifest: Optional[RunManifest] = None, **options
+) -> ApkResult:
+    """
+    Execute FlowDroid analysis in an APK file and record its result.
+
+    Parameters
+    ----------
+    path : str
+        Path-like object pointing to the apk file.
+    manifest : RunManifest, optional
+        Manifest where the result is recorded. If None, the result is not
+        recorded. By default None.
+    **options
+        Extra keyword arguments passed to `analyze_apk`.
+
+    Returns
+    -------
+    ApkResult
+        Structured result of the FlowDroid analyzer.
+    """
+    result = analyze_apk(path, **options)
+    if manifest is not None:
+        manifest.record(result)
+    return result
+
+
+def _heap_per_worker(max_heap: int, workers: int) -> int:
+    """
+    Split a total heap budget among the workers of a pool.
+
+    Parameters
+    ----------
+    max_heap : int
+        Total heap (in MB) available for all the workers. 0 means no limit.
+    workers : int
+        Number of workers in the pool.
+
+    Returns
+    -------
+    int
+        Heap (in MB) assigned to each worker. 0 means no limit.
+
+    Raises
+    ------
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is lower than `workers`.
+    """
+
+    if workers < 1:
+        raise ValueError("workers must be greater than 0")
+    if max_heap < 0 or 0 < max_heap < workers:
+        raise ValueError(f"Can not split {max_heap}MB among {workers} workers")
+    return max_heap // workers
+
+
+def _iter_pool(
+    apk_paths: Iterable[str], workers: int, queue_size: int = 0, **options
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Execute FlowDroid analysis in several APK files at the same time.
+
+    The analysis runs in separate FlowDroid processes, so the pool threads
+    only wait for them to finish. At most `queue_size` APKs are submitted to
+    the pool at any time, and `apk_paths` is consumed only as the pool needs
+    more APKs.
+
+    Parameters
+    ----------
+    apk_paths : Iterable[str]
+        Paths to the apk files.
+    workers : int
+        Number of FlowDroid processes running at the same time.
+    queue_size : int, optional
+        Maximum number of APKs waiting in the pool. If 0,
+        `workers * DEFAULT_QUEUE_FACTOR` is used. By default 0.
+    **options
+        Extra keyword arguments passed to `_analyze_and_record`.
+
+    Yields
+    ------
+    tuple[str, ApkResult]
+        Pairs of APK file name and its result of FlowDroid analyzer, in
+        completion order.
+    """
+
+    queue_size = queue_size or workers * DEFAULT_QUEUE_FACTOR
+    pending_paths = iter(apk_paths)
+    futures: dict = {}
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(amount: int):
+        for apk_path in itertools.islice(pending_paths, amount):
+            future = executor.submit(_analyze_and_record, apk_path, **options)
+            futures[future] = apk_path
+
+    try:
+        # Fill the queue of the pool
+        submit(queue_size)
+
+        # Yield finished analyses and keep the queue full
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield futures.pop(future), future.result()
+            submit(len(done))
+
+    # Do not start queued analyses if the results are no longer needed
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _iter_scheduled(
+    apk_paths: Iterable[str],
+    costs: dict,
+    cost_model: CostModel,
+    workers: int,
+    heap_budget: int = 0,
+    **options,
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Execute FlowDroid analysis in several APK files, sharing a heap budget.
+
+    Each apk gets a share of `heap_budget` proportional to its predicted cost,
+    and it only starts once that much heap is free, so several huge apks do
+    not run out of memory at the same time. While the next apk waits for
+    memory, smaller apks that fit in the free heap are started instead.
+
+    Parameters
+    ----------
+    apk_paths : Iterable[str]
+        Paths to the apk files, in the order they should be analyzed.
+    costs : dict
+        `ApkCost` of each apk, by its path.
+    cost_model : CostModel
+        Model where the observed durations are recorded.
+    workers : int
+        Number of FlowDroid processes running at the same time.
+    heap_budget : int, optional
+        Total heap (in MB) shared by all the FlowDroid JVMs. If 0, the heap
+        given in `options` is used. By default 0.
+    **options
+        Extra keyword arguments passed to `_analyze_and_record`.
+
+    Yields
+    ------
+    tuple[str, ApkResult]
+        Pairs of APK file name and its result of FlowDroid analyzer, in
+        completion order.
+    """
+
+    pending = list(apk_paths)
+    known = [costs[p].predicted for p in pending if p in costs]
+    mean = sum(known) / len(known) if known else 0
+    heaps = {p: plan_heap(costs[p], mean, heap_budget, workers) for p in costs}
+    free_heap = heap_budget
+    default_heap = options.get("max_heap", 0)
+    futures: dict = {}
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while pending or futures:
+            # Start the first apks that fit in the free workers and heap
+            while len(futures) < workers:
+                index = _next_fitting(
+                    pending, heaps, default_heap, free_heap, heap_budget
+                )
+                if index is None:
+                    break
+                apk_path = pending.pop(index)
+                heap = heaps.get(apk_path, default_heap)
+                free_heap -= heap if heap_budget > 0 else 0
+                future = executor.submit(_timed_analysis, apk_path, heap, options)
+                futures[future] = (apk_path, heap)
+
+            # Release the heap of the finished analyses
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                apk_path, heap = futures.pop(future)
+                free_heap += heap if heap_budget > 0 else 0
+                result, seconds = future.result()
+                if result.status == STATUS_OK and apk_path in costs:
+                    cost_model.record(costs[apk_path], seconds)
+                yield apk_path, result
+
+    # Do not start queued analyses, but keep what was learned
+    finally:
+        executor.shutdown(cancel_futures=True)
+        cost_model.save()
+
+
+def _next_fitting(
+    pending: list, heaps: dict, default_heap: int, free_heap: int, heap_budget: int
+) -> Optional[int]:
+    """
+    Finds the first pending apk whose heap fits in the free heap, or the first
+    one if there is no heap budget.
+    """
+    for index, apk_path in enumerate(pending):
+        if heap_budget <= 0 or heaps.get(apk_path, default_heap) <= free_heap:
+            return index
+    return None
+
+
+def _timed_analysis(apk_path: str, heap: int, options: dict) -> tuple:
+    """
+    Analyzes an apk with a given heap, measuring how long it takes.
+    """
+    start = time.monotonic()
+    result = _analyze_and_record(apk_path, **{**options, "max_heap": heap})
+    return result, time.monotonic() - start
 
 
 def analyze(
     path: str = DEFAULT_APK_FOLDER_NAME,
-    sources_and_sinks: str = "",
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
     save_logs: bool = True,
+    workers: int = 1,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    server: Optional[AnalysisServer] = None,
+    manifest: Optional[RunManifest] = None,
+    resume: bool = False,
+    retry_failed: bool = False,
+    log_store: Optional[LogStore] = None,
+    database: Optional[ResultsDatabase] = None,
+    triage: str = "",
+    queue: Optional[JobQueue] = None,
+    cost_model: Optional[CostModel] = None,
+    platforms: Optional[PlatformProvider] = None,
+    scanner: Optional[ApkScanner] = None,
 ) -> tuple[int, int, list]:
     """
     Execute FlowDroid analysis in the given path.
 
-    Parameters
-    ----------
-    path : str, optional
-        Path pointing the target of the analysis. If path points to an apk file,
-        it returns the results of its analysis. If path points to a folder, it
-        returns the overal results of analysing all apk files in that folder.
-        By default, 'apks'.
-    sources_and_sinks : path, optional
-        Defines the path to the sources and sinks file. As part of this
-        library there are two sources_and_sinks files: 'large.txt' and
-        'small.txt'. Both can be passed as valid values of this param.
-        If not specified, the default sources and sinks file is 'small.txt'.
-        A path to a custom sources and sinks file can be passed as a string too.
-    save_logs : bool, optional
-        Defines whether or not save raw logs from FlowDroid, by default True
+    Parameters are the ones of `iter_analyze`.
 
     Returns
     -------
@@ -200,31 +1587,50 @@ def analyze(
     ValueError
         If `sources_and_sinks` is passed and does not point to a existing file
         or is not one of default values ('small.txt' or 'large.txt').
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is too small to be shared
+        among all the workers.
+    ValueError
+        If `triage` is not '', 'skip' or 'defer'.
     """
 
-    # Create the path object with the folder
-    path = Path(path)
-
-    # Check if path exists and is a folder
-    if path.exists():
-        if path.is_dir():
-            logs = analyze_apk_folder(path, sources_and_sinks, save_logs)
-        else:
-            logs = {path: analyze_apk(path, sources_and_sinks, save_logs)}
-        return quantify_leaks(logs)
-
-    # Raise execption for invalid paths
-    raise ValueError(f"Address {path} does not point to an existing location")
+    # Quantify the leaks while the apks are analyzed
+    results = iter_analyze(
+        path,
+        sources_and_sinks,
+        save_logs,
+        workers,
+        max_heap,
+        cache,
+        refresh,
+        timeout,
+        max_rss,
+        server,
+        manifest,
+        resume,
+        retry_failed,
+        log_store,
+        database,
+        triage,
+        queue,
+        cost_model,
+        platforms,
+        scanner,
+    )
+    return quantify_leaks(results)
 
 
-def quantify_leaks(logs: dict) -> tuple[int, int, list]:
+def quantify_leaks(logs: Union[dict, Iterable]) -> tuple[int, int, list]:
     """
     Quantify the number of leaks in all the analyzed APK.
 
     Parameters
     ----------
-    logs : dict
-        Pairs of APK file name and its raw output of FlowDroid analyzer.
+    logs : dict or Iterable
+        Pairs of APK file name and its result of FlowDroid analyzer, either as
+        an `ApkResult` or as the raw output of FlowDroid. It can be a
+        dictionary or an iterable of pairs, like the one returned by
+        `iter_analyze`, which is consumed incrementally.
 
     Returns
     -------
@@ -235,18 +1641,24 @@ def quantify_leaks(logs: dict) -> tuple[int, int, list]:
     Raises
     ------
     ValueError
-        If `logs` is not a dictionary.
+        If `logs` is not a dictionary or an iterable.
     """
 
-    # Check if logs is a dictionary
-    if not isinstance(logs, dict):
-        raise ValueError("logs must be a dictionary")
+    # Check if logs is a dictionary or a stream of pairs
+    if isinstance(logs, dict):
+        logs = logs.items()
+    elif isinstance(logs, str) or not isinstance(logs, Iterable):
+        raise ValueError("logs must be a dictionary or an iterable of pairs")
 
     leaky_apks = []
     total_leaks = 0
-    total_apps = len(logs.keys())
-    for apk, log in logs.items():
-        leak_count = count_leaks_in_log_file(log)
+    total_apps = 0
+    for apk, log in logs:
+        total_apps += 1
+        if isinstance(log, str):
+            leak_count = count_leaks_in_log_file(log)
+        else:
+            leak_count = log.leak_count
         if leak_count != 0:
             total_leaks += leak_count
             leaky_apks.append(apk)
@@ -270,10 +1682,7 @@ def count_leaks_in_log_file(log: str) -> int:
     """
 
     # Parse the total count of leaks found in the logs
-    # TODO: Improve this with regex
-    last_line = log.split("\n")[-1]
-    leaks = last_line.split()[-2]
-    return int(leaks) if leaks.isdigit() else 0
+    return parse_logs(log.splitlines()).leak_count
 
 
 def generate_report(total_apps, total_leaks, leaky_apks) -> str:
@@ -287,7 +1696,8 @@ def generate_report(total_apps, total_leaks, leaky_apks) -> str:
     total_leaks : _type_
         Total number of leaks found by Flowdroid
     leaky_apks : _type_
-        List of the leaky apks.
+        List of the leaky apks. Any iterable is accepted, which is consumed
+        while the report is generated.
 
     Returns
     -------
@@ -295,17 +1705,15 @@ def generate_report(total_apps, total_leaks, leaky_apks) -> str:
         Comprehensive report of the analysis conducted
     """
 
-    # Generate the report
-    report = cli_header("PYFLOWDROID REPORT")
-    report += f"Analized: {total_apps}\n"
-    report += f"Leaks found: {total_leaks}\n\n"
-
-    if len(leaky_apks):
-        report += f"Leaky apks:\n"
-
-        for lap in leaky_apks:
-            report += f" - {lap}\n"
-    else:
-        report += "No leaky apks found\n"
+    # Generate the report, joining its lines once
+    lines = [
+        cli_header("PYFLOWDROID REPORT"),
+        f"Analized: {total_apps}\n",
+        f"Leaks found: {total_leaks}\n\n",
+        "Leaky apks:\n",
+    ]
+    lines.extend(f" - {lap}\n" for lap in leaky_apks)
+    if len(lines) == 4:
+        lines[-1] = "No leaky apks found\n"
 
-    return report
+    return "".join(lines)
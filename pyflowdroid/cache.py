@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+from pyflowdroid._cli_tools import _hash_file_once
+from pyflowdroid.results import ApkResult
+from pyflowdroid.consts import (
+    FLOWDROID_EXEC_NAME,
+    DEFAULT_CACHE_FOLDER,
+    DEFAULT_CACHE_SIZE,
+)
+
+
+class ResultCache:
+    """
+    Persistent on-disk cache of FlowDroid results.
+
+    Each entry is keyed on the content of the apk, the content of the sources
+    and sinks file and the FlowDroid version, so any change in one of them
+    misses the cache. When the cache grows over `max_size`, the least recently
+    used entries are removed.
+
+    Parameters
+    ----------
+    folder : str, optional
+        Folder where the cache entries are stored, by default
+        '~/.cache/pyflowdroid'.
+    max_size : int, optional
+        Maximum size (in MB) of the cache, by default 1024.
+    """
+
+    def __init__(
+        self,
+        folder: str = DEFAULT_CACHE_FOLDER,
+        max_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.folder = Path(folder)
+        self.max_size = max_size * 1024 * 1024
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def key(self, apk_path: str, sources_and_sinks: str) -> str:
+        """
+        Computes the cache key of an analysis.
+
+        Parameters
+        ----------
+        apk_path : str
+            Path to the apk file.
+        sources_and_sinks : str
+            Path to the resolved sources and sinks file.
+
+        Returns
+        -------
+        str
+            Key of the analysis in the cache.
+        """
+        apk_hash = _hash_file_once(apk_path)
+        sns_hash = _hash_file_once(sources_and_sinks)
+        raw_key = f"{apk_hash}:{sns_hash}:{FLOWDROID_EXEC_NAME}"
+        return hashlib.sha256(raw_key.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.folder / f"{key}.json"
+
+    def get(self, key: str) -> Optional[ApkResult]:
+        """
+        Retrieves the result of an analysis from the cache.
+
+        Parameters
+        ----------
+        key : str
+            Key of the analysis in the cache.
+
+        Returns
+        -------
+        Optional[ApkResult]
+            Result of the analysis, or None if the key is not in the cache.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r") as f:
+                result = ApkResult.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+        # Mark the entry as recently used
+        entry_path.touch()
+        return result
+
+    def put(self, key: str, result: ApkResult) -> None:
+        """
+        Stores the result of an analysis in the cache.
+
+        Parameters
+        ----------
+        key : str
+            Key of the analysis in the cache.
+        result : ApkResult
+            Result of the analysis.
+        """
+
+        # Write in a temporary file first so readers never see partial entries
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(result.to_dict(), f)
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits in
+        `max_size`.
+        """
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.folder):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                logging.info(f"Evicting '{entry_path}' from the cache")
+                Path(entry_path).unlink(missing_ok=True)
+                total_size -= size
+
+    def clear(self) -> None:
+        """
+        Removes all the entries in the cache.
+        """
+        with self._lock:
+            for entry_path in self.folder.glob("*.json"):
+                entry_path.unlink(missing_ok=True)
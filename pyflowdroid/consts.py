@@ -5,10 +5,74 @@ PYFLOWDROID_PATH = pathlib.Path(__file__).parent.resolve()
 DEFAULT_APK_FOLDER_NAME = "apks"
 ANDROID_FOLDER_NAME = "android-platforms-master"
 FLOWDROID_EXEC_NAME = "soot-infoflow-cmd-2.9.0-jar-with-dependencies.jar"
+FLOWDROID_SERVER_SOURCE = "java/FlowDroidServer.java"
+INSTALL_MANIFEST_NAME = "install.json"
 
 # URLs
 FLOWDROID_DOWNLOAD_URL = f"""https://github.com/secure-software-engineering/FlowDroid/releases/download/v2.9/{FLOWDROID_EXEC_NAME}"""
 SABLE_DOWNLOAD_URL = """https://github.com/Sable/android-platforms/archive/master.zip"""
 
 # OTHERS
-DEFAULT_APK_PROVIDER = 'cubapk.com'
\ No newline at end of file
+DEFAULT_APK_PROVIDER = "cubapk.com"
+DEFAULT_HTTP_TIMEOUT = 60  # seconds
+DEFAULT_HTTP_HEADERS = {"User-Agent": "Mozilla/5.0"}
+DEFAULT_INDEX_TTL = 24 * 60 * 60  # seconds
+DEFAULT_INDEX_WORKERS = 4
+
+# Analysis
+DEFAULT_QUEUE_FACTOR = 2
+
+
+# Cache
+DEFAULT_CACHE_FOLDER = pathlib.Path.home() / ".cache" / "pyflowdroid"
+DEFAULT_CACHE_SIZE = 1024  # MB
+DEFAULT_INDEX_FOLDER = DEFAULT_CACHE_FOLDER / "index"
+DEFAULT_DEFINITIONS_FOLDER = DEFAULT_CACHE_FOLDER / "sources_sinks"
+DEFAULT_DOWNLOAD_FOLDER = DEFAULT_CACHE_FOLDER / "downloads"
+
+# Logs
+DEFAULT_LOG_SEGMENT_SIZE = 64  # MB
+
+# Database
+DEFAULT_DATABASE_BATCH_SIZE = 500  # apks per transaction
+
+# Discovery
+DEFAULT_SNAPSHOT_SAVE_EVERY = 1000  # apks recorded between two saves
+
+# Reports
+DEFAULT_REPORT_TOP = 10  # entries of each ranking of the report summary
+
+# Platforms
+DEFAULT_API_LEVEL = 17  # for apks whose manifest has no SDK version
+
+# Scheduling
+DEFAULT_COST_HISTORY = DEFAULT_CACHE_FOLDER / "scheduler" / "costs.json"
+DEFAULT_SECONDS_PER_METHOD = 0.001  # until there is a history of runs
+DEFAULT_SECONDS_PER_MB = 5  # for apks without readable dex files
+
+# Distributed analysis
+DEFAULT_LEASE_TIME = 60  # seconds
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_QUEUE_POLL_INTERVAL = 1  # seconds
+
+# Metrics
+DEFAULT_METRIC_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+    1800,
+    3600,
+)  # seconds
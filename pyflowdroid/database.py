@@ -0,0 +1,456 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from pyflowdroid._cli_tools import _hash_file_once
+from pyflowdroid.results import ApkResult, Leak
+from pyflowdroid.consts import DEFAULT_DATABASE_BATCH_SIZE
+
+# Method signature inside a Jimple statement, e.g. "<a.B: void c(int)>"
+_SIGNATURE_PATTERN = re.compile(r"<([^<>]+)>")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT,
+    sources_and_sinks TEXT,
+    started REAL,
+    finished REAL,
+    total_apks INTEGER,
+    total_leaks INTEGER
+);
+CREATE TABLE IF NOT EXISTS apks (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs(id),
+    apk TEXT,
+    hash TEXT,
+    status TEXT,
+    leak_count INTEGER,
+    call_graph_edges INTEGER,
+    callback_iterations INTEGER,
+    timings TEXT,
+    returncode INTEGER,
+    log_path TEXT
+);
+CREATE TABLE IF NOT EXISTS leaks (
+    id INTEGER PRIMARY KEY,
+    apk_id INTEGER REFERENCES apks(id),
+    source TEXT,
+    sink TEXT,
+    source_signature TEXT,
+    sink_signature TEXT,
+    method TEXT,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS apks_run ON apks(run_id);
+CREATE INDEX IF NOT EXISTS apks_hash ON apks(hash);
+CREATE INDEX IF NOT EXISTS leaks_apk ON leaks(apk_id);
+CREATE INDEX IF NOT EXISTS leaks_source ON leaks(source_signature);
+CREATE INDEX IF NOT EXISTS leaks_sink ON leaks(sink_signature);
+"""
+
+
+def _signature(statement: str) -> str:
+    """
+    Extracts the signature of the method called in a Jimple statement.
+    """
+    match = _SIGNATURE_PATTERN.search(statement)
+    return match.group(1) if match else statement
+
+
+def _glob_prefix(pattern: str) -> str:
+    """
+    Converts a signature prefix, where '*' is a wildcard, to a GLOB pattern.
+    Prefix patterns let SQLite use the indexes on the signatures.
+    """
+    pattern = pattern.strip("<>").replace("[", "[[]").replace("?", "[?]")
+    return pattern + "*"
+
+
+def _row(apk: str, result: ApkResult) -> tuple:
+    """
+    Builds the row of an apk result, hashing the apk if it still exists.
+    """
+    try:
+        apk_hash: Optional[str] = _hash_file_once(apk)
+    except OSError:
+        apk_hash = None
+    return str(apk), apk_hash, result
+
+
+def _leak_filters(
+    sink: Optional[str],
+    source: Optional[str],
+    run_id: Optional[int],
+    apk_hash: Optional[str],
+) -> tuple[str, list]:
+    """
+    Builds the WHERE clause and its parameters of a query of the leaks.
+    """
+    clauses, params = [], []
+    if sink is not None:
+        clauses.append("leaks.sink_signature GLOB ?")
+        params.append(_glob_prefix(sink))
+    if source is not None:
+        clauses.append("leaks.source_signature GLOB ?")
+        params.append(_glob_prefix(source))
+    if run_id is not None:
+        clauses.append("apks.run_id = ?")
+        params.append(run_id)
+    if apk_hash is not None:
+        clauses.append("apks.hash = ?")
+        params.append(apk_hash)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+class ResultsDatabase:
+    """
+    SQLite database with the results of the analysis runs.
+
+    Each run stores one row per analyzed apk and one row per leak found, so
+    past results can be queried without analyzing the apks again. Rows are
+    written in batches, each one in a single transaction.
+
+    Parameters
+    ----------
+    path : str
+        Path to the database file. It is created if it does not exist.
+    batch_size : int, optional
+        Number of apks written in each transaction, by default 500.
+    """
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_DATABASE_BATCH_SIZE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> "ResultsDatabase":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the connection to the database.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def start_run(self, path: str = "", sources_and_sinks: str = "") -> int:
+        """
+        Registers a new analysis run.
+
+        Parameters
+        ----------
+        path : str, optional
+            Target of the analysis, by default ''.
+        sources_and_sinks : str, optional
+            Sources and sinks file used in the analysis, by default ''.
+
+        Returns
+        -------
+        int
+            Id of the run.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO runs (path, sources_and_sinks, started) VALUES (?, ?, ?)",
+                (str(path), str(sources_and_sinks), time.time()),
+            )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id: int) -> None:
+        """
+        Marks a run as finished, computing its totals.
+
+        Parameters
+        ----------
+        run_id : int
+            Id of the run.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE runs SET finished = ?, "
+                "total_apks = (SELECT COUNT(*) FROM apks WHERE run_id = ?), "
+                "total_leaks = (SELECT TOTAL(leak_count) FROM apks WHERE run_id = ?) "
+                "WHERE id = ?",
+                (time.time(), run_id, run_id, run_id),
+            )
+
+    def add_results(self, run_id: int, results: Iterable[tuple]) -> None:
+        """
+        Writes the results of some apks in a single transaction.
+
+        Parameters
+        ----------
+        run_id : int
+            Id of the run the results belong to.
+        results : Iterable[tuple]
+            Pairs of apk path and its `ApkResult`.
+        """
+        self._add_rows(run_id, [_row(apk, result) for apk, result in results])
+
+    def _add_rows(self, run_id: int, rows: list) -> None:
+        """
+        Writes rows of apk path, apk hash and `ApkResult` in a single
+        transaction.
+        """
+        with self._lock, self._connection:
+            for apk, apk_hash, result in rows:
+                cursor = self._connection.execute(
+                    "INSERT INTO apks (run_id, apk, hash, status, leak_count, "
+                    "call_graph_edges, callback_iterations, timings, returncode, "
+                    "log_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        run_id,
+                        apk,
+                        apk_hash,
+                        result.status,
+                        result.leak_count,
+                        result.call_graph_edges,
+                        result.callback_iterations,
+                        json.dumps(result.timings),
+                        result.returncode,
+                        result.log_path,
+                    ),
+                )
+                self._connection.executemany(
+                    "INSERT INTO leaks (apk_id, source, sink, source_signature, "
+                    "sink_signature, method, path) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            cursor.lastrowid,
+                            leak.source,
+                            leak.sink,
+                            _signature(leak.source),
+                            _signature(leak.sink),
+                            leak.method,
+                            json.dumps(leak.path),
+                        )
+                        for leak in result.leaks
+                    ],
+                )
+
+    def record(
+        self, results: Iterable[tuple], path: str = "", sources_and_sinks: str = ""
+    ) -> Iterator[tuple]:
+        """
+        Records a stream of results as a new run while passing them through,
+        so it can wrap the output of `iter_analyze`.
+
+        Parameters
+        ----------
+        results : Iterable[tuple]
+            Pairs of apk path and its `ApkResult`.
+        path : str, optional
+            Target of the analysis, by default ''.
+        sources_and_sinks : str, optional
+            Sources and sinks file used in the analysis, by default ''.
+
+        Yields
+        ------
+        tuple
+            The same pairs of apk path and `ApkResult`.
+        """
+        run_id = self.start_run(path, sources_and_sinks)
+        batch: list = []
+        finished = False
+        try:
+            for apk, result in results:
+                # Hash the apk before the consumer can delete it
+                batch.append(_row(apk, result))
+                if len(batch) >= self.batch_size:
+                    self._add_rows(run_id, batch)
+                    batch.clear()
+                yield apk, result
+            finished = True
+
+        # Write what was analyzed even if the run was stopped
+        finally:
+            self._add_rows(run_id, batch)
+            if finished:
+                self.finish_run(run_id)
+
+    def runs(self) -> list:
+        """
+        Lists the analysis runs in the database.
+
+        Returns
+        -------
+        list
+            Rows of the runs as dictionaries, newest first.
+        """
+        return self._select("SELECT * FROM runs ORDER BY id DESC", ())
+
+    def apks(
+        self,
+        run_id: Optional[int] = None,
+        apk_hash: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> list:
+        """
+        Finds the analyzed apks matching all the given filters.
+
+        Parameters
+        ----------
+        run_id : int, optional
+            Id of the run, by default any run.
+        apk_hash : str, optional
+            SHA-256 hash of the apk, by default any apk.
+        status : str, optional
+            Status of the analysis, by default any status.
+
+        Returns
+        -------
+        list
+            Rows of the apks as dictionaries.
+        """
+        clauses, params = [], []
+        for column, value in (
+            ("run_id", run_id),
+            ("hash", apk_hash),
+            ("status", status),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._select(f"SELECT * FROM apks{where} ORDER BY id", params)
+
+    def leaks(
+        self,
+        sink: Optional[str] = None,
+        source: Optional[str] = None,
+        run_id: Optional[int] = None,
+        apk_hash: Optional[str] = None,
+        limit: int = 0,
+    ) -> list:
+        """
+        Finds the leaks matching all the given filters.
+
+        Sources and sinks are matched by the prefix of the signature of their
+        method, e.g. 'android.telephony.SmsManager' matches every method of
+        the SmsManager class. '*' can be used as a wildcard.
+
+        Parameters
+        ----------
+        sink : str, optional
+            Prefix of the signature of the sink, by default any sink.
+        source : str, optional
+            Prefix of the signature of the source, by default any source.
+        run_id : int, optional
+            Id of the run, by default any run.
+        apk_hash : str, optional
+            SHA-256 hash of the apk, by default any apk.
+        limit : int, optional
+            Maximum number of leaks returned. If 0, there is no limit. By
+            default 0.
+
+        Returns
+        -------
+        list
+            Rows of the leaks as dictionaries, with the apk they belong to.
+        """
+        where, params = _leak_filters(sink, source, run_id, apk_hash)
+        query = (
+            "SELECT apks.run_id, apks.apk, apks.hash, leaks.source, leaks.sink, "
+            "leaks.method, leaks.path FROM leaks JOIN apks ON apks.id = leaks.apk_id"
+            f"{where} ORDER BY leaks.id"
+        )
+        if limit > 0:
+            query += f" LIMIT {int(limit)}"
+        rows = self._select(query, params)
+        for row in rows:
+            row["path"] = json.loads(row["path"])
+        return rows
+
+    def leaky_apks(
+        self,
+        sink: Optional[str] = None,
+        source: Optional[str] = None,
+        run_id: Optional[int] = None,
+        apk_hash: Optional[str] = None,
+    ) -> list:
+        """
+        Finds the apks with at least one leak matching all the given filters.
+
+        Parameters
+        ----------
+        sink : str, optional
+            Prefix of the signature of the sink, by default any sink.
+        source : str, optional
+            Prefix of the signature of the source, by default any source.
+        run_id : int, optional
+            Id of the run, by default any run.
+        apk_hash : str, optional
+            SHA-256 hash of the apk, by default any apk.
+
+        Returns
+        -------
+        list
+            Paths to the apks, without duplicates, sorted.
+        """
+        where, params = _leak_filters(sink, source, run_id, apk_hash)
+        query = (
+            "SELECT DISTINCT apks.apk FROM leaks JOIN apks ON apks.id = leaks.apk_id"
+            f"{where} ORDER BY apks.apk"
+        )
+        return [row["apk"] for row in self._select(query, params)]
+
+    def result(self, apk_id: int) -> ApkResult:
+        """
+        Rebuilds the result of an apk stored in the database.
+
+        Parameters
+        ----------
+        apk_id : int
+            Id of the apk row.
+
+        Returns
+        -------
+        ApkResult
+            Result of the analysis of the apk.
+
+        Raises
+        ------
+        KeyError
+            If there is no apk with the given id.
+        """
+        rows = self._select("SELECT * FROM apks WHERE id = ?", (apk_id,))
+        if not rows:
+            raise KeyError(apk_id)
+        row = rows[0]
+        leaks = [
+            Leak(leak["source"], leak["sink"], json.loads(leak["path"]), leak["method"])
+            for leak in self._select(
+                "SELECT * FROM leaks WHERE apk_id = ? ORDER BY id", (apk_id,)
+            )
+        ]
+        return ApkResult(
+            row["apk"],
+            row["status"],
+            leaks,
+            row["leak_count"],
+            row["call_graph_edges"],
+            row["callback_iterations"],
+            json.loads(row["timings"]),
+            row["returncode"],
+            row["log_path"],
+        )
+
+    def _select(self, query: str, params: Iterable) -> list:
+        with self._lock:
+            cursor = self._connection.execute(query, tuple(params))
+            return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,345 @@
+import os
+import re
+import hashlib
+import logging
+import functools
+from pathlib import Path
+from typing import Iterable, Optional, Union
+from pyflowdroid.consts import PYFLOWDROID_PATH, DEFAULT_DEFINITIONS_FOLDER
+
+# Kinds of definitions understood by FlowDroid
+KIND_SOURCE = "_SOURCE_"
+KIND_SINK = "_SINK_"
+KIND_BOTH = "_BOTH_"
+
+# Category of the definitions listed before any category header
+NO_CATEGORY = "NO_CATEGORY"
+
+# Sources and sinks files shipped with pyflowdroid
+BUILTIN_DEFINITIONS = ("small.txt", "large.txt")
+
+# Lines of a sources and sinks file
+_CATEGORY_PATTERN = re.compile(r"^([A-Z_]+):$")
+_DEFINITION_PATTERN = re.compile(r"^(<.+?\)>)\s*(.*?)\s*->\s*(_SOURCE_|_SINK_|_BOTH_)$")
+_SIGNATURE_PATTERN = re.compile(r"^<[\w$.]+: [\w$.\[\]]+ [\w$<>]+\([\w$.\[\],]*\)>$")
+
+
+class SourceSinkSet:
+    """
+    Validated and deduplicated set of sources and sinks definitions.
+
+    Definitions are kept by method signature, with their kind (source, sink
+    or both), their category and the permissions FlowDroid associates with
+    them. Sets can be filtered by category and merged, and they are compiled
+    into a canonical file named after the hash of its content, so equal sets
+    always produce the same file.
+
+    Parameters
+    ----------
+    definitions : dict, optional
+        Pairs of method signature and a tuple with its kind, category and
+        permissions, by default an empty set.
+    """
+
+    def __init__(self, definitions: Optional[dict] = None):
+        self.definitions = dict(definitions or {})
+
+    def __len__(self) -> int:
+        return len(self.definitions)
+
+    def __contains__(self, signature: str) -> bool:
+        return signature in self.definitions
+
+    def __or__(self, other: "SourceSinkSet") -> "SourceSinkSet":
+        return self.merge(other)
+
+    def __repr__(self) -> str:
+        return (
+            f"SourceSinkSet(sources={len(self.sources)}, sinks={len(self.sinks)}, "
+            f"digest={self.digest[:12]!r})"
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "SourceSinkSet":
+        """
+        Loads the definitions of a sources and sinks file.
+
+        Malformed definitions are skipped with a warning. Definitions of the
+        same method are merged, so a method listed as source and as sink is a
+        definition of both kinds.
+
+        Parameters
+        ----------
+        path : str
+            Path to the sources and sinks file.
+
+        Returns
+        -------
+        SourceSinkSet
+            Definitions of the file.
+        """
+        definitions: dict = {}
+        category = NO_CATEGORY
+        invalid = 0
+        with open(path, "r", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("%"):
+                    continue
+
+                match = _CATEGORY_PATTERN.match(line)
+                if match:
+                    category = match.group(1)
+                    continue
+
+                match = _DEFINITION_PATTERN.match(line)
+                if not match or not _SIGNATURE_PATTERN.match(match.group(1)):
+                    invalid += 1
+                    continue
+                signature, permissions, kind = match.groups()
+                _add(definitions, signature, kind, category, permissions)
+
+        if invalid:
+            logging.warning(f"Skipped {invalid} malformed definitions in '{path}'")
+        return cls(definitions)
+
+    @property
+    def sources(self) -> list:
+        """
+        Signatures of the methods defined as sources.
+        """
+        return [s for s, (kind, *_) in self.definitions.items() if kind != KIND_SINK]
+
+    @property
+    def sinks(self) -> list:
+        """
+        Signatures of the methods defined as sinks.
+        """
+        return [s for s, (kind, *_) in self.definitions.items() if kind != KIND_SOURCE]
+
+    def categories(self) -> dict:
+        """
+        Counts the sources and sinks of each category.
+
+        Returns
+        -------
+        dict
+            Pairs of category and a tuple with its number of sources and
+            sinks.
+        """
+        counts: dict = {}
+        for kind, category, _ in self.definitions.values():
+            sources, sinks = counts.get(category, (0, 0))
+            counts[category] = (
+                sources + (kind != KIND_SINK),
+                sinks + (kind != KIND_SOURCE),
+            )
+        return dict(sorted(counts.items()))
+
+    def select(
+        self,
+        source_categories: Optional[Iterable[str]] = None,
+        sink_categories: Optional[Iterable[str]] = None,
+    ) -> "SourceSinkSet":
+        """
+        Selects the sources and sinks of some categories.
+
+        Parameters
+        ----------
+        source_categories : Iterable[str], optional
+            Categories of the sources kept. If None, all the sources are kept.
+            By default None.
+        sink_categories : Iterable[str], optional
+            Categories of the sinks kept. If None, all the sinks are kept. By
+            default None.
+
+        Returns
+        -------
+        SourceSinkSet
+            Subset of the definitions.
+
+        Raises
+        ------
+        ValueError
+            If one of the categories is not in the set.
+        """
+        known = set(self.categories())
+        selected = {}
+        for kinds, categories in (
+            ((KIND_SOURCE, KIND_BOTH), source_categories),
+            ((KIND_SINK, KIND_BOTH), sink_categories),
+        ):
+            if categories is not None:
+                categories = set(categories)
+                unknown = categories - known
+                if unknown:
+                    raise ValueError(
+                        f"Unknown categories: {', '.join(sorted(unknown))}"
+                    )
+            for signature, (kind, category, permissions) in self.definitions.items():
+                if kind in kinds and (categories is None or category in categories):
+                    kept = kinds[0]
+                    _add(selected, signature, kept, category, permissions)
+        return SourceSinkSet(selected)
+
+    def merge(self, other: "SourceSinkSet") -> "SourceSinkSet":
+        """
+        Merges the definitions of two sets.
+
+        Parameters
+        ----------
+        other : SourceSinkSet
+            Set merged with this one.
+
+        Returns
+        -------
+        SourceSinkSet
+            Set with the definitions of both sets.
+        """
+        merged = dict(self.definitions)
+        for signature, (kind, category, permissions) in other.definitions.items():
+            _add(merged, signature, kind, category, permissions)
+        return SourceSinkSet(merged)
+
+    def to_text(self) -> str:
+        """
+        Serializes the set in the canonical form of a sources and sinks file,
+        grouped by category and sorted by signature.
+
+        Returns
+        -------
+        str
+            Content of the sources and sinks file.
+        """
+        by_category: dict = {}
+        for signature, (kind, category, permissions) in self.definitions.items():
+            line = f"{signature} -> {kind}"
+            if permissions:
+                line = f"{signature} {permissions} -> {kind}"
+            by_category.setdefault(category, []).append(line)
+
+        lines = []
+        for category in sorted(by_category):
+            lines.append(f"{category}:")
+            lines.extend(sorted(by_category[category]))
+            lines.append("")
+        return "\n".join(lines)
+
+    @functools.cached_property
+    def digest(self) -> str:
+        """
+        SHA-256 hash of the canonical form of the set.
+        """
+        return hashlib.sha256(self.to_text().encode()).hexdigest()
+
+    def compile(self, folder: str = DEFAULT_DEFINITIONS_FOLDER) -> Path:
+        """
+        Writes the canonical form of the set to a file named after its hash,
+        unless it was already written.
+
+        Parameters
+        ----------
+        folder : str, optional
+            Folder where the file is written, by default
+            '~/.cache/pyflowdroid/sources_sinks'.
+
+        Returns
+        -------
+        Path
+            Path to the compiled sources and sinks file.
+        """
+        path = Path(folder, f"{self.digest}.txt")
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(self.to_text())
+            os.replace(tmp_path, path)
+        return path
+
+
+def _add(
+    definitions: dict, signature: str, kind: str, category: str, permissions: str
+) -> None:
+    """
+    Adds a definition to a dictionary of definitions, merging its kind with
+    the one of a previous definition of the same method.
+    """
+    previous = definitions.get(signature)
+    if previous is not None and previous[0] != kind:
+        kind = KIND_BOTH
+    if previous is not None and previous[1] != NO_CATEGORY:
+        category = previous[1]
+    definitions[signature] = (kind, category, permissions)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_cached(path: str, mtime: float, size: int) -> SourceSinkSet:
+    return SourceSinkSet.load(path)
+
+
+def load_sources_and_sinks(sources_and_sinks: str = "") -> SourceSinkSet:
+    """
+    Loads a sources and sinks file, parsing each file only once.
+
+    Parameters
+    ----------
+    sources_and_sinks : str, optional
+        Path to a sources and sinks file, or the name of one of the files
+        shipped with pyflowdroid ('small.txt' or 'large.txt'), by default
+        'small.txt'.
+
+    Returns
+    -------
+    SourceSinkSet
+        Definitions of the file.
+
+    Raises
+    ------
+    ValueError
+        If `sources_and_sinks` does not point to a existing file and is not
+        the name of a file shipped with pyflowdroid.
+    """
+    path = resolve_sources_and_sinks(sources_and_sinks)
+    stat = path.stat()
+    return _load_cached(str(path), stat.st_mtime, stat.st_size)
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_path(sources_and_sinks: str) -> Path:
+    sns_path = Path(sources_and_sinks)
+    if sns_path.is_file():
+        return sns_path
+    if sources_and_sinks == "":
+        sources_and_sinks = "small.txt"
+    if sources_and_sinks in BUILTIN_DEFINITIONS:
+        return Path(PYFLOWDROID_PATH, "sources_sinks", sources_and_sinks)
+    raise ValueError("Invalid sources and sinks file path.")
+
+
+def resolve_sources_and_sinks(
+    sources_and_sinks: Union[str, Path, SourceSinkSet] = "",
+) -> Path:
+    """
+    Finds the sources and sinks file to be passed to FlowDroid.
+
+    Parameters
+    ----------
+    sources_and_sinks : str, Path or SourceSinkSet, optional
+        Path to a sources and sinks file, the name of one of the files shipped
+        with pyflowdroid ('small.txt' or 'large.txt'), or a set of definitions,
+        which is compiled to a file. By default 'small.txt'.
+
+    Returns
+    -------
+    Path
+        Path to the sources and sinks file.
+
+    Raises
+    ------
+    ValueError
+        If `sources_and_sinks` does not point to a existing file and is not
+        the name of a file shipped with pyflowdroid.
+    """
+    if isinstance(sources_and_sinks, SourceSinkSet):
+        return sources_and_sinks.compile()
+    return _resolve_path(str(sources_and_sinks))
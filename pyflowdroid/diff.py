@@ -0,0 +1,837 @@
+import re
+import os
+import sys
+import array
+import struct
+import hashlib
+import logging
+import zipfile
+import functools
+from pathlib import Path
+from typing import Optional, Union
+from pyflowdroid.analyze import analyze_apk
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.logstore import LogStore
+from pyflowdroid.metrics import get_metrics
+from pyflowdroid.platforms import PlatformProvider
+from pyflowdroid.database import _signature
+from pyflowdroid.triage import (
+    _DEX_NAME_PATTERN,
+    _DEX_HEADER_SIZE,
+    _DEX_MAGIC,
+    _METHOD_NAME_PATTERN,
+    _read_uleb128,
+)
+from pyflowdroid.definitions import (
+    KIND_SINK,
+    KIND_SOURCE,
+    SourceSinkSet,
+    load_sources_and_sinks,
+    resolve_sources_and_sinks,
+)
+from pyflowdroid.results import ApkResult, STATUS_OK
+
+# How the result of the new version of an apk was obtained
+MODE_REUSED = "reused"
+MODE_RESTRICTED = "restricted"
+MODE_FULL = "full"
+
+# Class of a method signature in a Jimple statement, e.g. 'a.B' in "<a.B: void c()>"
+_SIGNATURE_CLASS_PATTERN = re.compile(r"<([\w$.]+): ")
+
+# Entries of an apk, besides the code, that change the results of FlowDroid
+_RESOURCE_PATTERN = re.compile(r"^(AndroidManifest\.xml|res/layout[^/]*/.+)$")
+
+# Offsets in the header of a dex file of the (size, offset) of each table
+_TYPE_IDS_OFFSET = 0x40
+_PROTO_IDS_OFFSET = 0x48
+_FIELD_IDS_OFFSET = 0x50
+_METHOD_IDS_OFFSET = 0x58
+_CLASS_DEFS_OFFSET = 0x60
+_STRING_IDS_OFFSET = 0x38
+_NO_INDEX = 0xFFFFFFFF
+
+# Code units of each Dalvik instruction, by opcode
+_OPCODE_UNITS = bytearray([1] * 256)
+for _opcodes, _units in (
+    ((0x02, 0x05, 0x08, 0x13, 0x15, 0x16, 0x19, 0x1A, 0x1C, 0x1F), 2),
+    ((0x20, 0x22, 0x23, 0x29, 0xFE, 0xFF), 2),
+    (range(0x2D, 0x3E), 2),
+    (range(0x44, 0x6E), 2),
+    (range(0x90, 0xB0), 2),
+    (range(0xD0, 0xE3), 2),
+    ((0x03, 0x06, 0x09, 0x14, 0x17, 0x1B, 0x24, 0x25, 0x26, 0x2A, 0x2B), 3),
+    ((0x2C, 0xFC, 0xFD), 3),
+    (range(0x6E, 0x73), 3),
+    (range(0x74, 0x79), 3),
+    ((0xFA, 0xFB), 4),
+    ((0x18,), 5),
+):
+    for _opcode in _opcodes:
+        _OPCODE_UNITS[_opcode] = _units
+
+# Instructions referencing the string, type, field and method tables
+_CONST_STRING = 0x1A
+_CONST_STRING_JUMBO = 0x1B
+_TYPE_OPCODES = frozenset((0x1C, 0x1F, 0x20, 0x22, 0x23, 0x24, 0x25))
+_FIELD_OPCODES = frozenset(range(0x52, 0x6E))
+_METHOD_OPCODES = frozenset((*range(0x6E, 0x73), *range(0x74, 0x79), 0xFA, 0xFB))
+_REFERENCE_OPCODES = frozenset(
+    (
+        *_TYPE_OPCODES,
+        *_FIELD_OPCODES,
+        *_METHOD_OPCODES,
+        _CONST_STRING,
+        _CONST_STRING_JUMBO,
+    )
+)
+
+# Identifiers of the payloads of switch and fill-array-data instructions
+_PACKED_SWITCH_PAYLOAD = 0x0100
+_SPARSE_SWITCH_PAYLOAD = 0x0200
+_FILL_ARRAY_DATA_PAYLOAD = 0x0300
+
+
+def _java_name(descriptor: str) -> str:
+    """
+    Converts a class descriptor to a class name, e.g. 'La/B$C;' -> 'a.B$C'.
+    """
+    if descriptor.startswith("L") and descriptor.endswith(";"):
+        return descriptor[1:-1].replace("/", ".")
+    return descriptor
+
+
+class _DexReader:
+    """
+    Resolves the indexes of the tables of a dex file to names.
+    """
+
+    def __init__(self, dex: bytes):
+        if len(dex) < _DEX_HEADER_SIZE or not dex.startswith(_DEX_MAGIC):
+            raise ValueError("Not a dex file")
+        self.dex = dex
+        self.string_ids = struct.unpack_from("<II", dex, _STRING_IDS_OFFSET)
+        self.type_ids = struct.unpack_from("<II", dex, _TYPE_IDS_OFFSET)
+        self.proto_ids = struct.unpack_from("<II", dex, _PROTO_IDS_OFFSET)
+        self.field_ids = struct.unpack_from("<II", dex, _FIELD_IDS_OFFSET)
+        self.method_ids = struct.unpack_from("<II", dex, _METHOD_IDS_OFFSET)
+        self.class_defs = struct.unpack_from("<II", dex, _CLASS_DEFS_OFFSET)
+        self._strings: dict = {}
+        self._methods: dict = {}
+
+    def string(self, index: int) -> str:
+        value = self._strings.get(index)
+        if value is None:
+            if index >= self.string_ids[0]:
+                raise ValueError("String out of the string table")
+            (data_off,) = struct.unpack_from(
+                "<I", self.dex, self.string_ids[1] + 4 * index
+            )
+            _, start = _read_uleb128(self.dex, data_off)
+            end = self.dex.index(b"\0", start)
+            value = self.dex[start:end].decode("utf-8", "replace")
+            self._strings[index] = value
+        return value
+
+    def type(self, index: int) -> str:
+        if index >= self.type_ids[0]:
+            raise ValueError("Type out of the type table")
+        (descriptor_idx,) = struct.unpack_from(
+            "<I", self.dex, self.type_ids[1] + 4 * index
+        )
+        return self.string(descriptor_idx)
+
+    def type_list(self, offset: int) -> str:
+        if not offset:
+            return ""
+        (size,) = struct.unpack_from("<I", self.dex, offset)
+        indexes = struct.unpack_from(f"<{size}H", self.dex, offset + 4)
+        return "".join(self.type(index) for index in indexes)
+
+    def proto(self, index: int) -> str:
+        shorty_idx, return_idx, parameters_off = struct.unpack_from(
+            "<III", self.dex, self.proto_ids[1] + 12 * index
+        )
+        return f"({self.type_list(parameters_off)}){self.type(return_idx)}"
+
+    def field(self, index: int) -> str:
+        class_idx, type_idx, name_idx = struct.unpack_from(
+            "<HHI", self.dex, self.field_ids[1] + 8 * index
+        )
+        return f"{self.type(class_idx)}->{self.string(name_idx)}:{self.type(type_idx)}"
+
+    def method(self, index: int) -> tuple:
+        method = self._methods.get(index)
+        if method is None:
+            class_idx, proto_idx, name_idx = struct.unpack_from(
+                "<HHI", self.dex, self.method_ids[1] + 8 * index
+            )
+            name = self.string(name_idx)
+            method = (f"{self.type(class_idx)}->{name}{self.proto(proto_idx)}", name)
+            self._methods[index] = method
+        return method
+
+    def code(self, offset: int, invoked: set) -> bytes:
+        """
+        Normalizes the bytecode of a method, replacing the indexes of the
+        tables by the names they point to, so it does not change when other
+        classes add strings, types, fields or methods.
+        """
+        registers, ins, outs, tries = struct.unpack_from("<4H", self.dex, offset)
+        (insns_size,) = struct.unpack_from("<I", self.dex, offset + 12)
+        start = offset + 16
+        units = array.array("H", self.dex[start : start + 2 * insns_size])
+        if units.itemsize != 2 or len(units) != insns_size:
+            raise ValueError("Corrupt code item")
+        if sys.byteorder == "big":
+            units.byteswap()
+
+        references = [f"{registers} {ins} {outs} {tries}"]
+        pos = 0
+        while pos < insns_size:
+            unit = units[pos]
+
+            # Payloads are data mixed with the instructions, not references
+            width = _payload_width(units, pos)
+            if width is None:
+                width = _OPCODE_UNITS[unit & 0xFF]
+                reference = self._reference(units, pos, invoked)
+                if reference is not None:
+                    references.append(reference)
+            pos += width
+
+        return units.tobytes() + "\0".join(references).encode()
+
+    def _reference(self, units: array.array, pos: int, invoked: set) -> Optional[str]:
+        """
+        Replaces the index referenced by an instruction by 0, returning what
+        it points to, or None if the instruction has no reference.
+        """
+        opcode = units[pos] & 0xFF
+        if opcode not in _REFERENCE_OPCODES:
+            return None
+        index = units[pos + 1]
+        if opcode in _METHOD_OPCODES:
+            signature, name = self.method(index)
+            invoked.add(name)
+            reference = signature
+        elif opcode in _FIELD_OPCODES:
+            reference = self.field(index)
+        elif opcode in _TYPE_OPCODES:
+            reference = self.type(index)
+        elif opcode == _CONST_STRING:
+            reference = self.string(index)
+        else:
+            reference = self.string(index | units[pos + 2] << 16)
+            units[pos + 2] = 0
+        units[pos + 1] = 0
+        return reference
+
+
+def _payload_width(units: array.array, pos: int) -> Optional[int]:
+    """
+    Code units of the switch or fill-array-data payload at `pos`, or None if
+    it is an instruction.
+    """
+    unit = units[pos]
+    if unit == _PACKED_SWITCH_PAYLOAD:
+        return units[pos + 1] * 2 + 4
+    if unit == _SPARSE_SWITCH_PAYLOAD:
+        return units[pos + 1] * 4 + 2
+    if unit == _FILL_ARRAY_DATA_PAYLOAD:
+        size = units[pos + 2] | units[pos + 3] << 16
+        return (size * units[pos + 1] + 1) // 2 + 4
+    return None
+
+
+def dex_classes(dex: bytes) -> dict:
+    """
+    Fingerprints the classes defined in a dex file.
+
+    The fingerprint of a class covers its superclass, interfaces, fields and
+    the bytecode of its methods, with every reference to a string, type,
+    field or method replaced by its name. Recompiling an app where a class
+    did not change gives that class the same fingerprint, even if other
+    classes changed.
+
+    Parameters
+    ----------
+    dex : bytes
+        Content of the dex file.
+
+    Returns
+    -------
+    dict
+        Pairs of class name, e.g. 'com.example.Main', and a tuple with its
+        fingerprint and the names of the methods it calls.
+
+    Raises
+    ------
+    ValueError
+        If `dex` is not a valid dex file.
+    """
+    reader = _DexReader(dex)
+    classes = {}
+    try:
+        size, offset = reader.class_defs
+        for index in range(size):
+            (
+                class_idx,
+                access_flags,
+                superclass_idx,
+                interfaces_off,
+                _,
+                _,
+                class_data_off,
+                _,
+            ) = struct.unpack_from("<8I", dex, offset + 32 * index)
+            superclass = ""
+            if superclass_idx != _NO_INDEX:
+                superclass = reader.type(superclass_idx)
+            members = [
+                f"{access_flags} {superclass} {reader.type_list(interfaces_off)}"
+            ]
+            invoked: set = set()
+            if class_data_off:
+                members += _class_members(reader, class_data_off, invoked)
+
+            name = _java_name(reader.type(class_idx))
+            digest = hashlib.sha256("\n".join(sorted(members)).encode()).hexdigest()
+            classes.setdefault(name, (digest, frozenset(invoked)))
+    except (struct.error, IndexError) as error:
+        raise ValueError(f"Corrupt dex file: {error}") from error
+    return classes
+
+
+def _class_members(reader: _DexReader, offset: int, invoked: set) -> list:
+    """
+    Describes the fields and methods in the class data at `offset`, adding
+    the names of the methods they call to `invoked`.
+    """
+
+    # Class data: field and method counts, then their diff-encoded ids
+    dex = reader.dex
+    counts = []
+    for _ in range(4):
+        count, offset = _read_uleb128(dex, offset)
+        counts.append(count)
+    members = []
+    for kind, count in enumerate(counts):
+        member_idx = 0
+        for _ in range(count):
+            idx_diff, offset = _read_uleb128(dex, offset)
+            flags, offset = _read_uleb128(dex, offset)
+            member_idx += idx_diff
+            if kind < 2:
+                members.append(f"F {flags} {reader.field(member_idx)}")
+                continue
+            code_off, offset = _read_uleb128(dex, offset)
+            code = reader.code(code_off, invoked) if code_off else b""
+            signature = reader.method(member_idx)[0]
+            code_hash = hashlib.sha256(code).hexdigest()
+            members.append(f"M {flags} {signature} {code_hash}")
+    return members
+
+
+class ApkFingerprint:
+    """
+    Fingerprints of the code and of the resources of an apk that FlowDroid
+    reads.
+
+    Parameters
+    ----------
+    dex_crcs : tuple
+        CRC-32 of each dex file, in order.
+    resources : str
+        Hash of the manifest and the layouts.
+    classes : dict, optional
+        Fingerprint of each class, as returned by `dex_classes`. Read on
+        demand if None. By default None.
+    apk_path : str, optional
+        Path to the apk, to read the classes on demand, by default ''.
+    """
+
+    __slots__ = ("dex_crcs", "resources", "_classes", "apk_path")
+
+    def __init__(
+        self,
+        dex_crcs: tuple,
+        resources: str,
+        classes: Optional[dict] = None,
+        apk_path: str = "",
+    ):
+        self.dex_crcs = dex_crcs
+        self.resources = resources
+        self._classes = classes
+        self.apk_path = apk_path
+
+    @property
+    def classes(self) -> dict:
+        """
+        Fingerprint of each class of the apk. When a class is defined in
+        several dex files, the first one is used, like Android does.
+        """
+        if self._classes is None:
+            classes: dict = {}
+            try:
+                with zipfile.ZipFile(self.apk_path) as apk:
+                    for dex_name in _dex_names(apk):
+                        for name, entry in dex_classes(apk.read(dex_name)).items():
+                            classes.setdefault(name, entry)
+            except (zipfile.BadZipFile, EOFError, OSError) as error:
+                raise ValueError(f"Invalid apk: {error}") from error
+            self._classes = classes
+        return self._classes
+
+
+def _dex_names(apk: zipfile.ZipFile) -> list:
+    """
+    Names of the dex files of an apk in loading order: classes.dex,
+    classes2.dex, ...
+    """
+    names = [n for n in apk.namelist() if _DEX_NAME_PATTERN.match(n)]
+    return sorted(names, key=lambda n: (len(n), n))
+
+
+@functools.lru_cache(maxsize=8)
+def _fingerprint_cached(path: str, mtime_ns: int, size: int) -> ApkFingerprint:
+    try:
+        with zipfile.ZipFile(path) as apk:
+            dex_crcs = tuple(apk.getinfo(n).CRC for n in _dex_names(apk))
+            resources = hashlib.sha256()
+            for info in sorted(apk.infolist(), key=lambda i: i.filename):
+                if _RESOURCE_PATTERN.match(info.filename):
+                    resources.update(f"{info.filename}:{info.CRC}\n".encode())
+    except (zipfile.BadZipFile, EOFError, OSError) as error:
+        raise ValueError(f"Invalid apk: {error}") from error
+    if not dex_crcs:
+        raise ValueError("Invalid apk: No dex files")
+    return ApkFingerprint(dex_crcs, resources.hexdigest(), apk_path=path)
+
+
+def apk_fingerprint(apk_path: str) -> ApkFingerprint:
+    """
+    Fingerprints an apk, reading its classes only when they are compared.
+    Fingerprints of the last apks are kept while they are not modified.
+
+    Parameters
+    ----------
+    apk_path : str
+        Path to the apk.
+
+    Returns
+    -------
+    ApkFingerprint
+        Fingerprint of the apk.
+
+    Raises
+    ------
+    ValueError
+        If the apk is not a valid zip file or it has no dex files.
+    """
+    stat = os.stat(apk_path)
+    return _fingerprint_cached(str(apk_path), stat.st_mtime_ns, stat.st_size)
+
+
+class ApkDiff:
+    """
+    Differences between the code and resources of two versions of an apk.
+
+    Parameters
+    ----------
+    added : set
+        Classes only in the new version.
+    removed : set
+        Classes only in the old version.
+    modified : set
+        Classes in both versions whose code changed.
+    resources_changed : bool
+        Whether the manifest or the layouts changed.
+    invoked : set, optional
+        Names of the methods called by the added and modified classes, by
+        default an empty set.
+    """
+
+    __slots__ = ("added", "removed", "modified", "resources_changed", "invoked")
+
+    def __init__(
+        self,
+        added: set,
+        removed: set,
+        modified: set,
+        resources_changed: bool,
+        invoked: Optional[set] = None,
+    ):
+        self.added = added
+        self.removed = removed
+        self.modified = modified
+        self.resources_changed = resources_changed
+        self.invoked = invoked if invoked is not None else set()
+
+    def __repr__(self) -> str:
+        return (
+            f"ApkDiff(added={len(self.added)}, removed={len(self.removed)}, "
+            f"modified={len(self.modified)}, "
+            f"resources_changed={self.resources_changed})"
+        )
+
+    @property
+    def code_changed(self) -> bool:
+        """
+        Whether any class was added, removed or modified.
+        """
+        return bool(self.added or self.removed or self.modified)
+
+    @property
+    def is_empty(self) -> bool:
+        """
+        Whether the code and the resources read by FlowDroid are the same.
+        """
+        return not (self.code_changed or self.resources_changed)
+
+
+def diff_apks(old_apk: str, new_apk: str) -> ApkDiff:
+    """
+    Compares two versions of an apk at the class level.
+
+    The dex files are only parsed when their checksums differ, and classes
+    are compared by the fingerprint of their normalized bytecode, so classes
+    that only moved to another dex file or whose references were renumbered
+    are not reported as modified.
+
+    Parameters
+    ----------
+    old_apk : str
+        Path to the old version of the apk.
+    new_apk : str
+        Path to the new version of the apk.
+
+    Returns
+    -------
+    ApkDiff
+        Differences between the versions.
+
+    Raises
+    ------
+    ValueError
+        If one of the apks is not a valid zip file with valid dex files.
+    """
+    old, new = apk_fingerprint(old_apk), apk_fingerprint(new_apk)
+    resources_changed = old.resources != new.resources
+    if old.dex_crcs == new.dex_crcs:
+        return ApkDiff(set(), set(), set(), resources_changed)
+
+    old_classes, new_classes = old.classes, new.classes
+    added = new_classes.keys() - old_classes.keys()
+    removed = old_classes.keys() - new_classes.keys()
+    modified = {
+        name
+        for name in new_classes.keys() & old_classes.keys()
+        if new_classes[name][0] != old_classes[name][0]
+    }
+    invoked: set = set()
+    for name in added | modified:
+        invoked |= new_classes[name][1]
+    return ApkDiff(added, removed, modified, resources_changed, invoked)
+
+
+class DiffResult:
+    """
+    Result of the differential analysis of a new version of an apk.
+
+    Parameters
+    ----------
+    old_result : ApkResult
+        Result of the old version.
+    result : ApkResult
+        Result of the new version.
+    mode : str
+        How `result` was obtained: 'reused' (the old result, since the code
+        and resources did not change), 'restricted' (only the sinks called by
+        the changed classes and the sinks of the old leaks they may affect
+        were analyzed again) or 'full' (the new version was fully analyzed).
+    diff : ApkDiff, optional
+        Differences between the versions, or None if they could not be
+        compared. By default None.
+    """
+
+    __slots__ = ("old_result", "result", "mode", "diff", "new_leaks", "resolved_leaks")
+
+    def __init__(
+        self,
+        old_result: ApkResult,
+        result: ApkResult,
+        mode: str,
+        diff: Optional[ApkDiff] = None,
+    ):
+        self.old_result = old_result
+        self.result = result
+        self.mode = mode
+        self.diff = diff
+
+        # Leaks are compared by their source, sink and method, since the
+        # registers in the statements change between versions
+        old_keys = {_leak_key(leak) for leak in old_result.leaks}
+        new_keys = {_leak_key(leak) for leak in result.leaks}
+        self.new_leaks = [
+            leak for leak in result.leaks if _leak_key(leak) not in old_keys
+        ]
+        self.resolved_leaks = [
+            leak for leak in old_result.leaks if _leak_key(leak) not in new_keys
+        ]
+
+    def __repr__(self) -> str:
+        return (
+            f"DiffResult(apk={self.result.apk!r}, mode={self.mode!r}, "
+            f"new_leaks={len(self.new_leaks)}, "
+            f"resolved_leaks={len(self.resolved_leaks)})"
+        )
+
+
+def _leak_key(leak) -> tuple:
+    return _signature(leak.source), _signature(leak.sink), leak.method
+
+
+def _leak_classes(leak) -> set:
+    """
+    Classes named in the signatures of the source, the sink, the method and
+    the path of a leak, e.g. 'a.B' for '<a.B: void c()>'.
+    """
+    statements = [leak.source, leak.sink, leak.method, *leak.path]
+    return {
+        name
+        for statement in statements
+        for name in _SIGNATURE_CLASS_PATTERN.findall(statement)
+    }
+
+
+def _split_leaks(leaks: list, changed: set) -> Optional[tuple[list, set]]:
+    """
+    Splits the old leaks into the ones kept as they are and the ones looked
+    for again. A leak is looked for again if its path is unknown or it names
+    a changed class.
+
+    Returns
+    -------
+    Optional[tuple[list, set]]
+        Leaks kept and names of the sinks of the leaks looked for again, or
+        None if the name of one of those sinks is unknown.
+    """
+    kept, names = [], set()
+    for leak in leaks:
+        if leak.path and not _leak_classes(leak) & changed:
+            kept.append(leak)
+            continue
+        match = _METHOD_NAME_PATTERN.search(leak.sink)
+        if match is None:
+            return None
+        names.add(match.group(1))
+    return kept, names
+
+
+def _restrict_sinks(definitions: SourceSinkSet, names: set) -> SourceSinkSet:
+    """
+    Keeps all the sources and only the sinks with one of the given names.
+    """
+    restricted = {}
+    for signature, (kind, category, permissions) in definitions.definitions.items():
+        match = _METHOD_NAME_PATTERN.search(signature)
+        if kind != KIND_SOURCE and not (match and match.group(1) in names):
+            if kind == KIND_SINK:
+                continue
+            kind = KIND_SOURCE
+        restricted[signature] = (kind, category, permissions)
+    return SourceSinkSet(restricted)
+
+
+def analyze_apk_diff(
+    old_apk: str,
+    new_apk: str,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    timeout: int = 0,
+    max_rss: int = 0,
+    log_store: Optional[LogStore] = None,
+    platforms: Optional[PlatformProvider] = None,
+    restrict_scope: bool = True,
+) -> DiffResult:
+    """
+    Analyze a new version of an apk reusing the analysis of an old version.
+
+    The old version is analyzed first, which is free when its result is in
+    `cache`. Then both versions are compared class by class:
+
+    - If the code, the manifest and the layouts did not change, the old
+      result is reused without running FlowDroid, and cached for the new
+      version.
+    - Otherwise, with `restrict_scope`, FlowDroid only looks for the sinks
+      called by the added and modified classes, and for the sinks of the old
+      leaks whose path is unknown or names a changed class, which are looked
+      for again. The other old leaks are kept. The restriction only trims the
+      sinks: the whole new version is still loaded and its call graph built,
+      so it only saves the taint propagation to the other sinks. New leaks
+      that go through changed code into a sink called only from unchanged
+      classes are not looked for, so use `restrict_scope=False` when those
+      matter.
+    - Without `restrict_scope`, when the old analysis did not finish, the
+      apks cannot be compared or the sink of an old leak to be looked for
+      again is unknown, the new version is fully analyzed.
+
+    Parameters
+    ----------
+    old_apk : str
+        Path to the old version of the apk.
+    new_apk : str
+        Path to the new version of the apk.
+    sources_and_sinks : path, optional
+        Sources and sinks file, 'small.txt' (the default) or 'large.txt', or
+        a `SourceSinkSet`, as in `analyze_apk`.
+    save_logs : bool, optional
+        Defines whether or not save raw logs from FlowDroid, by default True
+    max_heap : int, optional
+        Maximum heap size (in MB) of the FlowDroid JVM. If 0, the JVM default
+        is used. By default 0.
+    cache : ResultCache, optional
+        Cache of the results of both versions, by default None.
+    timeout : int, optional
+        Maximum time (in seconds) FlowDroid can run on each version. If 0,
+        there is no limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of the FlowDroid process tree. If 0,
+        there is no limit. By default 0.
+    log_store : LogStore, optional
+        Compressed store where the raw logs are saved, by default None.
+    platforms : PlatformProvider, optional
+        Provider of the Android platform of the API level of each version,
+        fetched on demand, by default None.
+    restrict_scope : bool, optional
+        Defines whether or not analyze only the sinks called by the changed
+        classes, by default True.
+
+    Returns
+    -------
+    DiffResult
+        Result of the new version, with the new and resolved leaks.
+
+    Raises
+    ------
+    ValueError
+        If `old_apk` or `new_apk` does not exist or does not point to an apk
+        file.
+    ValueError
+        If `sources_and_sinks` is passed and does not point to a existing file
+        or is not one of default values ('small.txt' or 'large.txt').
+    """
+    if not isinstance(sources_and_sinks, SourceSinkSet):
+        sources_and_sinks = str(resolve_sources_and_sinks(sources_and_sinks))
+    options = dict(
+        save_logs=save_logs,
+        max_heap=max_heap,
+        cache=cache,
+        timeout=timeout,
+        max_rss=max_rss,
+        log_store=log_store,
+        platforms=platforms,
+    )
+    old_result = analyze_apk(old_apk, sources_and_sinks, **options)
+    if not Path(new_apk).is_file() or not str(new_apk).endswith(".apk"):
+        raise ValueError(f"Address {new_apk} does not point to a valid apk file")
+
+    # Compare the versions, falling back to a full analysis if they can't be
+    diff = None
+    if old_result.status == STATUS_OK:
+        diff = _compare(old_apk, new_apk)
+
+    # Same code and resources: the old result is the result of the new apk
+    if diff is not None and diff.is_empty:
+        result = _reused_result(old_result, new_apk, sources_and_sinks, cache)
+        return _diff_result(old_result, result, MODE_REUSED, diff)
+
+    # Keep the old leaks the changes can not affect, if they can be told apart
+    split = None
+    if diff is not None and restrict_scope:
+        changed = diff.added | diff.removed | diff.modified
+        split = _split_leaks(old_result.leaks, changed)
+    if split is None:
+        result = analyze_apk(new_apk, sources_and_sinks, **options)
+        return _diff_result(old_result, result, MODE_FULL, diff)
+
+    kept, rechecked = split
+    result = _analyze_restricted(
+        new_apk, sources_and_sinks, diff, kept, rechecked, options
+    )
+    return _diff_result(old_result, result, MODE_RESTRICTED, diff)
+
+
+def _compare(old_apk: str, new_apk: str) -> Optional[ApkDiff]:
+    """
+    Compares two versions of an apk, or returns None if they can't be.
+    """
+    try:
+        return diff_apks(old_apk, new_apk)
+    except ValueError as error:
+        logging.warning(f"Can not compare '{old_apk}' and '{new_apk}': {error}")
+        return None
+
+
+def _reused_result(
+    old_result: ApkResult,
+    new_apk: str,
+    sources_and_sinks: Union[str, SourceSinkSet],
+    cache: Optional[ResultCache] = None,
+) -> ApkResult:
+    """
+    Copies the result of the old version of an apk for the new version,
+    caching it.
+    """
+    logging.info(f"Reusing the results of '{old_result.apk}' for '{new_apk}'")
+    result = ApkResult.from_dict(old_result.to_dict())
+    result.apk = str(new_apk)
+    result.log_path = None
+    if cache is not None:
+        sns_path = resolve_sources_and_sinks(sources_and_sinks)
+        cache.put(cache.key(new_apk, sns_path), result)
+    return result
+
+
+def _analyze_restricted(
+    new_apk: str,
+    sources_and_sinks: Union[str, SourceSinkSet],
+    diff: ApkDiff,
+    kept: list,
+    rechecked: set,
+    options: dict,
+) -> ApkResult:
+    """
+    Analyzes a new version of an apk looking only for the sinks called by the
+    changed classes and the sinks of the old leaks looked for again, and
+    merges the old leaks kept with the ones found.
+    """
+    definitions = sources_and_sinks
+    if not isinstance(definitions, SourceSinkSet):
+        definitions = load_sources_and_sinks(definitions)
+    restricted = _restrict_sinks(definitions, diff.invoked | rechecked)
+    result = ApkResult(str(new_apk), reported_leaks=0)
+    if restricted.sinks:
+        logging.info(
+            f"Analyzing {len(restricted.sinks)} sinks of the changes in '{new_apk}'"
+        )
+        result = analyze_apk(new_apk, restricted, **options)
+    else:
+        logging.info(f"No changed class of '{new_apk}' calls a sink")
+
+    # Merge the old leaks with the ones found again
+    if result.status == STATUS_OK:
+        found = {_leak_key(leak) for leak in result.leaks}
+        result.leaks += [leak for leak in kept if _leak_key(leak) not in found]
+        result.reported_leaks = len(result.leaks)
+    return result
+
+
+def _diff_result(
+    old_result: ApkResult, result: ApkResult, mode: str, diff: Optional[ApkDiff]
+) -> DiffResult:
+    get_metrics().increment("pyflowdroid_diff_total", mode=mode)
+    return DiffResult(old_result, result, mode, diff)
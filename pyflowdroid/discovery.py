@@ -0,0 +1,401 @@
+import os
+import json
+import fnmatch
+import hashlib
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from pyflowdroid._cli_tools import _hash_file_once
+from pyflowdroid.results import ApkResult, STATUS_FAILED
+from pyflowdroid.consts import DEFAULT_SNAPSHOT_SAVE_EVERY, FLOWDROID_EXEC_NAME
+
+
+def _matches(name: str, relative: str, patterns: Iterable[str]) -> bool:
+    """
+    Checks if the name or the relative path of an entry matches a pattern.
+    """
+    return any(
+        fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relative, pattern)
+        for pattern in patterns
+    )
+
+
+def _config_key(sources_and_sinks: str, **settings) -> str:
+    """
+    Computes the key of an analysis configuration: the content of the sources
+    and sinks file, the FlowDroid version and the settings that change the
+    results, such as the timeout.
+    """
+    sns_hash = _hash_file_once(sources_and_sinks)
+    raw_key = json.dumps([sns_hash, FLOWDROID_EXEC_NAME, settings], sort_keys=True)
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+def _recorded_result(apk_path: str, entry: list) -> Optional[ApkResult]:
+    """
+    Rebuilds the result recorded in a snapshot entry for an apk.
+    """
+    if len(entry) < 4:
+        return None
+    result = ApkResult.from_dict(entry[3])
+    result.apk = apk_path
+    return result
+
+
+def _first_visit(directory: str, visited: set) -> bool:
+    """
+    Checks if a folder is listed for the first time, remembering it in
+    `visited`. Folders that can not be stat'ed are not listed.
+    """
+    try:
+        stat = os.stat(directory)
+    except OSError:
+        return False
+    if (stat.st_dev, stat.st_ino) in visited:
+        return False
+    visited.add((stat.st_dev, stat.st_ino))
+    return True
+
+
+class ScanSnapshot:
+    """
+    Size, modification time, hash and result of the apks already analyzed,
+    persisted to find the new and modified apks of the next runs.
+
+    An apk is unchanged if its size and modification time are the recorded
+    ones. If only its modification time changed, its hash is compared, so
+    touched or copied apks are not analyzed again. The apks are recorded
+    apart for each analysis configuration (see `_config_key`), so changing
+    the sources and sinks or the options analyzes them again.
+
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file of the snapshot. It is created if needed.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.configs: dict = {}
+        self._pending: dict = {}
+        self._unsaved = 0
+        if self.path.exists():
+            try:
+                self.configs = json.loads(self.path.read_text()).get("configs", {})
+            except (json.JSONDecodeError, AttributeError, OSError):
+                logging.warning(f"Ignoring corrupt scan snapshot '{self.path}'")
+
+    def previous_result(
+        self, apk_path: str, stat: os.stat_result, config: str = ""
+    ) -> Optional[ApkResult]:
+        """
+        Finds the recorded result of an apk if it is not new or modified,
+        otherwise remembers its stat to record it once it is analyzed.
+
+        Parameters
+        ----------
+        apk_path : str
+            Absolute path to the apk.
+        stat : os.stat_result
+            Stat of the apk when it was found.
+        config : str, optional
+            Key of the analysis configuration, by default ''.
+
+        Returns
+        -------
+        Optional[ApkResult]
+            Result of the previous analysis, or None if the apk has to be
+            analyzed.
+        """
+        entry = self.configs.get(config, {}).get(apk_path)
+        if entry is not None and entry[0] == stat.st_size:
+            if entry[1] == stat.st_mtime_ns:
+                return _recorded_result(apk_path, entry)
+
+            # Same size but touched: compare the content
+            if _hash_file_once(apk_path) == entry[2]:
+                entry[1] = stat.st_mtime_ns
+                self._unsaved += 1
+                return _recorded_result(apk_path, entry)
+        self._pending[(config, apk_path)] = stat
+        return None
+
+    def record(self, apk_path: str, result: ApkResult, config: str = "") -> None:
+        """
+        Records an analyzed apk and its result, unless it was modified after it
+        was found.
+
+        Parameters
+        ----------
+        apk_path : str
+            Absolute path to the apk.
+        result : ApkResult
+            Result of its analysis.
+        config : str, optional
+            Key of the analysis configuration, by default ''.
+        """
+        stat = self._pending.pop((config, apk_path), None)
+        if stat is None:
+            return
+        try:
+            current = os.stat(apk_path)
+            if (current.st_size, current.st_mtime_ns) != (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                return
+            digest = _hash_file_once(apk_path)
+        except OSError:
+            return
+        files = self.configs.setdefault(config, {})
+        files[apk_path] = [stat.st_size, stat.st_mtime_ns, digest, result.to_dict()]
+        self._unsaved += 1
+        if self._unsaved >= DEFAULT_SNAPSHOT_SAVE_EVERY:
+            self.save()
+
+    def forget_missing(self, folder: str, seen: set) -> int:
+        """
+        Forgets the apks of a folder that were not found in a full scan.
+
+        Parameters
+        ----------
+        folder : str
+            Absolute path to the scanned folder.
+        seen : set
+            Absolute paths of the apks found in the scan.
+
+        Returns
+        -------
+        int
+            Number of apks forgotten.
+        """
+        prefix = os.path.join(folder, "")
+        missing = set()
+        for files in self.configs.values():
+            for apk_path in [p for p in files if p.startswith(prefix)]:
+                if apk_path not in seen:
+                    del files[apk_path]
+                    missing.add(apk_path)
+        self._unsaved += len(missing)
+        return len(missing)
+
+    def save(self) -> None:
+        """
+        Writes the snapshot to its file if it changed.
+        """
+        if not self._unsaved:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"configs": self.configs}))
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+
+class ApkScanner:
+    """
+    Finds the apks in a folder tree with `os.scandir`.
+
+    The type of each entry comes with the directory listing, so only the
+    apks are stat'ed, and only when a snapshot is used. With a snapshot, the
+    apks recorded in previous runs with the same size and modification time
+    are not yielded.
+
+    Parameters
+    ----------
+    include : Iterable[str], optional
+        Patterns of the files to be analyzed, matched against their name and
+        their path relative to the folder, by default ('*.apk',).
+    exclude : Iterable[str], optional
+        Patterns of the files and folders to be ignored, matched the same
+        way. Excluded folders are not listed. By default ().
+    follow_symlinks : bool, optional
+        Defines whether or not follow symbolic links to files and folders.
+        Folders reached twice through links are listed once. By default
+        False.
+    max_depth : int, optional
+        Maximum depth of the subfolders listed, 0 being only the folder
+        itself. If -1, there is no limit. By default -1.
+    snapshot : str, optional
+        Path to the snapshot file used to skip the unchanged apks. If empty,
+        every apk is yielded. By default ''.
+    """
+
+    def __init__(
+        self,
+        include: Iterable[str] = ("*.apk",),
+        exclude: Iterable[str] = (),
+        follow_symlinks: bool = False,
+        max_depth: int = -1,
+        snapshot: str = "",
+    ):
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.follow_symlinks = follow_symlinks
+        self.max_depth = max_depth
+        self.snapshot = ScanSnapshot(snapshot) if snapshot else None
+
+    def walk(self, folder: str) -> Iterator[os.DirEntry]:
+        """
+        Lazily lists the files of a folder tree matching the patterns.
+
+        Parameters
+        ----------
+        folder : str
+            Path to the folder.
+
+        Yields
+        ------
+        os.DirEntry
+            Entry of each matching file.
+        """
+        stack = [(str(folder), "", 0)]
+        visited: set = set()
+        while stack:
+            directory, prefix, depth = stack.pop()
+
+            # Never list twice a folder reached through links
+            if self.follow_symlinks and not _first_visit(directory, visited):
+                continue
+
+            subfolders = []
+            for entry, relative, is_dir in self._entries(directory, prefix):
+                if not is_dir:
+                    yield entry
+                elif self.max_depth < 0 or depth < self.max_depth:
+                    subfolders.append((entry.path, relative))
+
+            # Reversed, so the subfolders are listed in order
+            stack.extend(
+                (path, f"{relative}/", depth + 1)
+                for path, relative in reversed(subfolders)
+            )
+
+    def _entries(
+        self, directory: str, prefix: str
+    ) -> Iterator[tuple[os.DirEntry, str, bool]]:
+        """
+        Lists the subfolders and the matching files of a folder, with their
+        relative path and whether they are a folder.
+        """
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative = prefix + entry.name
+                    is_dir = self._classify(entry, relative)
+                    if is_dir is not None:
+                        yield entry, relative, is_dir
+        except OSError as error:
+            logging.warning(f"Can not list '{directory}': {error}")
+
+    def _classify(self, entry: os.DirEntry, relative: str) -> Optional[bool]:
+        """
+        Checks if an entry is a folder to be listed (True), a file to be
+        analyzed (False) or has to be ignored (None).
+        """
+        if self.exclude and _matches(entry.name, relative, self.exclude):
+            return None
+        try:
+            if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                return True
+            if entry.is_file(follow_symlinks=self.follow_symlinks) and _matches(
+                entry.name, relative, self.include
+            ):
+                return False
+        except OSError:
+            pass
+        return None
+
+    def scan(
+        self, folder: str, config: str = "", reused: Optional[list] = None
+    ) -> Iterator[str]:
+        """
+        Lazily finds the apks of a folder tree to be analyzed: all of them,
+        or only the new and modified ones if a snapshot is used.
+
+        Parameters
+        ----------
+        folder : str
+            Path to the folder.
+        config : str, optional
+            Key of the analysis configuration the snapshot is looked up with
+            (see `_config_key`), by default ''.
+        reused : list, optional
+            List where the pairs of unchanged apk and its recorded result are
+            added, by default None.
+
+        Yields
+        ------
+        str
+            Path to an apk file.
+        """
+        found = changed = 0
+        seen: set = set()
+        for entry in self.walk(folder):
+            found += 1
+            if self.snapshot is None or self._is_changed(entry, config, seen, reused):
+                changed += 1
+                yield entry.path
+
+        # Only a complete scan tells which apks were removed
+        if self.snapshot is None:
+            logging.info(f"Found {found} apks in '{folder}'")
+            return
+        removed = self.snapshot.forget_missing(os.path.abspath(folder), seen)
+        self.snapshot.save()
+        logging.info(
+            f"Found {found} apks in '{folder}': {changed} new or modified, "
+            f"{found - changed} unchanged, {removed} removed"
+        )
+
+    def _is_changed(
+        self, entry: os.DirEntry, config: str, seen: set, reused: Optional[list]
+    ) -> bool:
+        """
+        Checks in the snapshot if an apk has to be analyzed, adding it to
+        `seen` and its recorded result to `reused` if it is unchanged.
+        """
+        try:
+            stat = entry.stat(follow_symlinks=self.follow_symlinks)
+        except OSError:
+            return False
+        key = os.path.abspath(entry.path)
+        seen.add(key)
+        result = self.snapshot.previous_result(key, stat, config)
+        if result is None:
+            return True
+        if reused is not None:
+            reused.append((entry.path, result))
+        return False
+
+    def record(
+        self, results: Iterable[tuple[str, ApkResult]], config: str = ""
+    ) -> Iterator[tuple[str, ApkResult]]:
+        """
+        Records the analyzed apks in the snapshot while passing the results
+        through, so the apks are skipped by the next scans. Failed analyses
+        are not recorded, so they are retried.
+
+        Parameters
+        ----------
+        results : Iterable[tuple[str, ApkResult]]
+            Pairs of apk path and its result.
+        config : str, optional
+            Key of the analysis configuration, as passed to `scan`, by default
+            ''.
+
+        Yields
+        ------
+        tuple[str, ApkResult]
+            The same pairs of apk path and result.
+        """
+        if self.snapshot is None:
+            yield from results
+            return
+        try:
+            for apk_path, result in results:
+                if result.status != STATUS_FAILED:
+                    self.snapshot.record(os.path.abspath(apk_path), result, config)
+                yield apk_path, result
+        finally:
+            self.snapshot.save()
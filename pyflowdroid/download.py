@@ -1,12 +1,423 @@
+import os
 import abc
+import ssl
+import asyncio
+import json
+import time
 import shutil
 import urllib
 import logging
 import functools
+import contextlib
+import threading
+import collections
+import http.client
+import urllib.error
+import urllib.parse
 from pathlib import Path
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
-from pyflowdroid.consts import DEFAULT_APK_PROVIDER
+from typing import AsyncIterator, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
+import lxml.html
+from pyflowdroid.metrics import get_metrics
+from pyflowdroid.consts import (
+    DEFAULT_APK_PROVIDER,
+    DEFAULT_HTTP_TIMEOUT,
+    DEFAULT_HTTP_HEADERS,
+    DEFAULT_INDEX_FOLDER,
+    DEFAULT_INDEX_TTL,
+    DEFAULT_INDEX_WORKERS,
+)
+
+
+class _ConnectionPool:
+    """
+    Keep-alive HTTP connections reused across requests to the same host.
+
+    Each thread gets its own connection per host, so the pool can be shared
+    by several download threads.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Timeout (in seconds) of the blocking operations of the connections,
+        by default 60.
+    max_redirects : int, optional
+        Maximum number of redirections followed by a request, by default 5.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_HTTP_TIMEOUT, max_redirects: int = 5):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._local = threading.local()
+
+    def _connections(self) -> dict:
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+        return self._local.connections
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        connections = self._connections()
+        if (scheme, netloc) not in connections:
+            if scheme == "https":
+                connection_class = http.client.HTTPSConnection
+            else:
+                connection_class = http.client.HTTPConnection
+            connections[scheme, netloc] = connection_class(netloc, timeout=self.timeout)
+        return connections[scheme, netloc]
+
+    def _drop(self, scheme: str, netloc: str) -> None:
+        connection = self._connections().pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _send(self, url: str, headers: dict) -> http.client.HTTPResponse:
+        parts = urllib.parse.urlsplit(url)
+        target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        headers = {**DEFAULT_HTTP_HEADERS, **headers}
+
+        # Retry once with a new connection, since the server may have closed
+        # the kept-alive one
+        for _ in range(2):
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", target, headers=headers)
+                return connection.getresponse()
+            except (http.client.HTTPException, OSError) as error:
+                self._drop(parts.scheme, parts.netloc)
+                last_error = error
+        raise urllib.error.URLError(last_error) from last_error
+
+    def request(
+        self, url: str, headers: Optional[dict] = None
+    ) -> http.client.HTTPResponse:
+        """
+        Sends a GET request following redirections.
+
+        The body of the returned response must be fully read before sending
+        another request from the same thread to the same host.
+
+        Parameters
+        ----------
+        url : str
+            Requested url.
+        headers : dict, optional
+            Extra headers of the request.
+
+        Returns
+        -------
+        http.client.HTTPResponse
+            Response of the server.
+
+        Raises
+        ------
+        urllib.error.HTTPError
+            If the server answers with an error or too many redirections.
+        urllib.error.URLError
+            If the server can not be reached.
+        """
+        for _ in range(self.max_redirects + 1):
+            response = self._send(url, headers or {})
+            if response.status in (301, 302, 303, 307, 308):
+                response.read()
+                url = urllib.parse.urljoin(url, response.getheader("Location", ""))
+                continue
+            if response.status >= 400 and response.status != 416:
+                response.read()
+                raise urllib.error.HTTPError(
+                    url, response.status, response.reason, response.headers, None
+                )
+            return response
+        raise urllib.error.HTTPError(url, 310, "Too many redirections", None, None)
+
+
+class _AsyncResponse:
+    """
+    Response of `_async_request`, whose body is read without blocking the
+    event loop.
+
+    Parameters
+    ----------
+    url : str
+        Url of the response, after the redirections.
+    status : int
+        HTTP status of the response.
+    reason : str
+        Reason phrase of the status.
+    headers : dict
+        Headers of the response, with lowercase names.
+    reader : asyncio.StreamReader
+        Stream the body is read from.
+    writer : asyncio.StreamWriter
+        Stream of the connection, closed with the response.
+    timeout : float
+        Timeout (in seconds) of each read.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        reason: str,
+        headers: dict,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        timeout: float,
+    ):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+        self._timeout = timeout
+
+    def getheader(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.headers.get(name.lower(), default)
+
+    async def _read(self, coroutine):
+        return await asyncio.wait_for(coroutine, self._timeout)
+
+    async def iter_chunks(self, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+        """
+        Iterates over the body of the response.
+
+        Yields
+        ------
+        bytes
+            Chunks of the body.
+        """
+
+        # Chunked transfer encoding: hexadecimal size line, data and CRLF
+        if "chunked" in self.getheader("Transfer-Encoding", "").lower():
+            while True:
+                size_line = await self._read(self._reader.readline())
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    return
+                yield await self._read(self._reader.readexactly(size))
+                await self._read(self._reader.readexactly(2))
+
+        # Known length, or until the server closes the connection
+        length = self.getheader("Content-Length")
+        remaining = int(length) if length is not None else None
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await self._read(self._reader.read(size))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+    async def read(self) -> bytes:
+        """
+        Reads the whole body of the response.
+        """
+        return b"".join([chunk async for chunk in self.iter_chunks()])
+
+    async def close(self) -> None:
+        """
+        Closes the connection of the response.
+        """
+        self._writer.close()
+        with contextlib.suppress(OSError, ssl.SSLError):
+            await self._writer.wait_closed()
+
+
+async def _async_request(
+    url: str,
+    headers: Optional[dict] = None,
+    timeout: float = DEFAULT_HTTP_TIMEOUT,
+    max_redirects: int = 5,
+) -> _AsyncResponse:
+    """
+    Asyncio counterpart of `_ConnectionPool.request`, sending a GET request
+    on a new connection that is closed with the response.
+
+    Parameters
+    ----------
+    url : str
+        Requested url.
+    headers : dict, optional
+        Extra headers of the request.
+    timeout : float, optional
+        Timeout (in seconds) of the connection and of each read, by default
+        60.
+    max_redirects : int, optional
+        Maximum number of redirections followed, by default 5.
+
+    Returns
+    -------
+    _AsyncResponse
+        Response of the server, to be closed once its body is read.
+
+    Raises
+    ------
+    urllib.error.HTTPError
+        If the server answers with an error or too many redirections.
+    urllib.error.URLError
+        If the server can not be reached or its answer is not HTTP.
+    """
+    headers = {**DEFAULT_HTTP_HEADERS, **(headers or {})}
+    for _ in range(max_redirects + 1):
+        response = await _async_send(url, headers, timeout)
+
+        # Follow redirections and fail on errors, as the sync pool does
+        if response.status in (301, 302, 303, 307, 308):
+            await response.close()
+            url = urllib.parse.urljoin(url, response.getheader("Location", ""))
+            continue
+        if response.status >= 400 and response.status != 416:
+            await response.close()
+            raise urllib.error.HTTPError(
+                url, response.status, response.reason, None, None
+            )
+        return response
+    raise urllib.error.HTTPError(url, 310, "Too many redirections", None, None)
+
+
+async def _async_send(url: str, headers: dict, timeout: float) -> _AsyncResponse:
+    """
+    Sends a GET request on a new connection and reads the head of the
+    response.
+
+    Raises
+    ------
+    urllib.error.URLError
+        If the server can not be reached or its answer is not HTTP.
+    """
+    parts = urllib.parse.urlsplit(url)
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parts.hostname,
+                port,
+                ssl=ssl.create_default_context() if secure else None,
+            ),
+            timeout,
+        )
+    except (OSError, asyncio.TimeoutError) as error:
+        raise urllib.error.URLError(error) from error
+
+    # Send the request and read the status line and the headers
+    lines = [f"GET {target} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    try:
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        response_headers = await _read_headers(reader, timeout)
+        _, status, reason = status_line.decode("latin-1").split(" ", 2)
+    except (OSError, ValueError, asyncio.TimeoutError) as error:
+        writer.close()
+        raise urllib.error.URLError(error) from error
+    return _AsyncResponse(
+        url, int(status), reason.strip(), response_headers, reader, writer, timeout
+    )
+
+
+async def _read_headers(reader: asyncio.StreamReader, timeout: float) -> dict:
+    """
+    Reads the headers of a response, with lowercase names.
+    """
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+def _apk_paths(path: str, apk_name: str) -> tuple[Path, Path]:
+    """
+    Finds the paths of an apk and of its partial download in a folder.
+
+    Raises
+    ------
+    ValueError
+        If path does not points to a folder
+    """
+    folder_path = Path(path)
+    if not folder_path.exists() or folder_path.is_file():
+        raise ValueError(f"{path} does not points to a folder")
+    return folder_path / apk_name, folder_path / f"{apk_name}.part"
+
+
+def _already_downloaded(apk_path: Path, force_redownload: bool) -> bool:
+    """
+    Checks whether the download of an apk can be skipped because the apk
+    already exists and `force_redownload` is False.
+    """
+    if apk_path.exists() and not force_redownload:
+        logging.info(f"{apk_path.name} already exists")
+        get_metrics().increment("pyflowdroid_downloads_total", status="skipped")
+        return True
+    return False
+
+
+def _check_complete_part(
+    content_range: str, apk_url: str, part_path: Path, offset: int
+) -> None:
+    """
+    Checks that a '.part' file whose resumed download got a 416 answer holds
+    the whole apk, deleting it otherwise.
+
+    Raises
+    ------
+    urllib.error.HTTPError
+        If the size of the apk in `content_range` is not `offset`.
+    """
+    if content_range.rpartition("/")[2] != str(offset):
+        part_path.unlink()
+        raise urllib.error.HTTPError(
+            apk_url, 416, "Invalid partial download", None, None
+        )
+
+
+def _check_received(content_length: Optional[str], received: int) -> None:
+    """
+    Checks that the whole body of a download was received, so the '.part'
+    file is kept to resume it otherwise.
+
+    Raises
+    ------
+    http.client.IncompleteRead
+        If fewer than `content_length` bytes were received.
+    """
+    if content_length is not None and received < int(content_length):
+        raise http.client.IncompleteRead(b"", int(content_length) - received)
+
+
+def _record_download(start: float, status: str) -> None:
+    """
+    Records the duration and the status of a download started at `start`.
+    """
+    metrics = get_metrics()
+    elapsed = time.perf_counter() - start
+    metrics.observe("pyflowdroid_download_seconds", elapsed, status=status)
+    metrics.increment("pyflowdroid_downloads_total", status=status)
+
+
+def _log_downloaded(downloaded: int, listed: int, amount: int) -> None:
+    """
+    Notifies how many of the `amount` apks requested were downloaded, out of
+    the `listed` ones the provider had.
+    """
+    if downloaded == amount:
+        logging.info(f"Downloaded {amount} apks")
+        return
+    reasons = []
+    if listed < amount:
+        reasons.append("No more apks to download")
+    if downloaded < listed:
+        reasons.append(f"{listed - downloaded} downloads failed")
+    logging.error(
+        f"Downloaded {downloaded} apks instead of {amount}. " + ". ".join(reasons)
+    )
 
 
 class ApkProvider(metaclass=abc.ABCMeta):
@@ -23,6 +434,7 @@ class ApkProvider(metaclass=abc.ABCMeta):
 
     def __init__(self, force_redownload: bool = False):
         self.force_redownload = force_redownload
+        self._pool = _ConnectionPool()
 
     @abc.abstractmethod
     def avialable_apks(self) -> dict:
@@ -45,10 +457,29 @@ class ApkProvider(metaclass=abc.ABCMeta):
         """
         ...
 
-    def download_apk(self, apk_name: str, apk_url: str, path: str) -> None:
+    def iter_apks(self) -> Iterator[tuple[str, str]]:
+        """
+        Lazily iterates over the apks the provider has avialable.
+
+        Providers able to list their apks incrementally should override this
+        method, so downloads can start before the full list is known. By
+        default, it iterates over `avialable_apks`.
+
+        Yields
+        ------
+        tuple[str, str]
+            Pairs of apk name and url.
+        """
+        yield from self.avialable_apks().items()
+
+    def download_apk(self, apk_name: str, apk_url: str, path: str) -> bool:
         """
         Download an apk from a given url.
 
+        The apk is downloaded into a '.part' file, which is renamed once the
+        download is complete. If a previous download was interrupted, it is
+        resumed from the end of the '.part' file.
+
         Parameters
         ----------
         apk_name : str
@@ -58,44 +489,201 @@ class ApkProvider(metaclass=abc.ABCMeta):
         path : str
             Path where the apk will be downloaded.
 
+        Returns
+        -------
+        bool
+            Whether the apk is in `path` after the call, because it was
+            downloaded or it already existed.
+
         Raises
         ------
         ValueError
             If path does not points to a folder
         """
 
-        # Check if path is a folder and exists
-        folder_path = Path(path)
-        if not folder_path.exists() or folder_path.is_file():
-            raise ValueError(f"{path} does not points to a folder")
+        apk_path, part_path = _apk_paths(path, apk_name)
+        if _already_downloaded(apk_path, self.force_redownload):
+            return True
 
-        # Generate the path to the apk file that is going to be downloaded
-        apk_path = folder_path / apk_name
+        # Resume the download from the end of the partial file if any
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
 
-        # Check if the apk file already exists and if force_redownload is False
-        if apk_path.exists() and not self.force_redownload:
+        # Download the apk file from the given url
+        start = time.perf_counter()
+        try:
+            logging.info(f"Downloading {apk_name} from {apk_url}")
+            response = self._pool.request(apk_url, headers)
+            self._save_response(response, apk_url, part_path, offset)
+            os.replace(part_path, apk_path)
+            status = "ok"
 
-            # If the apk file already exists and force_redownload is False skips
-            # the download
-            logging.info(f"{apk_name} already exists")
+        # Notify if the apk file could not be downloaded
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as error:
+            logging.error(f"Error downloading {apk_name} from {apk_url}: {error}")
+            status = "error"
+
+        _record_download(start, status)
+        return status == "ok"
+
+    @staticmethod
+    def _save_response(
+        response: http.client.HTTPResponse, apk_url: str, part_path: Path, offset: int
+    ) -> None:
+        """
+        Saves the body of the response to a download in the '.part' file of
+        the apk, which already holds its first `offset` bytes.
+        """
+
+        # The partial file may already hold the whole apk
+        if response.status == 416:
+            response.read()
+            content_range = response.getheader("Content-Range", "")
+            _check_complete_part(content_range, apk_url, part_path, offset)
             return
 
-        # Download the apk file from the given url
+        # Append only if the server honoured the requested range
+        mode = "ab" if response.status == 206 else "wb"
+        with open(part_path, mode) as out_file:
+            shutil.copyfileobj(response, out_file)
+            received = out_file.tell() - (offset if mode == "ab" else 0)
+        get_metrics().increment("pyflowdroid_download_bytes_total", received)
+        _check_received(response.getheader("Content-Length"), received)
+
+    def download_apks(
+        self, amount: int, path: str, create_path: bool = True, workers: int = 1
+    ) -> int:
+        """
+        Download a given amount of apks from the provider.
+
+        Parameters
+        ----------
+        amount : int
+            Amount of apks to be downloaded.
+        path : str
+            Path where the apks will be downloaded.
+        create_path : bool, optional
+            Defines wheter or not the path will be created if it does not exists.
+        workers : int, optional
+            Number of apks downloaded at the same time, by default 1.
+
+        Returns
+        -------
+        int
+            Number of apks downloaded, including the ones that already existed.
+        """
+
+        # Create the path if it does not exists
+        if create_path:
+            Path(path).mkdir(parents=True, exist_ok=True)
+
+        # Download the apks as soon as the provider lists them
+        downloads: dict = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for apk_name, apk_url in self.iter_apks():
+                if len(downloads) == amount:
+                    break
+                if apk_name not in downloads:
+                    downloads[apk_name] = executor.submit(
+                        self.download_apk, apk_name, apk_url, path
+                    )
+
+        # Count the apks really downloaded, raising any unexpected error
+        downloaded = sum(future.result() for future in downloads.values())
+        _log_downloaded(downloaded, len(downloads), amount)
+        return downloaded
+
+    async def download_apk_async(self, apk_name: str, apk_url: str, path: str) -> bool:
+        """
+        Asyncio counterpart of `download_apk`, downloading an apk without
+        blocking the event loop.
+
+        If the task is cancelled, the '.part' file is kept, so the download is
+        resumed by the next call.
+
+        Parameters
+        ----------
+        apk_name : str
+            Name of the apk to be downloaded.
+        apk_url : str
+            Url of the apk to be downloaded.
+        path : str
+            Path where the apk will be downloaded.
+
+        Raises
+        ------
+        ValueError
+            If path does not points to a folder
+        """
+
+        apk_path, part_path = _apk_paths(path, apk_name)
+        if _already_downloaded(apk_path, self.force_redownload):
+            return True
+
+        # Resume the download from the end of the partial file if any
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        start = time.perf_counter()
         try:
             logging.info(f"Downloading {apk_name} from {apk_url}")
-            hdr = {"User-Agent": "Mozilla/5.0"}
-            req = urllib.request.Request(apk_url, headers=hdr)
-            with urllib.request.urlopen(req) as response, open(
-                apk_path, "wb"
-            ) as out_file:
-                shutil.copyfileobj(response, out_file)
+            response = await _async_request(apk_url, headers, self._pool.timeout)
+            try:
+                await self._save_response_async(response, apk_url, part_path, offset)
+            finally:
+                await response.close()
+            os.replace(part_path, apk_path)
+            status = "ok"
+
         # Notify if the apk file could not be downloaded
-        except urllib.error.HTTPError:
-            logging.error(f"Error downloading {apk_name} from {apk_url}")
+        except (
+            urllib.error.URLError,
+            http.client.HTTPException,
+            OSError,
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+        ) as error:
+            logging.error(f"Error downloading {apk_name} from {apk_url}: {error}")
+            status = "error"
+
+        _record_download(start, status)
+        return status == "ok"
 
-    def download_apks(self, amount: int, path: str, create_path: bool = True) -> None:
+    @staticmethod
+    async def _save_response_async(
+        response: _AsyncResponse, apk_url: str, part_path: Path, offset: int
+    ) -> None:
         """
-        Download a given amount of apks from the provider.
+        Asyncio counterpart of `_save_response`.
+        """
+
+        # The partial file may already hold the whole apk
+        if response.status == 416:
+            await response.read()
+            content_range = response.getheader("Content-Range", "")
+            _check_complete_part(content_range, apk_url, part_path, offset)
+            return
+
+        # Append only if the server honoured the requested range
+        received = 0
+        mode = "ab" if response.status == 206 else "wb"
+        with open(part_path, mode) as out_file:
+            async for chunk in response.iter_chunks():
+                out_file.write(chunk)
+                received += len(chunk)
+        get_metrics().increment("pyflowdroid_download_bytes_total", received)
+        _check_received(response.getheader("Content-Length"), received)
+
+    async def download_apks_async(
+        self, amount: int, path: str, create_path: bool = True, workers: int = 1
+    ) -> int:
+        """
+        Asyncio counterpart of `download_apks`, with at most `workers` apks
+        downloaded at the same time.
+
+        The apks are listed in a thread, since listing them may parse web
+        pages, and each apk is downloaded as soon as it is listed. If the task
+        is cancelled, the downloads in progress are cancelled too.
 
         Parameters
         ----------
@@ -105,92 +693,288 @@ class ApkProvider(metaclass=abc.ABCMeta):
             Path where the apks will be downloaded.
         create_path : bool, optional
             Defines wheter or not the path will be created if it does not exists.
+        workers : int, optional
+            Number of apks downloaded at the same time, by default 1.
         """
 
         # Create the path if it does not exists
         if create_path:
             Path(path).mkdir(parents=True, exist_ok=True)
 
-        # Fetch the dictionary with all the apks from the provider
-        avialable_apks = self.avialable_apks()
+        # Download the apks as soon as the provider lists them
+        semaphore = asyncio.Semaphore(workers)
+        downloads: dict = {}
+        apks = self.iter_apks()
+        listing = None
+        try:
+            while len(downloads) < amount:
+                listing = asyncio.ensure_future(asyncio.to_thread(next, apks, None))
+                item = await asyncio.shield(listing)
+                if item is None:
+                    break
+                if item[0] not in downloads:
+                    downloads[item[0]] = asyncio.ensure_future(
+                        self._download_limited(semaphore, *item, path)
+                    )
+            results = await asyncio.gather(*downloads.values())
 
-        # Download each apk until reaching the amount of apks to be downloaded
-        for i, apk_name in enumerate(avialable_apks):
-            if i == amount:
-                logging.info(f"Downloaded {i} apks")
-                return
-            apk_url = avialable_apks[apk_name]
-            self.download_apk(apk_name, apk_url, path)
+        # Stop the downloads left and the listing, which can not be cancelled
+        finally:
+            await _stop_downloads(list(downloads.values()), listing, apks)
+
+        # Count the apks really downloaded
+        downloaded = sum(results)
+        _log_downloaded(downloaded, len(downloads), amount)
+        return downloaded
+
+    async def _download_limited(
+        self, semaphore: asyncio.Semaphore, apk_name: str, apk_url: str, path: str
+    ) -> bool:
+        """
+        Downloads an apk once `semaphore` lets it.
+        """
+        async with semaphore:
+            return await self.download_apk_async(apk_name, apk_url, path)
 
-        # Download each apk until reaching the amount of apks to be downloaded
-        logging.error(
-            f"Downloaded {i} apks instead of {amount}. No more apks to download"
-        )
+
+async def _stop_downloads(
+    tasks: list, listing: Optional[asyncio.Future], apks: Iterator
+) -> None:
+    """
+    Cancels the downloads left and waits for the listing of the apks, which
+    runs in a thread, to close the iterator.
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if listing is not None:
+        await asyncio.wait([listing])
+    await asyncio.to_thread(apks.close)
 
 
 class CubapkProvider(ApkProvider):
     """
     CubapkProvider class to download apks from the cubapk.com website.
+
+    The index of the website is crawled with several pages requested at the
+    same time, and it is stored on disk to be reused by later runs. Stored
+    pages older than `index_ttl` are revalidated with conditional requests.
+
+    Parameters
+    ----------
+    force_redownload : bool, optional
+        Defines wheter or not the provider will overwrite existing apk files,
+        by default False.
+    base_url : str, optional
+        Url of the website, by default 'https://cubapk.com'. It can point to a
+        mirror or to a local server for testing.
+    index_path : str, optional
+        Path to the file where the index is stored. If empty, the index is
+        stored in the cache folder of pyflowdroid. By default ''.
+    index_ttl : int, optional
+        Seconds a stored page of the index is used without revalidating it,
+        by default one day.
+    index_workers : int, optional
+        Number of index pages requested at the same time, by default 4.
     """
 
-    def __init__(self, force_redownload: bool = False):
+    def __init__(
+        self,
+        force_redownload: bool = False,
+        base_url: str = "https://cubapk.com",
+        index_path: str = "",
+        index_ttl: int = DEFAULT_INDEX_TTL,
+        index_workers: int = DEFAULT_INDEX_WORKERS,
+    ):
         super().__init__(force_redownload)
-        self.base_url = "https://cubapk.com"
+        self.base_url = base_url
+        host = urllib.parse.urlsplit(base_url).netloc.replace(":", "_")
+        self.index_path = Path(index_path or DEFAULT_INDEX_FOLDER / f"{host}.json")
+        self.index_ttl = index_ttl
+        self.index_workers = index_workers
 
     @functools.lru_cache(maxsize=None)
     def avialable_apks(self) -> dict:
         """
         Generates a dictionary with the avialable apks from cubapk.com website.
         """
+        return dict(self.iter_apks())
+
+    def iter_apks(self) -> Iterator[tuple[str, str]]:
+        """
+        Lazily iterates over the apks avialable in cubapk.com website, page by
+        page, while the next pages are being fetched.
+
+        Yields
+        ------
+        tuple[str, str]
+            Pairs of apk name and url.
+        """
+        index = self._load_index()
+        pages = index["pages"]
+        futures: collections.deque = collections.deque()
+        executor = ThreadPoolExecutor(max_workers=self.index_workers)
+
+        def submit(page: int):
+            cached = pages.get(str(page))
+            futures.append(executor.submit(self._fetch_page, page, cached, index))
 
-        # Empty dictionary to store the avialable apks
+        try:
+            # Request the first pages at the same time
+            for page in range(1, self.index_workers + 1):
+                submit(page)
+
+            # Yield the pages in order, requesting a new one for each one done
+            page = 1
+            while True:
+                entry = futures.popleft().result()
+                if entry is None:
+                    logging.info(f"Index of {self.base_url} has {page - 1} pages")
+                    index["end"] = {"page": page, "time": time.time()}
+                    break
+                pages[str(page)] = entry
+                submit(page + self.index_workers)
+                yield from entry["apks"].items()
+                page += 1
+
+        # Store the pages fetched so far, even if the iteration was stopped
+        finally:
+            executor.shutdown(cancel_futures=True)
+            self._save_index(index)
+
+    def _fetch_page(
+        self, page: int, cached: Optional[dict], index: dict
+    ) -> Optional[dict]:
+        """
+        Fetches a page of the index of the website.
+
+        Parameters
+        ----------
+        page : int
+            Number of the page.
+        cached : dict, optional
+            Stored version of the page, if any.
+        index : dict
+            Stored index of the website.
+
+        Returns
+        -------
+        Optional[dict]
+            Page with the apks it lists and its validators, or None if the
+            page does not exist.
+
+        Raises
+        ------
+        urllib.error.URLError
+            If the page can not be fetched for another reason than not
+            existing.
+        """
+        now = time.time()
+
+        # Use the stored page or end of the index if they are fresh enough
+        end = index.get("end")
+        if self._is_fresh(end, now) and page >= end["page"]:
+            return None
+        if self._is_fresh(cached, now):
+            return cached
+
+        # Fetches the website raw HTML, revalidating the stored page if any
+        page_url = f"{self.base_url}/store/?page={page}"
+        try:
+            response = self._pool.request(page_url, _validators(cached))
+            text = response.read()
+
+        # Only a missing page is the end of the index, other errors are raised
+        # so the end is not stored
+        except urllib.error.HTTPError as error:
+            if error.code == 404:
+                return None
+            raise
+
+        if response.status == 304 and cached:
+            return {**cached, "time": now}
+        return {
+            "time": now,
+            "etag": response.getheader("ETag"),
+            "last_modified": response.getheader("Last-Modified"),
+            "apks": self._parse_page(text),
+        }
+
+    def _is_fresh(self, entry: Optional[dict], now: float) -> bool:
+        """
+        Checks whether a stored entry of the index can be used without
+        revalidating it.
+        """
+        return bool(entry) and now - entry["time"] < self.index_ttl
+
+    def _parse_page(self, text: bytes) -> dict:
+        """
+        Parses the apks listed in a page of the index of the website.
+
+        Parameters
+        ----------
+        text : bytes
+            Raw HTML of the page.
+
+        Returns
+        -------
+        dict
+            Pairs of apk name and url.
+        """
         apk_dict = {}
+        for div in lxml.html.fromstring(text).find_class("app-data"):
 
-        # Interation variable to control the page we are parsing in the website
-        page = 1
+            # Parse the apk name
+            raw_name = div.find_class("app-title")[0].text_content()
+            apk_name = "".join(filter(str.isalnum, raw_name))
+            apk_name += ".apk"
 
-        # If there is another page to be parsed
-        while True:
-            page_url = f"{self.base_url}/store/?page={page}"
+            # Parse the apk url
+            raw_link = div.find_class("app-meta")[0].find(".//a").get("href")
+            link = f"{self.base_url}{raw_link}"
 
-            # Fetches the website raw HTML
-            try:
-                request = urllib.request.Request(
-                    page_url, headers={"User-Agent": "Mozilla/5.0"}
-                )
-                text = urlopen(request).read()
-            except urllib.error.HTTPError:
-                logging.info(f"Index of {self.base_url} has {page-1} pages")
-                break
-
-            # Parses the website
-            soup = BeautifulSoup(text, features="lxml")
-            data = soup.findAll("div", attrs={"class": "app-data"})
-            for div in data:
-
-                # Parse the apk name
-                raw_name = div.find("div", attrs={"class": "app-title"}).text
-                apk_name = "".join(filter(str.isalnum, raw_name))
-                apk_name += ".apk"
-
-                # Parse the apk url
-                download_div = div.find("div", attrs={"class": "app-meta"})
-                raw_link = download_div.a["href"]
-                link = f"{self.base_url}{raw_link}"
-
-                # Apend the data from the apk to the dictionary
-                apk_dict[apk_name] = link
-
-            # Updates the page number
-            page += 1
+            # Apend the data from the apk to the dictionary
+            apk_dict[apk_name] = link
         return apk_dict
 
+    def _load_index(self) -> dict:
+        """
+        Loads the index stored on disk, or an empty one.
+        """
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"pages": {}}
+
+    def _save_index(self, index: dict) -> None:
+        """
+        Stores the index on disk.
+        """
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+
+def _validators(cached: Optional[dict]) -> dict:
+    """
+    Builds the headers of a conditional request revalidating a stored page.
+    """
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
 
 # Dictionary with all the available providers
 _providers = {"cubapk.com": CubapkProvider}
 
 
-def get_provider(name: str, force_redownload:bool=False) -> ApkProvider:
+def get_provider(name: str, force_redownload: bool = False) -> ApkProvider:
     """
     Returns an ApkProvider instance with the given name. If there are no
     matches with the given name, the default provider is returned.
@@ -220,7 +1004,8 @@ def fetch(
     path: str,
     create_path: bool = True,
     force_redownload: bool = False,
-) -> None:
+    workers: int = 1,
+) -> int:
     """
     Download a given amount of apks from the given provider.
 
@@ -237,10 +1022,54 @@ def fetch(
     force_redownload : bool, optional
         Defines wheter or not the apks will be redownloaded if they already
         exists.
+    workers : int, optional
+        Number of apks downloaded at the same time, by default 1.
+
+    Returns
+    -------
+    int
+        Number of apks downloaded or already in `path`.
     """
 
     # Get the provider
     provider = get_provider(provider, force_redownload)
 
     # Download the apks
-    provider.download_apks(amount, path, create_path)
\ No newline at end of file
+    return provider.download_apks(amount, path, create_path, workers)
+
+
+async def fetch_async(
+    amount: int,
+    provider: str,
+    path: str,
+    create_path: bool = True,
+    force_redownload: bool = False,
+    workers: int = 1,
+) -> int:
+    """
+    Asyncio counterpart of `fetch`: download a given amount of apks from the
+    given provider without blocking the event loop.
+
+    Parameters
+    ----------
+    amount : int
+        Amount of apks to be downloaded.
+    provider : str
+        Name of the provider to be used.
+    path : str
+        Path where the apks will be downloaded.
+    create_path : bool, optional
+        Defines wheter or not the path will be created if it does not exists.
+    force_redownload : bool, optional
+        Defines wheter or not the apks will be redownloaded if they already
+        exists.
+    workers : int, optional
+        Number of apks downloaded at the same time, by default 1.
+
+    Returns
+    -------
+    int
+        Number of apks downloaded or already in `path`.
+    """
+    apk_provider = get_provider(provider, force_redownload)
+    return await apk_provider.download_apks_async(amount, path, create_path, workers)
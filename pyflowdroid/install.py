@@ -1,47 +1,351 @@
 import os
+import re
+import json
+import hashlib
 import logging
 import zipfile
-import urllib.request
+import http.client
 from pathlib import Path
+from typing import Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor
 
 from pyflowdroid.consts import (
     FLOWDROID_DOWNLOAD_URL,
     SABLE_DOWNLOAD_URL,
     DEFAULT_APK_FOLDER_NAME,
     FLOWDROID_EXEC_NAME,
+    ANDROID_FOLDER_NAME,
     PYFLOWDROID_PATH,
+    INSTALL_MANIFEST_NAME,
+    DEFAULT_DOWNLOAD_FOLDER,
 )
-from pyflowdroid._cli_tools import ProgressBar
+from pyflowdroid._cli_tools import _hash_file
+from pyflowdroid.download import (
+    _ConnectionPool,
+    _check_complete_part,
+    _check_received,
+)
+
+# Platform jars inside the Sable zip, e.g. "android-platforms-master/android-28/"
+_PLATFORM_PATTERN = re.compile(r"^[^/]+/android-(\d+)/")
+
+# Size of the chunks copied while downloading and extracting
+_CHUNK_SIZE = 1 << 20
 
 
-def download_flowdroid():
+def _download_file(
+    pool: _ConnectionPool, url: str, path: Path, sha256: str = ""
+) -> str:
     """
-    Fetches Flowdroid from the internet.
+    Downloads a file into a '.part' file, resuming a previous interrupted
+    download, and renames it once it is complete and verified.
+
+    Parameters
+    ----------
+    pool : _ConnectionPool
+        Connections used for the download.
+    url : str
+        Url of the file.
+    path : Path
+        Path where the file is saved.
+    sha256 : str, optional
+        Expected SHA-256 hash of the file. If empty, it is not verified. By
+        default ''.
+
+    Returns
+    -------
+    str
+        SHA-256 hash of the file.
+
+    Raises
+    ------
+    ValueError
+        If the hash of the downloaded file is not `sha256`.
+    urllib.error.URLError
+        If the file can not be downloaded.
+    """
+
+    # Reuse a previous download if it is still valid
+    digest = _reusable_digest(path, sha256)
+    if digest:
+        return digest
+
+    # Resume the download from the end of the partial file if any
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = path.with_name(f"{path.name}.part")
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    logging.info(f"Downloading {url}")
+    _save_part(pool.request(url, headers), url, part_path, offset)
+
+    # Never keep a corrupt file
+    digest = _hash_file(part_path)
+    if sha256 and digest != sha256:
+        part_path.unlink()
+        raise ValueError(f"Checksum mismatch for {url}: {digest} != {sha256}")
+    os.replace(part_path, path)
+    return digest
+
+
+def _reusable_digest(path: Path, sha256: str = "") -> str:
+    """
+    Hashes a previously downloaded file, deleting it if it does not match the
+    expected hash.
+
+    Returns
+    -------
+    str
+        SHA-256 hash of the file, or '' if there is no valid file.
+    """
+    if not path.exists():
+        return ""
+    digest = _hash_file(path)
+    if not sha256 or digest == sha256:
+        logging.info(f"Reusing {path}")
+        return digest
+    path.unlink()
+    return ""
+
+
+def _save_part(
+    response: http.client.HTTPResponse, url: str, part_path: Path, offset: int
+) -> None:
+    """
+    Saves the body of a response in a '.part' file which already holds its
+    first `offset` bytes.
+    """
+
+    # The partial file may already hold the whole file
+    if response.status == 416:
+        response.read()
+        content_range = response.getheader("Content-Range", "")
+        _check_complete_part(content_range, url, part_path, offset)
+        return
+
+    # Append only if the server honoured the requested range
+    mode = "ab" if response.status == 206 else "wb"
+    length = response.getheader("Content-Length")
+    with open(part_path, mode) as out_file:
+        start = out_file.tell()
+        total = start + int(length) if length else 0
+        logged = start * 10 // total if total else 0
+        for chunk in iter(lambda: response.read(_CHUNK_SIZE), b""):
+            out_file.write(chunk)
+            logged = _log_progress(url, out_file.tell(), total, logged)
+        received = out_file.tell() - start
+    _check_received(length, received)
+
+
+def _log_progress(url: str, done: int, total: int, logged: int) -> int:
+    """
+    Logs the progress of a download each time another tenth of the file is
+    received, since several files are downloaded at once.
+
+    Returns
+    -------
+    int
+        Tenths of the file logged so far.
+    """
+    tenths = done * 10 // total if total else 0
+    if tenths > logged:
+        logging.info(
+            f"Downloaded {tenths * 10}% of {url} ({done >> 20}/{total >> 20} MB)"
+        )
+    return max(tenths, logged)
+
+
+def _extract(
+    archive: Path, folder: Path, api_levels: Optional[Iterable[int]] = None
+) -> dict:
+    """
+    Extracts the platform jars of the Sable zip, streaming each member into a
+    temporary file renamed once it is complete.
+
+    Parameters
+    ----------
+    archive : Path
+        Path to the zip file.
+    folder : Path
+        Folder where the zip is extracted.
+    api_levels : Iterable[int], optional
+        API levels extracted. If None, the whole zip is extracted. By default
+        None.
+
+    Returns
+    -------
+    dict
+        Pairs of extracted file, relative to `folder`, and its size and
+        SHA-256 hash.
+    """
+    levels = None if api_levels is None else {int(level) for level in api_levels}
+    files = {}
+    with zipfile.ZipFile(archive) as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir():
+                continue
+            match = _PLATFORM_PATTERN.match(info.filename)
+            if levels is not None and (not match or int(match.group(1)) not in levels):
+                continue
+
+            # Hash the member while it is copied
+            target = _member_path(folder, info.filename)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(f"{target.name}.part")
+            digest = hashlib.sha256()
+            with zip_file.open(info) as source, open(tmp_path, "wb") as out_file:
+                for chunk in iter(lambda: source.read(_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    out_file.write(chunk)
+            os.replace(tmp_path, target)
+            files[info.filename] = {
+                "size": info.file_size,
+                "sha256": digest.hexdigest(),
+            }
+    return files
+
+
+def _member_path(folder: Path, name: str) -> Path:
+    """
+    Finds where a zip member is extracted, rejecting the names that point
+    outside of `folder`, like absolute paths or '../' components.
+
+    Raises
+    ------
+    ValueError
+        If the member would be extracted outside of `folder`.
+    """
+    root = folder.resolve()
+    target = (root / name).resolve()
+    if root not in target.parents:
+        raise ValueError(f"Zip member '{name}' points outside of '{folder}'")
+    return target
+
+
+def _load_manifest(folder: Path) -> dict:
+    """
+    Reads the manifest of a previous installation, or an empty one.
+    """
+    try:
+        return json.loads((folder / INSTALL_MANIFEST_NAME).read_text())
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _is_intact(manifest: dict, folder: Path, verify: bool = False) -> bool:
+    """
+    Checks that all the files of an installation are still there, comparing
+    their sizes or, if `verify` is True, their SHA-256 hashes.
+    """
+    if not manifest.get("files"):
+        return False
+    for name, entry in manifest["files"].items():
+        path = folder / name
+        if not path.is_file() or path.stat().st_size != entry["size"]:
+            return False
+        if verify and _hash_file(path) != entry["sha256"]:
+            return False
+    return True
+
+
+def installed_api_levels(folder: str = PYFLOWDROID_PATH) -> Optional[set]:
+    """
+    Finds the API levels of the installed Android platforms.
+
+    Parameters
+    ----------
+    folder : str, optional
+        Folder of the installation, by default the pyflowdroid package.
+
+    Returns
+    -------
+    set or None
+        Installed API levels, or None if all the levels of the Sable zip are
+        installed.
     """
+    manifest = _load_manifest(Path(folder))
+    levels = manifest.get("android", {}).get("api_levels")
+    return None if levels is None else set(levels)
+
+
+def download_flowdroid(
+    pool: Optional[_ConnectionPool] = None,
+    url: str = FLOWDROID_DOWNLOAD_URL,
+    sha256: str = "",
+    folder: str = PYFLOWDROID_PATH,
+) -> dict:
+    """
+    Fetches Flowdroid from the internet.
 
-    # Create a path object for the Flowdroid executable
-    flowdroid_path = PYFLOWDROID_PATH / FLOWDROID_EXEC_NAME
+    Parameters
+    ----------
+    pool : _ConnectionPool, optional
+        Connections used for the download, by default new ones.
+    url : str, optional
+        Url of the FlowDroid jar, by default the one of its GitHub release.
+    sha256 : str, optional
+        Expected SHA-256 hash of the jar. If empty, it is not verified. By
+        default ''.
+    folder : str, optional
+        Folder where the jar is saved, by default the pyflowdroid package.
+
+    Returns
+    -------
+    dict
+        Size and SHA-256 hash of the jar.
+    """
 
     # Download executable from GitHub
-    logging.info("Downloading Flowdroid")
-    urllib.request.urlretrieve(FLOWDROID_DOWNLOAD_URL, flowdroid_path, ProgressBar())
+    flowdroid_path = Path(folder, FLOWDROID_EXEC_NAME)
+    digest = _download_file(pool or _ConnectionPool(), url, flowdroid_path, sha256)
+    return {"size": flowdroid_path.stat().st_size, "sha256": digest}
 
 
-def download_android():
+def download_android(
+    pool: Optional[_ConnectionPool] = None,
+    url: str = SABLE_DOWNLOAD_URL,
+    sha256: str = "",
+    api_levels: Optional[Iterable[int]] = None,
+    folder: str = PYFLOWDROID_PATH,
+) -> dict:
     """
     Fetches Android from the internet.
+
+    The zip is kept in '~/.cache/pyflowdroid/downloads' when only some API
+    levels are extracted, so the others can be extracted later without
+    downloading it again.
+
+    Parameters
+    ----------
+    pool : _ConnectionPool, optional
+        Connections used for the download, by default new ones.
+    url : str, optional
+        Url of the zip with the Android platforms, by default the Sable one.
+    sha256 : str, optional
+        Expected SHA-256 hash of the zip. If empty, it is not verified. By
+        default ''.
+    api_levels : Iterable[int], optional
+        API levels extracted. If None, all of them are extracted. By default
+        None.
+    folder : str, optional
+        Folder where the zip is extracted, by default the pyflowdroid package.
+
+    Returns
+    -------
+    dict
+        SHA-256 hash of the zip and, in 'files', pairs of extracted file,
+        relative to `folder`, and its size and SHA-256 hash.
     """
 
     # Download project from GitHub
-    github_zip = "master.zip"
-    logging.info("Downloading Android")
-    urllib.request.urlretrieve(SABLE_DOWNLOAD_URL, github_zip, ProgressBar())
+    archive = Path(DEFAULT_DOWNLOAD_FOLDER, f"{ANDROID_FOLDER_NAME}.zip")
+    digest = _download_file(pool or _ConnectionPool(), url, archive, sha256)
 
     # Extract project
     logging.info("Uncompressing Android")
-    with zipfile.ZipFile(github_zip, "r") as zip_ref:
-        zip_ref.extractall(PYFLOWDROID_PATH)
-    os.remove(github_zip)
+    files = _extract(archive, Path(folder), api_levels)
+    if api_levels is None:
+        archive.unlink()
+    return {"sha256": digest, "files": files}
 
 
 def create_apk_folder():
@@ -57,10 +361,113 @@ def create_apk_folder():
     apk_path.mkdir(parents=True, exist_ok=True)
 
 
-def install_deps():
+def install_deps(
+    api_levels: Optional[Iterable[int]] = None,
+    force: bool = False,
+    verify: bool = False,
+    flowdroid_url: str = FLOWDROID_DOWNLOAD_URL,
+    android_url: str = SABLE_DOWNLOAD_URL,
+    flowdroid_sha256: str = "",
+    android_sha256: str = "",
+    folder: str = PYFLOWDROID_PATH,
+) -> bool:
     """
     Installs Flowdroid and Android.
+
+    Both are downloaded at the same time, resuming interrupted downloads. A
+    manifest with the size and hash of every installed file is written once
+    the installation is complete, so an intact installation is detected and
+    kept, and a half-finished one is installed again.
+
+    Parameters
+    ----------
+    api_levels : Iterable[int], optional
+        API levels of the Android platforms installed. If None, all of them
+        are installed. By default None.
+    force : bool, optional
+        Defines whether or not install again an intact installation, by
+        default False.
+    verify : bool, optional
+        Defines whether or not check the hashes of the installed files,
+        instead of only their sizes, by default False.
+    flowdroid_url : str, optional
+        Url of the FlowDroid jar, by default the one of its GitHub release.
+    android_url : str, optional
+        Url of the zip with the Android platforms, by default the Sable one.
+    flowdroid_sha256 : str, optional
+        Expected SHA-256 hash of the FlowDroid jar. If empty, it is not
+        verified. By default ''.
+    android_sha256 : str, optional
+        Expected SHA-256 hash of the Android platforms zip. If empty, it is
+        not verified. By default ''.
+    folder : str, optional
+        Folder of the installation, by default the pyflowdroid package.
+
+    Returns
+    -------
+    bool
+        True if anything was installed, False if the installation was intact.
+
+    Raises
+    ------
+    ValueError
+        If a downloaded file does not match its expected hash.
+    ValueError
+        If a member of the Android platforms zip points outside of `folder`.
     """
-    download_flowdroid()
-    download_android()
+    folder = Path(folder)
+    levels = None if api_levels is None else sorted({int(a) for a in api_levels})
+
+    # Keep an intact installation with the same files
+    manifest = _load_manifest(folder)
+    installed = manifest.get("android", {}).get("api_levels")
+    if manifest and installed is not None and levels is not None:
+        levels = sorted(set(levels) | set(installed))
+    same_levels = installed is None or (
+        levels is not None and set(levels) <= set(installed)
+    )
+    pinned = all(
+        not expected or manifest.get(name, {}).get("sha256") == expected
+        for name, expected in (
+            ("flowdroid", flowdroid_sha256),
+            ("android", android_sha256),
+        )
+    )
+    if not force and same_levels and pinned and _is_intact(manifest, folder, verify):
+        logging.info("FlowDroid and Android are already installed")
+        return False
+
+    # Download both at the same time, sharing the kept-alive connections
+    (folder / INSTALL_MANIFEST_NAME).unlink(missing_ok=True)
+    if force:
+        (folder / FLOWDROID_EXEC_NAME).unlink(missing_ok=True)
+        Path(DEFAULT_DOWNLOAD_FOLDER, f"{ANDROID_FOLDER_NAME}.zip").unlink(
+            missing_ok=True
+        )
+    pool = _ConnectionPool()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        flowdroid = executor.submit(
+            download_flowdroid, pool, flowdroid_url, flowdroid_sha256, folder
+        )
+        android = executor.submit(
+            download_android, pool, android_url, android_sha256, levels, folder
+        )
+        flowdroid_entry = flowdroid.result()
+        android_entry = android.result()
+
+    # Record the installation once it is complete
+    files = {**android_entry["files"], FLOWDROID_EXEC_NAME: flowdroid_entry}
+    manifest = {
+        "flowdroid": {"url": flowdroid_url, **flowdroid_entry},
+        "android": {
+            "url": android_url,
+            "sha256": android_entry["sha256"],
+            "api_levels": levels,
+        },
+        "files": files,
+    }
+    tmp_path = folder / f"{INSTALL_MANIFEST_NAME}.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp_path, folder / INSTALL_MANIFEST_NAME)
     logging.info("Instalation Complete")
+    return True
@@ -0,0 +1,41 @@
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+
+import soot.jimple.infoflow.cmd.MainClass;
+
+/**
+ * Long-lived FlowDroid process used by pyflowdroid's AnalysisServer.
+ *
+ * Each line read from stdin holds the tab-separated command line arguments of
+ * one FlowDroid analysis. The output of the analysis is written to stdout,
+ * followed by a line with the DONE marker and the exit code of the analysis.
+ *
+ * Each analysis runs through MainClass as a fresh command line, and FlowDroid
+ * resets Soot for every app, so the sources and sinks are parsed and the
+ * platform jars are loaded again each time. Only the JVM startup and the JIT
+ * warm-up are saved.
+ */
+public class FlowDroidServer extends MainClass {
+
+    private static final String DONE = "@@PYFLOWDROID_DONE";
+
+    public static void main(String[] args) throws Exception {
+        PrintStream out = System.out;
+        System.setErr(out);
+
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in));
+        String line;
+        while ((line = in.readLine()) != null) {
+            int status = 0;
+            try {
+                new FlowDroidServer().run(line.split("\t"));
+            } catch (Throwable t) {
+                t.printStackTrace(out);
+                status = 1;
+            }
+            out.println(DONE + " " + status);
+            out.flush();
+        }
+    }
+}
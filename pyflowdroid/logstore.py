@@ -0,0 +1,332 @@
+import io
+import os
+import gzip
+import json
+import time
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Iterator
+from pyflowdroid._cli_tools import _hash_file_once
+from pyflowdroid.consts import DEFAULT_LOG_SEGMENT_SIZE
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+# Compression formats supported by `LogStore`
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+
+# Logs bigger than this are compressed to a temporary file instead of memory
+_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+class _BoundedReader(io.RawIOBase):
+    """
+    Reads at most `length` bytes of a file, starting at its current position.
+    """
+
+    def __init__(self, file: BinaryIO, length: int):
+        self._file = file
+        self._remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._remaining)
+        if size == 0:
+            return 0
+        data = self._file.read(size)
+        buffer[: len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+class LogWriter:
+    """
+    Writer of the raw log of one apk into a `LogStore`.
+
+    The log is compressed while it is written and added to the store when the
+    writer is closed, so concurrent analyses never interleave their logs.
+    Logs of writers that are discarded are never added to the store.
+
+    Parameters
+    ----------
+    store : LogStore
+        Store where the log is added.
+    key : str
+        Key of the log in the store.
+    apk : str, optional
+        Path to the apk, recorded in the index of the store, by default ''.
+    """
+
+    def __init__(self, store: "LogStore", key: str, apk: str = ""):
+        self.store = store
+        self.key = key
+        self.apk = apk
+        self._spool = tempfile.SpooledTemporaryFile(_SPOOL_SIZE)
+        self._compressor = store._compressor(self._spool)
+
+    def __enter__(self) -> "LogWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, text: str) -> int:
+        return self._compressor.write(text.encode("utf-8", "replace"))
+
+    def close(self) -> None:
+        """
+        Finishes the compression of the log and adds it to the store.
+        """
+        if self._spool.closed:
+            return
+        self._compressor.close()
+        self._spool.seek(0)
+        try:
+            self.store._append(self.key, self.apk, self._spool)
+        finally:
+            self._spool.close()
+
+    def discard(self) -> None:
+        """
+        Drops the log without adding it to the store.
+        """
+        self._spool.close()
+
+
+class LogStore:
+    """
+    Compressed store of raw FlowDroid logs.
+
+    Logs are compressed and appended to segment files, which are rotated once
+    they reach `segment_size`. An index maps the key of each log, the hash of
+    its apk, to its position in the segments, so a log can be read without
+    decompressing the others. Whole segments are removed, oldest first, when
+    the store exceeds `max_size` or they are older than `max_age`.
+
+    Parameters
+    ----------
+    folder : str
+        Folder where the segments and the index are stored.
+    compression : str, optional
+        Compression of the logs, 'gzip' or 'zstd', by default 'gzip'. 'zstd'
+        requires the `zstandard` package.
+    segment_size : int, optional
+        Size (in MB) at which a new segment is started, by default 64.
+    max_size : int, optional
+        Maximum size (in MB) of the store. If 0, there is no limit. By default
+        0.
+    max_age : int, optional
+        Maximum age (in days) of a segment. If 0, there is no limit. By
+        default 0.
+
+    Raises
+    ------
+    ValueError
+        If `compression` is not supported.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        compression: str = COMPRESSION_GZIP,
+        segment_size: int = DEFAULT_LOG_SEGMENT_SIZE,
+        max_size: int = 0,
+        max_age: int = 0,
+    ):
+        if compression not in (COMPRESSION_GZIP, COMPRESSION_ZSTD):
+            raise ValueError(f"Unknown log compression '{compression}'")
+        if compression == COMPRESSION_ZSTD and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+
+        self.folder = Path(folder)
+        self.compression = compression
+        self.segment_size = segment_size * 1024 * 1024
+        self.max_size = max_size * 1024 * 1024
+        self.max_age = max_age * 24 * 60 * 60
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.folder / "index.jsonl"
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def key(self, apk_path: str) -> str:
+        """
+        Computes the key of the log of an apk, the hash of its content.
+
+        Parameters
+        ----------
+        apk_path : str
+            Path to the apk file.
+
+        Returns
+        -------
+        str
+            Key of the log in the store.
+        """
+        return _hash_file_once(apk_path)
+
+    def writer(self, key: str, apk: str = "") -> LogWriter:
+        """
+        Opens a writer for a new log. If the key is already in the store, the
+        new log replaces the old one once the writer is closed.
+
+        Parameters
+        ----------
+        key : str
+            Key of the log in the store.
+        apk : str, optional
+            Path to the apk, recorded in the index, by default ''.
+
+        Returns
+        -------
+        LogWriter
+            Writer of the log.
+        """
+        return LogWriter(self, key, apk)
+
+    def read(self, key: str) -> Iterator[str]:
+        """
+        Streams the lines of a log, decompressing it while it is read.
+
+        Parameters
+        ----------
+        key : str
+            Key of the log in the store.
+
+        Yields
+        ------
+        str
+            Lines of the log.
+
+        Raises
+        ------
+        KeyError
+            If the log is not in the store.
+        """
+        entry = self._index[key]
+        with open(self.folder / entry["segment"], "rb") as f:
+            f.seek(entry["offset"])
+            raw = io.BufferedReader(_BoundedReader(f, entry["length"]))
+            if entry.get("compression", COMPRESSION_GZIP) == COMPRESSION_ZSTD:
+                binary = zstandard.ZstdDecompressor().stream_reader(raw)
+            else:
+                binary = gzip.GzipFile(fileobj=raw, mode="rb")
+            yield from io.TextIOWrapper(binary, encoding="utf-8", errors="replace")
+
+    def entries(self) -> dict:
+        """
+        Returns the index of the store.
+
+        Returns
+        -------
+        dict
+            Pairs of key and position of its log, with the apk it belongs to
+            and the time it was stored.
+        """
+        with self._lock:
+            return dict(self._index)
+
+    def _compressor(self, file: BinaryIO):
+        if self.compression == COMPRESSION_ZSTD:
+            return zstandard.ZstdCompressor().stream_writer(file, closefd=False)
+        return gzip.GzipFile(fileobj=file, mode="wb")
+
+    def _segments(self) -> list:
+        return sorted(self.folder.glob("segment-*.log"))
+
+    def _current_segment(self) -> Path:
+        segments = self._segments()
+        if segments and segments[-1].stat().st_size < self.segment_size:
+            return segments[-1]
+        number = int(segments[-1].stem.split("-")[1]) + 1 if segments else 1
+        return self.folder / f"segment-{number:06d}.log"
+
+    def _append(self, key: str, apk: str, data: BinaryIO) -> None:
+        """
+        Appends a compressed log to the current segment and indexes it.
+        """
+        with self._lock:
+            segment = self._current_segment()
+            with open(segment, "ab") as f:
+                offset = f.tell()
+                length = 0
+                for chunk in iter(lambda: data.read(1 << 20), b""):
+                    f.write(chunk)
+                    length += len(chunk)
+
+            entry = {
+                "key": key,
+                "apk": apk,
+                "segment": segment.name,
+                "offset": offset,
+                "length": length,
+                "compression": self.compression,
+                "time": time.time(),
+            }
+            with open(self._index_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._index[key] = entry
+            self._enforce_retention()
+
+    def _load_index(self) -> dict:
+        index: dict = {}
+        if not self._index_path.exists():
+            return index
+        with open(self._index_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of a run killed while writing it
+                    continue
+                index[entry["key"]] = entry
+        return index
+
+    def _enforce_retention(self) -> None:
+        """
+        Removes the oldest segments exceeding the size or age limits. The
+        segment being written is never removed.
+        """
+        segments = self._segments()[:-1]
+        total_size = sum(s.stat().st_size for s in self._segments())
+        deadline = time.time() - self.max_age
+        removed = set()
+        for segment in segments:
+            too_big = self.max_size and total_size > self.max_size
+            too_old = self.max_age and segment.stat().st_mtime < deadline
+            if not (too_big or too_old):
+                break
+            logging.info(f"Removing '{segment}' from the log store")
+            total_size -= segment.stat().st_size
+            segment.unlink()
+            removed.add(segment.name)
+
+        if removed:
+            self._index = {
+                key: entry
+                for key, entry in self._index.items()
+                if entry["segment"] not in removed
+            }
+            self._save_index()
+
+    def _save_index(self) -> None:
+        tmp_path = self._index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            for entry in self._index.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self._index_path)
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Optional
+from pyflowdroid._cli_tools import _hash_file_once
+from pyflowdroid.results import ApkResult, STATUS_OK
+
+
+class RunManifest:
+    """
+    Append-only record of the apks analyzed in a batch run.
+
+    Each analyzed apk appends a JSON line to the manifest file as soon as its
+    analysis finishes, with its status, hash and result. If the run dies, the
+    manifest allows to resume it skipping the apks already analyzed.
+
+    Parameters
+    ----------
+    path : str
+        Path to the manifest file. It is created if it does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def record(self, result: ApkResult) -> None:
+        """
+        Appends the result of an analysis to the manifest.
+
+        Parameters
+        ----------
+        result : ApkResult
+            Result of the analysis of an apk.
+        """
+        stat = os.stat(result.apk)
+        entry = {
+            "apk": result.apk,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": _hash_file_once(result.apk),
+            "status": result.status,
+            "time": time.time(),
+            "result": result.to_dict(),
+        }
+        line = json.dumps(entry) + "\n"
+
+        # Flush each line so it survives if the run dies
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self) -> dict:
+        """
+        Reads the latest entry of each apk in the manifest.
+
+        Returns
+        -------
+        dict
+            Pairs of apk path and its latest entry in the manifest.
+        """
+        entries: dict = {}
+        if not self.path.exists():
+            return entries
+
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of a run killed while writing it
+                    continue
+                entries[entry["apk"]] = entry
+        return entries
+
+    def previous_result(
+        self, apk_path: str, entries: dict, retry_failed: bool = False
+    ) -> Optional[ApkResult]:
+        """
+        Finds the result of an apk that can be reused from a previous run.
+
+        An apk is reused if it has an entry in the manifest and it was not
+        modified since then.
+
+        Parameters
+        ----------
+        apk_path : str
+            Path to the apk.
+        entries : dict
+            Entries of the manifest, as returned by `entries`.
+        retry_failed : bool, optional
+            Defines whether or not apks whose analysis did not finish
+            successfully (failed, timed out or out of memory) are analyzed
+            again instead of reused, by default False.
+
+        Returns
+        -------
+        Optional[ApkResult]
+            Result of the apk in the previous run, or None if the apk has to
+            be analyzed again.
+        """
+        entry = entries.get(apk_path)
+        if entry is None or (retry_failed and entry["status"] != STATUS_OK):
+            return None
+
+        # Analyze again the apks modified since they were recorded
+        stat = os.stat(apk_path)
+        if stat.st_size != entry["size"] or stat.st_mtime != entry["mtime"]:
+            return None
+        return ApkResult.from_dict(entry["result"])
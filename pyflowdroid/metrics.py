@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import bisect
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+from pyflowdroid.consts import DEFAULT_METRIC_BUCKETS
+
+
+class _Timer:
+    """
+    Context manager observing the seconds spent inside it in a histogram.
+    """
+
+    __slots__ = ("_metrics", "_name", "_labels", "_start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: dict):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self._start
+        self._metrics.observe(self._name, elapsed, **self._labels)
+
+
+class _NullTimer:
+    """
+    Context manager doing nothing, used when metrics are disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms of a run.
+
+    Instrumented code records metrics in the registry returned by
+    `get_metrics`, which does nothing until a registry is installed with
+    `set_metrics`. Metrics can be sent to other systems by subclassing this
+    class and overriding `increment` and `observe`.
+
+    Parameters
+    ----------
+    buckets : tuple, optional
+        Upper bounds of the buckets of the histograms, in ascending order, by
+        default from 5ms to one hour.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets: tuple = DEFAULT_METRIC_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters: dict = {}
+        self._histograms: dict = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increments a counter.
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter.
+        value : float, optional
+            Amount added to the counter, by default 1.
+        **labels
+            Labels of the counter, e.g. `status='ok'`.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Records a value in a histogram.
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram.
+        value : float
+            Observed value, usually a duration in seconds.
+        **labels
+            Labels of the histogram, e.g. `stage='analysis'`.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                    0,
+                ]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def timer(self, name: str, **labels):
+        """
+        Measures the seconds spent in a `with` block in a histogram.
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram.
+        **labels
+            Labels of the histogram.
+
+        Returns
+        -------
+        context manager
+            Timer of the block.
+        """
+        return _Timer(self, name, labels)
+
+    def to_dict(self) -> dict:
+        """
+        Exports the metrics as a JSON serializable dictionary.
+
+        Returns
+        -------
+        dict
+            Counters and histograms, with the cumulative count of each bucket.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()
+            }
+
+        data: dict = {"counters": [], "histograms": []}
+        for (name, labels), value in sorted(counters.items()):
+            data["counters"].append(
+                {"name": name, "labels": dict(labels), "value": value}
+            )
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            bounds = [*map(str, self.buckets), "+Inf"]
+            cumulative = [sum(counts[: i + 1]) for i in range(len(counts))]
+            data["histograms"].append(
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": count,
+                    "sum": total,
+                    "buckets": dict(zip(bounds, cumulative)),
+                }
+            )
+        return data
+
+    def to_prometheus(self) -> str:
+        """
+        Exports the metrics in the Prometheus text format.
+
+        Returns
+        -------
+        str
+            Metrics ready to be read by the textfile collector of Prometheus.
+        """
+        lines = []
+        typed = set()
+        data = self.to_dict()
+        for counter in data["counters"]:
+            name = counter["name"]
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+
+        for histogram in data["histograms"]:
+            name, labels = histogram["name"], histogram["labels"]
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in histogram["buckets"].items():
+                bucket_labels = _labels({**labels, "le": bound})
+                lines.append(f"{name}_bucket{bucket_labels} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Writes the metrics to a file, as JSON if its extension is '.json' and
+        in the Prometheus text format otherwise.
+
+        Parameters
+        ----------
+        path : str
+            Path to the file. It is replaced atomically, so it can be read
+            while being written.
+        """
+        path = Path(path)
+        if path.suffix == ".json":
+            text = json.dumps(self.to_dict(), indent=2)
+        else:
+            text = self.to_prometheus()
+
+        tmp_path = path.with_suffix(f"{path.suffix}.tmp")
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+
+
+class NullMetrics(Metrics):
+    """
+    Registry discarding all the metrics, used when metrics are disabled.
+    """
+
+    enabled = False
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def timer(self, name: str, **labels):
+        return _NULL_TIMER
+
+
+_metrics: Metrics = NullMetrics()
+
+
+def _labels(labels: dict) -> str:
+    """
+    Formats labels for the Prometheus text format.
+    """
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def get_metrics() -> Metrics:
+    """
+    Returns the registry where pyflowdroid records its metrics.
+
+    Returns
+    -------
+    Metrics
+        Installed registry, or a `NullMetrics` if metrics are disabled.
+    """
+    return _metrics
+
+
+def set_metrics(metrics: Optional[Metrics] = None) -> Metrics:
+    """
+    Installs the registry where pyflowdroid records its metrics.
+
+    Parameters
+    ----------
+    metrics : Metrics, optional
+        Registry to be installed. If None, metrics are disabled. By default
+        None.
+
+    Returns
+    -------
+    Metrics
+        Installed registry.
+    """
+    global _metrics
+    _metrics = metrics if metrics is not None else NullMetrics()
+    return _metrics
+
+
+def _timed_calls(function: Callable, totals: dict, key: str) -> Callable:
+    """
+    Wraps a function of one argument to add the seconds spent in its calls to
+    `totals[key]`, used to time the handling of each line of the hot loops.
+    """
+
+    def wrapper(arg):
+        start = time.perf_counter()
+        function(arg)
+        totals[key] += time.perf_counter() - start
+
+    totals[key] = 0.0
+    return wrapper
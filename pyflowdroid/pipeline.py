@@ -0,0 +1,438 @@
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+from typing import Iterator, Optional, Union
+from pyflowdroid.download import ApkProvider, get_provider
+from pyflowdroid.analyze import (
+    AnalysisServer,
+    _analyze_and_record,
+    _heap_per_worker,
+    _iter_pool,
+    quantify_leaks,
+)
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.logstore import LogStore
+from pyflowdroid.database import ResultsDatabase
+from pyflowdroid.manifest import RunManifest
+from pyflowdroid.metrics import get_metrics
+from pyflowdroid.platforms import PlatformProvider
+from pyflowdroid.definitions import SourceSinkSet, resolve_sources_and_sinks
+from pyflowdroid.results import ApkResult
+from pyflowdroid.consts import DEFAULT_APK_PROVIDER, DEFAULT_APK_FOLDER_NAME
+
+# Seconds between two checks of the stop event by blocked download threads
+_STOP_CHECK_INTERVAL = 0.1
+
+# Marks the end of the downloads of a thread in the queue of ready apks
+_DONE = object()
+
+
+def iter_download(
+    provider: ApkProvider,
+    amount: int,
+    path: str,
+    workers: int = 1,
+    buffer_size: int = 0,
+) -> Iterator[tuple[str, bool]]:
+    """
+    Downloads apks from a provider, yielding each one as soon as its download
+    completes.
+
+    Downloads wait while `buffer_size` downloaded apks are waiting to be
+    consumed, so a slow consumer also slows the downloads down. At most
+    `workers + buffer_size` apks are downloaded ahead of the consumer.
+
+    Parameters
+    ----------
+    provider : ApkProvider
+        Provider the apks are downloaded from.
+    amount : int
+        Amount of apks to be downloaded.
+    path : str
+        Path where the apks are downloaded. It is created if needed.
+    workers : int, optional
+        Number of apks downloaded at the same time, by default 1.
+    buffer_size : int, optional
+        Maximum number of downloaded apks waiting to be consumed. If 0,
+        `workers` is used. By default 0.
+
+    Yields
+    ------
+    tuple[str, bool]
+        Path to each apk, and whether it was downloaded by this call (False
+        if it already existed), in completion order. Apks that could not be
+        downloaded are skipped.
+    """
+    folder_path = Path(path)
+    folder_path.mkdir(parents=True, exist_ok=True)
+    downloads = _Downloads(provider, amount, folder_path, buffer_size or workers)
+    threads = [
+        threading.Thread(target=downloads.run, daemon=True) for _ in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        yield from _iter_ready(downloads.ready, workers)
+
+    # Stop the downloads if the consumer stops early
+    finally:
+        downloads.stop.set()
+        for thread in threads:
+            thread.join()
+        downloads.close()
+
+    # Notify if the provider did not have enough apks
+    if len(downloads.selected) < amount:
+        logging.error(
+            f"Downloaded {len(downloads.selected)} apks instead of {amount}. "
+            "No more apks to download"
+        )
+
+
+class _Downloads:
+    """
+    Downloads shared by the threads of `iter_download`.
+
+    Attributes
+    ----------
+    ready : queue.Queue
+        Downloaded apks waiting to be consumed, the errors of the threads and
+        `_DONE` when a thread finishes.
+    stop : threading.Event
+        Set when the consumer stops.
+    selected : set
+        Names of the apks taken from the listing of the provider.
+    """
+
+    def __init__(
+        self, provider: ApkProvider, amount: int, folder_path: Path, buffer_size: int
+    ) -> None:
+        self.ready: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self.stop = threading.Event()
+        self.selected: set = set()
+        self._provider = provider
+        self._amount = amount
+        self._folder_path = folder_path
+        self._listing = provider.iter_apks()
+        self._listing_lock = threading.Lock()
+
+    def run(self) -> None:
+        """
+        Downloads apks until there are no more or the consumer stops.
+        """
+        try:
+            while not self.stop.is_set():
+                apk = self._next_apk()
+                if apk is None:
+                    break
+                self._download(*apk)
+
+        # Errors are raised in the consumer
+        except BaseException as error:
+            self._put(error)
+        finally:
+            self._put(_DONE)
+
+    def close(self) -> None:
+        """
+        Closes the listing of the provider.
+        """
+        with self._listing_lock:
+            self._listing.close()
+
+    def _next_apk(self) -> Optional[tuple[str, str]]:
+        with self._listing_lock:
+            if len(self.selected) >= self._amount:
+                return None
+            for apk_name, apk_url in self._listing:
+                if apk_name not in self.selected:
+                    self.selected.add(apk_name)
+                    return apk_name, apk_url
+            return None
+
+    def _download(self, apk_name: str, apk_url: str) -> None:
+        apk_path = self._folder_path / apk_name
+        existed = apk_path.exists()
+        self._provider.download_apk(apk_name, apk_url, str(self._folder_path))
+        if apk_path.exists():
+            self._put((str(apk_path), not existed))
+
+    def _put(self, item) -> None:
+        start = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                self.ready.put(item, timeout=_STOP_CHECK_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        waited = time.perf_counter() - start
+        get_metrics().observe(
+            "pyflowdroid_pipeline_wait_seconds", waited, stage="download"
+        )
+
+
+def _iter_ready(ready: queue.Queue, workers: int) -> Iterator[tuple[str, bool]]:
+    """
+    Yields the downloaded apks until all the threads finish, raising their
+    errors.
+    """
+    running = workers
+    while running:
+        start = time.perf_counter()
+        item = ready.get()
+        waited = time.perf_counter() - start
+        get_metrics().observe(
+            "pyflowdroid_pipeline_wait_seconds", waited, stage="analysis"
+        )
+        if item is _DONE:
+            running -= 1
+        elif isinstance(item, BaseException):
+            raise item
+        else:
+            yield item
+
+
+def iter_fetch_and_analyze(
+    amount: int,
+    provider: Union[str, ApkProvider] = DEFAULT_APK_PROVIDER,
+    path: str = DEFAULT_APK_FOLDER_NAME,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    workers: int = 1,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    server: Optional[AnalysisServer] = None,
+    manifest: Optional[RunManifest] = None,
+    log_store: Optional[LogStore] = None,
+    database: Optional[ResultsDatabase] = None,
+    platforms: Optional[PlatformProvider] = None,
+    download_workers: int = 1,
+    buffer_size: int = 0,
+    delete_apks: bool = False,
+    force_redownload: bool = False,
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Downloads apks from a provider and analyzes each one as soon as its
+    download completes, so the network and the CPU are busy at the same time.
+
+    Both stages are bounded: downloads wait while `buffer_size` apks are
+    waiting for a FlowDroid process, and the analysis waits for downloads
+    when it runs ahead of them. With `delete_apks`, the disk only ever holds
+    the apks being downloaded, waiting or being analyzed.
+
+    Parameters
+    ----------
+    amount : int
+        Amount of apks to be downloaded and analyzed.
+    provider : Union[str, ApkProvider], optional
+        Name of the provider the apks are downloaded from, or the provider
+        itself, by default 'cubapk.com'.
+    path : str, optional
+        Path where the apks are downloaded, by default 'apks'.
+    sources_and_sinks : path, optional
+        Sources and sinks file, 'small.txt' (the default) or 'large.txt', or
+        a `SourceSinkSet`, as in `analyze_apk`.
+    save_logs : bool, optional
+        Defines whether or not save raw logs from FlowDroid, by default True
+    workers : int, optional
+        Number of FlowDroid processes running at the same time, by default 1.
+    max_heap : int, optional
+        Total heap (in MB) shared by all the FlowDroid JVMs. If 0, the JVM
+        default is used. By default 0.
+    cache : ResultCache, optional
+        Cache used to skip the analysis of already analyzed apks, by default
+        None.
+    refresh : bool, optional
+        Defines whether or not ignore the cached results, by default False.
+    timeout : int, optional
+        Maximum time (in seconds) FlowDroid can run on each apk. If 0, there
+        is no limit. By default 0.
+    max_rss : int, optional
+        Maximum resident memory (in MB) of each FlowDroid process tree. If 0,
+        there is no limit. By default 0.
+    server : AnalysisServer, optional
+        Running FlowDroid server used to analyze the apks, by default None.
+    manifest : RunManifest, optional
+        Manifest where each result is recorded, by default None.
+    log_store : LogStore, optional
+        Compressed store where the raw logs are saved, by default None.
+    database : ResultsDatabase, optional
+        Database where the results are recorded as a new run, by default
+        None.
+    platforms : PlatformProvider, optional
+        Provider of the Android platform of the API level of each apk,
+        fetched on demand, by default None.
+    download_workers : int, optional
+        Number of apks downloaded at the same time, by default 1.
+    buffer_size : int, optional
+        Maximum number of downloaded apks waiting for a FlowDroid process. If
+        0, `workers` is used. By default 0.
+    delete_apks : bool, optional
+        Defines whether or not delete each apk downloaded by this run once it
+        is analyzed. Apks that were already in `path` are kept. By default
+        False.
+    force_redownload : bool, optional
+        Defines whether or not download again the apks already in `path`,
+        when `provider` is a name, by default False.
+
+    Yields
+    ------
+    tuple[str, ApkResult]
+        Pairs of APK file name and its result of FlowDroid analyzer, in
+        completion order.
+
+    Raises
+    ------
+    ValueError
+        If `sources_and_sinks` is passed and does not point to a existing file
+        or is not one of default values ('small.txt' or 'large.txt').
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is too small to be shared
+        among all the workers.
+    """
+    sources_and_sinks = str(resolve_sources_and_sinks(sources_and_sinks))
+
+    # Options shared by the analysis of every apk
+    options = dict(
+        sources_and_sinks=sources_and_sinks,
+        save_logs=save_logs,
+        max_heap=_heap_per_worker(max_heap, workers),
+        cache=cache,
+        refresh=refresh,
+        timeout=timeout,
+        max_rss=max_rss,
+        server=server,
+        manifest=manifest,
+        log_store=log_store,
+        platforms=platforms,
+    )
+
+    # Remember which apks were downloaded, to delete only those
+    downloaded: set = set()
+    apk_provider = provider
+    if not isinstance(apk_provider, ApkProvider):
+        apk_provider = get_provider(provider, force_redownload)
+    downloads = iter_download(
+        apk_provider, amount, path, download_workers, buffer_size or workers
+    )
+    paths = _new_apks(downloads, downloaded)
+
+    # The pool only takes a new apk from the downloads when it has room
+    if workers == 1:
+        results = ((p, _analyze_and_record(p, **options)) for p in paths)
+    else:
+        results = _iter_pool(paths, workers, **options)
+
+    # The database hashes each apk before it is yielded and can be deleted
+    if database is not None:
+        results = database.record(results, path, sources_and_sinks)
+    if delete_apks:
+        results = _delete_analyzed(results, downloaded)
+
+    try:
+        yield from results
+
+    # Stop the downloads if the results are no longer needed
+    finally:
+        results.close()
+        paths.close()
+
+
+def _new_apks(downloads: Iterator[tuple[str, bool]], downloaded: set) -> Iterator[str]:
+    """
+    Yields the paths of the downloaded apks, adding the ones downloaded by
+    this run to `downloaded`.
+    """
+    for apk_path, is_new in downloads:
+        if is_new:
+            downloaded.add(apk_path)
+        yield apk_path
+
+
+def _delete_analyzed(
+    results: Iterator[tuple[str, ApkResult]], downloaded: set
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Deletes each apk in `downloaded` once its result is recorded.
+    """
+    try:
+        for apk_path, result in results:
+            if apk_path in downloaded:
+                Path(apk_path).unlink(missing_ok=True)
+                downloaded.discard(apk_path)
+            yield apk_path, result
+    finally:
+        results.close()
+
+
+def fetch_and_analyze(
+    amount: int,
+    provider: Union[str, ApkProvider] = DEFAULT_APK_PROVIDER,
+    path: str = DEFAULT_APK_FOLDER_NAME,
+    sources_and_sinks: Union[str, SourceSinkSet] = "",
+    save_logs: bool = True,
+    workers: int = 1,
+    max_heap: int = 0,
+    cache: Optional[ResultCache] = None,
+    refresh: bool = False,
+    timeout: int = 0,
+    max_rss: int = 0,
+    server: Optional[AnalysisServer] = None,
+    manifest: Optional[RunManifest] = None,
+    log_store: Optional[LogStore] = None,
+    database: Optional[ResultsDatabase] = None,
+    platforms: Optional[PlatformProvider] = None,
+    download_workers: int = 1,
+    buffer_size: int = 0,
+    delete_apks: bool = False,
+    force_redownload: bool = False,
+) -> tuple[int, int, list]:
+    """
+    Downloads apks from a provider while analyzing them, and quantifies the
+    leaks.
+
+    Parameters are the ones of `iter_fetch_and_analyze`.
+
+    Returns
+    -------
+    tuple[int, int, list]
+        Total of apks analyzed, total of leaks found and list of leaky apks.
+
+    Raises
+    ------
+    ValueError
+        If `sources_and_sinks` is passed and does not point to a existing file
+        or is not one of default values ('small.txt' or 'large.txt').
+    ValueError
+        If `workers` is lower than 1 or `max_heap` is too small to be shared
+        among all the workers.
+    """
+    results = iter_fetch_and_analyze(
+        amount,
+        provider,
+        path,
+        sources_and_sinks,
+        save_logs,
+        workers,
+        max_heap,
+        cache,
+        refresh,
+        timeout,
+        max_rss,
+        server,
+        manifest,
+        log_store,
+        database,
+        platforms,
+        download_workers,
+        buffer_size,
+        delete_apks,
+        force_redownload,
+    )
+    return quantify_leaks(results)
@@ -0,0 +1,440 @@
+import os
+import re
+import shutil
+import struct
+import logging
+import zipfile
+import threading
+import urllib.error
+import http.client
+from pathlib import Path
+from typing import Iterator
+from pyflowdroid.download import _ConnectionPool
+from pyflowdroid.install import _download_file
+from pyflowdroid.consts import (
+    PYFLOWDROID_PATH,
+    ANDROID_FOLDER_NAME,
+    DEFAULT_DOWNLOAD_FOLDER,
+    DEFAULT_API_LEVEL,
+)
+
+# Chunks of the binary XML format of AndroidManifest.xml
+_XML_TYPE = 0x0003
+_STRING_POOL_TYPE = 0x0001
+_RESOURCE_MAP_TYPE = 0x0180
+_START_ELEMENT_TYPE = 0x0102
+_UTF8_FLAG = 0x100
+
+# Types of the values of the attributes
+_TYPE_STRING = 0x03
+_TYPE_INT_DEC = 0x10
+_TYPE_INT_HEX = 0x11
+
+# SDK versions in the manifest, by attribute name and resource id
+_SDK_ATTRIBUTES = {
+    "minSdkVersion": "min",
+    "targetSdkVersion": "target",
+    "compileSdkVersion": "compile",
+    "platformBuildVersionCode": "compile",
+}
+_SDK_RESOURCE_IDS = {
+    0x0101020C: "min",
+    0x01010270: "target",
+    0x01010572: "compile",
+}
+
+# Platform jar of an API level inside a folder or a zip
+_PLATFORM_JAR_PATTERN = re.compile(r"(?:^|/)android-(\d+)/android\.jar$")
+
+# Folder of `PlatformProvider` with the platforms used instead of missing ones
+_FALLBACK_FOLDER_NAME = "fallback"
+
+# Errors of a platform fetch that may succeed if retried
+_FETCH_ERRORS = (OSError, zipfile.BadZipFile, http.client.HTTPException, ValueError)
+
+
+def _read_string(data: bytes, offset: int, utf8: bool) -> str:
+    """
+    Reads a string of the string pool of a binary XML file.
+    """
+    if utf8:
+        # Length in characters, then in bytes, each in one or two bytes
+        offset += 2 if data[offset] & 0x80 else 1
+        length = data[offset]
+        if length & 0x80:
+            length = ((length & 0x7F) << 8) | data[offset + 1]
+            offset += 1
+        offset += 1
+        return data[offset : offset + length].decode("utf-8", "replace")
+
+    # Length in UTF-16 code units, in one or two 16 bits words
+    (length,) = struct.unpack_from("<H", data, offset)
+    offset += 2
+    if length & 0x8000:
+        (low,) = struct.unpack_from("<H", data, offset)
+        length = ((length & 0x7FFF) << 16) | low
+        offset += 2
+    return data[offset : offset + 2 * length].decode("utf-16-le", "replace")
+
+
+def _chunks(manifest: bytes) -> Iterator[tuple]:
+    """
+    Iterates over the chunks of a binary XML file.
+
+    Yields
+    ------
+    tuple
+        Position, type, header size and size of each chunk.
+    """
+    xml_type, position, _ = struct.unpack_from("<HHI", manifest, 0)
+    if xml_type != _XML_TYPE:
+        raise ValueError("Not a binary XML file")
+    while position + 8 <= len(manifest):
+        chunk_type, header_size, size = struct.unpack_from("<HHI", manifest, position)
+        if size < 8:
+            raise ValueError("Corrupt chunk")
+        yield position, chunk_type, header_size, size
+        position += size
+
+
+def _string_pool(manifest: bytes, position: int, header_size: int) -> list:
+    """
+    Decodes the strings of a string pool chunk, all at once since manifests
+    are small.
+    """
+    count, _, flags, strings_start, _ = struct.unpack_from(
+        "<IIIII", manifest, position + 8
+    )
+    offsets = struct.unpack_from(f"<{count}I", manifest, position + header_size)
+    utf8 = bool(flags & _UTF8_FLAG)
+    base = position + strings_start
+    return [_read_string(manifest, base + offset, utf8) for offset in offsets]
+
+
+def _resource_map(manifest: bytes, position: int, header_size: int, size: int) -> tuple:
+    """
+    Reads the resource ids of the attribute names of a resource map chunk, by
+    string index.
+    """
+    count = (size - header_size) // 4
+    return struct.unpack_from(f"<{count}I", manifest, position + header_size)
+
+
+def _sdk_key(attr_name: int, strings: list, resource_ids: tuple) -> str:
+    """
+    Finds which SDK version an attribute declares, by its resource id or, if
+    it has none, by its name.
+    """
+    resource_id = resource_ids[attr_name] if attr_name < len(resource_ids) else None
+    return _SDK_RESOURCE_IDS.get(resource_id) or _SDK_ATTRIBUTES.get(strings[attr_name])
+
+
+def _read_sdk_attributes(
+    manifest: bytes,
+    position: int,
+    header_size: int,
+    strings: list,
+    resource_ids: tuple,
+    versions: dict,
+) -> None:
+    """
+    Adds to `versions` the SDK versions declared in the attributes of a start
+    element chunk, if it is a <manifest> or <uses-sdk> element.
+    """
+    extension = position + header_size
+    _, name, start, attribute_size, count = struct.unpack_from(
+        "<IIHHH", manifest, extension
+    )
+    if strings[name] not in ("manifest", "uses-sdk"):
+        return
+    for index in range(count):
+        attribute = extension + start + index * attribute_size
+        _, attr_name, raw, _, _, data_type, data = struct.unpack_from(
+            "<IIIHBBI", manifest, attribute
+        )
+        key = _sdk_key(attr_name, strings, resource_ids)
+        if key is None or key in versions:
+            continue
+        if data_type in (_TYPE_INT_DEC, _TYPE_INT_HEX):
+            versions[key] = data
+        elif data_type == _TYPE_STRING and strings[raw].isdigit():
+            versions[key] = int(strings[raw])
+
+
+def parse_sdk_versions(manifest: bytes) -> dict:
+    """
+    Reads the SDK versions declared in a binary AndroidManifest.xml.
+
+    Parameters
+    ----------
+    manifest : bytes
+        Content of the binary AndroidManifest.xml of an apk.
+
+    Returns
+    -------
+    dict
+        The 'min', 'target' and 'compile' SDK versions found in the manifest.
+
+    Raises
+    ------
+    ValueError
+        If `manifest` is not a binary XML file.
+    """
+    try:
+        strings: list = []
+        resource_ids: tuple = ()
+        versions: dict = {}
+        for position, chunk_type, header_size, size in _chunks(manifest):
+            if chunk_type == _STRING_POOL_TYPE:
+                strings = _string_pool(manifest, position, header_size)
+            elif chunk_type == _RESOURCE_MAP_TYPE:
+                resource_ids = _resource_map(manifest, position, header_size, size)
+            elif chunk_type == _START_ELEMENT_TYPE:
+                _read_sdk_attributes(
+                    manifest, position, header_size, strings, resource_ids, versions
+                )
+        return versions
+    except (struct.error, IndexError) as error:
+        raise ValueError(f"Corrupt binary XML file: {error}") from error
+
+
+def api_level(apk_path: str, default: int = DEFAULT_API_LEVEL) -> int:
+    """
+    Finds the API level an apk is analyzed with: its target SDK version, or
+    its compile or minimum SDK version if it declares no target.
+
+    Parameters
+    ----------
+    apk_path : str
+        Path to the apk.
+    default : int, optional
+        API level used if the manifest can not be read or declares no SDK
+        version, by default 17.
+
+    Returns
+    -------
+    int
+        API level of the apk.
+    """
+    try:
+        with zipfile.ZipFile(apk_path) as apk:
+            versions = parse_sdk_versions(apk.read("AndroidManifest.xml"))
+    except (zipfile.BadZipFile, KeyError, ValueError, OSError) as error:
+        logging.warning(f"Can not read the SDK version of '{apk_path}': {error}")
+        return default
+    for key in ("target", "compile", "min"):
+        if versions.get(key):
+            return versions[key]
+    return default
+
+
+class PlatformProvider:
+    """
+    Provides the Android platform jar of each apk on demand.
+
+    Only the platforms of the API levels actually analyzed are kept in
+    `folder`. Missing platforms are copied from `mirror` the first time an
+    apk needs them. If a platform is not available, the closest higher one
+    is used instead, or the closest lower one if there is no higher one: it
+    is linked as the missing platform in a folder under 'fallback', which is
+    passed to FlowDroid instead of `folder`.
+
+    Parameters
+    ----------
+    folder : str, optional
+        Platforms folder passed to FlowDroid, with a 'android-<level>' folder
+        per API level, by default the one installed with pyflowdroid.
+    mirror : str, optional
+        Where missing platforms are taken from: a zip like the Sable one, a
+        folder like `folder`, or the url of such a folder. By default, the zip
+        kept by `install_deps` when only some API levels were installed.
+    """
+
+    def __init__(
+        self,
+        folder: str = Path(PYFLOWDROID_PATH, ANDROID_FOLDER_NAME),
+        mirror: str = "",
+    ):
+        self.folder = Path(folder)
+        self.mirror = mirror or str(
+            Path(DEFAULT_DOWNLOAD_FOLDER, f"{ANDROID_FOLDER_NAME}.zip")
+        )
+        self._lock = threading.Lock()
+        self._missing: set = set()
+        self._pool = _ConnectionPool()
+
+    def levels(self) -> set:
+        """
+        Finds the API levels of the platforms in `folder`.
+
+        Returns
+        -------
+        set
+            Available API levels.
+        """
+        return {
+            int(match.group(1))
+            for match in (
+                _PLATFORM_JAR_PATTERN.search(path.relative_to(self.folder).as_posix())
+                for path in self.folder.glob("android-*/android.jar")
+            )
+            if match
+        }
+
+    def platforms(self, level: int) -> Path:
+        """
+        Makes sure the platform of an API level is in `folder`, fetching it
+        from the mirror if needed.
+
+        Parameters
+        ----------
+        level : int
+            API level.
+
+        Returns
+        -------
+        Path
+            Platforms folder to be passed to FlowDroid.
+
+        Raises
+        ------
+        ValueError
+            If there is no platform at all.
+        """
+        jar_path = self.folder / f"android-{level}" / "android.jar"
+        if jar_path.exists():
+            return self.folder
+
+        # Fetch the platform, remembering only the levels the mirror lacks
+        with self._lock:
+            if not jar_path.exists() and level not in self._missing:
+                try:
+                    if not self._fetch(level, jar_path):
+                        self._missing.add(level)
+                except _FETCH_ERRORS as error:
+                    logging.warning(f"Can not fetch Android API level {level}: {error}")
+            if jar_path.exists():
+                return self.folder
+            return self._fallback(level)
+
+    def _fallback(self, level: int) -> Path:
+        """
+        Builds a platforms folder where the closest available platform to an
+        API level is found as the platform of that level.
+
+        Returns
+        -------
+        Path
+            Folder with only an 'android-<level>' folder, whose jar is a link
+            to the platform used instead.
+
+        Raises
+        ------
+        ValueError
+            If there is no platform at all.
+        """
+        available = self.levels()
+        if not available:
+            raise ValueError(f"No Android platform for API level {level}")
+        higher = [a for a in available if a > level]
+        used = min(higher) if higher else max(available)
+        logging.warning(f"Android API level {level} not available, using {used}")
+
+        # Kept out of `folder`, so the real platform is still fetched later
+        folder = self.folder / _FALLBACK_FOLDER_NAME / str(level)
+        link_path = folder / f"android-{level}" / "android.jar"
+        link_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = link_path.with_name(f"{link_path.name}.{os.getpid()}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        target = self.folder / f"android-{used}" / "android.jar"
+        try:
+            tmp_path.symlink_to(target.resolve())
+        except OSError:
+            shutil.copyfile(target, tmp_path)
+        os.replace(tmp_path, link_path)
+        return folder
+
+    def for_apk(self, apk_path: str) -> Path:
+        """
+        Makes sure the platform of the API level of an apk is in `folder`.
+
+        Parameters
+        ----------
+        apk_path : str
+            Path to the apk.
+
+        Returns
+        -------
+        Path
+            Platforms folder to be passed to FlowDroid.
+        """
+        return self.platforms(api_level(apk_path))
+
+    def _fetch(self, level: int, jar_path: Path) -> bool:
+        """
+        Copies the platform of an API level from the mirror.
+
+        Returns
+        -------
+        bool
+            False if the mirror has no platform for the API level.
+
+        Raises
+        ------
+        OSError
+            If the mirror can not be read, e.g. because of a network error.
+        """
+        name = f"android-{level}/android.jar"
+        jar_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.mirror.startswith(("http://", "https://")):
+            url = f"{self.mirror.rstrip('/')}/{name}"
+            return self._fetch_url(level, url, jar_path)
+
+        # Zip or folder with the platforms
+        tmp_path = jar_path.with_name(f"{jar_path.name}.part")
+        mirror = Path(self.mirror)
+        if zipfile.is_zipfile(mirror):
+            found = _extract_platform(mirror, name, tmp_path)
+        elif (mirror / name).is_file():
+            shutil.copyfile(mirror / name, tmp_path)
+            found = True
+        else:
+            found = False
+        if found:
+            os.replace(tmp_path, jar_path)
+            logging.info(f"Extracted Android API level {level} from '{self.mirror}'")
+        return found
+
+    def _fetch_url(self, level: int, url: str, jar_path: Path) -> bool:
+        """
+        Downloads a platform jar from the url of a folder with the platforms.
+        """
+        try:
+            _download_file(self._pool, url, jar_path)
+        except urllib.error.HTTPError as error:
+            if error.code == 404:
+                return False
+            raise
+        logging.info(f"Fetched Android API level {level} from {url}")
+        return True
+
+
+def _extract_platform(archive: Path, name: str, path: Path) -> bool:
+    """
+    Extracts a platform jar from a zip with the platforms, under any top
+    folder.
+
+    Returns
+    -------
+    bool
+        False if the zip has no such jar.
+    """
+    with zipfile.ZipFile(archive) as zip_file:
+        members = [
+            n for n in zip_file.namelist() if n == name or n.endswith(f"/{name}")
+        ]
+        if not members:
+            return False
+        with zip_file.open(members[0]) as src, open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+    return True
@@ -0,0 +1,316 @@
+import csv
+import json
+import heapq
+from collections import Counter
+from pathlib import Path
+from typing import IO, Iterable, Union
+from pyflowdroid._cli_tools import cli_header
+from pyflowdroid.database import _signature
+from pyflowdroid.results import ApkResult, parse_logs
+from pyflowdroid.consts import DEFAULT_REPORT_TOP
+
+# Formats of the reports
+REPORT_TEXT = "text"
+REPORT_JSON = "json"
+REPORT_CSV = "csv"
+REPORT_SARIF = "sarif"
+REPORT_FORMATS = (REPORT_TEXT, REPORT_JSON, REPORT_CSV, REPORT_SARIF)
+
+# Columns of the CSV reports, shared by the apk, leak and summary rows
+_CSV_COLUMNS = ("kind", "apk", "status", "source", "sink", "method", "count")
+
+# SARIF 2.1.0 schema and the single rule reported
+_SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+_SARIF_RULE = {
+    "id": "PFD001",
+    "name": "DataLeak",
+    "shortDescription": {"text": "Data flows from a source to a sink"},
+    "defaultConfiguration": {"level": "warning"},
+}
+
+
+class ReportWriter:
+    """
+    Writes a report of the results while they are produced.
+
+    Each apk is written as soon as it is added, and only counters are kept
+    in memory: leaks per source, per sink and per source and sink pair, apks
+    per status, and the `top` leakiest apks. The summary with these
+    aggregations is written when the writer is closed.
+
+    Parameters
+    ----------
+    out : IO[str]
+        Open text file, or stdout, the report is written to.
+    report_format : str, optional
+        One of 'text', 'json', 'csv' or 'sarif', by default 'text'.
+    top : int, optional
+        Number of sources, sinks, flows and apks in the rankings of the
+        summary, by default 10.
+
+    Raises
+    ------
+    ValueError
+        If `report_format` is not a known format.
+    """
+
+    def __init__(
+        self,
+        out: IO[str],
+        report_format: str = REPORT_TEXT,
+        top: int = DEFAULT_REPORT_TOP,
+    ):
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format '{report_format}'")
+        self.out = out
+        self.report_format = report_format
+        self.top = top
+        self.total_apps = 0
+        self.total_leaks = 0
+        self.leaky_apps = 0
+        self.statuses: Counter = Counter()
+        self.sources: Counter = Counter()
+        self.sinks: Counter = Counter()
+        self.flows: Counter = Counter()
+        self._top_apps: list = []
+        self._csv = csv.writer(out) if report_format == REPORT_CSV else None
+        self._sarif_results = 0
+        self._closed = False
+        self._write_header()
+
+    def __enter__(self) -> "ReportWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+
+    def add(self, apk: str, result: Union[ApkResult, str]) -> None:
+        """
+        Adds the result of an apk to the report.
+
+        Parameters
+        ----------
+        apk : str
+            Path to the apk.
+        result : ApkResult or str
+            Result of the apk, or the raw output of FlowDroid.
+        """
+        if isinstance(result, str):
+            result = parse_logs(result.splitlines(), apk)
+        leak_count = result.leak_count
+        self.total_apps += 1
+        self.total_leaks += leak_count
+        self.statuses[result.status] += 1
+        for leak in result.leaks:
+            source, sink = _signature(leak.source), _signature(leak.sink)
+            self.sources[source] += 1
+            self.sinks[sink] += 1
+            self.flows[source, sink] += 1
+
+        # Keep only the leakiest apks, in a min-heap of size `top`
+        if leak_count:
+            self.leaky_apps += 1
+            entry = (leak_count, self.total_apps, apk)
+            if len(self._top_apps) < self.top:
+                heapq.heappush(self._top_apps, entry)
+            elif self.top:
+                heapq.heappushpop(self._top_apps, entry)
+
+        self._write_apk(apk, result)
+
+    def summary(self) -> dict:
+        """
+        Aggregations of the results added so far.
+
+        Returns
+        -------
+        dict
+            Totals, apks per status and the rankings of sources, sinks, flows
+            and apks by number of leaks.
+        """
+        top_apps = sorted(self._top_apps, key=lambda e: (-e[0], e[1]))
+        return {
+            "apks": self.total_apps,
+            "leaks": self.total_leaks,
+            "leaky_apks": self.leaky_apps,
+            "statuses": dict(self.statuses),
+            "top_sources": self.sources.most_common(self.top),
+            "top_sinks": self.sinks.most_common(self.top),
+            "top_flows": [
+                [source, sink, count]
+                for (source, sink), count in self.flows.most_common(self.top)
+            ],
+            "top_apks": [[apk, count] for count, _, apk in top_apps],
+        }
+
+    def close(self) -> dict:
+        """
+        Writes the summary and the end of the report. The output file is not
+        closed.
+
+        Returns
+        -------
+        dict
+            Summary of the report.
+        """
+        summary = self.summary()
+        if not self._closed:
+            self._closed = True
+            self._write_footer(summary)
+            self.out.flush()
+        return summary
+
+    def _write_header(self) -> None:
+        if self.report_format == REPORT_TEXT:
+            self.out.write(cli_header("PYFLOWDROID REPORT"))
+            self.out.write("Leaky apks:\n")
+        elif self.report_format == REPORT_JSON:
+            self.out.write('{"results": [')
+        elif self.report_format == REPORT_CSV:
+            self._csv.writerow(_CSV_COLUMNS)
+        else:
+            self.out.write(
+                f'{{"$schema": "{_SARIF_SCHEMA}", "version": "2.1.0", '
+                '"runs": [{"results": ['
+            )
+
+    def _write_apk(self, apk: str, result: ApkResult) -> None:
+        if self.report_format == REPORT_TEXT:
+            if result.leak_count:
+                self.out.write(f" - {apk} ({result.leak_count} leaks)\n")
+
+        elif self.report_format == REPORT_JSON:
+            entry = {
+                "apk": apk,
+                "status": result.status,
+                "leak_count": result.leak_count,
+                "leaks": [
+                    {"source": leak.source, "sink": leak.sink, "method": leak.method}
+                    for leak in result.leaks
+                ],
+            }
+            separator = ", " if self.total_apps > 1 else ""
+            self.out.write(separator + json.dumps(entry))
+
+        elif self.report_format == REPORT_CSV:
+            status = result.status
+            self._csv.writerow(("apk", apk, status, "", "", "", result.leak_count))
+            self._csv.writerows(
+                ("leak", apk, status, leak.source, leak.sink, leak.method, 1)
+                for leak in result.leaks
+            )
+
+        else:
+            uri = Path(apk).as_posix()
+            for leak in result.leaks:
+                entry = {
+                    "ruleId": _SARIF_RULE["id"],
+                    "level": "warning",
+                    "message": {
+                        "text": f"Data from {_signature(leak.source)} "
+                        f"leaks to {_signature(leak.sink)}"
+                    },
+                    "locations": [
+                        {
+                            "physicalLocation": {"artifactLocation": {"uri": uri}},
+                            "logicalLocations": [
+                                {"fullyQualifiedName": leak.method.strip("<>")}
+                            ],
+                        }
+                    ],
+                    "properties": {"source": leak.source, "sink": leak.sink},
+                }
+                if leak.path:
+                    steps = [{"location": {"message": {"text": s}}} for s in leak.path]
+                    entry["codeFlows"] = [{"threadFlows": [{"locations": steps}]}]
+                separator = ", " if self._sarif_results else ""
+                self._sarif_results += 1
+                self.out.write(separator + json.dumps(entry))
+
+    def _write_footer(self, summary: dict) -> None:
+        if self.report_format == REPORT_TEXT:
+            if not summary["leaky_apks"]:
+                self.out.write(" (none)\n")
+            self.out.write(f"\nAnalized: {summary['apks']}\n")
+            self.out.write(f"Leaks found: {summary['leaks']}\n")
+            statuses = ", ".join(f"{s}: {n}" for s, n in summary["statuses"].items())
+            self.out.write(f"Status: {statuses or '-'}\n")
+            sections = (
+                ("Top sources", summary["top_sources"]),
+                ("Top sinks", summary["top_sinks"]),
+                ("Top flows", [[f"{s} -> {k}", n] for s, k, n in summary["top_flows"]]),
+                ("Top leaky apks", summary["top_apks"]),
+            )
+            for title, ranking in sections:
+                if ranking:
+                    lines = "".join(f"{n:>8}  {name}\n" for name, n in ranking)
+                    self.out.write(f"\n{title}:\n{lines}")
+
+        elif self.report_format == REPORT_JSON:
+            self.out.write(f'], "summary": {json.dumps(summary)}}}\n')
+
+        elif self.report_format == REPORT_CSV:
+            rows = [("total", "", "", "", "", "", summary["apks"])]
+            rows += [
+                ("status", "", s, "", "", "", n) for s, n in summary["statuses"].items()
+            ]
+            rows += [
+                ("source", "", "", s, "", "", n) for s, n in summary["top_sources"]
+            ]
+            rows += [("sink", "", "", "", k, "", n) for k, n in summary["top_sinks"]]
+            rows += [("flow", "", "", s, k, "", n) for s, k, n in summary["top_flows"]]
+            rows += [("top_apk", a, "", "", "", "", n) for a, n in summary["top_apks"]]
+            self._csv.writerows(rows)
+
+        else:
+            from pyflowdroid import __version__
+
+            driver = {
+                "name": "pyflowdroid",
+                "version": __version__,
+                "informationUri": "https://github.com/gvieralopez/pyFlowDroid",
+                "rules": [_SARIF_RULE],
+            }
+            self.out.write(
+                f'], "tool": {{"driver": {json.dumps(driver)}}}, '
+                f'"properties": {json.dumps(summary)}}}]}}\n'
+            )
+
+
+def write_report(
+    results: Iterable[tuple],
+    out: IO[str],
+    report_format: str = REPORT_TEXT,
+    top: int = DEFAULT_REPORT_TOP,
+) -> dict:
+    """
+    Writes a report of a stream of results, in a single pass over them.
+
+    Parameters
+    ----------
+    results : Iterable[tuple]
+        Pairs of apk path and its `ApkResult` (or raw FlowDroid output), like
+        the ones yielded by `iter_analyze`.
+    out : IO[str]
+        Open text file, or stdout, the report is written to.
+    report_format : str, optional
+        One of 'text', 'json', 'csv' or 'sarif', by default 'text'.
+    top : int, optional
+        Number of sources, sinks, flows and apks in the rankings of the
+        summary, by default 10.
+
+    Returns
+    -------
+    dict
+        Summary of the report.
+
+    Raises
+    ------
+    ValueError
+        If `report_format` is not a known format.
+    """
+    with ReportWriter(out, report_format, top) as writer:
+        for apk, result in results:
+            writer.add(apk, result)
+    return writer.close()
@@ -0,0 +1,301 @@
+import re
+from typing import Iterable, Optional
+
+# Status of the analysis of an apk
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+STATUS_OUT_OF_MEMORY = "out_of_memory"
+STATUS_SKIPPED = "skipped"
+STATUS_INVALID = "invalid"
+
+# Prefix added by the FlowDroid logger, e.g. "[main] INFO soot.Class - "
+_PREFIX_PATTERN = re.compile(r"^\[[^\]]*\] [A-Z]+ +\S+ - ")
+
+# Messages of FlowDroid relevant for the results
+_SINK_PATTERN = re.compile(
+    r"^The sink (.+) in method (<.+>) was called with values from the following"
+)
+_SOURCE_PATTERN = re.compile(r"^- (.+) in method (<.+>)$")
+_PATH_PATTERN = re.compile(r"^\s*-> (.+)$")
+_LEAKS_PATTERN = re.compile(r"^Found (\d+) leaks|^(No results found)")
+_CALL_GRAPH_PATTERN = re.compile(r"^Callgraph has (\d+) edges")
+_CALLBACKS_PATTERN = re.compile(r"^Found (\d+) callback methods")
+_TIMING_PATTERNS = {
+    "call_graph": re.compile(r"^Callgraph construction took (\d+) seconds"),
+    "callbacks": re.compile(r"building a callgraph took (\d+) seconds"),
+    "taint_propagation": re.compile(r"^IFDS problem .* solved in (\d+) seconds"),
+    "path_reconstruction": re.compile(r"^Path reconstruction took (\d+) seconds"),
+    "data_flow": re.compile(r"^Data flow solver took (\d+) seconds"),
+}
+_TIMEOUT_PATTERN = re.compile(r"[Tt]imeout reached|[Tt]imed out")
+_OUT_OF_MEMORY_PATTERN = re.compile(r"java\.lang\.OutOfMemoryError")
+_EXCEPTION_PATTERN = re.compile(r"^Exception in thread")
+
+
+class Leak:
+    """
+    Flow of data from a source to a sink found by FlowDroid.
+
+    Parameters
+    ----------
+    source : str
+        Statement where the data is obtained.
+    sink : str
+        Statement where the data is leaked.
+    path : list, optional
+        Statements the data goes through from the source to the sink, if
+        FlowDroid reported them.
+    method : str, optional
+        Method containing the sink.
+    """
+
+    __slots__ = ("source", "sink", "path", "method")
+
+    def __init__(
+        self, source: str, sink: str, path: Optional[list] = None, method: str = ""
+    ):
+        self.source = source
+        self.sink = sink
+        self.path = path if path is not None else []
+        self.method = method
+
+    def __repr__(self) -> str:
+        return f"Leak(source={self.source!r}, sink={self.sink!r})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Leak) and self.to_dict() == other.to_dict()
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Leak":
+        return cls(**data)
+
+
+class ApkResult:
+    """
+    Structured result of the analysis of an apk.
+
+    Parameters
+    ----------
+    apk : str
+        Path to the analyzed apk.
+    status : str, optional
+        One of 'ok', 'failed', 'timeout', 'out_of_memory', 'skipped' (no
+        leak is possible, so FlowDroid was not executed) or 'invalid' (the apk
+        is corrupt), by default 'ok'.
+    leaks : list, optional
+        Leaks found by FlowDroid.
+    reported_leaks : int, optional
+        Number of leaks reported by FlowDroid, or None if it was not reported.
+    call_graph_edges : int, optional
+        Size of the call graph, or None if it was not reported.
+    callback_iterations : int, optional
+        Number of iterations of the callback analysis.
+    timings : dict, optional
+        Duration (in seconds) of each phase of the analysis.
+    returncode : int, optional
+        Exit code of FlowDroid, or None if it was not executed.
+    log_path : str, optional
+        Path to the raw FlowDroid logs, if they were saved.
+    """
+
+    __slots__ = (
+        "apk",
+        "status",
+        "leaks",
+        "reported_leaks",
+        "call_graph_edges",
+        "callback_iterations",
+        "timings",
+        "returncode",
+        "log_path",
+    )
+
+    def __init__(
+        self,
+        apk: str,
+        status: str = STATUS_OK,
+        leaks: Optional[list] = None,
+        reported_leaks: Optional[int] = None,
+        call_graph_edges: Optional[int] = None,
+        callback_iterations: int = 0,
+        timings: Optional[dict] = None,
+        returncode: Optional[int] = None,
+        log_path: Optional[str] = None,
+    ):
+        self.apk = apk
+        self.status = status
+        self.leaks = leaks if leaks is not None else []
+        self.reported_leaks = reported_leaks
+        self.call_graph_edges = call_graph_edges
+        self.callback_iterations = callback_iterations
+        self.timings = timings if timings is not None else {}
+        self.returncode = returncode
+        self.log_path = log_path
+
+    def __repr__(self) -> str:
+        return (
+            f"ApkResult(apk={self.apk!r}, status={self.status!r}, "
+            f"leak_count={self.leak_count})"
+        )
+
+    @property
+    def leak_count(self) -> int:
+        """
+        Number of leaks found by FlowDroid.
+        """
+        if self.reported_leaks is not None:
+            return self.reported_leaks
+        return len(self.leaks)
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["leaks"] = [leak.to_dict() for leak in self.leaks]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ApkResult":
+        data = dict(data)
+        data["leaks"] = [Leak.from_dict(leak) for leak in data.get("leaks", [])]
+        return cls(**data)
+
+
+class LogParser:
+    """
+    Single pass parser of the FlowDroid output.
+
+    Lines are fed one by one with `feed`, as FlowDroid prints them, so the
+    full output never needs to be in memory.
+
+    Parameters
+    ----------
+    apk : str, optional
+        Path to the analyzed apk, by default ''.
+    """
+
+    def __init__(self, apk: str = ""):
+        self.result = ApkResult(apk)
+        self._sink: Optional[tuple] = None
+        self._leak: Optional[Leak] = None
+
+    def feed(self, line: str) -> None:
+        """
+        Parses a line of the FlowDroid output.
+
+        Parameters
+        ----------
+        line : str
+            Line of the FlowDroid output.
+        """
+
+        # Remove the logger prefix if there is any
+        prefix = _PREFIX_PATTERN.match(line)
+        message = line[prefix.end() :] if prefix else line.strip()
+
+        # Try the leak related messages first since they are the most frequent
+        if self._parse_leaks(message):
+            return
+
+        result = self.result
+        match = _LEAKS_PATTERN.match(message)
+        if match:
+            result.reported_leaks = int(match.group(1) or 0)
+            return
+
+        match = _CALL_GRAPH_PATTERN.match(message)
+        if match:
+            result.call_graph_edges = int(match.group(1))
+            return
+
+        if _CALLBACKS_PATTERN.match(message):
+            result.callback_iterations += 1
+        elif not self._parse_status(message):
+            self._parse_timings(message)
+
+    def finish(self, returncode: int, log_path: Optional[str] = None) -> ApkResult:
+        """
+        Completes the result once FlowDroid has finished.
+
+        Parameters
+        ----------
+        returncode : int
+            Exit code of FlowDroid.
+        log_path : str, optional
+            Path to the raw FlowDroid logs, if they were saved.
+
+        Returns
+        -------
+        ApkResult
+            Structured result of the analysis.
+        """
+        self.result.returncode = returncode
+        self.result.log_path = log_path
+        if returncode != 0 and self.result.status == STATUS_OK:
+            self.result.status = STATUS_FAILED
+        return self.result
+
+    def _parse_leaks(self, message: str) -> bool:
+        match = _PATH_PATTERN.match(message)
+        if match and self._leak is not None:
+            self._leak.path.append(match.group(1))
+            return True
+
+        match = _SOURCE_PATTERN.match(message)
+        if match and self._sink is not None:
+            sink, method = self._sink
+            self._leak = Leak(match.group(1), sink, method=method)
+            self.result.leaks.append(self._leak)
+            return True
+
+        match = _SINK_PATTERN.match(message)
+        if match:
+            self._sink = match.groups()
+            self._leak = None
+            return True
+
+        return False
+
+    def _parse_status(self, message: str) -> bool:
+        if _OUT_OF_MEMORY_PATTERN.search(message):
+            self.result.status = STATUS_OUT_OF_MEMORY
+        elif _TIMEOUT_PATTERN.search(message):
+            self.result.status = STATUS_TIMEOUT
+        elif _EXCEPTION_PATTERN.match(message):
+            if self.result.status == STATUS_OK:
+                self.result.status = STATUS_FAILED
+        else:
+            return False
+        return True
+
+    def _parse_timings(self, message: str) -> None:
+        for phase, pattern in _TIMING_PATTERNS.items():
+            match = pattern.search(message)
+            if match:
+                self.result.timings[phase] = int(match.group(1))
+                return
+
+
+def parse_logs(lines: Iterable[str], apk: str = "") -> ApkResult:
+    """
+    Parses the output of FlowDroid.
+
+    Parameters
+    ----------
+    lines : Iterable[str]
+        Lines of the FlowDroid output. A file object can be passed to parse a
+        log file without loading it in memory.
+    apk : str, optional
+        Path to the analyzed apk, by default ''.
+
+    Returns
+    -------
+    ApkResult
+        Structured result of the analysis.
+    """
+    parser = LogParser(apk)
+    for line in lines:
+        parser.feed(line.rstrip("\n"))
+    return parser.result
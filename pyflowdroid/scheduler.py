@@ -0,0 +1,268 @@
+import os
+import json
+import struct
+import logging
+import zipfile
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+from pyflowdroid._cli_tools import _hash_file_once
+from pyflowdroid.triage import _DEX_NAME_PATTERN, _DEX_MAGIC, _METHOD_IDS_OFFSET
+from pyflowdroid.consts import (
+    DEFAULT_COST_HISTORY,
+    DEFAULT_SECONDS_PER_METHOD,
+    DEFAULT_SECONDS_PER_MB,
+)
+
+# Weight of a new runtime in the runtime remembered for an apk
+_HISTORY_WEIGHT = 0.5
+
+
+class ApkCost:
+    """
+    Features of an apk used to predict the cost of its analysis.
+
+    Parameters
+    ----------
+    apk : str
+        Path to the apk.
+    apk_hash : str
+        SHA-256 hash of the apk.
+    size : int
+        Size (in bytes) of the apk.
+    dex_count : int
+        Number of dex files in the apk.
+    methods : int
+        Number of methods referenced by the dex files of the apk.
+    predicted : float, optional
+        Predicted duration (in seconds) of the analysis, by default 0.
+    """
+
+    __slots__ = ("apk", "apk_hash", "size", "dex_count", "methods", "predicted")
+
+    def __init__(
+        self,
+        apk: str,
+        apk_hash: str,
+        size: int,
+        dex_count: int,
+        methods: int,
+        predicted: float = 0,
+    ):
+        self.apk = apk
+        self.apk_hash = apk_hash
+        self.size = size
+        self.dex_count = dex_count
+        self.methods = methods
+        self.predicted = predicted
+
+    def __repr__(self) -> str:
+        return (
+            f"ApkCost(apk={self.apk!r}, methods={self.methods}, "
+            f"predicted={self.predicted:.1f})"
+        )
+
+
+def _count_methods(apk_path: str) -> tuple:
+    """
+    Counts the dex files of an apk and the methods they reference, reading
+    only the header of each dex file.
+    """
+    dex_count = methods = 0
+    try:
+        with zipfile.ZipFile(apk_path) as apk:
+            for name in apk.namelist():
+                if not _DEX_NAME_PATTERN.match(name):
+                    continue
+                with apk.open(name) as dex:
+                    header = dex.read(_METHOD_IDS_OFFSET + 4)
+                if len(header) == _METHOD_IDS_OFFSET + 4 and header.startswith(
+                    _DEX_MAGIC
+                ):
+                    dex_count += 1
+                    methods += struct.unpack_from("<I", header, _METHOD_IDS_OFFSET)[0]
+    except (zipfile.BadZipFile, EOFError, OSError, struct.error):
+        # Invalid apks fail fast, so they are cheap
+        pass
+    return dex_count, methods
+
+
+class CostModel:
+    """
+    Predicts the duration of the analysis of each apk to schedule the
+    longest ones first.
+
+    The duration of an apk analyzed before is the one observed, averaged over
+    its runs. Other apks are predicted from the number of methods of their
+    dex files, or from their size if they have no readable dex files, at the
+    rate observed in the history. Observed durations are saved, so the
+    predictions improve with each run.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to the file with the history of durations, by default
+        '~/.cache/pyflowdroid/scheduler/costs.json'.
+    """
+
+    def __init__(self, path: str = DEFAULT_COST_HISTORY):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.history: dict = {}
+        self._rates: Optional[tuple] = None
+        if self.path.exists():
+            try:
+                self.history = json.loads(self.path.read_text())
+            except (json.JSONDecodeError, OSError):
+                logging.warning(f"Ignoring corrupt cost history '{self.path}'")
+
+    def features(self, apk_path: str) -> ApkCost:
+        """
+        Reads the features of an apk.
+
+        Parameters
+        ----------
+        apk_path : str
+            Path to the apk.
+
+        Returns
+        -------
+        ApkCost
+            Features of the apk, with its predicted duration.
+        """
+        dex_count, methods = _count_methods(apk_path)
+        cost = ApkCost(
+            str(apk_path),
+            _hash_file_once(apk_path),
+            os.path.getsize(apk_path),
+            dex_count,
+            methods,
+        )
+        cost.predicted = self.predict(cost)
+        return cost
+
+    def rates(self) -> tuple:
+        """
+        Average duration per method and per MB of the apks in the history.
+
+        Returns
+        -------
+        tuple
+            Seconds per method and seconds per MB.
+        """
+        with self._lock:
+            if self._rates is not None:
+                return self._rates
+            entries = list(self.history.values())
+        seconds = sum(e["seconds"] for e in entries if e["methods"])
+        methods = sum(e["methods"] for e in entries)
+        per_method = seconds / methods if methods else DEFAULT_SECONDS_PER_METHOD
+        seconds = sum(e["seconds"] for e in entries)
+        megabytes = sum(e["size"] for e in entries) / (1024 * 1024)
+        per_mb = seconds / megabytes if megabytes else DEFAULT_SECONDS_PER_MB
+        self._rates = (per_method, per_mb)
+        return self._rates
+
+    def predict(self, cost: ApkCost) -> float:
+        """
+        Predicts the duration of the analysis of an apk.
+
+        Parameters
+        ----------
+        cost : ApkCost
+            Features of the apk.
+
+        Returns
+        -------
+        float
+            Predicted duration (in seconds).
+        """
+        with self._lock:
+            entry = self.history.get(cost.apk_hash)
+        if entry is not None:
+            return entry["seconds"]
+        per_method, per_mb = self.rates()
+        if cost.methods:
+            return cost.methods * per_method
+        return cost.size / (1024 * 1024) * per_mb
+
+    def order(self, apk_paths: Iterable[str]) -> list:
+        """
+        Sorts apks from the longest to the shortest predicted analysis.
+
+        Parameters
+        ----------
+        apk_paths : Iterable[str]
+            Paths to the apks.
+
+        Returns
+        -------
+        list
+            Features of the apks, longest first.
+        """
+        costs = [self.features(apk_path) for apk_path in apk_paths]
+        return sorted(costs, key=lambda c: c.predicted, reverse=True)
+
+    def record(self, cost: ApkCost, seconds: float) -> None:
+        """
+        Records the observed duration of the analysis of an apk.
+
+        Parameters
+        ----------
+        cost : ApkCost
+            Features of the apk.
+        seconds : float
+            Observed duration (in seconds).
+        """
+        with self._lock:
+            entry = self.history.get(cost.apk_hash)
+            if entry is not None:
+                seconds = (1 - _HISTORY_WEIGHT) * entry["seconds"] + (
+                    _HISTORY_WEIGHT * seconds
+                )
+            self.history[cost.apk_hash] = {
+                "seconds": seconds,
+                "methods": cost.methods,
+                "size": cost.size,
+            }
+            self._rates = None
+
+    def save(self) -> None:
+        """
+        Writes the history of durations to its file.
+        """
+        with self._lock:
+            content = json.dumps(self.history)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(content)
+        os.replace(tmp_path, self.path)
+
+
+def plan_heap(cost: ApkCost, mean: float, max_heap: int, workers: int) -> int:
+    """
+    Assigns to an apk a share of the heap budget proportional to its
+    predicted cost, between half and all of the budget.
+
+    Parameters
+    ----------
+    cost : ApkCost
+        Features of the apk.
+    mean : float
+        Mean predicted duration of the apks of the run.
+    max_heap : int
+        Total heap (in MB) shared by all the FlowDroid JVMs. If 0, the JVM
+        default is used.
+    workers : int
+        Number of FlowDroid processes running at the same time.
+
+    Returns
+    -------
+    int
+        Heap (in MB) of the JVM analyzing the apk, or 0 for the JVM default.
+    """
+    if max_heap <= 0:
+        return 0
+    fair = max_heap / workers
+    weight = cost.predicted / mean if mean > 0 else 1
+    return int(min(max_heap, max(fair / 2, fair * weight)))
@@ -0,0 +1,256 @@
+import re
+import struct
+import logging
+import zipfile
+import threading
+from typing import Iterable
+from pyflowdroid._cli_tools import _hash_file_once
+from pyflowdroid.definitions import SourceSinkSet
+from pyflowdroid.metrics import get_metrics
+
+# What to do with the apks that cannot leak anything
+TRIAGE_SKIP = "skip"
+TRIAGE_DEFER = "defer"
+
+# Verdicts of the triage of an apk
+VERDICT_ANALYZE = "analyze"
+VERDICT_INVALID = "invalid"
+VERDICT_DUPLICATE = "duplicate"
+VERDICT_NO_SINKS = "no_sinks"
+
+# Dex files inside an apk: classes.dex, classes2.dex, ...
+_DEX_NAME_PATTERN = re.compile(r"^classes\d*\.dex$")
+
+# Name of the method of a signature, e.g. "<a.B: void c(int)>" -> "c"
+_METHOD_NAME_PATTERN = re.compile(r" ([\w$<>]+)\(")
+
+# Offsets in the header of a dex file
+_DEX_MAGIC = b"dex\n"
+_DEX_HEADER_SIZE = 0x70
+_STRING_IDS_OFFSET = 0x38
+_METHOD_IDS_OFFSET = 0x58
+
+
+class TriageResult:
+    """
+    Verdict of the triage of an apk.
+
+    Parameters
+    ----------
+    apk : str
+        Path to the apk.
+    verdict : str
+        One of 'analyze', 'invalid', 'duplicate' or 'no_sinks'.
+    apk_hash : str, optional
+        SHA-256 hash of the apk, by default ''.
+    reason : str, optional
+        Explanation of the verdict, by default ''.
+    original : str, optional
+        Path to the apk with the same content, for duplicates, by default ''.
+    """
+
+    __slots__ = ("apk", "verdict", "apk_hash", "reason", "original")
+
+    def __init__(
+        self,
+        apk: str,
+        verdict: str,
+        apk_hash: str = "",
+        reason: str = "",
+        original: str = "",
+    ):
+        self.apk = apk
+        self.verdict = verdict
+        self.apk_hash = apk_hash
+        self.reason = reason
+        self.original = original
+
+    def __repr__(self) -> str:
+        return f"TriageResult(apk={self.apk!r}, verdict={self.verdict!r})"
+
+
+def _read_uleb128(data: bytes, offset: int) -> tuple:
+    """
+    Reads an unsigned LEB128 number, returning it and the offset after it.
+    """
+    result = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def dex_method_names(dex: bytes) -> set:
+    """
+    Reads the names of all the methods referenced by a dex file, either
+    defined in it or called from it.
+
+    Parameters
+    ----------
+    dex : bytes
+        Content of the dex file.
+
+    Returns
+    -------
+    set
+        Names of the methods, e.g. 'sendTextMessage'.
+
+    Raises
+    ------
+    ValueError
+        If `dex` is not a valid dex file.
+    """
+    if len(dex) < _DEX_HEADER_SIZE or not dex.startswith(_DEX_MAGIC):
+        raise ValueError("Not a dex file")
+
+    try:
+        string_ids_size, string_ids_off = struct.unpack_from(
+            "<II", dex, _STRING_IDS_OFFSET
+        )
+        method_ids_size, method_ids_off = struct.unpack_from(
+            "<II", dex, _METHOD_IDS_OFFSET
+        )
+        if method_ids_off + 8 * method_ids_size > len(dex):
+            raise ValueError("Method table out of the dex file")
+
+        # Each method id is (class_idx: u16, proto_idx: u16, name_idx: u32)
+        name_indexes = {
+            name_idx
+            for _, _, name_idx in struct.iter_unpack(
+                "<HHI", dex[method_ids_off : method_ids_off + 8 * method_ids_size]
+            )
+        }
+
+        # Each string id is the offset of its uleb128 length and MUTF-8 bytes
+        names = set()
+        for index in name_indexes:
+            if index >= string_ids_size:
+                raise ValueError("Method name out of the string table")
+            (data_off,) = struct.unpack_from("<I", dex, string_ids_off + 4 * index)
+            _, start = _read_uleb128(dex, data_off)
+            end = dex.index(b"\0", start)
+            names.add(dex[start:end].decode("utf-8", "replace"))
+        return names
+    except (struct.error, IndexError) as error:
+        raise ValueError(f"Corrupt dex file: {error}") from error
+
+
+def apk_method_names(apk_path: str) -> set:
+    """
+    Reads the names of all the methods referenced by the dex files of an apk.
+
+    Parameters
+    ----------
+    apk_path : str
+        Path to the apk.
+
+    Returns
+    -------
+    set
+        Names of the methods.
+
+    Raises
+    ------
+    ValueError
+        If the apk is not a valid zip file or it has no valid dex files.
+    """
+    try:
+        with zipfile.ZipFile(apk_path) as apk:
+            dex_names = [n for n in apk.namelist() if _DEX_NAME_PATTERN.match(n)]
+            if not dex_names:
+                raise ValueError("No dex files")
+
+            # Reading a member checks its CRC, so corrupt dex files are found
+            names: set = set()
+            for dex_name in dex_names:
+                names |= dex_method_names(apk.read(dex_name))
+            return names
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError, OSError) as error:
+        raise ValueError(f"Invalid apk: {error}") from error
+
+
+class Triage:
+    """
+    Cheap checks done on the apks before launching FlowDroid on them.
+
+    The triage finds the apks that are not valid zip files with dex files,
+    the apks with the same content as an apk already seen, and the apks that
+    cannot leak anything because no method they reference has the name of a
+    sink. Only method names are compared, since the class of a call may be a
+    subclass of the one in the sink definition, so no apk that could leak is
+    discarded. Sources are not checked, since FlowDroid also finds sources in
+    callbacks and layouts.
+
+    Parameters
+    ----------
+    sources_and_sinks : SourceSinkSet
+        Sources and sinks used in the analysis.
+    """
+
+    def __init__(self, sources_and_sinks: SourceSinkSet):
+        self.sink_names = frozenset(
+            match.group(1)
+            for match in map(_METHOD_NAME_PATTERN.search, sources_and_sinks.sinks)
+            if match
+        )
+        self._seen: dict = {}
+        self._lock = threading.Lock()
+
+    def check(self, apk_path: str) -> TriageResult:
+        """
+        Triages an apk.
+
+        Parameters
+        ----------
+        apk_path : str
+            Path to the apk.
+
+        Returns
+        -------
+        TriageResult
+            Verdict of the apk.
+        """
+        apk_path = str(apk_path)
+        result = self._check(apk_path)
+        get_metrics().increment("pyflowdroid_triage_total", verdict=result.verdict)
+        if result.verdict != VERDICT_ANALYZE:
+            logging.info(f"Triage of '{apk_path}': {result.verdict} ({result.reason})")
+        return result
+
+    def _check(self, apk_path: str) -> TriageResult:
+        apk_hash = _hash_file_once(apk_path)
+        with self._lock:
+            original = self._seen.setdefault(apk_hash, apk_path)
+        if original != apk_path:
+            return TriageResult(
+                apk_path, VERDICT_DUPLICATE, apk_hash, f"same as '{original}'", original
+            )
+
+        try:
+            names = apk_method_names(apk_path)
+        except ValueError as error:
+            return TriageResult(apk_path, VERDICT_INVALID, apk_hash, str(error))
+
+        if names.isdisjoint(self.sink_names):
+            reason = "no method named like a sink"
+            return TriageResult(apk_path, VERDICT_NO_SINKS, apk_hash, reason)
+        return TriageResult(apk_path, VERDICT_ANALYZE, apk_hash)
+
+    def check_all(self, apk_paths: Iterable[str]) -> list:
+        """
+        Triages several apks.
+
+        Parameters
+        ----------
+        apk_paths : Iterable[str]
+            Paths to the apks.
+
+        Returns
+        -------
+        list
+            Verdicts of the apks.
+        """
+        return [self.check(apk_path) for apk_path in apk_paths]
@@ -0,0 +1,613 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import sqlite3
+import threading
+import contextlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pyflowdroid.results import ApkResult, STATUS_FAILED
+from pyflowdroid.metrics import get_metrics
+from pyflowdroid.consts import (
+    DEFAULT_DEFINITIONS_FOLDER,
+    DEFAULT_LEASE_TIME,
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_QUEUE_POLL_INTERVAL,
+)
+
+# Status of the jobs of a `JobQueue`
+JOB_PENDING = "pending"
+JOB_LEASED = "leased"
+JOB_DONE = "done"
+
+# Jobs submitted in each transaction
+_SUBMIT_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    apk TEXT UNIQUE,
+    options TEXT,
+    status TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    finished INTEGER
+);
+CREATE TABLE IF NOT EXISTS definitions (
+    digest TEXT PRIMARY KEY,
+    content TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_expires);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished);
+"""
+
+
+def _worker_name() -> str:
+    """
+    Default name of a worker, unique among the workers of all the hosts.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+
+
+class JobQueue:
+    """
+    Queue of apk analysis jobs shared by a coordinator and its workers.
+
+    The queue is a SQLite file, so it only needs a folder shared by all the
+    hosts, e.g. a network filesystem with working locks. The coordinator
+    submits the apks, and workers lease jobs, analyze them and push their
+    results back. Leases expire unless workers renew them with heartbeats, so
+    jobs of dead workers are leased again, as are jobs whose analysis failed.
+    A job is given up after `max_attempts` leases.
+
+    Parameters
+    ----------
+    path : str
+        Path to the queue file. It is created if it does not exist.
+    lease_time : int, optional
+        Time (in seconds) a job is leased to a worker without a heartbeat, by
+        default 60.
+    max_attempts : int, optional
+        Number of times a job is leased before it is given up, by default 3.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_time: int = DEFAULT_LEASE_TIME,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the connection to the queue.
+        """
+        with self._lock:
+            self._connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Runs statements in a transaction that locks the queue for writing, so
+        no two workers lease the same job.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def submit(
+        self, apk_paths: Iterable[str], sources_and_sinks: str = "", **options
+    ) -> int:
+        """
+        Adds analysis jobs to the queue. Apks already in the queue are
+        analyzed again.
+
+        Parameters
+        ----------
+        apk_paths : Iterable[str]
+            Paths to the apks, which must be readable by all the workers.
+        sources_and_sinks : str, optional
+            Path to the sources and sinks file. Its content is stored in the
+            queue, so workers do not need access to it. By default, no file.
+        **options
+            Extra keyword arguments passed to `analyze_apk` by the workers.
+
+        Returns
+        -------
+        int
+            Number of jobs submitted.
+        """
+        if sources_and_sinks:
+            content = Path(sources_and_sinks).read_text(errors="replace")
+            digest = hashlib.sha256(content.encode()).hexdigest()
+            options["definitions"] = digest
+            with self._transaction() as connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO definitions VALUES (?, ?)", (digest, content)
+                )
+
+        encoded = json.dumps(options)
+        count = 0
+        apk_paths = iter(apk_paths)
+        while True:
+            batch = [str(p) for _, p in zip(range(_SUBMIT_BATCH_SIZE), apk_paths)]
+            if not batch:
+                return count
+            with self._transaction() as connection:
+                connection.executemany(
+                    "INSERT INTO jobs (apk, options, status) VALUES (?, ?, ?) "
+                    "ON CONFLICT(apk) DO UPDATE SET options = excluded.options, "
+                    "status = excluded.status, worker = NULL, lease_expires = NULL, "
+                    "attempts = 0, error = NULL, result = NULL, finished = NULL",
+                    [(apk, encoded, JOB_PENDING) for apk in batch],
+                )
+            count += len(batch)
+
+    def lease(self, worker: str, count: int = 1) -> list:
+        """
+        Leases pending jobs, or jobs whose lease expired, to a worker.
+
+        Parameters
+        ----------
+        worker : str
+            Name of the worker.
+        count : int, optional
+            Maximum number of jobs leased, by default 1.
+
+        Returns
+        -------
+        list
+            Tuples with the id, apk path and options of each leased job.
+        """
+        if count <= 0:
+            return []
+        now = time.time()
+        with self._transaction() as connection:
+            self._give_up_expired(connection, now)
+            rows = connection.execute(
+                "SELECT id, apk, options FROM jobs WHERE status = ? "
+                "OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT ?",
+                (JOB_PENDING, JOB_LEASED, now, count),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [(JOB_LEASED, worker, now + self.lease_time, r[0]) for r in rows],
+            )
+        if rows:
+            get_metrics().increment(
+                "pyflowdroid_queue_jobs_total", len(rows), event="leased"
+            )
+        return [(job_id, apk, json.loads(options)) for job_id, apk, options in rows]
+
+    def heartbeat(self, worker: str, job_ids: Iterable[int]) -> None:
+        """
+        Renews the leases of the jobs a worker is analyzing.
+
+        Parameters
+        ----------
+        worker : str
+            Name of the worker.
+        job_ids : Iterable[int]
+            Ids of the jobs.
+        """
+        expires = time.time() + self.lease_time
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                [(expires, job_id, worker, JOB_LEASED) for job_id in job_ids],
+            )
+
+    def complete(self, job_id: int, worker: str, result: ApkResult) -> bool:
+        """
+        Pushes the result of a job. Failed analyses are leased again until
+        the job reaches `max_attempts`.
+
+        Parameters
+        ----------
+        job_id : int
+            Id of the job.
+        worker : str
+            Name of the worker.
+        result : ApkResult
+            Result of the analysis.
+
+        Returns
+        -------
+        bool
+            False if the job was no longer leased to the worker, e.g. because
+            its lease expired and another worker took it.
+        """
+        if result.status == STATUS_FAILED:
+            return self.fail(job_id, worker, "FlowDroid failed", result)
+        with self._transaction() as connection:
+            if not self._owns(connection, job_id, worker):
+                return False
+            self._finish(connection, job_id, result)
+        get_metrics().increment("pyflowdroid_queue_jobs_total", event="completed")
+        return True
+
+    def fail(
+        self,
+        job_id: int,
+        worker: str,
+        error: str,
+        result: Optional[ApkResult] = None,
+    ) -> bool:
+        """
+        Reports a job that could not be analyzed, so it is leased again, or
+        given up if it reached `max_attempts`.
+
+        Parameters
+        ----------
+        job_id : int
+            Id of the job.
+        worker : str
+            Name of the worker.
+        error : str
+            Reason of the failure.
+        result : ApkResult, optional
+            Result of the failed analysis, kept if the job is given up. By
+            default, a 'failed' result without leaks.
+
+        Returns
+        -------
+        bool
+            False if the job was no longer leased to the worker.
+        """
+        with self._transaction() as connection:
+            if not self._owns(connection, job_id, worker):
+                return False
+            apk, attempts = connection.execute(
+                "SELECT apk, attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if attempts >= self.max_attempts:
+                self._finish(
+                    connection, job_id, result or ApkResult(apk, STATUS_FAILED)
+                )
+                event = "given_up"
+            else:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL "
+                    "WHERE id = ?",
+                    (JOB_PENDING, job_id),
+                )
+                event = "retried"
+            connection.execute(
+                "UPDATE jobs SET error = ? WHERE id = ?", (error, job_id)
+            )
+        logging.warning(f"Job of '{apk}' failed on {worker}: {error} ({event})")
+        get_metrics().increment("pyflowdroid_queue_jobs_total", event=event)
+        return True
+
+    def results(self, after: int = 0, limit: int = _SUBMIT_BATCH_SIZE) -> list:
+        """
+        Reads the results of the finished jobs in the order they finished.
+
+        Parameters
+        ----------
+        after : int, optional
+            Only jobs finished after this position are read, by default 0.
+        limit : int, optional
+            Maximum number of results read, by default 500.
+
+        Returns
+        -------
+        list
+            Tuples with the finishing position, apk path and `ApkResult` of
+            each job.
+        """
+        with self._transaction() as connection:
+            self._give_up_expired(connection, time.time())
+            rows = connection.execute(
+                "SELECT finished, apk, result FROM jobs WHERE finished > ? "
+                "ORDER BY finished LIMIT ?",
+                (after, limit),
+            ).fetchall()
+        return [
+            (finished, apk, ApkResult.from_dict(json.loads(result)))
+            for finished, apk, result in rows
+        ]
+
+    def last_finished(self) -> int:
+        """
+        Position of the last finished job, or 0 if no job is finished.
+        """
+        with self._lock:
+            (position,) = self._connection.execute(
+                "SELECT COALESCE(MAX(finished), 0) FROM jobs"
+            ).fetchone()
+        return position
+
+    def counts(self) -> dict:
+        """
+        Counts the jobs of each status.
+
+        Returns
+        -------
+        dict
+            Pairs of status ('pending', 'leased' or 'done') and number of jobs.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return {JOB_PENDING: 0, JOB_LEASED: 0, JOB_DONE: 0, **dict(rows)}
+
+    def definitions_path(
+        self, digest: str, folder: str = DEFAULT_DEFINITIONS_FOLDER
+    ) -> Path:
+        """
+        Writes the sources and sinks file of some jobs to a local file, unless
+        it was already written.
+
+        Parameters
+        ----------
+        digest : str
+            Hash of the content of the file.
+        folder : str, optional
+            Folder where the file is written, by default
+            '~/.cache/pyflowdroid/sources_sinks'.
+
+        Returns
+        -------
+        Path
+            Path to the local sources and sinks file.
+
+        Raises
+        ------
+        KeyError
+            If the queue has no sources and sinks file with the given hash.
+        """
+        path = Path(folder, f"{digest}.txt")
+        if not path.exists():
+            with self._lock:
+                row = self._connection.execute(
+                    "SELECT content FROM definitions WHERE digest = ?", (digest,)
+                ).fetchone()
+            if row is None:
+                raise KeyError(digest)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(row[0])
+            os.replace(tmp_path, path)
+        return path
+
+    def _owns(self, connection: sqlite3.Connection, job_id: int, worker: str) -> bool:
+        row = connection.execute(
+            "SELECT 1 FROM jobs WHERE id = ? AND worker = ? AND status = ?",
+            (job_id, worker, JOB_LEASED),
+        ).fetchone()
+        return row is not None
+
+    def _finish(
+        self, connection: sqlite3.Connection, job_id: int, result: ApkResult
+    ) -> None:
+        connection.execute(
+            "UPDATE jobs SET status = ?, lease_expires = NULL, result = ?, "
+            "finished = (SELECT COALESCE(MAX(finished), 0) + 1 FROM jobs) "
+            "WHERE id = ?",
+            (JOB_DONE, json.dumps(result.to_dict()), job_id),
+        )
+
+    def _give_up_expired(self, connection: sqlite3.Connection, now: float) -> None:
+        """
+        Gives up the jobs whose last allowed lease expired.
+        """
+        rows = connection.execute(
+            "SELECT id, apk FROM jobs WHERE status = ? AND lease_expires < ? "
+            "AND attempts >= ?",
+            (JOB_LEASED, now, self.max_attempts),
+        ).fetchall()
+        for job_id, apk in rows:
+            logging.warning(f"Giving up the job of '{apk}': its lease expired")
+            connection.execute(
+                "UPDATE jobs SET error = ? WHERE id = ?", ("Lease expired", job_id)
+            )
+            self._finish(connection, job_id, ApkResult(apk, STATUS_FAILED))
+
+
+def iter_queue_results(
+    queue: JobQueue,
+    apk_paths: Iterable[str],
+    sources_and_sinks: str = "",
+    poll_interval: float = DEFAULT_QUEUE_POLL_INTERVAL,
+    **options,
+) -> Iterator[tuple[str, ApkResult]]:
+    """
+    Submits apks to a queue and waits for the workers to analyze them.
+
+    Parameters
+    ----------
+    queue : JobQueue
+        Queue shared with the workers.
+    apk_paths : Iterable[str]
+        Paths to the apks, which must be readable by all the workers.
+    sources_and_sinks : str, optional
+        Path to the sources and sinks file, by default no file.
+    poll_interval : float, optional
+        Time (in seconds) between checks for new results, by default 1.
+    **options
+        Extra keyword arguments passed to `analyze_apk` by the workers.
+
+    Yields
+    ------
+    tuple[str, ApkResult]
+        Pairs of APK file name and its result, in completion order.
+    """
+    position = queue.last_finished()
+    pending: set = set()
+    count = queue.submit(_unique(apk_paths, pending), sources_and_sinks, **options)
+    logging.info(f"Submitted {count} apks to '{queue.path}'")
+    while pending:
+        results = queue.results(position)
+        if not results:
+            time.sleep(poll_interval)
+            continue
+        for position, apk, result in results:
+            if apk in pending:
+                pending.remove(apk)
+                yield apk, result
+
+
+def _unique(apk_paths: Iterable[str], seen: set) -> Iterator[str]:
+    """
+    Lazily skips the repeated apk paths, adding the new ones to `seen`.
+    """
+    for apk in map(str, apk_paths):
+        if apk not in seen:
+            seen.add(apk)
+            yield apk
+
+
+def run_worker(
+    queue: JobQueue,
+    workers: int = 1,
+    name: str = "",
+    keep_waiting: bool = False,
+    poll_interval: float = DEFAULT_QUEUE_POLL_INTERVAL,
+    **options,
+) -> int:
+    """
+    Analyzes the jobs of a queue until there are no jobs left.
+
+    Parameters
+    ----------
+    queue : JobQueue
+        Queue shared with the coordinator.
+    workers : int, optional
+        Number of FlowDroid processes running at the same time, by default 1.
+    name : str, optional
+        Name of the worker, by default one made from the host name and the
+        process id.
+    keep_waiting : bool, optional
+        Defines whether or not wait for new jobs when the queue is empty,
+        instead of returning, by default False.
+    poll_interval : float, optional
+        Time (in seconds) between checks for new jobs, by default 1.
+    **options
+        Extra keyword arguments passed to `analyze_apk`, e.g. `max_heap`,
+        `cache`, `server` or `log_store`.
+
+    Returns
+    -------
+    int
+        Number of jobs analyzed by the worker.
+    """
+    name = name or _worker_name()
+    in_flight: dict = {}
+    stopped = threading.Event()
+    done_jobs = 0
+
+    logging.info(f"Worker {name} waiting for jobs in '{queue.path}'")
+    heartbeat_thread = threading.Thread(
+        target=_renew_leases, args=(queue, name, in_flight, stopped), daemon=True
+    )
+    heartbeat_thread.start()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # Keep all the FlowDroid processes busy
+            for job in queue.lease(name, workers - len(in_flight)):
+                future = executor.submit(_analyze_job, queue, job[1], job[2], options)
+                in_flight[future] = job
+
+            if not in_flight:
+                if not keep_waiting and _is_drained(queue):
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            # Push the results back as soon as they are ready
+            done, _ = wait(in_flight, poll_interval, return_when=FIRST_COMPLETED)
+            done_jobs += _push_results(queue, name, in_flight, done)
+    finally:
+        stopped.set()
+        executor.shutdown(cancel_futures=True)
+        heartbeat_thread.join()
+    logging.info(f"Worker {name} analyzed {done_jobs} apks")
+    return done_jobs
+
+
+def _renew_leases(
+    queue: JobQueue, name: str, in_flight: dict, stopped: threading.Event
+) -> None:
+    """
+    Renews the leases of the jobs a worker is analyzing until it stops.
+    """
+    while not stopped.wait(max(queue.lease_time / 3, 0.1)):
+        queue.heartbeat(name, [job[0] for job in tuple(in_flight.values())])
+
+
+def _analyze_job(
+    queue: JobQueue, apk: str, job_options: dict, options: dict
+) -> ApkResult:
+    """
+    Analyzes the apk of a job with the sources and sinks stored in the queue.
+    """
+    from pyflowdroid.analyze import analyze_apk
+
+    digest = job_options.pop("definitions", None)
+    if digest is not None:
+        job_options["sources_and_sinks"] = str(queue.definitions_path(digest))
+    return analyze_apk(apk, **job_options, **options)
+
+
+def _is_drained(queue: JobQueue) -> bool:
+    """
+    Checks whether a queue has no pending or leased jobs left.
+    """
+    counts = queue.counts()
+    return not counts[JOB_PENDING] + counts[JOB_LEASED]
+
+
+def _push_results(queue: JobQueue, name: str, in_flight: dict, done: set) -> int:
+    """
+    Pushes the results of the finished analyses of a worker to the queue.
+
+    Returns
+    -------
+    int
+        Number of jobs completed, not counting the failed ones.
+    """
+    completed = 0
+    for future in done:
+        job_id, _, _ = in_flight.pop(future)
+        try:
+            result = future.result()
+        except Exception as error:
+            queue.fail(job_id, name, repr(error))
+            continue
+        queue.complete(job_id, name, result)
+        completed += 1
+    return completed
@@ -0,0 +1,48 @@
+import os
+import sys
+from pathlib import Path
+import pytest
+
+BENCHMARKS_PATH = Path(__file__).parent.parent / "benchmarks"
+sys.path.insert(0, str(BENCHMARKS_PATH))
+
+from store_server import StoreServer  # noqa: E402
+
+
+@pytest.fixture
+def fake_java(tmp_path, monkeypatch):
+    """
+    Puts the FlowDroid stand-in of the benchmarks in the PATH as `java`.
+    """
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    java_path = bin_path / "java"
+    script_path = (BENCHMARKS_PATH / "fake_flowdroid.py").resolve()
+    java_path.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script_path}" "$@"\n')
+    java_path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_FLOWDROID_LATENCY", "0.05")
+    monkeypatch.setenv("FAKE_FLOWDROID_LINES", "10")
+    monkeypatch.setenv("FAKE_FLOWDROID_LEAKS", "2")
+    return java_path
+
+
+@pytest.fixture
+def apks(tmp_path):
+    """
+    Folder with some apks, which the FlowDroid stand-in does not read.
+    """
+    folder = tmp_path / "apks"
+    folder.mkdir()
+    for name in ("a", "b", "c", "d", "e"):
+        (folder / f"{name}.apk").write_bytes(name.encode())
+    return folder
+
+
+@pytest.fixture
+def store():
+    """
+    Local apk store with 3 pages of 4 apks of 10 KB each.
+    """
+    with StoreServer(pages=3, apks_per_page=4, apk_size=10_000) as server:
+        yield server
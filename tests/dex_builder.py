@@ -0,0 +1,164 @@
+"""
+Builds small dex files and apks for the tests of the dex readers.
+
+Classes are given as a dictionary of class descriptor, e.g. 'Lcom/ex/Main;',
+and its methods, a dictionary of method name and its code. Every method
+takes no arguments and returns void. The code is a list of instructions:
+
+- ("invoke", class descriptor, method name): invoke-virtual.
+- ("const-string", string): const-string into v0.
+- ("return-void",): return-void.
+"""
+
+import struct
+import zipfile
+
+_OBJECT = "Ljava/lang/Object;"
+_VOID = "V"
+_HEADER_SIZE = 0x70
+_NO_INDEX = 0xFFFFFFFF
+_ACC_PUBLIC = 1
+
+
+def _uleb128(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, value = value & 0x7F, value >> 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def _indexes(items: list) -> dict:
+    return {item: index for index, item in enumerate(items)}
+
+
+class _Tables:
+    """
+    Sorted string, type and method tables of a dex file, as the format
+    requires.
+    """
+
+    def __init__(self, classes: dict):
+        methods = set()
+        strings = {_VOID, _OBJECT, *classes}
+        for descriptor, code_by_method in classes.items():
+            methods.update((descriptor, name) for name in code_by_method)
+            for code in code_by_method.values():
+                methods.update(i[1:] for i in code if i[0] == "invoke")
+                strings.update(i[1] for i in code if i[0] == "const-string")
+        types = {_VOID, _OBJECT, *classes, *(cls for cls, _ in methods)}
+        strings |= types | {name for _, name in methods}
+
+        self.strings = sorted(strings)
+        self.string_idx = _indexes(self.strings)
+        self.types = sorted(types, key=self.string_idx.get)
+        self.type_idx = _indexes(self.types)
+        self.methods = sorted(
+            methods, key=lambda m: (self.type_idx[m[0]], self.string_idx[m[1]])
+        )
+        self.method_idx = _indexes(self.methods)
+
+    def code_units(self, code: list) -> list:
+        units = []
+        for instruction in code:
+            if instruction[0] == "invoke":
+                units += [0x6E, self.method_idx[instruction[1:]], 0]
+            elif instruction[0] == "const-string":
+                units += [0x1A, self.string_idx[instruction[1]]]
+            else:
+                units += [0x0E]
+        return units
+
+
+class _DataSection:
+    """
+    Data section of a dex file, placed after the index tables.
+    """
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        self.data = bytearray()
+
+    def add(self, item: bytes, align: int = 1) -> int:
+        while (self.offset + len(self.data)) % align:
+            self.data.append(0)
+        offset = self.offset + len(self.data)
+        self.data += item
+        return offset
+
+
+def build_dex(classes: dict) -> bytes:
+    """
+    Builds a dex file defining the given classes.
+    """
+    tables = _Tables(classes)
+    sizes = (
+        len(tables.strings),
+        len(tables.types),
+        1,
+        len(tables.methods),
+        len(classes),
+    )
+    offsets = [_HEADER_SIZE]
+    for size, width in zip(sizes, (4, 4, 12, 8, 32)):
+        offsets.append(offsets[-1] + size * width)
+    data = _DataSection(offsets[-1])
+
+    # Strings, then the code of each method and the methods of each class
+    string_offsets = [
+        data.add(_uleb128(len(s)) + s.encode() + b"\0") for s in tables.strings
+    ]
+    code_offsets = {}
+    for descriptor, code_by_method in classes.items():
+        for name, code in code_by_method.items():
+            units = tables.code_units(code)
+            item = struct.pack(f"<4HII{len(units)}H", 1, 0, 0, 0, 0, len(units), *units)
+            code_offsets[tables.method_idx[descriptor, name]] = data.add(item, 4)
+    class_data_offsets = []
+    for descriptor, code_by_method in classes.items():
+        indexes = sorted(tables.method_idx[descriptor, name] for name in code_by_method)
+        item = _uleb128(0) * 3 + _uleb128(len(indexes))
+        for previous, index in zip([0] + indexes, indexes):
+            item += _uleb128(index - previous) + _uleb128(_ACC_PUBLIC)
+            item += _uleb128(code_offsets[index])
+        class_data_offsets.append(data.add(item))
+
+    # Header with the size and offset of each table, then the tables
+    header = bytearray(b"dex\n035\0".ljust(_HEADER_SIZE, b"\0"))
+    for position, size, offset in zip((0x38, 0x40, 0x48, 0x58, 0x60), sizes, offsets):
+        struct.pack_into("<II", header, position, size, offset)
+    string_idx, type_idx = tables.string_idx, tables.type_idx
+    tables_data = b"".join(struct.pack("<I", offset) for offset in string_offsets)
+    tables_data += b"".join(struct.pack("<I", string_idx[t]) for t in tables.types)
+    tables_data += struct.pack("<III", string_idx[_VOID], type_idx[_VOID], 0)
+    tables_data += b"".join(
+        struct.pack("<HHI", type_idx[cls], 0, string_idx[name])
+        for cls, name in tables.methods
+    )
+    tables_data += b"".join(
+        struct.pack(
+            "<8I",
+            type_idx[descriptor],
+            _ACC_PUBLIC,
+            type_idx[_OBJECT],
+            0,
+            _NO_INDEX,
+            0,
+            class_data_offset,
+            0,
+        )
+        for descriptor, class_data_offset in zip(classes, class_data_offsets)
+    )
+    return bytes(header + tables_data + data.data)
+
+
+def write_apk(path, *dex_files: dict, manifest: bytes = b"<manifest/>") -> None:
+    """
+    Writes an apk with a dex file for each dictionary of classes given.
+    """
+    with zipfile.ZipFile(path, "w") as apk:
+        apk.writestr("AndroidManifest.xml", manifest)
+        for number, classes in enumerate(dex_files, 1):
+            name = "classes.dex" if number == 1 else f"classes{number}.dex"
+            apk.writestr(name, build_dex(classes))
@@ -0,0 +1,93 @@
+import os
+import asyncio
+import pytest
+from pyflowdroid.aio import analyze_apk_async, analyze_async, iter_analyze_async
+from pyflowdroid.results import STATUS_OK
+
+
+@pytest.fixture
+def slow_java(fake_java, tmp_path, monkeypatch):
+    """
+    FlowDroid stand-in that takes a minute and records the pid of each run.
+    """
+    pids_path = tmp_path / "pids"
+    script = fake_java.read_text().replace("exec", f'echo $$ >> "{pids_path}"\nexec')
+    fake_java.write_text(script)
+    monkeypatch.setenv("FAKE_FLOWDROID_LATENCY", "60")
+    return pids_path
+
+
+async def _wait_for_pids(pids_path, amount):
+    while not pids_path.exists() or len(pids_path.read_text().split()) < amount:
+        await asyncio.sleep(0.05)
+    # Give the processes some time to start printing their output
+    await asyncio.sleep(0.5)
+    return [int(pid) for pid in pids_path.read_text().split()]
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_cancelling_the_analysis_kills_flowdroid(slow_java, apks):
+    async def main():
+        task = asyncio.ensure_future(
+            analyze_apk_async(str(apks / "a.apk"), save_logs=False)
+        )
+        pids = await _wait_for_pids(slow_java, 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pids
+
+    pids = asyncio.run(asyncio.wait_for(main(), 30))
+    assert not any(_is_running(pid) for pid in pids)
+
+
+def test_cancelling_the_iteration_kills_every_flowdroid(slow_java, apks):
+    async def consume():
+        async for _ in iter_analyze_async(str(apks), save_logs=False, workers=2):
+            pass
+
+    async def main():
+        task = asyncio.ensure_future(consume())
+        pids = await _wait_for_pids(slow_java, 2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pids
+
+    pids = asyncio.run(asyncio.wait_for(main(), 30))
+    assert len(pids) == 2
+    assert not any(_is_running(pid) for pid in pids)
+
+
+def test_results_are_yielded_for_every_apk(fake_java, apks):
+    async def main():
+        return [
+            pair
+            async for pair in iter_analyze_async(str(apks), save_logs=False, workers=3)
+        ]
+
+    results = asyncio.run(main())
+    assert sorted(apk for apk, _ in results) == sorted(
+        str(apk) for apk in apks.iterdir()
+    )
+    assert all(result.status == STATUS_OK for _, result in results)
+    assert all(result.leak_count == 2 for _, result in results)
+
+
+def test_analyze_async_quantifies_the_leaks(fake_java, apks):
+    total_apps, total_leaks, leaky_apks = asyncio.run(
+        analyze_async(str(apks), save_logs=False, workers=2)
+    )
+    assert (total_apps, total_leaks, len(leaky_apks)) == (5, 10, 5)
+
+
+def test_workers_must_be_positive(apks):
+    with pytest.raises(ValueError):
+        asyncio.run(analyze_async(str(apks), workers=0))
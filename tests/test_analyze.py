@@ -0,0 +1,124 @@
+import sys
+import subprocess
+from pathlib import Path
+import pytest
+from pyflowdroid.analyze import (
+    AnalysisServer,
+    _heap_per_worker,
+    analyze,
+    analyze_apk,
+    analyze_apk_folder,
+    iter_analyze,
+)
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.manifest import RunManifest
+from pyflowdroid.results import STATUS_FAILED, STATUS_OK, STATUS_TIMEOUT
+
+
+def test_apk_path_with_spaces_is_one_argument(tmp_path, monkeypatch, fake_java):
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "my apks"
+    folder.mkdir()
+    apk = folder / "a b;touch injected.apk"
+    apk.write_bytes(b"a")
+
+    result = analyze_apk(str(apk))
+
+    assert result.status == STATUS_OK
+    assert f"Initializing Soot for {apk}..." in apk.with_suffix(".log").read_text()
+    assert not (tmp_path / "injected").exists()
+
+
+def test_heap_is_split_among_the_workers():
+    assert _heap_per_worker(32000, 8) == 4000
+    assert _heap_per_worker(0, 8) == 0
+
+
+@pytest.mark.parametrize("max_heap, workers", [(1000, 0), (1, 2), (-1, 1)])
+def test_heap_that_cannot_be_split_is_rejected(max_heap, workers):
+    with pytest.raises(ValueError):
+        _heap_per_worker(max_heap, workers)
+
+
+@pytest.mark.parametrize("command", ["analyze", "worker"])
+def test_cli_rejects_zero_jobs(tmp_path, command):
+    process = subprocess.run(
+        [sys.executable, "-m", "pyflowdroid", command, str(tmp_path), "--jobs", "0"],
+        capture_output=True,
+        text=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    assert process.returncode == 2
+    assert "--jobs" in process.stderr
+
+
+def test_folder_is_analyzed_by_a_pool_of_workers(apks, fake_java):
+    results = analyze_apk_folder(str(apks), save_logs=False, workers=3)
+
+    assert list(results) == sorted(str(apk) for apk in apks.iterdir())
+    assert all(result.leak_count == 2 for result in results.values())
+
+
+def test_missing_folder_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        analyze_apk_folder(str(tmp_path / "missing"))
+
+
+def test_cached_results_skip_flowdroid(tmp_path, apks, fake_java):
+    cache = ResultCache(tmp_path / "cache")
+    first = analyze_apk_folder(str(apks), save_logs=False, cache=cache)
+    fake_java.write_text("#!/bin/sh\nexit 1\n")
+
+    second = analyze_apk_folder(str(apks), save_logs=False, cache=cache)
+    refreshed = analyze_apk(str(apks / "a.apk"), cache=cache, refresh=True)
+
+    assert {apk: r.leak_count for apk, r in second.items()} == {
+        apk: r.leak_count for apk, r in first.items()
+    }
+    assert refreshed.status == STATUS_FAILED
+
+
+def test_slow_analyses_time_out(apks, fake_java, monkeypatch):
+    monkeypatch.setenv("FAKE_FLOWDROID_LATENCY", "30")
+
+    result = analyze_apk(str(apks / "a.apk"), save_logs=False, timeout=1)
+
+    assert result.status == STATUS_TIMEOUT
+
+
+def test_server_reuses_its_processes(apks, fake_java):
+    with AnalysisServer(workers=2) as server:
+        results = analyze_apk_folder(
+            str(apks), save_logs=False, workers=2, server=server
+        )
+        processes = list(server._processes)
+
+    assert 0 < len(processes) <= 2
+    assert all(result.leak_count == 2 for result in results.values())
+    assert all(process.poll() is not None for process in processes)
+
+
+def test_results_are_yielded_as_they_finish(apks, fake_java):
+    results = iter_analyze(str(apks), save_logs=False)
+
+    apk, result = next(results)
+    results.close()
+
+    assert apk.endswith(".apk")
+    assert result.leak_count == 2
+    total_apks, total_leaks, leaky_apks = analyze(str(apks), save_logs=False)
+    assert (total_apks, total_leaks) == (5, 10)
+    assert sorted(leaky_apks) == sorted(str(apk) for apk in apks.iterdir())
+
+
+def test_resumed_runs_skip_the_recorded_apks(tmp_path, apks, fake_java):
+    manifest = RunManifest(tmp_path / "manifest.jsonl")
+    analyze_apk_folder(str(apks), save_logs=False, manifest=manifest)
+    fake_java.write_text("#!/bin/sh\nexit 1\n")
+
+    results = analyze_apk_folder(
+        str(apks), save_logs=False, manifest=manifest, resume=True
+    )
+
+    assert len(results) == 5
+    assert all(result.status == STATUS_OK for result in results.values())
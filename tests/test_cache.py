@@ -0,0 +1,48 @@
+import os
+from pyflowdroid.cache import ResultCache
+from pyflowdroid.results import ApkResult, STATUS_OK
+
+
+def test_results_are_cached_by_content(tmp_path, apks):
+    cache = ResultCache(tmp_path / "cache")
+    sns = tmp_path / "sources_and_sinks.txt"
+    sns.write_text("sources")
+    key = cache.key(str(apks / "a.apk"), str(sns))
+
+    assert cache.get(key) is None
+    cache.put(key, ApkResult(str(apks / "a.apk"), STATUS_OK, reported_leaks=3))
+    result = cache.get(key)
+    assert result.apk == str(apks / "a.apk")
+    assert result.leak_count == 3
+
+    # Any change in the apk or the sources and sinks misses the cache
+    assert cache.key(str(apks / "b.apk"), str(sns)) != key
+    sns.write_text("other sources")
+    assert cache.key(str(apks / "a.apk"), str(sns)) != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_size=1)
+    # Two entries fit in the cache, a third one evicts the oldest
+    timings = {"padding": ["x" * 1000] * 400}
+    for number, key in enumerate(["old", "used"]):
+        cache.put(key, ApkResult(f"{key}.apk", timings=timings))
+        os.utime(cache._entry_path(key), (number, number))
+
+    # Reading an entry marks it as recently used
+    assert cache.get("old") is not None
+    cache.put("new", ApkResult("new.apk", timings=timings))
+
+    entries = sorted(path.stem for path in (tmp_path / "cache").glob("*.json"))
+    assert entries == ["new", "old"]
+
+
+def test_clear_removes_all_the_entries(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    cache.put("a", ApkResult("a.apk"))
+    cache.put("b", ApkResult("b.apk"))
+
+    cache.clear()
+
+    assert cache.get("a") is None
+    assert not list((tmp_path / "cache").iterdir())
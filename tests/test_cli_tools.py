@@ -0,0 +1,66 @@
+import sys
+from pyflowdroid import _cli_tools
+from pyflowdroid._cli_tools import (
+    KILLED_BY_TIMEOUT,
+    _hash_file,
+    _hash_file_once,
+    _run_command,
+)
+
+PRINT_ARGS = "import sys\nfor arg in sys.argv[1:]: print(arg)"
+
+
+def test_arguments_are_passed_without_a_shell(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    args = ["my apks/a b.apk", "$(touch injected)", "x; touch injected"]
+    lines = []
+
+    result = _run_command(
+        [sys.executable, "-c", PRINT_ARGS, *args], on_line=lines.append
+    )
+
+    assert result.returncode == 0
+    assert lines == args
+    assert not (tmp_path / "injected").exists()
+
+
+def test_output_is_saved_and_its_tail_kept(tmp_path):
+    log_path = tmp_path / "out.log"
+    script = "for i in range(50): print(i)"
+
+    result = _run_command([sys.executable, "-c", script], str(log_path), tail_size=3)
+
+    assert log_path.read_text().splitlines() == [str(i) for i in range(50)]
+    assert result.tail == ["47", "48", "49"]
+    assert result.log_path == str(log_path)
+    assert result.killed_by is None
+
+
+def test_exit_code_is_returned():
+    result = _run_command([sys.executable, "-c", "raise SystemExit(3)"])
+    assert result.returncode == 3
+
+
+def test_timeout_kills_the_command():
+    script = "import time\nprint('started', flush=True)\ntime.sleep(30)"
+    result = _run_command([sys.executable, "-c", script], timeout=0.5)
+    assert result.killed_by == KILLED_BY_TIMEOUT
+    assert result.returncode != 0
+    assert result.tail == ["started"]
+
+
+def test_files_are_hashed_once_while_unchanged(tmp_path, monkeypatch):
+    path = tmp_path / "a.apk"
+    path.write_bytes(b"a")
+    calls = []
+    monkeypatch.setattr(
+        _cli_tools, "_hash_file", lambda p: calls.append(p) or _hash_file(p)
+    )
+
+    first = _hash_file_once(path)
+    assert _hash_file_once(str(path)) == first
+    assert calls == [str(path)]
+
+    path.write_bytes(b"changed")
+    assert _hash_file_once(path) != first
+    assert len(calls) == 2
@@ -0,0 +1,99 @@
+import pytest
+from pyflowdroid._cli_tools import _hash_file
+from pyflowdroid.database import ResultsDatabase
+from pyflowdroid.results import ApkResult, Leak, STATUS_FAILED, STATUS_OK
+
+DEVICE_ID = "$r3 = virtualinvoke $r2.<android.telephony.TelephonyManager: java.lang.String getDeviceId()>()"
+LOCATION = "$r3 = virtualinvoke $r2.<android.location.Location: double getLatitude()>()"
+SMS = "virtualinvoke $r5.<android.telephony.SmsManager: void sendTextMessage(java.lang.String)>($r3)"
+LOG = "virtualinvoke $r5.<android.util.Log: int i(java.lang.String,java.lang.String)>($r3)"
+METHOD = "<com.ex.Main: void onCreate(android.os.Bundle)>"
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Database with two runs: b.apk and c.apk leak in the first one, a.apk and
+    b.apk in the second one.
+    """
+    sms = Leak(DEVICE_ID, SMS, ["$r4 = $r3"], METHOD)
+    log = Leak(LOCATION, LOG, [], METHOD)
+    with ResultsDatabase(tmp_path / "results.sqlite") as database:
+        first = database.start_run("apks", "small.txt")
+        database.add_results(
+            first,
+            [
+                ("c.apk", ApkResult("c.apk", leaks=[sms, sms], timings={"x": 1})),
+                ("b.apk", ApkResult("b.apk", leaks=[log])),
+                ("d.apk", ApkResult("d.apk", STATUS_FAILED)),
+            ],
+        )
+        database.finish_run(first)
+        second = database.start_run("apks", "small.txt")
+        database.add_results(
+            second,
+            [
+                ("b.apk", ApkResult("b.apk", leaks=[sms])),
+                ("a.apk", ApkResult("a.apk", leaks=[log])),
+            ],
+        )
+        yield database
+
+
+def test_record_hashes_apks_deleted_by_the_consumer(tmp_path, apks):
+    hashes = {str(apk): _hash_file(apk) for apk in apks.glob("*.apk")}
+    results = [(apk, ApkResult(apk, STATUS_OK)) for apk in sorted(hashes)]
+
+    with ResultsDatabase(tmp_path / "results.sqlite", batch_size=2) as database:
+        for apk, _ in database.record(results, str(apks)):
+            (apks / apk).unlink()
+        rows = database.apks()
+
+    assert {row["apk"]: row["hash"] for row in rows} == hashes
+    assert not list(apks.glob("*.apk"))
+
+
+def test_leaky_apks_are_listed_once(database):
+    assert database.leaky_apks() == ["a.apk", "b.apk", "c.apk"]
+    assert database.leaky_apks(sink="android.telephony.SmsManager") == [
+        "b.apk",
+        "c.apk",
+    ]
+    assert database.leaky_apks(source="android.location.*", run_id=2) == ["a.apk"]
+    assert database.leaky_apks(sink="android.telephony.SmsManager", run_id=2) == [
+        "b.apk"
+    ]
+    assert database.leaky_apks(apk_hash="unknown") == []
+
+
+def test_leaks_are_filtered(database):
+    leaks = database.leaks(sink="android.telephony.SmsManager: void send*")
+    assert [leak["apk"] for leak in leaks] == ["c.apk", "c.apk", "b.apk"]
+    assert leaks[0]["path"] == ["$r4 = $r3"]
+    assert len(database.leaks(limit=2)) == 2
+    assert database.leaks(source="android.telephony.SmsManager") == []
+
+
+def test_runs_and_apks_are_listed(database):
+    runs = database.runs()
+    assert [run["id"] for run in runs] == [2, 1]
+    assert (runs[1]["total_apks"], runs[1]["total_leaks"]) == (3, 3)
+    assert runs[0]["finished"] is None
+
+    assert [apk["apk"] for apk in database.apks(run_id=1)] == [
+        "c.apk",
+        "b.apk",
+        "d.apk",
+    ]
+    assert [apk["apk"] for apk in database.apks(status=STATUS_FAILED)] == ["d.apk"]
+
+
+def test_results_are_rebuilt(database):
+    apk_id = database.apks(run_id=1)[0]["id"]
+    result = database.result(apk_id)
+    assert result.apk == "c.apk"
+    assert result.leak_count == 2
+    assert result.leaks[0] == Leak(DEVICE_ID, SMS, ["$r4 = $r3"], METHOD)
+    assert result.timings == {"x": 1}
+    with pytest.raises(KeyError):
+        database.result(100)
@@ -0,0 +1,81 @@
+import pytest
+from pyflowdroid.definitions import (
+    KIND_BOTH,
+    KIND_SINK,
+    KIND_SOURCE,
+    SourceSinkSet,
+    load_sources_and_sinks,
+    resolve_sources_and_sinks,
+)
+
+DEVICE_ID = "<android.telephony.TelephonyManager: java.lang.String getDeviceId()>"
+SMS = "<android.telephony.SmsManager: void sendTextMessage(java.lang.String)>"
+LOG = "<android.util.Log: int i(java.lang.String,java.lang.String)>"
+
+DEFINITIONS = f"""% Comment
+UNIQUE_IDENTIFIER:
+{DEVICE_ID} android.permission.READ_PHONE_STATE -> _SOURCE_
+SMS_MMS:
+{SMS} -> _SINK_
+LOG:
+{LOG} -> _SINK_
+{LOG} -> _SOURCE_
+<not a signature> -> _SINK_
+"""
+
+
+@pytest.fixture
+def definitions(tmp_path):
+    path = tmp_path / "sources_and_sinks.txt"
+    path.write_text(DEFINITIONS)
+    return SourceSinkSet.load(path)
+
+
+def test_definitions_are_validated_and_merged(definitions):
+    assert len(definitions) == 3
+    assert DEVICE_ID in definitions
+    assert definitions.definitions[LOG] == (KIND_BOTH, "LOG", "")
+    assert definitions.sources == [DEVICE_ID, LOG]
+    assert definitions.sinks == [SMS, LOG]
+    assert definitions.categories() == {
+        "LOG": (1, 1),
+        "SMS_MMS": (0, 1),
+        "UNIQUE_IDENTIFIER": (1, 0),
+    }
+
+
+def test_categories_are_selected(definitions):
+    selected = definitions.select(["UNIQUE_IDENTIFIER"], ["LOG"])
+
+    assert selected.definitions == {
+        DEVICE_ID: (
+            KIND_SOURCE,
+            "UNIQUE_IDENTIFIER",
+            "android.permission.READ_PHONE_STATE",
+        ),
+        LOG: (KIND_SINK, "LOG", ""),
+    }
+    assert len(definitions.select(sink_categories=[])) == 2
+    with pytest.raises(ValueError):
+        definitions.select(["CALENDAR"])
+
+
+def test_merged_sets_compile_to_the_same_file(tmp_path, definitions):
+    sources = definitions.select(sink_categories=[])
+    sinks = definitions.select(source_categories=[])
+
+    merged = sources | sinks
+    path = merged.compile(tmp_path / "compiled")
+
+    assert merged.digest == definitions.digest
+    assert path == definitions.compile(tmp_path / "compiled")
+    assert SourceSinkSet.load(path).definitions == definitions.definitions
+
+
+def test_builtin_files_are_loaded_once():
+    small = load_sources_and_sinks("small.txt")
+
+    assert load_sources_and_sinks() is small
+    assert len(small.sources) and len(small.sinks)
+    with pytest.raises(ValueError):
+        resolve_sources_and_sinks("missing.txt")
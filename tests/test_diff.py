@@ -0,0 +1,131 @@
+import pytest
+from dex_builder import build_dex, write_apk
+from pyflowdroid.diff import (
+    MODE_FULL,
+    MODE_REUSED,
+    MODE_RESTRICTED,
+    _split_leaks,
+    analyze_apk_diff,
+    dex_classes,
+    diff_apks,
+)
+from pyflowdroid.results import Leak
+
+SOURCE = "$r3 = virtualinvoke $r2.<android.telephony.TelephonyManager: java.lang.String getDeviceId()>()"
+SINK = "virtualinvoke $r5.<android.util.Log: int i(java.lang.String,java.lang.String)>($r3)"
+SMS_SINK = "virtualinvoke $r1.<android.telephony.SmsManager: void sendTextMessage(java.lang.String)>($r3)"
+
+MAIN = {"Lcom/ex/Main;": {"onCreate": [("const-string", "hi"), ("return-void",)]}}
+UTIL = {"Lcom/ex/Util;": {"log": [("return-void",)]}}
+LOGS = {
+    "Lcom/ex/Util;": {"log": [("invoke", "Landroid/util/Log;", "i"), ("return-void",)]}
+}
+
+
+def _leak(sink, path, method="<com.ex.Main: void onCreate(android.os.Bundle)>"):
+    return Leak(SOURCE, sink, path, method)
+
+
+def test_leaks_through_unchanged_classes_are_kept():
+    leak = _leak(SINK, ["staticinvoke <com.ex.Util: void log(java.lang.String)>($r3)"])
+    assert _split_leaks([leak], {"com.ex.Other"}) == ([leak], set())
+
+
+def test_leaks_through_changed_classes_are_looked_for_again():
+    through = _leak(
+        SINK, ["staticinvoke <com.ex.Util: void log(java.lang.String)>($r3)"]
+    )
+    sink_in = _leak(SMS_SINK, ["$r3 = $r2"], "<com.ex.Util: void send()>")
+    kept, names = _split_leaks([through, sink_in], {"com.ex.Util"})
+    assert kept == []
+    assert names == {"i", "sendTextMessage"}
+
+
+def test_leaks_without_path_are_looked_for_again():
+    assert _split_leaks([_leak(SINK, [])], set()) == ([], {"i"})
+
+
+def test_unknown_sink_needs_a_full_analysis():
+    assert _split_leaks([_leak("$r1 = $r2", [])], set()) is None
+
+
+def test_unchanged_classes_keep_their_fingerprint():
+    old = dex_classes(build_dex({**MAIN, **UTIL}))
+    # New strings renumber the references of the unchanged class
+    new = dex_classes(
+        build_dex({**MAIN, **LOGS, "La/A;": {"a": [("const-string", "a")]}})
+    )
+
+    assert new["com.ex.Main"] == old["com.ex.Main"]
+    assert new["com.ex.Util"][0] != old["com.ex.Util"][0]
+    assert new["com.ex.Util"][1] == {"i"}
+    assert "a.A" in new
+
+
+def test_corrupt_dex_files_are_rejected():
+    with pytest.raises(ValueError):
+        dex_classes(build_dex(MAIN)[:0xB0])
+
+
+def test_diff_finds_the_changed_classes(tmp_path):
+    write_apk(tmp_path / "old.apk", {**MAIN, **UTIL})
+    write_apk(tmp_path / "new.apk", LOGS, {"Lcom/ex/New;": {"run": [("return-void",)]}})
+
+    diff = diff_apks(tmp_path / "old.apk", tmp_path / "new.apk")
+
+    assert diff.added == {"com.ex.New"}
+    assert diff.removed == {"com.ex.Main"}
+    assert diff.modified == {"com.ex.Util"}
+    assert diff.invoked == {"i"}
+    assert not diff.resources_changed
+
+
+def test_diff_ignores_classes_moved_to_other_dex_files(tmp_path):
+    write_apk(tmp_path / "old.apk", {**MAIN, **UTIL})
+    write_apk(tmp_path / "new.apk", MAIN, UTIL, manifest=b"<manifest new/>")
+
+    diff = diff_apks(tmp_path / "old.apk", tmp_path / "new.apk")
+
+    assert not diff.code_changed
+    assert diff.resources_changed
+    assert not diff.is_empty
+
+
+def test_same_code_reuses_the_old_result(tmp_path, fake_java):
+    write_apk(tmp_path / "old.apk", MAIN)
+    write_apk(tmp_path / "new.apk", MAIN)
+
+    diff = analyze_apk_diff(tmp_path / "old.apk", tmp_path / "new.apk", save_logs=False)
+
+    assert diff.mode == MODE_REUSED
+    assert diff.diff.is_empty
+    assert diff.result.apk == str(tmp_path / "new.apk")
+    assert diff.result.leak_count == 2
+    assert diff.new_leaks == diff.resolved_leaks == []
+
+
+def test_changes_without_sinks_keep_the_old_leaks(tmp_path, fake_java):
+    write_apk(tmp_path / "old.apk", {**MAIN, **UTIL})
+    write_apk(tmp_path / "new.apk", {**MAIN, "Lcom/ex/Util;": {"log": []}})
+
+    diff = analyze_apk_diff(tmp_path / "old.apk", tmp_path / "new.apk", save_logs=False)
+
+    assert diff.mode == MODE_RESTRICTED
+    assert diff.diff.modified == {"com.ex.Util"}
+    assert diff.result.leaks == diff.old_result.leaks
+
+
+def test_unrestricted_changes_are_fully_analyzed(tmp_path, fake_java):
+    write_apk(tmp_path / "old.apk", MAIN)
+    write_apk(tmp_path / "new.apk", {**MAIN, **UTIL})
+
+    diff = analyze_apk_diff(
+        tmp_path / "old.apk",
+        tmp_path / "new.apk",
+        save_logs=False,
+        restrict_scope=False,
+    )
+
+    assert diff.mode == MODE_FULL
+    assert diff.diff.added == {"com.ex.Util"}
+    assert diff.result.leak_count == 2
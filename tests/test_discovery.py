@@ -0,0 +1,58 @@
+import os
+from pyflowdroid.discovery import ApkScanner
+from pyflowdroid.results import ApkResult, STATUS_FAILED, STATUS_OK
+
+
+def _scan_and_record(scanner, folder, config, status=STATUS_OK):
+    """
+    Scans a folder and records a result with a leak for each apk found.
+    """
+    reused: list = []
+    found = list(scanner.scan(str(folder), config, reused))
+    results = [(apk, ApkResult(apk, status, reported_leaks=1)) for apk in found]
+    list(scanner.record(results, config))
+    return sorted(found), reused
+
+
+def test_rescan_returns_recorded_results(tmp_path, apks):
+    snapshot = str(tmp_path / "snapshot.json")
+    found, _ = _scan_and_record(ApkScanner(snapshot=snapshot), apks, "config")
+    assert len(found) == 5
+
+    found, reused = _scan_and_record(ApkScanner(snapshot=snapshot), apks, "config")
+    assert found == []
+    assert sorted(apk for apk, _ in reused) == sorted(str(p) for p in apks.iterdir())
+    assert all(result.leak_count == 1 for _, result in reused)
+
+
+def test_other_config_analyzes_again(tmp_path, apks):
+    snapshot = str(tmp_path / "snapshot.json")
+    _scan_and_record(ApkScanner(snapshot=snapshot), apks, "config")
+
+    found, reused = _scan_and_record(ApkScanner(snapshot=snapshot), apks, "other")
+    assert len(found) == 5
+    assert reused == []
+
+
+def test_modified_and_failed_apks_are_analyzed_again(tmp_path, apks):
+    snapshot = str(tmp_path / "snapshot.json")
+    _scan_and_record(ApkScanner(snapshot=snapshot), apks, "config", STATUS_FAILED)
+    found, _ = _scan_and_record(ApkScanner(snapshot=snapshot), apks, "config")
+    assert len(found) == 5
+
+    (apks / "a.apk").write_bytes(b"changed")
+    os.utime(apks / "b.apk")
+    found, reused = _scan_and_record(ApkScanner(snapshot=snapshot), apks, "config")
+    assert found == [str(apks / "a.apk")]
+    assert len(reused) == 4
+
+
+def test_walk_skips_excluded_and_deep_entries(apks):
+    (apks / "sub" / "deeper").mkdir(parents=True)
+    (apks / "sub" / "f.apk").write_bytes(b"f")
+    (apks / "sub" / "deeper" / "g.apk").write_bytes(b"g")
+    (apks / "notes.txt").write_text("not an apk")
+
+    scanner = ApkScanner(exclude=("a.apk",), max_depth=1)
+    names = sorted(entry.name for entry in scanner.walk(str(apks)))
+    assert names == ["b.apk", "c.apk", "d.apk", "e.apk", "f.apk"]
@@ -0,0 +1,136 @@
+import asyncio
+import pytest
+from pyflowdroid import download
+from pyflowdroid.download import CubapkProvider, _ConnectionPool
+
+
+@pytest.fixture
+def provider(store, tmp_path):
+    return CubapkProvider(base_url=store.url, index_path=str(tmp_path / "index.json"))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / "apks"
+    path.mkdir()
+    return path
+
+
+def _apk_requests(store):
+    return [request for request in store.requests if request[0].startswith("/dl/")]
+
+
+def test_index_lists_the_apks_of_every_page(store, provider):
+    apks = dict(provider.iter_apks())
+    assert len(apks) == 12
+    assert apks["App10.apk"] == f"{store.url}/go/1_0"
+    assert apks["App33.apk"] == f"{store.url}/go/3_3"
+
+
+def test_stored_index_is_reused(store, provider, tmp_path):
+    dict(provider.iter_apks())
+    requests = len(store.requests)
+
+    again = CubapkProvider(base_url=store.url, index_path=str(tmp_path / "index.json"))
+    assert len(dict(again.iter_apks())) == 12
+    assert len(store.requests) == requests
+
+
+def test_stale_index_is_revalidated(store, provider, tmp_path):
+    dict(provider.iter_apks())
+    stale = CubapkProvider(
+        base_url=store.url, index_path=str(tmp_path / "index.json"), index_ttl=0
+    )
+    assert len(dict(stale.iter_apks())) == 12
+
+
+def test_apks_are_downloaded(store, provider, folder):
+    assert provider.download_apks(6, str(folder), workers=3) == 6
+
+    apks = sorted(folder.iterdir())
+    assert len(apks) == 6
+    assert (folder / "App10.apk").read_bytes() == store._apk("1_0")
+    assert not list(folder.glob("*.part"))
+
+
+def test_existing_apks_are_not_downloaded_again(store, provider, folder):
+    (folder / "App10.apk").write_bytes(b"kept")
+    assert provider.download_apks(2, str(folder)) == 2
+    assert (folder / "App10.apk").read_bytes() == b"kept"
+    assert [path for path, _ in _apk_requests(store)] == ["/dl/1_1"]
+
+
+def test_connections_are_kept_alive(store):
+    pool = _ConnectionPool()
+    for page in (1, 2, 3):
+        pool.request(f"{store.url}/store/?page={page}").read()
+    assert len(pool._connections()) == 1
+
+
+def test_cut_download_is_resumed(store, provider, folder):
+    url = f"{store.url}/go/1_0"
+    store.cut_at = 4000
+    assert not provider.download_apk("a.apk", url, str(folder))
+
+    # The apk only appears once it is complete
+    assert not (folder / "a.apk").exists()
+    assert (folder / "a.apk.part").stat().st_size == 4000
+
+    store.cut_at = 0
+    assert provider.download_apk("a.apk", url, str(folder))
+    assert _apk_requests(store)[-1] == ("/dl/1_0", "bytes=4000-")
+    assert (folder / "a.apk").read_bytes() == store._apk("1_0")
+    assert not (folder / "a.apk.part").exists()
+
+
+def test_complete_partial_download_is_kept_on_416(store, provider, folder):
+    (folder / "a.apk.part").write_bytes(store._apk("1_0"))
+    assert provider.download_apk("a.apk", f"{store.url}/go/1_0", str(folder))
+    assert _apk_requests(store) == [("/dl/1_0", "bytes=10000-")]
+    assert (folder / "a.apk").read_bytes() == store._apk("1_0")
+
+
+def test_oversized_partial_download_is_deleted_on_416(store, provider, folder):
+    (folder / "a.apk.part").write_bytes(store._apk("1_0") + b"garbage")
+    assert not provider.download_apk("a.apk", f"{store.url}/go/1_0", str(folder))
+    assert not (folder / "a.apk.part").exists()
+
+    assert provider.download_apk("a.apk", f"{store.url}/go/1_0", str(folder))
+    assert (folder / "a.apk").read_bytes() == store._apk("1_0")
+
+
+def test_failed_downloads_are_not_counted(store, provider, folder):
+    dict(provider.iter_apks())
+    store.cut_at = 100
+    assert provider.download_apks(3, str(folder), workers=2) == 0
+    assert not list(folder.glob("*.apk"))
+
+
+def test_missing_folder_is_rejected(store, provider, tmp_path):
+    with pytest.raises(ValueError):
+        provider.download_apk("a.apk", f"{store.url}/go/1_0", str(tmp_path / "no"))
+
+
+@pytest.fixture
+def local_provider(store, tmp_path, monkeypatch):
+    def factory(force_redownload):
+        return CubapkProvider(
+            force_redownload,
+            base_url=store.url,
+            index_path=str(tmp_path / "index.json"),
+        )
+
+    monkeypatch.setitem(download._providers, "local", factory)
+
+
+def test_fetch_returns_the_downloaded_amount(local_provider, tmp_path):
+    path = tmp_path / "new"
+    assert download.fetch(20, "local", str(path), workers=4) == 12
+    assert len(list(path.glob("*.apk"))) == 12
+
+
+def test_fetch_async_downloads_and_resumes(store, local_provider, folder):
+    (folder / "App10.apk.part").write_bytes(store._apk("1_0")[:2500])
+    assert asyncio.run(download.fetch_async(3, "local", str(folder), workers=2)) == 3
+    assert ("/dl/1_0", "bytes=2500-") in _apk_requests(store)
+    assert (folder / "App10.apk").read_bytes() == store._apk("1_0")
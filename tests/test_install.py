@@ -0,0 +1,235 @@
+import io
+import json
+import hashlib
+import zipfile
+import threading
+import http.client
+import http.server
+import urllib.error
+import pytest
+from pyflowdroid import install
+from pyflowdroid.consts import FLOWDROID_EXEC_NAME, INSTALL_MANIFEST_NAME
+from pyflowdroid.download import _ConnectionPool
+
+
+class _RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the files of the server from memory, honouring 'bytes=N-' ranges.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        content = server.files.get(self.path)
+        if content is None:
+            self._answer(404, b"")
+            return
+
+        # Answer with the requested range, or with 416 if it is past the end
+        offset = 0
+        headers = {}
+        if self.headers.get("Range"):
+            offset = int(self.headers["Range"][len("bytes=") : -1])
+            if offset >= len(content):
+                self._answer(416, b"", {"Content-Range": f"bytes */{len(content)}"})
+                return
+            end = len(content) - 1
+            headers["Content-Range"] = f"bytes {offset}-{end}/{len(content)}"
+        body = content[offset : server.cut_at or None]
+        self._answer(206 if offset else 200, body, headers, len(content) - offset)
+
+    def _answer(self, status, body, headers=None, length=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        if length is not None and length != len(body):
+            self.close_connection = True
+
+
+@pytest.fixture
+def server():
+    """
+    Local HTTP server whose files are set in its `files` dict.
+    """
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    httpd.files = {}
+    httpd.requests = []
+    httpd.cut_at = 0
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+CONTENT = bytes(range(256)) * 64
+
+
+def test_download_resumes_a_partial_file(server, tmp_path):
+    server.files["/file"] = CONTENT
+    path = tmp_path / "file"
+    (tmp_path / "file.part").write_bytes(CONTENT[:1000])
+
+    digest = install._download_file(_ConnectionPool(), f"{server.url}/file", path)
+
+    assert server.requests == [("/file", "bytes=1000-")]
+    assert path.read_bytes() == CONTENT
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert not (tmp_path / "file.part").exists()
+
+
+def test_cut_download_keeps_the_partial_file(server, tmp_path):
+    server.files["/file"] = CONTENT
+    server.cut_at = 5000
+    path = tmp_path / "file"
+    with pytest.raises(http.client.IncompleteRead):
+        install._download_file(_ConnectionPool(), f"{server.url}/file", path)
+    assert (tmp_path / "file.part").read_bytes() == CONTENT[:5000]
+
+    # The next attempt only downloads the rest
+    server.cut_at = 0
+    install._download_file(_ConnectionPool(), f"{server.url}/file", path)
+    assert server.requests[-1] == ("/file", "bytes=5000-")
+    assert path.read_bytes() == CONTENT
+
+
+def test_download_progress_is_logged(server, tmp_path, monkeypatch, caplog):
+    server.files["/file"] = CONTENT
+    monkeypatch.setattr(install, "_CHUNK_SIZE", 1024)
+    (tmp_path / "file.part").write_bytes(CONTENT[:8192])
+
+    with caplog.at_level("INFO"):
+        install._download_file(
+            _ConnectionPool(), f"{server.url}/file", tmp_path / "file"
+        )
+
+    # A resumed download only logs the tenths it receives
+    progress = [r.message.split("%")[0] for r in caplog.records if "%" in r.message]
+    assert progress == [f"Downloaded {tenth}0" for tenth in range(6, 11)]
+
+
+def test_checksum_mismatch_deletes_the_download(server, tmp_path):
+    server.files["/file"] = CONTENT
+    path = tmp_path / "file"
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        install._download_file(
+            _ConnectionPool(), f"{server.url}/file", path, sha256="0" * 64
+        )
+    assert not path.exists()
+    assert not (tmp_path / "file.part").exists()
+
+
+def test_complete_partial_file_is_kept_on_416(server, tmp_path):
+    server.files["/file"] = CONTENT
+    path = tmp_path / "file"
+    (tmp_path / "file.part").write_bytes(CONTENT)
+
+    install._download_file(_ConnectionPool(), f"{server.url}/file", path)
+
+    assert server.requests == [("/file", f"bytes={len(CONTENT)}-")]
+    assert path.read_bytes() == CONTENT
+
+
+def test_oversized_partial_file_is_deleted_on_416(server, tmp_path):
+    server.files["/file"] = CONTENT
+    path = tmp_path / "file"
+    (tmp_path / "file.part").write_bytes(CONTENT + b"garbage")
+
+    with pytest.raises(urllib.error.HTTPError):
+        install._download_file(_ConnectionPool(), f"{server.url}/file", path)
+    assert not (tmp_path / "file.part").exists()
+
+    # The next attempt downloads the whole file again
+    install._download_file(_ConnectionPool(), f"{server.url}/file", path)
+    assert path.read_bytes() == CONTENT
+
+
+def test_valid_download_is_reused(server, tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(CONTENT)
+    digest = hashlib.sha256(CONTENT).hexdigest()
+    url = f"{server.url}/file"
+    assert install._download_file(_ConnectionPool(), url, path, digest) == digest
+    assert server.requests == []
+
+
+@pytest.fixture
+def deps(server, tmp_path, monkeypatch):
+    """
+    FlowDroid jar and Android platforms zip served by the local server.
+    """
+    platforms = io.BytesIO()
+    with zipfile.ZipFile(platforms, "w") as zip_file:
+        for level in (17, 28):
+            zip_file.writestr(f"platforms/android-{level}/android.jar", b"%d" % level)
+    server.files["/flowdroid.jar"] = b"flowdroid"
+    server.files["/platforms.zip"] = platforms.getvalue()
+    monkeypatch.setattr(install, "DEFAULT_DOWNLOAD_FOLDER", tmp_path / "downloads")
+    folder = tmp_path / "install"
+    folder.mkdir()
+    return dict(
+        flowdroid_url=f"{server.url}/flowdroid.jar",
+        android_url=f"{server.url}/platforms.zip",
+        folder=folder,
+    )
+
+
+def test_intact_installation_is_not_installed_again(server, deps):
+    assert install.install_deps(**deps)
+    manifest = json.loads((deps["folder"] / INSTALL_MANIFEST_NAME).read_text())
+    assert set(manifest["files"]) == {
+        FLOWDROID_EXEC_NAME,
+        "platforms/android-17/android.jar",
+        "platforms/android-28/android.jar",
+    }
+
+    requests = len(server.requests)
+    assert not install.install_deps(**deps)
+    assert not install.install_deps(verify=True, **deps)
+    assert len(server.requests) == requests
+
+
+def test_damaged_installation_is_installed_again(server, deps):
+    install.install_deps(**deps)
+    jar = deps["folder"] / "platforms" / "android-28" / "android.jar"
+
+    # A file with the same size but other content is only found when verifying
+    jar.write_bytes(b"xx")
+    assert not install.install_deps(**deps)
+    assert install.install_deps(verify=True, **deps)
+    assert jar.read_bytes() == b"28"
+
+    jar.unlink()
+    assert install.install_deps(**deps)
+    assert jar.read_bytes() == b"28"
+
+
+def test_new_api_levels_are_added_to_the_installation(server, deps):
+    assert install.install_deps(api_levels=[17], **deps)
+    assert install.installed_api_levels(deps["folder"]) == {17}
+    assert not install.install_deps(api_levels=[17], **deps)
+    assert install.install_deps(api_levels=[28], **deps)
+    assert install.installed_api_levels(deps["folder"]) == {17, 28}
+
+
+@pytest.mark.parametrize("name", ["../outside.jar", "/tmp/absolute.jar", "a/../../b"])
+def test_members_outside_the_folder_are_rejected(tmp_path, name):
+    archive = tmp_path / "platforms.zip"
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr(name, b"x")
+    folder = tmp_path / "install"
+    folder.mkdir()
+
+    with pytest.raises(ValueError, match="outside"):
+        install._extract(archive, folder)
+    assert list(folder.iterdir()) == []
+    assert not (tmp_path / "outside.jar").exists()
@@ -0,0 +1,95 @@
+import os
+import time
+import pytest
+from pyflowdroid.analyze import analyze_apk
+from pyflowdroid.logstore import COMPRESSION_GZIP, COMPRESSION_ZSTD, LogStore
+from pyflowdroid.results import parse_logs
+
+
+def _write(store, key, text, apk=""):
+    with store.writer(key, apk) as writer:
+        writer.write(text)
+
+
+@pytest.mark.parametrize("compression", [COMPRESSION_GZIP, COMPRESSION_ZSTD])
+def test_logs_are_read_back(tmp_path, compression):
+    if compression == COMPRESSION_ZSTD:
+        pytest.importorskip("zstandard")
+    store = LogStore(tmp_path / "logs", compression)
+    _write(store, "a", "first line\nsecond line\n", "a.apk")
+    _write(store, "b", "other log\n")
+
+    assert list(store.read("a")) == ["first line\n", "second line\n"]
+    assert list(store.read("b")) == ["other log\n"]
+    assert store.entries()["a"]["apk"] == "a.apk"
+
+    # The index is loaded again from the disk
+    again = LogStore(tmp_path / "logs", compression)
+    assert len(again) == 2
+    assert list(again.read("a")) == ["first line\n", "second line\n"]
+
+
+def test_new_log_replaces_the_old_one(tmp_path):
+    store = LogStore(tmp_path)
+    _write(store, "a", "old\n")
+    _write(store, "a", "new\n")
+    assert list(store.read("a")) == ["new\n"]
+    assert list(LogStore(tmp_path).read("a")) == ["new\n"]
+
+
+def test_failed_writes_are_discarded(tmp_path):
+    store = LogStore(tmp_path)
+    with pytest.raises(RuntimeError):
+        with store.writer("a") as writer:
+            writer.write("partial\n")
+            raise RuntimeError("analysis failed")
+    assert "a" not in store
+    with pytest.raises(KeyError):
+        list(store.read("a"))
+
+
+def test_truncated_index_line_is_ignored(tmp_path):
+    store = LogStore(tmp_path)
+    _write(store, "a", "log\n")
+    with open(tmp_path / "index.jsonl", "a") as f:
+        f.write('{"key": "b", "seg')
+    assert list(LogStore(tmp_path).entries()) == ["a"]
+
+
+def test_oldest_segments_are_removed_over_the_size_limit(tmp_path):
+    store = LogStore(tmp_path, segment_size=0)
+    store.max_size = 1
+    for key in "abc":
+        _write(store, key, f"log of {key}\n")
+
+    # The segment being written is always kept
+    assert list(store.entries()) == ["c"]
+    assert len(list(tmp_path.glob("segment-*.log"))) == 1
+    assert list(LogStore(tmp_path).entries()) == ["c"]
+
+
+def test_old_segments_are_removed(tmp_path):
+    store = LogStore(tmp_path, segment_size=0, max_age=1)
+    _write(store, "a", "old log\n")
+    old = time.time() - 2 * 24 * 60 * 60
+    os.utime(tmp_path / "segment-000001.log", (old, old))
+    _write(store, "b", "new log\n")
+    _write(store, "c", "newer log\n")
+    assert sorted(store.entries()) == ["b", "c"]
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LogStore(tmp_path, "lz4")
+
+
+def test_analysis_saves_its_log_in_the_store(tmp_path, apks, fake_java):
+    store = LogStore(tmp_path / "logs")
+    apk = apks / "a.apk"
+
+    result = analyze_apk(str(apk), log_store=store)
+
+    key = store.key(str(apk))
+    assert store.entries()[key]["apk"] == str(apk)
+    assert parse_logs(store.read(key)).leak_count == result.leak_count == 2
+    assert not apk.with_suffix(".log").exists()
@@ -0,0 +1,43 @@
+import os
+from pyflowdroid.manifest import RunManifest
+from pyflowdroid.results import ApkResult, STATUS_FAILED, STATUS_OK
+
+
+def test_recorded_apks_are_reused(tmp_path, apks):
+    manifest = RunManifest(tmp_path / "runs" / "manifest.jsonl")
+    manifest.record(ApkResult(str(apks / "a.apk"), STATUS_OK, reported_leaks=2))
+    manifest.record(ApkResult(str(apks / "b.apk"), STATUS_FAILED))
+
+    entries = manifest.entries()
+
+    result = manifest.previous_result(str(apks / "a.apk"), entries)
+    assert result.leak_count == 2
+    assert manifest.previous_result(str(apks / "b.apk"), entries).status == (
+        STATUS_FAILED
+    )
+    assert manifest.previous_result(str(apks / "c.apk"), entries) is None
+
+
+def test_failed_and_modified_apks_are_analyzed_again(tmp_path, apks):
+    manifest = RunManifest(tmp_path / "manifest.jsonl")
+    manifest.record(ApkResult(str(apks / "a.apk"), STATUS_OK))
+    manifest.record(ApkResult(str(apks / "b.apk"), STATUS_FAILED))
+    entries = manifest.entries()
+
+    assert manifest.previous_result(str(apks / "b.apk"), entries, True) is None
+    os.utime(apks / "a.apk", (0, 0))
+    assert manifest.previous_result(str(apks / "a.apk"), entries) is None
+
+
+def test_latest_entries_survive_a_killed_run(tmp_path, apks):
+    manifest = RunManifest(tmp_path / "manifest.jsonl")
+    manifest.record(ApkResult(str(apks / "a.apk"), STATUS_FAILED))
+    manifest.record(ApkResult(str(apks / "a.apk"), STATUS_OK))
+    with open(manifest.path, "a") as f:
+        f.write('{"apk": "b.apk", "sta')
+
+    entries = manifest.entries()
+
+    assert list(entries) == [str(apks / "a.apk")]
+    assert entries[str(apks / "a.apk")]["status"] == STATUS_OK
+    assert RunManifest(tmp_path / "missing.jsonl").entries() == {}
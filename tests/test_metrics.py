@@ -0,0 +1,101 @@
+import json
+import pytest
+from pyflowdroid.metrics import (
+    Metrics,
+    NullMetrics,
+    _timed_calls,
+    get_metrics,
+    set_metrics,
+)
+
+
+@pytest.fixture
+def metrics():
+    """
+    Registry installed for the test, disabling metrics again afterwards.
+    """
+    yield set_metrics(Metrics(buckets=(1, 10)))
+    set_metrics()
+
+
+def test_counters_and_histograms_are_exported(metrics):
+    get_metrics().increment("apks_total", status="ok")
+    get_metrics().increment("apks_total", 2, status="ok")
+    get_metrics().observe("seconds", 0.5, stage="analysis")
+    get_metrics().observe("seconds", 5, stage="analysis")
+    get_metrics().observe("seconds", 50, stage="analysis")
+
+    data = metrics.to_dict()
+
+    assert data["counters"] == [
+        {"name": "apks_total", "labels": {"status": "ok"}, "value": 3}
+    ]
+    assert data["histograms"] == [
+        {
+            "name": "seconds",
+            "labels": {"stage": "analysis"},
+            "count": 3,
+            "sum": 55.5,
+            "buckets": {"1": 1, "10": 2, "+Inf": 3},
+        }
+    ]
+
+
+def test_prometheus_format(metrics):
+    metrics.increment("apks_total", apk='a "b".apk')
+    metrics.increment("apks_total")
+    with metrics.timer("seconds"):
+        pass
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert lines[:3] == [
+        "# TYPE apks_total counter",
+        "apks_total 1",
+        'apks_total{apk="a \\"b\\".apk"} 1',
+    ]
+    assert lines[3:6] == [
+        "# TYPE seconds histogram",
+        'seconds_bucket{le="1"} 1',
+        'seconds_bucket{le="10"} 1',
+    ]
+    assert lines[-1] == "seconds_count 1"
+
+
+def test_metrics_are_written_by_extension(tmp_path, metrics):
+    metrics.increment("apks_total")
+
+    metrics.write(tmp_path / "metrics.json")
+    metrics.write(tmp_path / "metrics.prom")
+
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["counters"][0]["value"] == 1
+    assert (tmp_path / "metrics.prom").read_text() == metrics.to_prometheus()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "metrics.json",
+        "metrics.prom",
+    ]
+
+
+def test_metrics_are_disabled_by_default():
+    metrics = get_metrics()
+    metrics.increment("apks_total")
+    metrics.observe("seconds", 1)
+    with metrics.timer("seconds"):
+        pass
+
+    assert isinstance(metrics, NullMetrics)
+    assert not metrics.enabled
+    assert metrics.to_dict() == {"counters": [], "histograms": []}
+
+
+def test_timed_calls_add_up():
+    totals: dict = {}
+    lines = []
+    handler = _timed_calls(lines.append, totals, "parse")
+
+    handler("a")
+    handler("b")
+
+    assert lines == ["a", "b"]
+    assert totals["parse"] >= 0
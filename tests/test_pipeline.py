@@ -0,0 +1,85 @@
+import pytest
+from pyflowdroid.database import ResultsDatabase
+from pyflowdroid.download import CubapkProvider
+from pyflowdroid.pipeline import (
+    fetch_and_analyze,
+    iter_download,
+    iter_fetch_and_analyze,
+)
+
+
+@pytest.fixture
+def provider(store, tmp_path):
+    return CubapkProvider(base_url=store.url, index_path=str(tmp_path / "index.json"))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return tmp_path / "apks"
+
+
+def test_downloads_are_yielded_as_they_complete(provider, folder):
+    folder.mkdir()
+    (folder / "App10.apk").write_bytes(b"kept")
+
+    downloads = dict(iter_download(provider, 5, str(folder), workers=2))
+
+    assert len(downloads) == 5
+    assert downloads.pop(str(folder / "App10.apk")) is False
+    assert all(downloads.values())
+    assert (folder / "App10.apk").read_bytes() == b"kept"
+
+
+def test_stopping_early_stops_the_downloads(provider, folder):
+    downloads = iter_download(provider, 12, str(folder), workers=2, buffer_size=1)
+    next(downloads)
+    downloads.close()
+    # Two downloading threads and one buffered apk at most
+    assert len(list(folder.glob("*.apk"))) <= 4
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_downloaded_apks_are_analyzed(provider, folder, fake_java, workers):
+    total_apps, total_leaks, leaky_apks = fetch_and_analyze(
+        6, provider, str(folder), save_logs=False, workers=workers
+    )
+    assert (total_apps, total_leaks, len(leaky_apks)) == (6, 12, 6)
+    assert len(list(folder.glob("*.apk"))) == 6
+
+
+@pytest.mark.parametrize("force_redownload", [False, True])
+def test_only_new_apks_are_deleted(
+    store, tmp_path, folder, fake_java, force_redownload
+):
+    provider = CubapkProvider(
+        force_redownload, base_url=store.url, index_path=str(tmp_path / "index.json")
+    )
+    folder.mkdir()
+    (folder / "App10.apk").write_bytes(b"kept")
+
+    results = list(
+        iter_fetch_and_analyze(
+            4, provider, str(folder), save_logs=False, delete_apks=True
+        )
+    )
+
+    assert len(results) == 4
+    assert [path.name for path in folder.glob("*.apk")] == ["App10.apk"]
+
+
+def test_results_are_recorded_in_the_database(provider, folder, tmp_path, fake_java):
+    with ResultsDatabase(tmp_path / "results.sqlite") as database:
+        fetch_and_analyze(
+            3,
+            provider,
+            str(folder),
+            save_logs=False,
+            database=database,
+            delete_apks=True,
+        )
+        apks = database.apks()
+
+    # The apks were hashed before being deleted
+    assert len(apks) == 3
+    assert all(apk["hash"] for apk in apks)
+    assert not list(folder.glob("*.apk"))
@@ -0,0 +1,66 @@
+import zipfile
+import pytest
+from dex_builder import write_apk
+from pyflowdroid.consts import DEFAULT_API_LEVEL
+from pyflowdroid.platforms import PlatformProvider, api_level
+
+
+def _platform(folder, level):
+    jar_path = folder / f"android-{level}" / "android.jar"
+    jar_path.parent.mkdir(parents=True)
+    jar_path.write_bytes(f"android {level}".encode())
+
+
+@pytest.fixture
+def platforms(tmp_path):
+    """
+    Platforms folder with the API level 23 and a zip mirror with the levels
+    23 and 28.
+    """
+    folder = tmp_path / "platforms"
+    _platform(folder, 23)
+    mirror = tmp_path / "android-platforms.zip"
+    with zipfile.ZipFile(mirror, "w") as zip_file:
+        for level in (23, 28):
+            zip_file.writestr(
+                f"android-platforms-master/android-{level}/android.jar",
+                f"android {level}",
+            )
+    return PlatformProvider(folder, str(mirror))
+
+
+def test_missing_platforms_are_fetched_from_the_mirror(platforms):
+    assert platforms.platforms(23) == platforms.folder
+    assert platforms.platforms(28) == platforms.folder
+    assert platforms.levels() == {23, 28}
+    assert (platforms.folder / "android-28" / "android.jar").read_text() == (
+        "android 28"
+    )
+
+
+def test_closest_platform_is_used_when_missing(platforms):
+    platforms.platforms(28)
+    folder = platforms.platforms(19)
+
+    assert folder == platforms.folder / "fallback" / "19"
+    assert (folder / "android-19" / "android.jar").read_text() == "android 23"
+    assert 19 not in platforms.levels()
+    folder = platforms.platforms(30)
+    assert (folder / "android-30" / "android.jar").read_text() == "android 28"
+
+
+def test_platforms_are_fetched_from_a_folder(tmp_path):
+    mirror = tmp_path / "mirror"
+    _platform(mirror, 26)
+    provider = PlatformProvider(tmp_path / "platforms", str(mirror))
+
+    assert provider.platforms(26) == provider.folder
+    with pytest.raises(ValueError):
+        PlatformProvider(tmp_path / "empty", str(tmp_path / "none")).platforms(26)
+
+
+def test_apks_without_sdk_version_use_the_default_level(tmp_path, apks):
+    write_apk(tmp_path / "text.apk", {})
+
+    assert api_level(str(tmp_path / "text.apk")) == DEFAULT_API_LEVEL
+    assert api_level(str(apks / "a.apk"), default=21) == 21
@@ -0,0 +1,127 @@
+import io
+import csv
+import json
+import pytest
+from pyflowdroid.report import (
+    REPORT_CSV,
+    REPORT_FORMATS,
+    REPORT_JSON,
+    REPORT_SARIF,
+    REPORT_TEXT,
+    ReportWriter,
+    write_report,
+)
+from pyflowdroid.results import STATUS_FAILED, ApkResult, Leak
+
+SOURCE = "$r3 = virtualinvoke $r2.<android.telephony.TelephonyManager: java.lang.String getDeviceId()>()"
+SINK = "virtualinvoke $r5.<android.util.Log: int i(java.lang.String,java.lang.String)>($r3)"
+METHOD = "<com.ex.Main: void onCreate(android.os.Bundle)>"
+DEVICE_ID = "android.telephony.TelephonyManager: java.lang.String getDeviceId()"
+LOG = "android.util.Log: int i(java.lang.String,java.lang.String)"
+
+
+def _results():
+    leak = Leak(SOURCE, SINK, ['$r4 = "a, \\"quoted\\" value"', "$r3 = $r4"], METHOD)
+    return [
+        ('apks/with "quotes", commas.apk', ApkResult("a", leaks=[leak, leak])),
+        ("apks/clean.apk", ApkResult("b", reported_leaks=0)),
+        ("apks/broken.apk", ApkResult("c", status=STATUS_FAILED)),
+        ("apks/raw.apk", "[main] INFO x.Setup - Found 3 leaks\n"),
+    ]
+
+
+def _report(report_format, results=None, top=10):
+    out = io.StringIO()
+    summary = write_report(
+        _results() if results is None else results, out, report_format, top
+    )
+    return out.getvalue(), summary
+
+
+def test_summary_aggregates_the_results():
+    _, summary = _report(REPORT_TEXT, top=1)
+    assert summary["apks"] == 4
+    assert summary["leaks"] == 5
+    assert summary["leaky_apks"] == 2
+    assert summary["statuses"] == {"ok": 3, "failed": 1}
+    assert summary["top_sources"] == [(DEVICE_ID, 2)]
+    assert summary["top_flows"] == [[DEVICE_ID, LOG, 2]]
+    assert summary["top_apks"] == [["apks/raw.apk", 3]]
+
+
+def test_text_report_lists_the_leaky_apks():
+    text, _ = _report(REPORT_TEXT)
+    assert ' - apks/with "quotes", commas.apk (2 leaks)' in text
+    assert "clean.apk" not in text.split("Analized")[0]
+    assert "Leaks found: 5" in text
+
+
+def test_json_report_is_valid():
+    text, summary = _report(REPORT_JSON)
+    report = json.loads(text)
+
+    assert [entry["apk"] for entry in report["results"]] == [
+        apk for apk, _ in _results()
+    ]
+    assert report["results"][0]["leaks"][0] == {
+        "source": SOURCE,
+        "sink": SINK,
+        "method": METHOD,
+    }
+    assert report["summary"] == json.loads(json.dumps(summary))
+
+
+def test_csv_report_is_valid():
+    text, _ = _report(REPORT_CSV)
+    rows = list(csv.DictReader(io.StringIO(text)))
+
+    apk_rows = [row for row in rows if row["kind"] == "apk"]
+    assert [row["apk"] for row in apk_rows] == [apk for apk, _ in _results()]
+    assert [row["count"] for row in apk_rows] == ["2", "0", "0", "3"]
+    leak_rows = [row for row in rows if row["kind"] == "leak"]
+    assert [row["source"] for row in leak_rows] == [SOURCE, SOURCE]
+    totals = [row["count"] for row in rows if row["kind"] == "total"]
+    assert totals == ["4"]
+
+
+def test_sarif_report_is_valid():
+    text, _ = _report(REPORT_SARIF)
+    report = json.loads(text)
+
+    assert report["version"] == "2.1.0"
+    run = report["runs"][0]
+    assert run["tool"]["driver"]["rules"][0]["id"] == "PFD001"
+    assert len(run["results"]) == 2
+    result = run["results"][0]
+    location = result["locations"][0]["physicalLocation"]["artifactLocation"]
+    assert location["uri"] == 'apks/with "quotes", commas.apk'
+    steps = result["codeFlows"][0]["threadFlows"][0]["locations"]
+    assert steps[0]["location"]["message"]["text"] == '$r4 = "a, \\"quoted\\" value"'
+    assert run["properties"]["leaks"] == 5
+
+
+@pytest.mark.parametrize("report_format", [REPORT_JSON, REPORT_SARIF])
+def test_empty_reports_are_valid(report_format):
+    text, summary = _report(report_format, [])
+    assert json.loads(text)
+    assert summary["apks"] == 0
+
+
+def test_empty_text_report_says_none():
+    text, _ = _report(REPORT_TEXT, [])
+    assert " (none)" in text
+
+
+def test_unknown_formats_are_rejected():
+    assert "xml" not in REPORT_FORMATS
+    with pytest.raises(ValueError):
+        ReportWriter(io.StringIO(), "xml")
+
+
+def test_close_writes_the_footer_once():
+    out = io.StringIO()
+    writer = ReportWriter(out, REPORT_JSON)
+    writer.add("a.apk", ApkResult("a.apk"))
+    writer.close()
+    writer.close()
+    assert json.loads(out.getvalue())["summary"]["apks"] == 1
@@ -0,0 +1,113 @@
+import io
+import pytest
+from fake_flowdroid import METHOD, SINK, SOURCE, analyze
+from pyflowdroid.analyze import count_leaks_in_log_file
+from pyflowdroid.results import (
+    STATUS_FAILED,
+    STATUS_OK,
+    STATUS_OUT_OF_MEMORY,
+    STATUS_TIMEOUT,
+    ApkResult,
+    Leak,
+    LogParser,
+    parse_logs,
+)
+
+PREFIX = "[main] INFO soot.jimple.infoflow.Infoflow - "
+
+
+@pytest.fixture
+def log(monkeypatch):
+    """
+    Log of the FlowDroid stand-in reporting 2 leaks.
+    """
+    monkeypatch.setenv("FAKE_FLOWDROID_LATENCY", "0")
+    monkeypatch.setenv("FAKE_FLOWDROID_LINES", "5")
+    monkeypatch.setenv("FAKE_FLOWDROID_LEAKS", "2")
+    out = io.StringIO()
+    analyze("a.apk", out)
+    return out.getvalue()
+
+
+def test_leaks_and_statistics_are_parsed(log):
+    result = parse_logs(io.StringIO(log), "a.apk")
+
+    assert result.apk == "a.apk"
+    assert result.status == STATUS_OK
+    assert result.leak_count == 2
+    assert result.leaks == [Leak(SOURCE, SINK, [METHOD], METHOD)] * 2
+    assert result.call_graph_edges == 18234
+    assert result.callback_iterations == 1
+    assert result.timings == {"callbacks": 3, "taint_propagation": 2, "data_flow": 4}
+
+
+def test_lines_without_logger_prefix_are_parsed():
+    result = parse_logs(
+        [
+            f"The sink {SINK} in method {METHOD} was called with values from the following sources:",
+            f"- {SOURCE} in method {METHOD}",
+            "  -> first",
+            "  -> second",
+            "No results found",
+        ]
+    )
+    assert result.leaks == [Leak(SOURCE, SINK, ["first", "second"], METHOD)]
+    assert result.reported_leaks == 0
+
+
+def test_leak_count_falls_back_to_the_parsed_leaks(log):
+    lines = [line for line in log.splitlines() if "leaks" not in line]
+    result = parse_logs(lines)
+    assert result.reported_leaks is None
+    assert result.leak_count == 2
+
+
+@pytest.mark.parametrize(
+    "line, status",
+    [
+        (f"{PREFIX}Timeout reached, stopping the solvers...", STATUS_TIMEOUT),
+        ("Data flow solver timed out", STATUS_TIMEOUT),
+        (
+            'Exception in thread "main" java.lang.OutOfMemoryError: Java heap space',
+            STATUS_OUT_OF_MEMORY,
+        ),
+        ('Exception in thread "main" java.lang.RuntimeException', STATUS_FAILED),
+    ],
+)
+def test_failures_set_the_status(line, status):
+    assert parse_logs(["Callgraph has 3 edges", line]).status == status
+
+
+def test_out_of_memory_is_kept_after_the_exception():
+    result = parse_logs(
+        [
+            "java.lang.OutOfMemoryError: GC overhead limit exceeded",
+            'Exception in thread "main" java.lang.RuntimeException',
+        ]
+    )
+    assert result.status == STATUS_OUT_OF_MEMORY
+
+
+def test_finish_marks_non_zero_exit_codes_as_failed(log):
+    parser = LogParser("a.apk")
+    for line in log.splitlines():
+        parser.feed(line)
+
+    result = parser.finish(1, "a.log")
+
+    assert result.status == STATUS_FAILED
+    assert result.returncode == 1
+    assert result.log_path == "a.log"
+    assert LogParser().finish(0).status == STATUS_OK
+
+
+def test_results_round_trip_through_dicts(log):
+    result = parse_logs(log.splitlines(), "a.apk")
+    again = ApkResult.from_dict(result.to_dict())
+    assert again.to_dict() == result.to_dict()
+    assert again.leaks == result.leaks
+
+
+def test_count_leaks_in_log_file(log):
+    assert count_leaks_in_log_file(log) == 2
+    assert count_leaks_in_log_file("") == 0
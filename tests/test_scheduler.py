@@ -0,0 +1,64 @@
+import pytest
+from dex_builder import write_apk
+from pyflowdroid.consts import DEFAULT_SECONDS_PER_METHOD, DEFAULT_SECONDS_PER_MB
+from pyflowdroid.scheduler import ApkCost, CostModel, plan_heap
+
+
+def _classes(methods: int) -> dict:
+    return {"Lcom/ex/Main;": {f"m{i}": [("return-void",)] for i in range(methods)}}
+
+
+@pytest.fixture
+def sized_apks(tmp_path):
+    """
+    Apks with 2 and 20 methods, and an apk without dex files.
+    """
+    write_apk(tmp_path / "small.apk", _classes(2))
+    write_apk(tmp_path / "big.apk", _classes(10), _classes(10))
+    (tmp_path / "plain.apk").write_bytes(b"x" * 1024 * 1024)
+    return tmp_path
+
+
+def test_apks_are_ordered_longest_first(tmp_path, sized_apks):
+    model = CostModel(tmp_path / "costs.json")
+
+    costs = model.order(str(sized_apks / name) for name in ["small.apk", "big.apk"])
+
+    assert [cost.apk for cost in costs] == [
+        str(sized_apks / "big.apk"),
+        str(sized_apks / "small.apk"),
+    ]
+    assert (costs[0].dex_count, costs[0].methods) == (2, 20)
+    assert costs[0].predicted == 20 * DEFAULT_SECONDS_PER_METHOD
+    plain = model.features(str(sized_apks / "plain.apk"))
+    assert (plain.dex_count, plain.methods) == (0, 0)
+    assert plain.predicted == DEFAULT_SECONDS_PER_MB
+
+
+def test_observed_durations_are_remembered(tmp_path, sized_apks):
+    model = CostModel(tmp_path / "costs.json")
+    big = model.features(str(sized_apks / "big.apk"))
+    model.record(big, 10)
+    model.record(big, 20)
+    model.save()
+
+    model = CostModel(tmp_path / "costs.json")
+
+    assert model.features(str(sized_apks / "big.apk")).predicted == 15
+    # Unknown apks are predicted at the rate observed
+    assert model.rates()[0] == 15 / 20
+    assert model.features(str(sized_apks / "small.apk")).predicted == 2 * 15 / 20
+
+
+def test_corrupt_history_is_ignored(tmp_path):
+    (tmp_path / "costs.json").write_text("{")
+    assert CostModel(tmp_path / "costs.json").history == {}
+
+
+@pytest.mark.parametrize(
+    "predicted, max_heap, expected",
+    [(10, 8000, 2000), (1, 8000, 1000), (100, 8000, 8000), (10, 0, 0)],
+)
+def test_heap_is_planned_by_predicted_cost(predicted, max_heap, expected):
+    cost = ApkCost("a.apk", "hash", 1, 1, 1, predicted)
+    assert plan_heap(cost, 10, max_heap, 4) == expected
@@ -0,0 +1,97 @@
+import pytest
+from dex_builder import build_dex, write_apk
+from pyflowdroid.definitions import KIND_SINK, KIND_SOURCE, SourceSinkSet
+from pyflowdroid.triage import (
+    VERDICT_ANALYZE,
+    VERDICT_DUPLICATE,
+    VERDICT_INVALID,
+    VERDICT_NO_SINKS,
+    Triage,
+    apk_method_names,
+    dex_method_names,
+)
+
+SMS_MANAGER = "Landroid/telephony/SmsManager;"
+DEFINITIONS = SourceSinkSet(
+    {
+        "<android.telephony.TelephonyManager: java.lang.String getDeviceId()>": (
+            KIND_SOURCE,
+            "NO_CATEGORY",
+            "",
+        ),
+        "<android.telephony.SmsManager: void sendTextMessage(java.lang.String)>": (
+            KIND_SINK,
+            "NO_CATEGORY",
+            "",
+        ),
+    }
+)
+
+
+def _classes(*code):
+    return {"Lcom/ex/Main;": {"onCreate": [*code, ("return-void",)]}}
+
+
+SENDS_SMS = _classes(("invoke", SMS_MANAGER, "sendTextMessage"))
+
+
+def test_dex_method_names_lists_defined_and_called_methods():
+    dex = build_dex(
+        {
+            **SENDS_SMS,
+            "Lcom/ex/Util;": {"log": [("const-string", "getDeviceId")]},
+        }
+    )
+    # Strings that are not method names are not reported
+    assert dex_method_names(dex) == {"onCreate", "sendTextMessage", "log"}
+
+
+@pytest.mark.parametrize(
+    "dex",
+    [
+        b"",
+        b"not a dex file",
+        b"dex\n035\0" + b"\xff" * 120,
+        build_dex(SENDS_SMS)[:0xC0],
+    ],
+)
+def test_invalid_dex_files_are_rejected(dex):
+    with pytest.raises(ValueError):
+        dex_method_names(dex)
+
+
+def test_apk_method_names_reads_every_dex_file(tmp_path):
+    apk = tmp_path / "a.apk"
+    write_apk(apk, _classes(), {"Lcom/ex/Other;": {"run": [("return-void",)]}})
+    assert apk_method_names(str(apk)) == {"onCreate", "run"}
+
+
+def test_apks_calling_a_sink_are_analyzed(tmp_path):
+    write_apk(tmp_path / "a.apk", SENDS_SMS)
+    result = Triage(DEFINITIONS).check(tmp_path / "a.apk")
+    assert result.verdict == VERDICT_ANALYZE
+    assert len(result.apk_hash) == 64
+
+
+def test_apks_without_sinks_are_not_analyzed(tmp_path):
+    write_apk(tmp_path / "a.apk", _classes())
+    triage = Triage(DEFINITIONS)
+    assert triage.sink_names == {"sendTextMessage"}
+    assert triage.check(tmp_path / "a.apk").verdict == VERDICT_NO_SINKS
+
+
+def test_duplicated_apks_are_found(tmp_path):
+    write_apk(tmp_path / "a.apk", SENDS_SMS)
+    (tmp_path / "b.apk").write_bytes((tmp_path / "a.apk").read_bytes())
+
+    results = Triage(DEFINITIONS).check_all([tmp_path / "a.apk", tmp_path / "b.apk"])
+
+    assert [r.verdict for r in results] == [VERDICT_ANALYZE, VERDICT_DUPLICATE]
+    assert results[1].original == str(tmp_path / "a.apk")
+
+
+def test_invalid_apks_are_found(tmp_path, apks):
+    write_apk(tmp_path / "no_dex.apk")
+    triage = Triage(DEFINITIONS)
+    assert triage.check(apks / "a.apk").verdict == VERDICT_INVALID
+    assert triage.check(tmp_path / "no_dex.apk").verdict == VERDICT_INVALID
@@ -0,0 +1,149 @@
+import time
+import threading
+import pytest
+from pyflowdroid.results import ApkResult, STATUS_FAILED, STATUS_OK
+from pyflowdroid.workqueue import (
+    JOB_DONE,
+    JOB_LEASED,
+    JOB_PENDING,
+    JobQueue,
+    iter_queue_results,
+    run_worker,
+)
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return tmp_path / "queue" / "jobs.sqlite"
+
+
+def _start_workers(queue_path, count, **options):
+    """
+    Starts `count` workers in threads, each one with its own connection to
+    the queue, as workers on other hosts would have.
+    """
+    done = []
+
+    def work(index):
+        with JobQueue(queue_path, lease_time=options.pop("lease_time", 60)) as queue:
+            done.append(
+                run_worker(queue, name=f"worker-{index}", poll_interval=0.05, **options)
+            )
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, done
+
+
+def test_lease_gives_each_job_to_one_worker(queue_path, apks):
+    with JobQueue(queue_path) as queue:
+        assert queue.submit(sorted(apks.iterdir())) == 5
+        first = queue.lease("w1", 3)
+        second = queue.lease("w2", 3)
+        assert len(first) == 3 and len(second) == 2
+        assert not {job[1] for job in first} & {job[1] for job in second}
+        assert queue.lease("w3", 1) == []
+        assert queue.counts() == {JOB_PENDING: 0, JOB_LEASED: 5, JOB_DONE: 0}
+
+
+def test_complete_pushes_results_in_completion_order(queue_path, apks):
+    with JobQueue(queue_path) as queue:
+        queue.submit(sorted(apks.iterdir()))
+        jobs = queue.lease("w1", 2)
+        for job_id, apk, _ in reversed(jobs):
+            assert queue.complete(job_id, "w1", ApkResult(apk, STATUS_OK))
+        results = queue.results()
+        assert [apk for _, apk, _ in results] == [job[1] for job in reversed(jobs)]
+        assert queue.results(results[0][0])[0][1] == jobs[0][1]
+
+
+def test_expired_lease_is_leased_again(queue_path, apks):
+    with JobQueue(queue_path, lease_time=0.2) as queue:
+        queue.submit([apks / "a.apk"])
+        [(job_id, _, _)] = queue.lease("dead")
+        assert queue.lease("alive") == []
+        time.sleep(0.3)
+        assert [job[0] for job in queue.lease("alive")] == [job_id]
+
+        # The worker that lost the lease can not push its result anymore
+        assert not queue.complete(job_id, "dead", ApkResult("a.apk", STATUS_OK))
+        assert queue.complete(job_id, "alive", ApkResult("a.apk", STATUS_OK))
+
+
+def test_heartbeat_renews_the_lease(queue_path, apks):
+    with JobQueue(queue_path, lease_time=0.3) as queue:
+        queue.submit([apks / "a.apk"])
+        [(job_id, _, _)] = queue.lease("w1")
+        for _ in range(3):
+            time.sleep(0.15)
+            queue.heartbeat("w1", [job_id])
+        assert queue.lease("w2") == []
+
+        # Heartbeats of other workers do not renew it
+        time.sleep(0.15)
+        queue.heartbeat("w2", [job_id])
+        time.sleep(0.2)
+        assert len(queue.lease("w2")) == 1
+
+
+def test_job_is_given_up_after_max_attempts(queue_path, apks):
+    with JobQueue(queue_path, lease_time=0.1, max_attempts=2) as queue:
+        queue.submit([apks / "a.apk"])
+        [(job_id, _, _)] = queue.lease("w1")
+        assert queue.fail(job_id, "w1", "crashed")
+        assert queue.counts()[JOB_PENDING] == 1
+
+        # The second lease expires, so the job is given up as failed
+        queue.lease("w2")
+        time.sleep(0.2)
+        assert queue.lease("w3") == []
+        [(_, apk, result)] = queue.results()
+        assert apk == str(apks / "a.apk") and result.status == STATUS_FAILED
+
+
+def test_several_workers_analyze_all_the_apks(queue_path, apks, fake_java):
+    apk_paths = sorted(str(path) for path in apks.iterdir())
+    with JobQueue(queue_path) as queue:
+        queue.submit(apk_paths, save_logs=False)
+    threads, done = _start_workers(queue_path, 3, workers=2)
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert sum(done) == len(apk_paths)
+    with JobQueue(queue_path) as queue:
+        results = queue.results()
+    assert sorted(apk for _, apk, _ in results) == apk_paths
+    assert all(len(result.leaks) == 2 for _, _, result in results)
+
+
+def test_jobs_of_a_dead_worker_are_analyzed_by_the_others(queue_path, apks, fake_java):
+    with JobQueue(queue_path, lease_time=0.5) as queue:
+        queue.submit(sorted(apks.iterdir()), save_logs=False)
+        abandoned = queue.lease("dead", 2)
+    threads, done = _start_workers(queue_path, 2, lease_time=0.5)
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert sum(done) == 5
+    with JobQueue(queue_path) as queue:
+        finished = {apk: result for _, apk, result in queue.results()}
+    assert all(finished[job[1]].status == STATUS_OK for job in abandoned)
+
+
+def test_iter_queue_results_ignores_repeated_apks(queue_path, apks, fake_java):
+    apk_paths = sorted(str(path) for path in apks.iterdir())
+    threads: list = []
+
+    # Start the workers once all the apks are submitted
+    def submitted():
+        yield from apk_paths + apk_paths[:2]
+        threads.extend(_start_workers(queue_path, 2, workers=2)[0])
+
+    with JobQueue(queue_path) as queue:
+        results = list(
+            iter_queue_results(queue, submitted(), poll_interval=0.05, save_logs=False)
+        )
+    for thread in threads:
+        thread.join(timeout=60)
+    assert sorted(apk for apk, _ in results) == apk_paths